@@ -0,0 +1,413 @@
+"""In-process stand-ins for every external API the bot talks to.
+
+One threaded HTTP server answers, by path prefix:
+
+    /tg/bot<token>/<method>        Telegram Bot API (PTB ``base_url``)
+    /tg/file/bot<token>/<path>     Telegram file downloads (PTB ``base_file_url``)
+    /max/...                       Max Bot API (aiomax ``api_url``), uploads included
+    /files/<name>                  Max attachment downloads
+    /replicate/v1/predictions...   Replicate predictions (``REPLICATE_BASE_URL``)
+    /tinkoff/v2/<method>           Tinkoff acquiring (``payment.BASE_URL``)
+    anything else                  S3 object PUT / multipart upload (``S3_ENDPOINT``)
+
+Each answers with just enough of the real response shape for the client
+libraries to parse it. The server remembers the inline-keyboard buttons the bot
+showed to each user, so simulated users press only buttons they can see.
+Uploaded bytes are counted and dropped.
+
+Runs on its own threads, so the bot's event loop is measured without
+the fake servers competing for it (they still compete for the GIL, the same
+way real network I/O costs some CPU).
+"""
+import email.parser
+import email.policy
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+S3_BUCKET = "sim-bucket"
+
+# Simulated uploads carry their duration in the file name: "sim-<seconds>s-<n>.mp3".
+SIM_DURATION_RE = re.compile(r"sim-(\d+)s-")
+
+_WORDS = (
+    "значит", "давайте", "посмотрим", "на", "этот", "проект", "коллеги", "сейчас",
+    "обсудим", "сроки", "и", "бюджет", "хорошо", "понятно", "следующий", "вопрос",
+)
+
+
+class FakeState:
+    """Everything the fakes remember between requests; guarded by one lock."""
+
+    def __init__(self, *, upload_bytes: int, replicate_speed: float, replicate_queue: float,
+                 llm_seconds: float, payment_confirm_seconds: float):
+        self.lock = threading.Lock()
+        self.upload_bytes = upload_bytes
+        self.replicate_speed = replicate_speed
+        self.replicate_queue = replicate_queue
+        self.llm_seconds = llm_seconds
+        self.payment_confirm_seconds = payment_confirm_seconds
+
+        self._ids = itertools.count(1000)
+        # (platform, user_id) -> {message_id: [callback payloads]}
+        self.buttons: dict[tuple[str, int], dict[str, list[str]]] = {}
+        self._message_owner: dict[str, tuple[str, int]] = {}
+        self.predictions: dict[str, dict] = {}
+        self.payments: dict[int, float] = {}
+        self.requests: dict[str, int] = {}
+        self.s3_bytes = 0
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self._ids)
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def set_buttons(self, platform: str, user_id: int | None, message_id, payloads: list[str]) -> None:
+        message_id = str(message_id)
+        with self.lock:
+            owner = (platform, user_id) if user_id is not None else self._message_owner.get(message_id)
+            if owner is None:
+                return
+            self._message_owner[message_id] = owner
+            chat = self.buttons.setdefault(owner, {})
+            if payloads:
+                chat[message_id] = payloads
+            else:
+                chat.pop(message_id, None)
+
+    def visible_buttons(self, platform: str, user_id: int) -> list[tuple[str, str]]:
+        """``(message_id, payload)`` of every button currently shown to the user."""
+        with self.lock:
+            chat = self.buttons.get((platform, user_id), {})
+            return [(mid, payload) for mid, payloads in chat.items() for payload in payloads]
+
+    def forget_button(self, platform: str, user_id: int, message_id: str) -> None:
+        with self.lock:
+            self.buttons.get((platform, user_id), {}).pop(str(message_id), None)
+
+
+# ─────────────────────────── request parsing ───────────────────────────
+
+
+def _read_body(handler: BaseHTTPRequestHandler) -> bytes:
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int(handler.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                while handler.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass  # trailers
+                return b"".join(chunks)
+            chunks.append(handler.rfile.read(size))
+            handler.rfile.readline()
+    length = int(handler.headers.get("Content-Length") or 0)
+    return handler.rfile.read(length) if length else b""
+
+
+def _form(handler: BaseHTTPRequestHandler, body: bytes) -> dict:
+    """Request parameters from a JSON, urlencoded or multipart body."""
+    content_type = handler.headers.get("Content-Type", "")
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name and part.get_filename() is None:
+                fields[name] = part.get_content()
+        return fields
+    return {}
+
+
+def _tg_buttons(reply_markup) -> list[str]:
+    if not reply_markup:
+        return []
+    if isinstance(reply_markup, str):
+        reply_markup = json.loads(reply_markup)
+    return [
+        button["callback_data"]
+        for row in reply_markup.get("inline_keyboard", [])
+        for button in row
+        if "callback_data" in button
+    ]
+
+
+def _max_buttons(body: dict) -> list[str]:
+    return [
+        button["payload"]
+        for attachment in body.get("attachments") or []
+        if attachment.get("type") == "inline_keyboard"
+        for row in attachment.get("payload", {}).get("buttons", [])
+        for button in row
+        if button.get("payload")
+    ]
+
+
+def whisperx_output(duration_seconds: int, seed: int) -> dict:
+    """A WhisperX-shaped result: one ~5 s segment of Russian speech per 5 s of audio."""
+    rng = random.Random(seed)
+    segments = []
+    for start in range(0, max(5, duration_seconds), 5):
+        segments.append({
+            "start": float(start),
+            "end": start + 4.7,
+            "text": " " + " ".join(rng.choice(_WORDS) for _ in range(12)),
+            "avg_logprob": rng.uniform(-0.4, -0.05),
+        })
+    return {"segments": segments, "detected_language": "ru"}
+
+
+# ─────────────────────────── handler ───────────────────────────
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeState  # set on the subclass built by start_fake_apis()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply_json(self, payload, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self._reply(body, status, {"Content-Type": "application/json"})
+
+    def _reply(self, body: bytes = b"", status: int = 200, headers: dict | None = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self) -> None:
+        url = urlsplit(self.path)
+        path = url.path
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = _read_body(self)
+        if path.startswith("/tg/file/"):
+            self.state.count("tg:file")
+            return self._reply(bytes(self.state.upload_bytes))
+        if path.startswith("/tg/bot"):
+            method = path.rsplit("/", 1)[-1]
+            self.state.count(f"tg:{method}")
+            return self._telegram(method, _form(self, body))
+        if path.startswith("/max/"):
+            self.state.count(f"max:{self.command} {path[5:].split('/')[0]}")
+            return self._max(path[5:], query, _form(self, body) if body else {})
+        if path.startswith("/files/"):
+            self.state.count("max:file")
+            return self._reply(bytes(self.state.upload_bytes))
+        if path.startswith("/replicate/"):
+            self.state.count(f"replicate:{self.command}")
+            return self._replicate(path[len("/replicate"):], _form(self, body) if body else {})
+        if path.startswith("/tinkoff/"):
+            method = path.rsplit("/", 1)[-1]
+            self.state.count(f"tinkoff:{method}")
+            return self._tinkoff(method, _form(self, body))
+        self.state.count(f"s3:{self.command}")
+        return self._s3(query, body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    # Telegram ---------------------------------------------------------
+
+    def _tg_message(self, chat_id, message_id=None, text="") -> dict:
+        return {
+            "message_id": int(message_id or self.state.next_id()),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text or "",
+        }
+
+    def _telegram(self, method: str, params: dict) -> None:
+        state = self.state
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Sim", "username": "sim_bot"}
+        elif method == "getFile":
+            result = {
+                "file_id": params["file_id"],
+                "file_unique_id": params["file_id"],
+                "file_size": state.upload_bytes,
+                "file_path": params["file_id"],
+            }
+        elif method in ("sendMessage", "sendDocument"):
+            result = self._tg_message(params["chat_id"], text=params.get("text", ""))
+            state.set_buttons("telegram", int(params["chat_id"]), result["message_id"],
+                              _tg_buttons(params.get("reply_markup")))
+        elif method in ("editMessageText", "editMessageReplyMarkup"):
+            result = self._tg_message(params["chat_id"], params["message_id"], params.get("text", ""))
+            # An edit without reply_markup removes the keyboard, as on Telegram.
+            state.set_buttons("telegram", int(params["chat_id"]), params["message_id"],
+                              _tg_buttons(params.get("reply_markup")))
+        elif method == "deleteMessage":
+            state.set_buttons("telegram", int(params["chat_id"]), params["message_id"], [])
+            result = True
+        else:  # answerCallbackQuery, sendChatAction, setMyCommands, ...
+            result = True
+        self._reply_json({"ok": True, "result": result})
+
+    # Max --------------------------------------------------------------
+
+    def _max_message(self, user_id: int, text: str) -> dict:
+        return {
+            "recipient": {"chat_id": user_id, "chat_type": "dialog"},
+            "body": {"mid": f"mid.{self.state.next_id()}", "seq": 0, "text": text or ""},
+            "sender": {"user_id": 1, "first_name": "Sim", "name": "Sim", "is_bot": True,
+                       "last_activity_time": 0, "username": "sim_bot"},
+            "timestamp": int(time.time() * 1000),
+        }
+
+    def _max(self, path: str, query: dict, body: dict) -> None:
+        state = self.state
+        resource = path.split("/")[0]
+        if resource == "me":
+            return self._reply_json({"user_id": 1, "first_name": "Sim", "name": "Sim", "is_bot": True,
+                                     "last_activity_time": 0, "username": "sim_bot"})
+        if resource == "uploads":
+            host = self.headers.get("Host")
+            return self._reply_json({"url": f"http://{host}/max/upload", "token": uuid.uuid4().hex})
+        if resource == "upload":
+            return self._reply_json({"token": uuid.uuid4().hex})
+        if resource == "messages" and self.command == "POST":
+            # Dialogs: the simulator uses the user id as the chat id.
+            user_id = int(query.get("user_id") or query["chat_id"])
+            message = self._max_message(user_id, body.get("text"))
+            state.set_buttons("max", user_id, message["body"]["mid"], _max_buttons(body))
+            return self._reply_json({"message": message})
+        if resource == "messages" and self.command == "PUT":
+            if "attachments" in body:  # attachments=None keeps the keyboard
+                state.set_buttons("max", None, query["message_id"], _max_buttons(body))
+            return self._reply_json({"success": True})
+        if resource == "messages" and self.command == "DELETE":
+            state.set_buttons("max", None, query["message_id"], [])
+            return self._reply_json({"success": True})
+        return self._reply_json({"success": True})  # answers, chat actions, patch me
+
+    # Replicate --------------------------------------------------------
+
+    def _prediction(self, prediction_id: str) -> dict:
+        state = self.state
+        with state.lock:
+            prediction = dict(state.predictions[prediction_id])
+        now = time.time()
+        if prediction["status"] == "starting" and now >= prediction["ready_at"]:
+            prediction["status"] = "succeeded"
+            prediction["output"] = prediction.pop("pending_output")
+            prediction["metrics"] = {"predict_time": prediction["ready_at"] - prediction["created"]}
+            with state.lock:
+                state.predictions[prediction_id] = prediction
+        prediction.pop("pending_output", None)
+        return {
+            "id": prediction_id,
+            "model": "sim/model",
+            "version": prediction["version"],
+            "status": "processing" if prediction["status"] == "starting" else prediction["status"],
+            "input": prediction["input"],
+            "output": prediction.get("output"),
+            "logs": "",
+            "error": None,
+            "metrics": prediction.get("metrics"),
+            "created_at": None,
+            "started_at": None,
+            "completed_at": None,
+            "urls": {},
+        }
+
+    def _replicate(self, path: str, body: dict) -> None:
+        state = self.state
+        parts = path.strip("/").split("/")  # v1, predictions, [id], [cancel]
+        if self.command == "POST" and parts[-1] == "predictions":
+            prediction_id = uuid.uuid4().hex
+            payload = body.get("input") or {}
+            now = time.time()
+            if "audio_file" in payload:
+                match = SIM_DURATION_RE.search(payload["audio_file"])
+                duration = int(match.group(1)) if match else 60
+                ready_at = now + state.replicate_queue + duration / state.replicate_speed
+                output = whisperx_output(duration, seed=len(state.predictions))
+            else:  # LLM summarize / improve
+                ready_at = now + state.llm_seconds
+                output = ["Краткое ", "содержание ", "записи."]
+            with state.lock:
+                state.predictions[prediction_id] = {
+                    "version": body.get("version", ""), "input": payload, "status": "starting",
+                    "created": now, "ready_at": ready_at, "pending_output": output,
+                }
+            return self._reply_json(self._prediction(prediction_id), status=201)
+        if len(parts) >= 3 and parts[2] in state.predictions:
+            if parts[-1] == "cancel":
+                with state.lock:
+                    state.predictions[parts[2]]["status"] = "canceled"
+            return self._reply_json(self._prediction(parts[2]))
+        return self._reply_json({"detail": "Not found"}, status=404)
+
+    # Tinkoff ----------------------------------------------------------
+
+    def _tinkoff(self, method: str, body: dict) -> None:
+        state = self.state
+        if method == "Init":
+            payment_id = state.next_id()
+            with state.lock:
+                state.payments[payment_id] = time.time() + state.payment_confirm_seconds
+            return self._reply_json({
+                "Success": True, "ErrorCode": "0", "Status": "NEW", "PaymentId": payment_id,
+                "OrderId": body.get("OrderId"), "Amount": body.get("Amount"),
+                "PaymentURL": f"https://pay.sim/{payment_id}",
+            })
+        payment_id = int(body.get("PaymentId") or 0)
+        if method == "Cancel":
+            return self._reply_json({"Success": True, "ErrorCode": "0", "Status": "CANCELED", "PaymentId": payment_id})
+        confirmed_at = state.payments.get(payment_id)
+        status = "CONFIRMED" if confirmed_at is not None and time.time() >= confirmed_at else "NEW"
+        return self._reply_json({"Success": True, "ErrorCode": "0", "Status": status, "PaymentId": payment_id})
+
+    # S3 ---------------------------------------------------------------
+
+    def _s3(self, query: dict, body: bytes) -> None:
+        if self.command == "PUT":
+            with self.state.lock:
+                self.state.s3_bytes += len(body)
+            return self._reply(headers={"ETag": f'"{uuid.uuid4().hex}"'})
+        if self.command == "POST" and "uploads" in query:
+            xml = (
+                "<InitiateMultipartUploadResult>"
+                f"<Bucket>{S3_BUCKET}</Bucket><Key>k</Key><UploadId>{uuid.uuid4().hex}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            )
+        else:
+            xml = (
+                "<CompleteMultipartUploadResult>"
+                f"<Bucket>{S3_BUCKET}</Bucket><Key>k</Key><ETag>\"{uuid.uuid4().hex}\"</ETag>"
+                "</CompleteMultipartUploadResult>"
+            )
+        return self._reply(xml.encode(), headers={"Content-Type": "application/xml"})
+
+
+def start_fake_apis(state: FakeState | None = None, port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    """Serve the fakes on a background thread; returns the server and its base URL."""
+    if state is None:
+        state = FakeState(upload_bytes=0, replicate_speed=60.0, replicate_queue=0.0,
+                          llm_seconds=1.0, payment_confirm_seconds=5.0)
+    handler = type("BoundFakeAPIHandler", (FakeAPIHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
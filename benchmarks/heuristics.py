@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark the WhisperX quality heuristics on synthetic long-recording payloads.
+
+The scheduler runs these on the full result of every completed job inside the
+1-second poll tick, so their cost on the longest allowed upload (6 hours)
+directly delays every other user's status updates.
+
+Usage:
+    python benchmarks/heuristics.py                  # 1h / 3h / 6h payloads
+    python benchmarks/heuristics.py --hours 6 --repeat 20
+    python benchmarks/heuristics.py --output bench/heuristics.json
+
+Prints the median wall time of one analyze() call next to the old call
+pattern (get_text + is_wrong_language + looks_like_hallucination, each walking
+the payload on its own). With --output the numbers are also written as JSON.
+"""
+# ruff: noqa: E402
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("REPLICATE_API_TOKEN", "benchmark")
+
+from providers.replicate import analyze, get_text, is_wrong_language, looks_like_hallucination
+
+
+# Prod WhisperX output averages one ~5 s segment of ~80 characters.
+SEGMENT_SECONDS = 5.0
+WORDS = (
+    "значит", "давайте", "посмотрим", "на", "этот", "проект", "коллеги", "сейчас",
+    "обсудим", "сроки", "и", "бюджет", "meeting", "deadline", "хорошо", "понятно",
+)
+
+
+def make_payload(hours: float, seed: int = 0) -> dict:
+    """A WhisperX-shaped payload of *hours* of coherent Russian speech."""
+    rng = random.Random(seed)
+    segments = []
+    start = 0.0
+    for _ in range(int(hours * 3600 / SEGMENT_SECONDS)):
+        text = " " + " ".join(rng.choice(WORDS) for _ in range(12))
+        segments.append({
+            "start": start,
+            "end": start + SEGMENT_SECONDS - 0.3,
+            "text": text,
+            "avg_logprob": rng.uniform(-0.6, -0.05),
+        })
+        start += SEGMENT_SECONDS
+    return {"status": "succeeded", "output": {"detected_language": "ru", "segments": segments}}
+
+
+def _median_seconds(func, payload, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(payload)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def _separate_calls(payload):
+    return get_text(payload), is_wrong_language(payload), looks_like_hallucination(payload)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark WhisperX quality heuristics")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 3, 6])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    print(f"{'hours':>6} {'segments':>9} {'analyze ms':>11} {'separate ms':>12}")
+    for hours in args.hours:
+        payload = make_payload(hours)
+        segments = len(payload["output"]["segments"])
+        single = _median_seconds(analyze, payload, args.repeat)
+        separate = _median_seconds(_separate_calls, payload, args.repeat)
+        print(f"{hours:>6g} {segments:>9} {single * 1000:>11.1f} {separate * 1000:>12.1f}")
+        results.append({
+            "hours": hours,
+            "segments": segments,
+            "analyze_ms": round(single * 1000, 2),
+            "separate_calls_ms": round(separate * 1000, 2),
+        })
+
+    if args.output:
+        path = Path(args.output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"benchmark": "heuristics", "results": results}, indent=2))
+        print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Benchmark the file ingest pipeline on synthetic recordings of 1 minute to 6 hours.
+
+Replays what handlers/*/file.py does with an upload — ffprobe duration,
+conversion to OGG/Opus, volumedetect and the S3 upload of the result — on
+generated audio and video fixtures, and reports for every stage:
+
+    wall_s        wall-clock time
+    cpu_s         user + system CPU of the stage, ffmpeg/ffprobe children included
+    peak_rss_mb   peak resident memory of the stage (Python or its ffmpeg child)
+    peak_disk_mb  peak size of the per-file temp workdir while the stage runs
+
+Every stage runs in a fresh spawned process so peak RSS is the stage's own,
+not the high-water mark of everything before it. Uploads go to an in-process
+S3 stand-in that speaks just enough of the API for boto3 (single PUT and
+multipart) and discards the bytes; pass --s3-endpoint to use a real local
+S3 (e.g. MinIO) instead.
+
+Fixtures are generated with ffmpeg's lavfi sources once and cached in
+--fixtures-dir, so reruns only measure the pipeline. Needs ffmpeg/ffprobe in
+PATH.
+
+Usage:
+    python benchmarks/ingest.py                                 # audio + video, 1m / 10m / 1h / 6h
+    python benchmarks/ingest.py --minutes 1 10 --kinds audio
+    python benchmarks/ingest.py --output bench/ingest-$(git rev-parse --short HEAD).json
+    python benchmarks/ingest.py --output new.json --compare old.json   # exits 1 on regressions
+"""
+# ruff: noqa: E402
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+# audio: a phone voice memo; video: a screen/meeting recording.
+FIXTURES = {
+    "audio": {
+        "ext": "m4a",
+        "inputs": ["-f", "lavfi", "-i", "sine=frequency=220:sample_rate=44100",
+                   "-f", "lavfi", "-i", "anoisesrc=color=pink:amplitude=0.05:sample_rate=44100"],
+        "codecs": ["-filter_complex", "amix=inputs=2", "-c:a", "aac", "-b:a", "96k"],
+    },
+    "video": {
+        "ext": "mp4",
+        "inputs": ["-f", "lavfi", "-i", "testsrc2=size=640x360:rate=15",
+                   "-f", "lavfi", "-i", "sine=frequency=220:sample_rate=44100"],
+        "codecs": ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "35",
+                   "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart"],
+    },
+}
+
+STAGES = ("copy", "duration", "convert", "volume", "upload")
+
+BUCKET = "bench"
+
+
+# ─────────────────────────── S3 stand-in ───────────────────────────
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    """Accepts object PUTs and multipart uploads; counts bytes, stores nothing."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _drain(self) -> int:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            total = 0
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass  # trailers
+                    return total
+                remaining = size
+                while remaining:
+                    remaining -= len(self.rfile.read(min(remaining, 1 << 20)))
+                self.rfile.readline()
+                total += size
+        remaining = int(self.headers.get("Content-Length") or 0)
+        total = remaining
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return total
+
+    def _reply(self, status: int = 200, body: bytes = b"", headers: dict | None = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        received = self._drain()
+        with self.server.lock:  # multipart parts arrive on parallel connections
+            self.server.bytes_received += received
+        self._reply(headers={"ETag": f'"{uuid.uuid4().hex}"'})
+
+    def do_POST(self):
+        self._drain()
+        if "uploads" in self.path.split("?", 1)[-1].split("&"):
+            body = (
+                "<InitiateMultipartUploadResult>"
+                f"<Bucket>{BUCKET}</Bucket><Key>k</Key><UploadId>{uuid.uuid4().hex}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            )
+        else:
+            body = (
+                "<CompleteMultipartUploadResult>"
+                f"<Bucket>{BUCKET}</Bucket><Key>k</Key><ETag>\"{uuid.uuid4().hex}\"</ETag>"
+                "</CompleteMultipartUploadResult>"
+            )
+        self._reply(body=body.encode(), headers={"Content-Type": "application/xml"})
+
+
+def start_s3_stand_in() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _S3Handler)
+    server.bytes_received = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ─────────────────────────── fixtures ───────────────────────────
+
+
+def make_fixture(kind: str, minutes: float, directory: Path) -> Path:
+    spec = FIXTURES[kind]
+    path = directory / f"{kind}-{minutes:g}m.{spec['ext']}"
+    if path.exists():
+        return path
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"tmp-{path.name}")
+    print(f"Generating {path.name}…", flush=True)
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", *spec["inputs"], *spec["codecs"],
+         "-t", str(minutes * 60), str(tmp)],
+        check=True,
+    )
+    tmp.rename(path)
+    return path
+
+
+# ─────────────────────────── stage worker ───────────────────────────
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for entry in path.rglob("*"):
+        try:
+            if entry.is_file():
+                total += entry.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def _run_stage(stage: str, fixture: str, workdir: str, queue) -> None:
+    """Body of one spawned stage process; puts its measurements on *queue*."""
+    from utils.ffmpeg import convert_to_ogg, get_mean_volume, get_media_duration
+    from utils.s3 import upload_file
+
+    workdir = Path(workdir)
+    source = workdir / "in" / Path(fixture).name
+    ogg = workdir / "out" / "audio.ogg"
+
+    async def copy():
+        # Stands in for the messenger download: the file lands in the workdir.
+        await asyncio.to_thread(shutil.copyfile, fixture, source)
+        return source.stat().st_size
+
+    async def convert():
+        error = await convert_to_ogg(source, ogg, workdir / "out" / "audio.progress")
+        if error is None:
+            source.unlink()  # the handler drops the original right after conversion
+        return error
+
+    stages = {
+        "copy": copy,
+        "duration": lambda: get_media_duration(source),
+        "convert": convert,
+        "volume": lambda: get_mean_volume(ogg),
+        "upload": lambda: upload_file(ogg, f"bench/{uuid.uuid4().hex}.ogg"),
+    }
+
+    peak_disk = _dir_size(workdir)
+    done = threading.Event()
+
+    def sample_disk():
+        nonlocal peak_disk
+        while not done.wait(0.2):
+            peak_disk = max(peak_disk, _dir_size(workdir))
+
+    sampler = threading.Thread(target=sample_disk, daemon=True)
+    sampler.start()
+
+    before_self = resource.getrusage(resource.RUSAGE_SELF)
+    before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    result = asyncio.run(stages[stage]())
+    wall = time.perf_counter() - started
+    after_self = resource.getrusage(resource.RUSAGE_SELF)
+    after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    done.set()
+    sampler.join()
+    peak_disk = max(peak_disk, _dir_size(workdir))
+
+    cpu = sum(
+        getattr(after, field) - getattr(before, field)
+        for before, after in ((before_self, after_self), (before_children, after_children))
+        for field in ("ru_utime", "ru_stime")
+    )
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = max(after_self.ru_maxrss, after_children.ru_maxrss) * scale
+    ok = {
+        "copy": bool(result),
+        "duration": bool(result),
+        "convert": result is None,
+        "volume": result is not None,
+        "upload": bool(result),
+    }[stage]
+    queue.put({
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        "peak_disk_mb": round(peak_disk / 2**20, 1),
+        "ok": ok,
+    })
+
+
+def run_pipeline(fixture: Path) -> list[dict]:
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ingest-bench-") as workdir:
+        (Path(workdir) / "in").mkdir()
+        (Path(workdir) / "out").mkdir()
+        for stage in STAGES:
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_stage, args=(stage, str(fixture), workdir, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                results.append({"stage": stage, "ok": False})
+                break
+            results.append({"stage": stage, **queue.get()})
+            if not results[-1]["ok"]:
+                break
+    return results
+
+
+# ─────────────────────────── reporting ───────────────────────────
+
+
+def git_sha() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """Human-readable regressions of *new* against *old* beyond *threshold*."""
+    previous = {(row["fixture"], row["stage"]): row for row in old["results"]}
+    regressions = []
+    for row in new["results"]:
+        base = previous.get((row["fixture"], row["stage"]))
+        if base is None or not row.get("ok") or not base.get("ok"):
+            continue
+        for metric in ("wall_s", "cpu_s", "peak_rss_mb", "peak_disk_mb"):
+            # Ignore sub-noise absolute changes on tiny fixtures.
+            if base[metric] <= 0 or row[metric] - base[metric] < 0.05:
+                continue
+            change = row[metric] / base[metric] - 1
+            if change > threshold:
+                regressions.append(
+                    f"{row['fixture']:<12} {row['stage']:<9} {metric:<13} "
+                    f"{base[metric]:>9} → {row[metric]:<9} (+{change:.0%})"
+                )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline on synthetic media")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60, 360])
+    parser.add_argument("--kinds", nargs="+", choices=sorted(FIXTURES), default=sorted(FIXTURES))
+    parser.add_argument("--fixtures-dir", default=str(Path(tempfile.gettempdir()) / "ingest-fixtures"))
+    parser.add_argument("--s3-endpoint", help="use this S3 endpoint instead of the in-process stand-in")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="previous JSON result to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        sys.exit("ffmpeg and ffprobe must be in PATH")
+
+    server = None
+    if args.s3_endpoint:
+        endpoint = args.s3_endpoint
+    else:
+        server = start_s3_stand_in()
+        endpoint = f"http://127.0.0.1:{server.server_port}"
+    # Read by utils.s3 at import time in every stage process.
+    os.environ.update({
+        "S3_ENDPOINT": endpoint,
+        "S3_BUCKET": os.environ.get("S3_BUCKET", BUCKET) if args.s3_endpoint else BUCKET,
+        "S3_ACCESS_KEY": os.environ.get("S3_ACCESS_KEY", "bench"),
+        "S3_SECRET_KEY": os.environ.get("S3_SECRET_KEY", "bench"),
+        "ENABLE_SENTRY": "0",
+    })
+
+    fixtures_dir = Path(args.fixtures_dir)
+    results = []
+    print(f"{'fixture':<12} {'size MB':>8} {'stage':<9} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} {'disk MB':>8}")
+    for kind in args.kinds:
+        for minutes in args.minutes:
+            fixture = make_fixture(kind, minutes, fixtures_dir)
+            name = re.sub(r"\.\w+$", "", fixture.name)
+            size = fixture.stat().st_size
+            for row in run_pipeline(fixture):
+                row = {"fixture": name, "kind": kind, "minutes": minutes, "size_bytes": size, **row}
+                results.append(row)
+                if not row["ok"]:
+                    print(f"{name:<12} {size / 2**20:>8.1f} {row['stage']:<9} FAILED")
+                    continue
+                print(
+                    f"{name:<12} {size / 2**20:>8.1f} {row['stage']:<9} {row['wall_s']:>8.2f} "
+                    f"{row['cpu_s']:>8.2f} {row['peak_rss_mb']:>8.1f} {row['peak_disk_mb']:>8.1f}"
+                )
+
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        "benchmark": "ingest",
+        "git_sha": git_sha(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        path = Path(args.output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2))
+        print(f"Saved to {path}")
+
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text())
+        regressions = compare(old, report, args.threshold)
+        print(f"\nCompared with {old.get('git_sha') or args.compare}: ", end="")
+        if not regressions:
+            print("no regressions")
+            return
+        print(f"{len(regressions)} regression(s)")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
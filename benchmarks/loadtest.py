@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+"""
+Load-test both bots in one process against fake Telegram, Max, Replicate,
+Tinkoff and S3 servers.
+
+The real handlers and schedulers run unchanged. That covers handle_file,
+the create_task and other button callbacks, commands, check_running_tasks,
+check_refinements, check_pending_payments and expire_stale_pending. They
+are built with main.build_application / main.build_max_bot, the same way
+run_bots builds them. The API servers come from benchmarks/fake_apis.py,
+and the database is a fresh SQLite file (DATABASE_URL), so the real
+queries run on each event.
+
+Simulated users arrive as Poisson processes:
+
+    uploads   a user sends a recording; most then press «Распознать» after a short think time
+    clicks    a user presses a random button the bot is currently showing them
+    payments  a user sends /topup and picks an amount; the fake Tinkoff confirms it later
+
+Reported:
+
+    handler latency   p50 / p95 / p99 per event kind, from update arrival to handler return
+    event-loop lag    how late a 100 ms sleep wakes up, sampled for the whole run
+    DB queries        statements executed per event kind and per scheduler tick
+    scheduler ticks   p50 / p95 / p99 / max duration of every periodic job
+
+ffmpeg and ffprobe are simulated: an upload's duration is encoded
+in its file name, and the probe, conversion and volumedetect calls sleep
+in proportion to it without holding the event loop. That is how the real
+subprocess calls behave too. benchmarks/ingest.py measures their actual
+cost. Replicate finishes a job after queue + duration / --replicate-speed
+seconds.
+
+Usage:
+    python benchmarks/loadtest.py                                   # today's traffic, 2 minutes
+    python benchmarks/loadtest.py --scale 10 --duration 300         # 10x
+    python benchmarks/loadtest.py --uploads-per-min 60 --clicks-per-min 300 --payments-per-min 10
+    python benchmarks/loadtest.py --scale 10 --output bench/loadtest-10x.json
+"""
+# ruff: noqa: E402
+import argparse
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_apis import SIM_DURATION_RE, S3_BUCKET, FakeState, start_fake_apis
+
+
+# Rough prod traffic at the time of writing; --scale multiplies all three.
+BASE_UPLOADS_PER_MIN = 4.0
+BASE_CLICKS_PER_MIN = 12.0
+BASE_PAYMENTS_PER_MIN = 0.5
+
+# Recording length mix (seconds, weight).
+DURATIONS = ((60, 0.30), (300, 0.30), (1200, 0.20), (3600, 0.15), (10800, 0.05))
+
+TELEGRAM_TOKEN = "1:sim"
+MAX_TOKEN = "sim"
+MAX_ANSWERS_HOST = "https://botapi.max.ru/"
+# Scheduler jobs the harness runs. refresh_landing_stats rewrites landing/ and
+# check_pollers watches real polling, so neither belongs in a simulation.
+SIMULATED_JOBS = ("check_running_tasks", "check_refinements", "check_pending_payments", "expire_stale_pending")
+
+# The event or scheduler tick the current task is serving; DB statements are
+# charged to it. asyncio tasks and to_thread copy the context, so this also
+# follows the work into aiomax's handler tasks and worker threads.
+current = contextvars.ContextVar("current", default=None)
+
+
+class Event:
+    """One simulated update, from arrival until every handler it triggered returned."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.queries = 0
+        self.tasks = []
+
+
+class Recorder:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.ticks = defaultdict(list)
+        self.tick_queries = defaultdict(list)
+        self.loop_lag = []
+        self.failures = Counter()
+
+    def event(self, event: Event, seconds: float) -> None:
+        self.latency[event.kind].append(seconds)
+        self.queries[event.kind].append(event.queries)
+
+    def tick(self, name: str, seconds: float, queries: int) -> None:
+        self.ticks[name].append(seconds)
+        self.tick_queries[name].append(queries)
+
+
+def percentile(values, q: float) -> float | None:
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def _summary_ms(values) -> dict:
+    return {
+        "count": len(values),
+        **{f"p{q}_ms": round(percentile(values, q) * 1000, 1) if values else None for q in (50, 95, 99)},
+        "max_ms": round(max(values) * 1000, 1) if values else None,
+    }
+
+
+# ─────────────────────────── environment ───────────────────────────
+
+
+def configure_environment(base_url: str, workdir: Path) -> None:
+    """Point every module-level client at the fakes; must run before bot modules are imported."""
+    os.environ.pop("USE_LOCAL_PTB", None)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir / 'loadtest.db'}",
+        "TELEGRAM_BOT_TOKEN": TELEGRAM_TOKEN,
+        "MAX_BOT_TOKEN": MAX_TOKEN,
+        "REPLICATE_API_TOKEN": "sim",
+        "YC_API_KEY": "sim",
+        "YC_FOLDER_ID": "sim",
+        "REPLICATE_BASE_URL": f"{base_url}/replicate",
+        "S3_ENDPOINT": base_url,
+        "S3_BUCKET": S3_BUCKET,
+        "S3_ACCESS_KEY": "sim",
+        "S3_SECRET_KEY": "sim",
+        "TERMINAL_KEY": "sim",
+        "TERMINAL_PASSWORD": "sim",
+        "ENABLE_SENTRY": "0",
+        "ENABLE_HEALTHCHECK": "0",
+    })
+
+
+def install_simulated_ffmpeg(convert_speed: float) -> None:
+    """Swap the ffmpeg helpers the file handlers imported for sleeps of the same shape."""
+    import handlers.max.file as max_file
+    import handlers.telegram.file as telegram_file
+
+    def _duration(path) -> float:
+        match = SIM_DURATION_RE.search(Path(path).name)
+        return float(match.group(1)) if match else 60.0
+
+    async def get_media_duration(source):
+        await asyncio.sleep(0.05)
+        return _duration(source)
+
+    async def convert_to_ogg(source, destination, progress_file):
+        await asyncio.sleep(_duration(source) / convert_speed)
+        Path(destination).write_bytes(b"OggS" + bytes(1020))
+        return None
+
+    async def get_mean_volume(source):
+        await asyncio.sleep(_duration(source) / convert_speed / 4)
+        return -21.0
+
+    for module in (telegram_file, max_file):
+        module.get_media_duration = get_media_duration
+        module.convert_to_ogg = convert_to_ogg
+        module.get_mean_volume = get_mean_volume
+
+
+def count_queries(engine) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        owner = current.get()
+        if owner is not None:
+            owner.queries += 1
+
+
+# ─────────────────────────── simulated users ───────────────────────────
+
+
+class Simulator:
+    def __init__(self, args, state: FakeState, base_url: str, application, max_bot, recorder: Recorder):
+        self.args = args
+        self.state = state
+        self.base_url = base_url
+        self.application = application
+        self.max_bot = max_bot
+        self.recorder = recorder
+        self.rng = random.Random(args.seed)
+        self.ids = itertools.count(1)
+        self.pending = set()
+
+    # Update builders ---------------------------------------------------
+
+    @staticmethod
+    def _tg_user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Sim", "language_code": "ru"}
+
+    def _tg_message(self, user_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self.ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._tg_user(user_id),
+            **fields,
+        }
+
+    @staticmethod
+    def _max_user(user_id: int) -> dict:
+        return {"user_id": user_id, "first_name": "Sim", "name": "Sim", "is_bot": False, "last_activity_time": 0}
+
+    def _max_message(self, user_id: int, text: str = "", attachments=None, mid: str | None = None) -> dict:
+        return {
+            "recipient": {"chat_id": user_id, "chat_type": "dialog"},
+            "body": {"mid": mid or f"mid.u{next(self.ids)}", "seq": 0, "text": text, "attachments": attachments or []},
+            "sender": self._max_user(user_id),
+            "timestamp": int(time.time() * 1000),
+        }
+
+    # Dispatch ----------------------------------------------------------
+
+    async def _deliver(self, platform: str, kind: str, update: dict) -> None:
+        event = Event(f"{platform}:{kind}")
+        token = current.set(event)
+        started = time.perf_counter()
+        try:
+            if platform == "telegram":
+                from telegram import Update
+
+                await self.application.process_update(Update.de_json(update, self.application.bot))
+            else:
+                await self.max_bot.handle_update(update)
+                await asyncio.sleep(0)  # let aiomax's handler tasks start and register
+                await asyncio.gather(*event.tasks, return_exceptions=True)
+        except Exception:
+            self.recorder.failures[event.kind] += 1
+            logging.exception("Simulated %s failed", event.kind)
+        finally:
+            current.reset(token)
+        self.recorder.event(event, time.perf_counter() - started)
+
+    def spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    def _pick_user(self) -> tuple[str, int]:
+        index = self.rng.randrange(self.args.users)
+        if self.max_bot is not None and self.rng.random() < self.args.max_share:
+            return "max", 2_000_000 + index
+        return "telegram", 1_000_000 + index
+
+    async def click(self, platform: str, user_id: int, message_id: str, payload: str, kind: str = "click") -> None:
+        self.state.forget_button(platform, user_id, message_id)  # a pressed keyboard is not pressed twice
+        if platform == "telegram":
+            update = {
+                "update_id": next(self.ids),
+                "callback_query": {
+                    "id": str(next(self.ids)),
+                    "from": self._tg_user(user_id),
+                    "chat_instance": str(user_id),
+                    "data": payload,
+                    "message": self._tg_message(user_id, message_id=int(message_id), text=""),
+                },
+            }
+        else:
+            now = int(time.time() * 1000)
+            update = {
+                "update_type": "message_callback",
+                "timestamp": now,
+                "callback": {"timestamp": now, "callback_id": str(next(self.ids)),
+                             "user": self._max_user(user_id), "payload": payload},
+                "message": self._max_message(user_id, mid=message_id),
+            }
+        await self._deliver(platform, kind, update)
+
+    async def _click_visible(self, platform: str, user_id: int, pattern: str, kind: str) -> bool:
+        """Press the newest visible button whose payload matches *pattern*."""
+        for message_id, payload in reversed(self.state.visible_buttons(platform, user_id)):
+            if re.fullmatch(pattern, payload):
+                await self.click(platform, user_id, message_id, payload, kind)
+                return True
+        return False
+
+    # Arrivals ----------------------------------------------------------
+
+    async def upload(self) -> None:
+        platform, user_id = self._pick_user()
+        duration = self.rng.choices([d for d, _ in DURATIONS], [w for _, w in DURATIONS])[0]
+        name = f"sim-{duration}s-{next(self.ids)}.mp3"
+        size = self.state.upload_bytes
+        if platform == "telegram":
+            document = {"file_id": name, "file_unique_id": name, "file_name": name,
+                        "mime_type": "audio/mpeg", "file_size": size}
+            update = {"update_id": next(self.ids), "message": self._tg_message(user_id, document=document)}
+        else:
+            attachment = {"type": "file", "payload": {"token": name, "url": f"{self.base_url}/files/{name}"},
+                          "filename": name, "size": size}
+            update = {"update_type": "message_created", "timestamp": int(time.time() * 1000),
+                      "message": self._max_message(user_id, attachments=[attachment])}
+        await self._deliver(platform, "upload", update)
+        if self.rng.random() < self.args.create_share:
+            await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+            await self._click_visible(platform, user_id, r"create_task:\d+", "create_task")
+
+    async def random_click(self) -> None:
+        platform, user_id = self._pick_user()
+        buttons = self.state.visible_buttons(platform, user_id)
+        if not buttons:
+            # Most of the user base has no open keyboard; press one of whoever does.
+            with self.state.lock:
+                owners = [owner for owner, chat in self.state.buttons.items() if chat]
+            if not owners:
+                return
+            platform, user_id = self.rng.choice(owners)
+            buttons = self.state.visible_buttons(platform, user_id)
+            if not buttons:
+                return
+        message_id, payload = self.rng.choice(buttons)
+        await self.click(platform, user_id, message_id, payload)
+
+    async def payment(self) -> None:
+        platform, user_id = self._pick_user()
+        if platform == "telegram":
+            text = "/topup"
+            message = self._tg_message(user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(text)}])
+            update = {"update_id": next(self.ids), "message": message}
+        else:
+            update = {"update_type": "message_created", "timestamp": int(time.time() * 1000),
+                      "message": self._max_message(user_id, text="/topup")}
+        await self._deliver(platform, "topup_command", update)
+        await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+        # Any amount but "topup:cancel".
+        await self._click_visible(platform, user_id, r"topup:\d+", "topup_amount")
+
+    async def arrivals(self, per_minute: float, make, deadline: float) -> None:
+        if per_minute <= 0:
+            return
+        rate = per_minute / 60
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if time.monotonic() >= deadline:
+                return
+            self.spawn(make())
+
+
+def instrument_max_handlers(max_bot) -> None:
+    """Make aiomax handler tasks report back to the event that spawned them."""
+    def wrap(call):
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            event = current.get()
+            if event is not None:
+                event.tasks.append(asyncio.current_task())
+            return await call(*args, **kwargs)
+        return timed
+
+    # The public handlers/commands properties return deep copies; patch the originals.
+    for handlers in max_bot._handlers.values():
+        for handler in handlers:
+            if hasattr(handler, "call"):
+                handler.call = wrap(handler.call)
+    for handlers in max_bot._commands.values():
+        for handler in handlers:
+            handler.call = wrap(handler.call)
+
+
+def timed_job(callback, recorder: Recorder):
+    @functools.wraps(callback)
+    async def tick(context):
+        owner = Event(f"tick:{callback.__name__}")
+        token = current.set(owner)
+        started = time.perf_counter()
+        try:
+            await callback(context)
+        finally:
+            current.reset(token)
+            recorder.tick(callback.__name__, time.perf_counter() - started, owner.queries)
+    return tick
+
+
+async def sample_loop_lag(recorder: Recorder, interval: float = 0.1) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        recorder.loop_lag.append(max(0.0, loop.time() - started - interval))
+
+
+# ─────────────────────────── run ───────────────────────────
+
+
+async def run(args, state: FakeState, base_url: str) -> dict:
+    from database.connection import engine
+    from database.models import Base, Transcription
+
+    import main as bot_main
+    import payment
+
+    # The schedulers hand result_json over as a dict; mysqlclient binds it as
+    # its repr (which parse_result_json reads back), sqlite3 refuses it.
+    sqlite3.register_adapter(dict, repr)
+    Base.metadata.create_all(engine)
+    count_queries(engine)
+    payment.BASE_URL = f"{base_url}/tinkoff/v2"
+    install_simulated_ffmpeg(args.convert_speed)
+
+    recorder = Recorder()
+    application = bot_main.build_application(base_url=f"{base_url}/tg/bot", base_file_url=f"{base_url}/tg/file/bot")
+    max_bot = bot_main.build_max_bot(application, api_url=f"{base_url}/max/") if args.max_share > 0 else None
+    application.bot_data["max_bot"] = max_bot
+    for callback, interval, first in bot_main.JOBS:
+        if callback.__name__ in SIMULATED_JOBS:
+            application.job_queue.run_repeating(timed_job(callback, recorder), interval=interval, first=first)
+
+    await application.initialize()
+    await application.start()
+    if max_bot is not None:
+        import aiohttp
+
+        # start_polling would open this session and then long-poll the fake
+        # forever; updates are fed to handle_update directly instead.
+        max_bot.session = aiohttp.ClientSession(headers={"Authorization": MAX_TOKEN}, base_url=max_bot.api_url)
+        await max_bot.get_me()
+        instrument_max_handlers(max_bot)
+        # Callback.answer posts to an absolute URL that bypasses api_url.
+        post = max_bot.post
+
+        async def post_to_fake(url: str, *args, **kwargs):
+            if url.startswith(MAX_ANSWERS_HOST):
+                url = f"{base_url}/max/{url[len(MAX_ANSWERS_HOST):]}"
+            return await post(url, *args, **kwargs)
+
+        max_bot.post = post_to_fake
+
+    sim = Simulator(args, state, base_url, application, max_bot, recorder)
+    lag = asyncio.create_task(sample_loop_lag(recorder))
+    started = time.monotonic()
+    deadline = started + args.duration
+    scale = args.scale
+    uploads = args.uploads_per_min if args.uploads_per_min is not None else BASE_UPLOADS_PER_MIN * scale
+    clicks = args.clicks_per_min if args.clicks_per_min is not None else BASE_CLICKS_PER_MIN * scale
+    payments = args.payments_per_min if args.payments_per_min is not None else BASE_PAYMENTS_PER_MIN * scale
+    print(f"Simulating {args.duration:.0f}s: {uploads:g} uploads/min, {clicks:g} clicks/min, "
+          f"{payments:g} payments/min over {args.users} users")
+    try:
+        await asyncio.gather(
+            sim.arrivals(uploads, sim.upload, deadline),
+            sim.arrivals(clicks, sim.random_click, deadline),
+            sim.arrivals(payments, sim.payment, deadline),
+        )
+        if sim.pending:
+            await asyncio.wait(set(sim.pending), timeout=args.drain)
+        unfinished = len(sim.pending)
+        for task in list(sim.pending):
+            task.cancel()
+        elapsed = time.monotonic() - started
+    finally:
+        lag.cancel()
+        await application.stop()
+        await application.shutdown()
+        if max_bot is not None:
+            await max_bot.session.close()
+
+    from sqlalchemy import func, select
+
+    with engine.connect() as connection:
+        statuses = dict(connection.execute(
+            select(Transcription.status, func.count()).group_by(Transcription.status)
+        ).all())
+
+    return {
+        "benchmark": "loadtest",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "duration_s": args.duration, "users": args.users, "max_share": args.max_share,
+            "uploads_per_min": uploads, "clicks_per_min": clicks, "payments_per_min": payments,
+            "replicate_speed": args.replicate_speed, "convert_speed": args.convert_speed,
+        },
+        "elapsed_s": round(elapsed, 1),
+        "unfinished_events": unfinished,
+        "handlers": {
+            kind: {**_summary_ms(values),
+                   "queries_avg": round(sum(recorder.queries[kind]) / len(values), 1),
+                   "queries_max": max(recorder.queries[kind]),
+                   "failures": recorder.failures[kind]}
+            for kind, values in sorted(recorder.latency.items())
+        },
+        "loop_lag": _summary_ms(recorder.loop_lag),
+        "scheduler": {
+            name: {**_summary_ms(values),
+                   "queries_avg": round(sum(recorder.tick_queries[name]) / len(values), 1),
+                   "queries_max": max(recorder.tick_queries[name])}
+            for name, values in sorted(recorder.ticks.items())
+        },
+        "transcriptions": statuses,
+        "api_requests": dict(sorted(state.requests.items())),
+    }
+
+
+def print_report(report: dict) -> None:
+    def row(name, stats, extra=""):
+        cells = " ".join(
+            f"{stats[key]:>8.1f}" if stats[key] is not None else f"{'—':>8}"
+            for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")
+        )
+        print(f"{name:<36} {stats['count']:>6} {cells}{extra}")
+
+    header = f"{'':<36} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    print(f"\n{header} {'queries avg/max':>16}")
+    for kind, stats in report["handlers"].items():
+        failed = f"  failed: {stats['failures']}" if stats["failures"] else ""
+        row(kind, stats, f" {stats['queries_avg']:>9}/{stats['queries_max']:<6}{failed}")
+    print()
+    for name, stats in report["scheduler"].items():
+        row(f"tick:{name}", stats, f" {stats['queries_avg']:>9}/{stats['queries_max']:<6}")
+    print()
+    row("event loop lag", report["loop_lag"])
+    print(f"\ntranscriptions by status: {report['transcriptions']}")
+    if report["unfinished_events"]:
+        print(f"events still running after the drain: {report['unfinished_events']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test both bots against fake platform APIs")
+    parser.add_argument("--duration", type=float, default=120, help="seconds of arrivals")
+    parser.add_argument("--drain", type=float, default=60, help="seconds to wait for in-flight events afterwards")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on today's traffic")
+    parser.add_argument("--uploads-per-min", type=float, help="override the upload rate")
+    parser.add_argument("--clicks-per-min", type=float, help="override the random button click rate")
+    parser.add_argument("--payments-per-min", type=float, help="override the /topup rate")
+    parser.add_argument("--users", type=int, default=2000, help="distinct simulated users")
+    parser.add_argument("--max-share", type=float, default=0.3, help="share of users on Max (0 = Telegram only)")
+    parser.add_argument("--create-share", type=float, default=0.9, help="share of uploads confirmed with «Распознать»")
+    parser.add_argument("--think-time", type=float, default=5.0, help="mean seconds before a user presses a button")
+    parser.add_argument("--file-kb", type=int, default=256, help="size of every simulated upload")
+    parser.add_argument("--convert-speed", type=float, default=300.0, help="simulated ffmpeg speed, x realtime")
+    parser.add_argument("--replicate-speed", type=float, default=60.0, help="fake transcription speed, x realtime")
+    parser.add_argument("--replicate-queue", type=float, default=2.0, help="fake queue delay per prediction, seconds")
+    parser.add_argument("--payment-confirm", type=float, default=15.0, help="seconds until a fake payment confirms")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own logging")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    state = FakeState(
+        upload_bytes=args.file_kb * 1024,
+        replicate_speed=args.replicate_speed,
+        replicate_queue=args.replicate_queue,
+        llm_seconds=3.0,
+        payment_confirm_seconds=args.payment_confirm,
+    )
+    server, base_url = start_fake_apis(state)
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        configure_environment(base_url, Path(workdir))
+        report = asyncio.run(run(args, state, base_url))
+    server.shutdown()
+
+    print_report(report)
+    if args.output:
+        path = Path(args.output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
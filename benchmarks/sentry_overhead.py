@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Measure the per-tick cost of Sentry tracing on the 1-second poll jobs.
+
+Runs a stand-in poll tick (no database, no providers — only the tracing
+around it) under two setups and reports microseconds per tick:
+
+    before   traces_sample_rate=1.0, every tick opens a transaction, empty
+             ticks drop it afterwards, busy ticks open one span per item
+    after    utils.sentry's traces sampler, empty ticks return before any
+             transaction, spans are skipped inside unsampled transactions
+
+Events go to a transport that discards them, so only the SDK's in-process
+work is measured. With --budget-us the script exits 1 when an "after" tick
+costs more than the budget, which makes it usable as a CI gate.
+
+Usage:
+    python benchmarks/sentry_overhead.py
+    python benchmarks/sentry_overhead.py --ticks 20000 --items 5
+    python benchmarks/sentry_overhead.py --budget-us 20 --output bench/sentry.json
+"""
+# ruff: noqa: E402
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import sentry_sdk
+
+from sentry_sdk.transport import Transport
+
+import utils.sentry as sentry
+
+
+class NullTransport(Transport):
+    def capture_envelope(self, envelope):
+        pass
+
+
+def init(**options) -> None:
+    sentry_sdk.init(dsn="https://public@sentry.invalid/1", transport=NullTransport, **options)
+
+
+async def item() -> None:
+    await asyncio.sleep(0)
+
+
+async def before_tick(items: int) -> None:
+    with sentry_sdk.start_transaction(name="transcription.poll", op="task.check"):
+        if not items:
+            sentry.sentry_drop_transaction()
+            return
+        for _ in range(items):
+            with sentry_sdk.start_span(op="transcription.check", description="item"):
+                await item()
+
+
+@sentry.sentry_transaction(name="transcription.poll", op="task.check")
+async def _after_poll(items: int) -> None:
+    span_item = sentry.sentry_span(op="transcription.check", description="item")(item)
+    for _ in range(items):
+        await span_item()
+
+
+async def after_tick(items: int) -> None:
+    if not items:
+        return
+    await _after_poll(items)
+
+
+async def measure(tick, ticks: int, items: int) -> float:
+    for _ in range(min(ticks, 100)):
+        await tick(items)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        await tick(items)
+    return (time.perf_counter() - started) / ticks * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticks", type=int, default=5000, help="ticks per measurement")
+    parser.add_argument("--items", type=int, default=3, help="items in a busy tick")
+    parser.add_argument("--budget-us", type=float, default=None, help="fail if an 'after' tick costs more")
+    parser.add_argument("--output", type=Path, default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    sentry.ENABLE_SENTRY = True
+    results = {}
+
+    init(traces_sample_rate=1.0)
+    results["before"] = {
+        "empty_us": asyncio.run(measure(before_tick, args.ticks, 0)),
+        "busy_us": asyncio.run(measure(before_tick, args.ticks, args.items)),
+    }
+
+    init(traces_sampler=sentry._traces_sampler)
+    results["after"] = {
+        "empty_us": asyncio.run(measure(after_tick, args.ticks, 0)),
+        "busy_us": asyncio.run(measure(after_tick, args.ticks, args.items)),
+    }
+
+    print(f"{'setup':<8} {'empty tick, us':>15} {'busy tick, us':>15}")
+    for setup, row in results.items():
+        print(f"{setup:<8} {row['empty_us']:>15.1f} {row['busy_us']:>15.1f}")
+    print(f"poll sample rate: {sentry.POLL_TRACES_SAMPLE_RATE}, items per busy tick: {args.items}")
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({
+            "ticks": args.ticks,
+            "items": args.items,
+            "poll_sample_rate": sentry.POLL_TRACES_SAMPLE_RATE,
+            **results,
+        }, indent=2))
+
+    if args.budget_us is not None:
+        over = [name for name, value in results["after"].items() if value > args.budget_us]
+        if over:
+            print(f"over budget ({args.budget_us} us): {', '.join(over)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
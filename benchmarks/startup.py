@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Import-time profile of the bot's cold start.
+
+Imports main.py in a fresh interpreter under ``python -X importtime`` and
+reports the total and the modules with the largest cumulative and self import
+times, so a new eager import of boto3, fastapi or similar shows up before it
+reaches a pm2 restart. Placeholder credentials and an in-memory SQLite
+DATABASE_URL are filled in for anything unset; nothing connects at import
+time.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --top 30 --runs 5
+    python benchmarks/startup.py --budget-ms 1500 --output bench/startup.json   # exits 1 over budget
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PLACEHOLDER_ENV = {
+    "DATABASE_URL": "sqlite://",
+    "TELEGRAM_BOT_TOKEN": "1:startup",
+    "TERMINAL_KEY": "startup",
+    "TERMINAL_PASSWORD": "startup",
+    "REPLICATE_API_TOKEN": "startup",
+    "YC_API_KEY": "startup",
+    "YC_FOLDER_ID": "startup",
+    "S3_ACCESS_KEY": "startup",
+    "S3_SECRET_KEY": "startup",
+    "S3_ENDPOINT": "http://127.0.0.1:9",
+    "S3_BUCKET": "startup",
+}
+
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile_once(env: dict) -> list[tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for every import of main.py."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"import main failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="interpreters to start; the median run is reported")
+    parser.add_argument("--top", type=int, default=15, help="modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if importing main takes longer")
+    parser.add_argument("--output", type=Path, default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    env.pop("ENABLE_SENTRY", None)
+    runs = [profile_once(env) for _ in range(args.runs)]
+    totals = [next(cumulative for module, _, cumulative, _ in rows if module == "main") for rows in runs]
+    median_total = statistics.median(totals)
+    rows = runs[totals.index(min(totals, key=lambda total: abs(total - median_total)))]
+
+    top_cumulative = sorted((row for row in rows if row[0] != "main"), key=lambda row: -row[2])[:args.top]
+    top_self = sorted(rows, key=lambda row: -row[1])[:args.top]
+
+    print(f"import main: {median_total / 1000:.0f} ms (median of {args.runs}, {len(rows)} modules)\n")
+    print(f"{'cumulative, ms':>14}  module")
+    for module, _, cumulative, depth in top_cumulative:
+        print(f"{cumulative / 1000:>14.1f}  {'  ' * (depth - 1)}{module}")
+    print(f"\n{'self, ms':>14}  module")
+    for module, self_us, _, _ in top_self:
+        print(f"{self_us / 1000:>14.1f}  {module}")
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({
+            "total_ms": median_total / 1000,
+            "runs_ms": [total / 1000 for total in totals],
+            "top_cumulative": [{"module": m, "ms": c / 1000} for m, _, c, _ in top_cumulative],
+            "top_self": [{"module": m, "ms": s / 1000} for m, s, _, _ in top_self],
+        }, indent=2))
+
+    if args.budget_ms is not None and median_total / 1000 > args.budget_ms:
+        print(f"\nover budget: {median_total / 1000:.0f} ms > {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
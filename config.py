@@ -17,6 +17,9 @@ MAX_BOT_TOKEN = os.getenv("MAX_BOT_TOKEN")
 TERMINAL_KEY = os.getenv("TERMINAL_KEY")
 TERMINAL_PASSWORD = os.getenv("TERMINAL_PASSWORD")
 TERMINAL_ENV = os.getenv("TERMINAL_ENV", "test")
+# Optional public URL of healthcheck.py's /tinkoff/notification; when set,
+# Tinkoff pushes payment status changes and polling only reconciles.
+TERMINAL_NOTIFICATION_URL = os.getenv("TERMINAL_NOTIFICATION_URL")
 
 # Required at runtime; MAX_BOT_TOKEN is optional (Max bot is opt-in).
 _REQUIRED = ("TELEGRAM_BOT_TOKEN", "TERMINAL_KEY", "TERMINAL_PASSWORD")
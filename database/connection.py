@@ -5,33 +5,46 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 
+# Full SQLAlchemy URL overriding the MySQL settings below; used by the load-test
+# harness (benchmarks/loadtest.py) to run the real queries against SQLite.
+DATABASE_URL = os.getenv("DATABASE_URL")
+
 MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
 MYSQL_HOST = os.getenv("MYSQL_HOST")
 MYSQL_PORT = os.getenv("MYSQL_PORT")
 MYSQL_DB = os.getenv("MYSQL_DB")
 
-if not all([MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB]):
-    raise RuntimeError(
-        "MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT and MYSQL_DB must be set"
+if DATABASE_URL:
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+else:
+    if not all([MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB]):
+        raise RuntimeError(
+            "MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT and MYSQL_DB must be set"
+        )
+
+    # Как можно скачать сертификат для подключения к MySQL
+    # mkdir ~/.mysql
+    # curl -o ~/.mysql/root.crt https://storage.yandexcloud.net/cloud-certs/CA.pem
+    ssl_ca_path = os.path.expanduser("~/.mysql/root.crt")
+    assert os.path.isfile(ssl_ca_path), "Не найден сертификат для подключения к MySQL"
+
+    engine = create_engine(
+        f"mysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}?ssl_ca={ssl_ca_path}",
+        pool_pre_ping=True,
+        # Socket-level timeouts so a hung DB aborts at the driver instead of piling up
+        # threads on the healthcheck; safe app-wide since all queries are small.
+        connect_args={"connect_timeout": 3, "read_timeout": 3, "write_timeout": 3},
     )
-
-# Как можно скачать сертификат для подключения к MySQL
-# mkdir ~/.mysql
-# curl -o ~/.mysql/root.crt https://storage.yandexcloud.net/cloud-certs/CA.pem
-ssl_ca_path = os.path.expanduser("~/.mysql/root.crt")
-assert os.path.isfile(ssl_ca_path), "Не найден сертификат для подключения к MySQL"
-
-engine = create_engine(
-    f"mysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}?ssl_ca={ssl_ca_path}",
-    pool_pre_ping=True,
-    # Socket-level timeouts so a hung DB aborts at the driver instead of piling up
-    # threads on the healthcheck; safe app-wide since all queries are small.
-    connect_args={"connect_timeout": 3, "read_timeout": 3, "write_timeout": 3},
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-# Разогреваем пул, чтобы не было задержек при первом подключении
-with engine.connect() as connection:
-    pass
+def warm_up() -> None:
+    """Open the first pooled connection so the first query doesn't pay for it.
+
+    Blocking; main.py runs it in a thread while the bots start polling, so
+    startup no longer waits for the MySQL TLS handshake.
+    """
+    # Разогреваем пул, чтобы не было задержек при первом подключении
+    with engine.connect():
+        pass
@@ -39,6 +39,14 @@ STATUS_REJECTED = "rejected"
 STATUS_CANCELLED = "cancelled"
 STATUS_EXPIRED = "expired"
 
+# Ingest job stages, in order: each is recorded once the step has finished,
+# so a job interrupted by a restart resumes with the step after it.
+INGEST_STAGE_RECEIVED = "received"
+INGEST_STAGE_DOWNLOADED = "downloaded"
+INGEST_STAGE_CONVERTED = "converted"
+INGEST_STAGE_UPLOADED = "uploaded"
+INGEST_STAGE_PRICED = "priced"
+
 
 def is_owner(record, user_id: int, platform: str) -> bool:
     """True if ``record`` exists and belongs to ``user_id`` on ``platform``."""
@@ -99,6 +107,15 @@ class Transcription(Base):
     # Path to the audio file in S3
     audio_s3_path = Column(Text, nullable=False)
 
+    # SHA-256 of the file as uploaded, and of the decoded converted audio;
+    # a repeat upload with either one reuses audio_s3_path (utils/dedup.py)
+    source_sha256 = Column(String(64), nullable=True)
+    audio_sha256 = Column(String(64), nullable=True)
+
+    # When the object at audio_s3_path was uploaded; a reusing row copies it,
+    # so reuse is bounded by the object's age, not the row's
+    audio_uploaded_at = Column(DateTime, nullable=True)
+
     # Duration of the audio in seconds
     duration_seconds = Column(Integer, nullable=True)
 
@@ -121,9 +138,14 @@ class Transcription(Base):
     # Model used for transcription
     model = Column(String(64), nullable=True)
 
+    # Language a re-transcription was forced to (ISO code); Scribe only runs
+    # in Russian, so such a task is neither hedged nor challenged
+    language = Column(String(8), nullable=True)
+
     # Raw recognition result returned by the provider.
     # MEDIUMTEXT: WhisperX payloads with timestamps easily exceed the 64 KB TEXT limit.
-    result_json = Column(MEDIUMTEXT, nullable=True)
+    # Plain TEXT elsewhere, so SQLite snapshots can be built from the model.
+    result_json = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=True)
 
     # Token counts for transcribed text by encoding
     llm_tokens_by_encoding = Column(JSON, nullable=True)
@@ -156,6 +178,12 @@ class Transcription(Base):
         ),
         Index("idx_transcriptions_status", "status"),
         Index("idx_transcriptions_user_recent", "user_id", "user_platform", "id"),
+        # Covering: the first-completion check reads nothing but the index.
+        Index("idx_transcriptions_user_status", "user_id", "user_platform", "status", "is_shadow"),
+        # Recent tasks per provider for the routing estimates.
+        Index("idx_transcriptions_provider_started", "provider", "started_at"),
+        Index("idx_transcriptions_source_sha256", "source_sha256"),
+        Index("idx_transcriptions_audio_sha256", "audio_sha256"),
     )
 
 
@@ -190,7 +218,7 @@ class Refinement(Base):
 
     # Result text produced by the LLM.
     # MEDIUMTEXT: improved transcripts of long audio exceed the 64 KB TEXT limit.
-    result_text = Column(MEDIUMTEXT, nullable=True)
+    result_text = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=True)
 
     # LLM model used
     llm_model = Column(String(64), nullable=True)
@@ -211,7 +239,8 @@ class Refinement(Base):
             ["transcriptions.id"],
         ),
         Index("idx_refinements_status", "status"),
-        Index("idx_refinements_transcription_task", "transcription_id", "task_type"),
+        # Covering for has_refinement, which also filters on status.
+        Index("idx_refinements_transcription_task", "transcription_id", "task_type", "status"),
         Index("idx_refinements_user", "user_id", "user_platform"),
     )
 
@@ -268,3 +297,188 @@ class Payment(Base):
         Index("idx_payments_status_check", "status", "next_check_at"),
         Index("idx_payments_user_recent", "user_id", "user_platform", "id"),
     )
+
+
+class IngestJob(Base):
+    """Preparation of an uploaded file: download, conversion, S3 upload, pricing.
+
+    Persisted so a restart mid-ingest resumes from the last finished stage
+    instead of losing the upload (see schedulers/ingest.py).
+    """
+
+    __tablename__ = "ingest_jobs"
+
+    # Identifier of the ingest job; also names its working directory
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Platform user identifier
+    user_id = Column(BigInteger, nullable=False)
+
+    # Platform: "telegram" or "max"
+    user_platform = Column(String(16), nullable=False)
+
+    # Identifier of the user's message with the file
+    source_message_id = Column(String(64), nullable=False)
+
+    # Identifier of the "file received" acknowledgement, removed once the file is prepared
+    ack_message_id = Column(String(64), nullable=True)
+
+    # How to fetch the file again: Telegram file_id or Max attachment URL
+    source_ref = Column(Text, nullable=False)
+
+    # Original file name, already truncated and stripped of directories
+    file_name = Column(String(255), nullable=False)
+
+    # Last finished stage: "received" → "downloaded" → "converted" → "uploaded" → "priced"
+    stage = Column(String(16), nullable=False)
+
+    # "running" until the confirm message is sent ("completed") or the file is rejected ("failed")
+    status = Column(String(32), nullable=False)
+
+    # Duration of the media in seconds (known from "converted")
+    duration_seconds = Column(Integer, nullable=True)
+
+    # Mean volume of the converted audio in dB (known from "uploaded")
+    mean_volume_db = Column(Float, nullable=True)
+
+    # Path to the converted audio in S3 (known from "uploaded")
+    audio_s3_path = Column(Text, nullable=True)
+
+    # Pending transcription created for the file (known from "priced")
+    transcription_id = Column(Integer, nullable=True)
+
+    # Restarts the job was resumed after; gives up past utils.ingest.MAX_RESUME_ATTEMPTS
+    attempts = Column(Integer, nullable=False, default=0)
+
+    # Timestamp when the file was received
+    created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["user_id", "user_platform"],
+            ["users.user_id", "users.user_platform"],
+        ),
+        Index("idx_ingest_jobs_status", "status"),
+    )
+
+
+class TranscriptionChunk(Base):
+    """One piece of a long recording transcribed as its own prediction.
+
+    Cut at silences during ingest (see utils/chunking.py); the pieces of a
+    transcription run in parallel and are merged into one WhisperX result.
+    """
+
+    __tablename__ = "transcription_chunks"
+
+    # Identifier of the chunk
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Transcription the chunk belongs to
+    transcription_id = Column(Integer, nullable=False)
+
+    # Position of the chunk in the recording, from 0
+    chunk_index = Column(Integer, nullable=False)
+
+    # Where the chunk starts in the recording and how long it is, in seconds
+    offset_seconds = Column(Float, nullable=False)
+    duration_seconds = Column(Float, nullable=False)
+
+    # Path to the chunk's audio in S3
+    audio_s3_path = Column(Text, nullable=False)
+
+    # Replicate prediction ID of the current attempt
+    operation_id = Column(String(64), nullable=True)
+
+    # "pending" until started, then "running" → "completed" / "failed"
+    status = Column(String(32), nullable=False)
+
+    # Language the chunk was forced to, when it is not auto-detected
+    language = Column(String(8), nullable=True)
+
+    # Predictions started for the chunk
+    attempts = Column(Integer, nullable=False, default=0)
+
+    # Billed prediction time of the finished attempt, in seconds
+    predict_time = Column(Float, nullable=True)
+
+    # WhisperX output of the finished attempt, times relative to the chunk
+    result_json = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=True)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["transcription_id"],
+            ["transcriptions.id"],
+        ),
+        Index("idx_transcription_chunks_transcription", "transcription_id", "chunk_index"),
+    )
+
+
+class LandingStats(Base):
+    """Running totals behind the landing-page stats block, kept in a single row.
+
+    Transcriptions up to ``last_transcription_id`` are already folded in,
+    except the ``held_ids`` that were still unfinished; each refresh adds the
+    rows after the mark and the held ones that have finished since (see
+    queries.get_landing_stats).
+    """
+
+    __tablename__ = "landing_stats"
+
+    id = Column(Integer, primary_key=True)
+
+    # Highest transcription id folded into the totals
+    last_transcription_id = Column(Integer, nullable=False, default=0)
+
+    # Audio duration of completed transcriptions, in seconds
+    duration_seconds = Column(BigInteger, nullable=False, default=0)
+
+    # Number of completed and failed transcriptions
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+
+    # Pending or running transcriptions below the mark, to fold in once finished
+    held_ids = Column(JSON, nullable=True)
+
+
+class ArchiveMark(Base):
+    """How far the result archiver (schedulers/archive.py) has walked a table."""
+
+    __tablename__ = "archive_marks"
+
+    # Archived column, e.g. "transcriptions.result_json"
+    name = Column(String(64), primary_key=True)
+
+    # Highest row id already considered for archiving
+    last_id = Column(Integer, nullable=False, default=0)
+
+
+class MetricaHit(Base):
+    """Measurement Protocol hit waiting to be sent to Yandex.Metrica (utils/marketing.py)."""
+
+    __tablename__ = "metrica_outbox"
+
+    # Identifier of the hit
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Ad click identifier the conversion is attributed to
+    yclid = Column(String(64), nullable=False)
+
+    # Metrica goal, e.g. "telegram_paid"
+    goal = Column(String(64), nullable=False)
+
+    # Hit type: "pageview" or "event"
+    hit_type = Column(String(16), nullable=False)
+
+    # Unix time of the conversion, sent as the hit's event time
+    event_time = Column(Integer, nullable=False)
+
+    # Failed sends so far
+    attempts = Column(Integer, nullable=False, default=0)
+
+    # Earliest time of the next send
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+    __table_args__ = (
+        Index("idx_metrica_outbox_due", "next_attempt_at"),
+    )
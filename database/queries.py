@@ -1,49 +1,114 @@
 import json
+import threading
+import time
 
-from typing import Optional, Any
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Callable, NamedTuple, Optional
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from sqlalchemy import text, update
+from sqlalchemy import and_, case, delete, func, or_, text, update
 
 from database.connection import SessionLocal
 from database.models import (
-    User, Transcription, Payment, Refinement,
+    User, Transcription, TranscriptionChunk, Payment, Refinement, IngestJob, LandingStats, ArchiveMark, MetricaHit,
+    INGEST_STAGE_RECEIVED,
     STATUS_PENDING, STATUS_RUNNING, STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED,
     STATUS_EXPIRED,
 )
+from utils.metrics import timed_query
 from utils.utils import MoscowTimezone
 
 
+# Inserts keep the attributes they wrote instead of reloading the row after
+# commit; the primary key comes back with the INSERT itself. Columns filled by
+# a server default (created_at, registered_at) are not loaded on the returned
+# object — read the row again when they are needed.
+_KeepLoadedSession = partial(SessionLocal, expire_on_commit=False)
+
+
+def _update_where(model, condition, fields: dict[str, Any]) -> bool:
+    """Apply *fields* with one ``UPDATE … WHERE``; True if a row matched."""
+    if not fields:
+        return False
+    with SessionLocal() as session:
+        result = session.execute(update(model).where(condition).values(**fields))
+        session.commit()
+        return result.rowcount > 0
+
+
+@timed_query
 def ping_db() -> None:
     """Verify the database is reachable. Raises if the query fails."""
     with SessionLocal() as session:
         session.execute(text("SELECT 1"))
 
 
+@timed_query
 def add_user(user_id: int, platform: str, yclid: str | None = None) -> User:
     """Create and persist a new user."""
-    with SessionLocal() as session:
+    with _KeepLoadedSession() as session:
         user = User(user_id=user_id, user_platform=platform, yclid=yclid)
         session.add(user)
         session.commit()
-        session.refresh(user)
         return user
 
 
+# get_user runs at the top of nearly every handler. Its rows are cached for a
+# few seconds; every write to a user in this module drops the entry, so the
+# balance this process shows is always the committed one. A write from another
+# process (scripts/refund.py) shows within USER_CACHE_TTL_SECONDS.
+USER_CACHE_TTL_SECONDS = 30.0
+USER_CACHE_MAX_ENTRIES = 4096
+
+# (user_id, platform) -> (expires at, monotonic; user); least recently used first.
+_user_cache: "OrderedDict[tuple[int, str], tuple[float, User]]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+# Bumped by every invalidation, so a read that raced a write is not cached.
+_user_cache_epoch = 0
+
+
+def _forget_user(user_id: int, platform: str) -> None:
+    global _user_cache_epoch
+    with _user_cache_lock:
+        _user_cache.pop((user_id, platform), None)
+        _user_cache_epoch += 1
+
+
+@timed_query
 def get_user(user_id: int, platform: str) -> Optional[User]:
-    """Fetch a user by their platform identifier."""
+    """Fetch a user by their platform identifier (read through a short-lived cache)."""
+    key = (user_id, platform)
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(key)
+        if entry is not None and entry[0] > now:
+            _user_cache.move_to_end(key)
+            return entry[1]
+        epoch = _user_cache_epoch
+
     with SessionLocal() as session:
-        return (
+        user = (
             session.query(User)
             .filter(User.user_id == user_id, User.user_platform == platform)
             .one_or_none()
         )
 
+    if user is not None:
+        with _user_cache_lock:
+            if epoch == _user_cache_epoch:
+                _user_cache[key] = (now + USER_CACHE_TTL_SECONDS, user)
+                _user_cache.move_to_end(key)
+                while len(_user_cache) > USER_CACHE_MAX_ENTRIES:
+                    _user_cache.popitem(last=False)
+    return user
 
+
+@timed_query
 def change_user_balance(user_id: int, platform: str, delta: Decimal) -> User:
     """Add *delta* to user's balance and return updated user."""
-    with SessionLocal() as session:
+    with _KeepLoadedSession() as session:
         user = (
             session.query(User)
             .filter(User.user_id == user_id, User.user_platform == platform)
@@ -52,10 +117,11 @@ def change_user_balance(user_id: int, platform: str, delta: Decimal) -> User:
         )
         user.balance = (user.balance or Decimal("0")) + delta
         session.commit()
-        session.refresh(user)
-        return user
+    _forget_user(user_id, platform)
+    return user
 
 
+@timed_query
 def add_transcription(
     user_id: int,
     platform: str,
@@ -66,9 +132,12 @@ def add_transcription(
     mean_volume_db: float | None = None,
     price_for_user: Decimal | None = None,
     result_s3_path: str | None = None,
+    source_sha256: str | None = None,
+    audio_sha256: str | None = None,
+    audio_uploaded_at: datetime | None = None,
 ) -> Transcription:
     """Persist a new transcription history record."""
-    with SessionLocal() as session:
+    with _KeepLoadedSession() as session:
         history = Transcription(
             user_id=user_id,
             user_platform=platform,
@@ -79,13 +148,32 @@ def add_transcription(
             mean_volume_db=mean_volume_db,
             price_for_user=price_for_user,
             result_s3_path=result_s3_path,
+            source_sha256=source_sha256,
+            audio_sha256=audio_sha256,
+            audio_uploaded_at=audio_uploaded_at,
         )
         session.add(history)
         session.commit()
-        session.refresh(history)
         return history
 
 
+def _shadow_fields(task: Transcription, model: str, result_json: Any) -> dict[str, Any]:
+    return {
+        "user_id": task.user_id,
+        "user_platform": task.user_platform,
+        "status": STATUS_COMPLETED,
+        "is_shadow": True,
+        "audio_s3_path": task.audio_s3_path,
+        "duration_seconds": task.duration_seconds,
+        "mean_volume_db": task.mean_volume_db,
+        "provider": task.provider,
+        "model": model,
+        "result_json": result_json,
+        "operation_id": task.operation_id,
+    }
+
+
+@timed_query
 def add_shadow_transcription(task: Transcription, model: str, result_json: Any) -> Transcription:
     """Persist the losing result of a Scribe challenge as a shadow row.
 
@@ -93,74 +181,180 @@ def add_shadow_transcription(task: Transcription, model: str, result_json: Any)
     ``operation_id``; shadow rows carry no prices and are excluded from all
     user-facing queries and stats.
     """
-    with SessionLocal() as session:
-        shadow = Transcription(
-            user_id=task.user_id,
-            user_platform=task.user_platform,
-            status=STATUS_COMPLETED,
-            is_shadow=True,
-            audio_s3_path=task.audio_s3_path,
-            duration_seconds=task.duration_seconds,
-            mean_volume_db=task.mean_volume_db,
-            provider=task.provider,
-            model=model,
-            result_json=result_json,
-            operation_id=task.operation_id,
-        )
+    with _KeepLoadedSession() as session:
+        shadow = Transcription(**_shadow_fields(task, model, result_json))
         session.add(shadow)
         session.commit()
-        session.refresh(shadow)
         return shadow
 
 
+@timed_query
 def get_transcription(transcription_id: int) -> Optional[Transcription]:
     """Fetch a transcription history record by its identifier."""
     with SessionLocal() as session:
         return session.get(Transcription, transcription_id)
 
 
-def update_transcription(transcription_id: int, **fields: Any) -> Optional[Transcription]:
-    """Update fields of an existing transcription history record."""
-    if not fields:
-        return None
-    with SessionLocal() as session:
-        history = session.get(Transcription, transcription_id)
-        if history is None:
-            return None
-        for key, value in fields.items():
-            setattr(history, key, value)
-        session.commit()
-        session.refresh(history)
-        return history
+@timed_query
+def update_transcription(transcription_id: int, **fields: Any) -> bool:
+    """Update fields of an existing transcription history record; False if it does not exist."""
+    return _update_where(Transcription, Transcription.id == transcription_id, fields)
+
 
+def _same_content(source_sha256: str | None, audio_sha256: str | None):
+    conditions = []
+    if source_sha256:
+        conditions.append(Transcription.source_sha256 == source_sha256)
+    if audio_sha256:
+        conditions.append(Transcription.audio_sha256 == audio_sha256)
+    return or_(*conditions) if conditions else None
 
-def has_other_completed_transcription(user_id: int, platform: str, exclude_id: int) -> bool:
-    """True if the user has a completed transcription besides *exclude_id*.
 
-    Drives the one-shot ``*_first_transcription`` marketing goal: it must fire
-    only when the just-completed task is the user's first successful one.
+@timed_query
+def find_reusable_upload(
+    user_id: int, platform: str, *, source_sha256: str | None = None, audio_sha256: str | None = None,
+    since: datetime,
+) -> Optional[Transcription]:
+    """The user's latest transcription of the same content whose audio was uploaded after *since*.
+
+    Its audio_s3_path, duration and loudness are reused; *since* keeps the
+    S3 object clear of the source/ lifecycle expiry. The bound is on
+    audio_uploaded_at, which reusing rows copy, so a chain of repeat uploads
+    cannot keep handing out an ever older object. Only the user's own
+    uploads qualify: the object lives under their source/ prefix and the
+    delivered transcript is named after it.
     """
+    same_content = _same_content(source_sha256, audio_sha256)
+    if same_content is None:
+        return None
     with SessionLocal() as session:
         return (
-            session.query(Transcription.id)
+            session.query(Transcription)
+            .filter(
+                same_content,
+                Transcription.user_id == user_id,
+                Transcription.user_platform == platform,
+                Transcription.audio_uploaded_at >= since,
+            )
+            .order_by(Transcription.id.desc())
+            .first()
+        )
+
+
+@timed_query
+def find_completed_duplicate(
+    user_id: int, platform: str, *, source_sha256: str | None = None, audio_sha256: str | None = None
+) -> Optional[Transcription]:
+    """The user's latest completed transcription of the same content, if any."""
+    same_content = _same_content(source_sha256, audio_sha256)
+    if same_content is None:
+        return None
+    with SessionLocal() as session:
+        return (
+            session.query(Transcription)
             .filter(
+                same_content,
                 Transcription.user_id == user_id,
                 Transcription.user_platform == platform,
                 Transcription.status == STATUS_COMPLETED,
                 Transcription.is_shadow.is_(False),
-                Transcription.id != exclude_id,
+            )
+            .order_by(Transcription.id.desc())
+            .first()
+        )
+
+
+@timed_query
+def complete_transcription(transcription_id: int, **fields: Any) -> Optional[User]:
+    """Mark a transcription completed with *fields*, in one transaction.
+
+    Returns the owner if this is their first completed transcription — the
+    one-shot ``*_first_transcription`` marketing goal — otherwise ``None``.
+    """
+    with SessionLocal() as session:
+        task = session.get(Transcription, transcription_id)
+        if task is None:
+            return None
+        task.status = STATUS_COMPLETED
+        for key, value in fields.items():
+            setattr(task, key, value)
+        has_other = (
+            session.query(Transcription.id)
+            .filter(
+                Transcription.user_id == task.user_id,
+                Transcription.user_platform == task.user_platform,
+                Transcription.status == STATUS_COMPLETED,
+                Transcription.is_shadow.is_(False),
+                Transcription.id != transcription_id,
             )
             .first()
             is not None
         )
+        user_id, platform = task.user_id, task.user_platform
+        session.commit()
+        if has_other:
+            return None
+        # Read after the commit, so the owner is returned loaded rather than expired.
+        return (
+            session.query(User)
+            .filter(User.user_id == user_id, User.user_platform == platform)
+            .one_or_none()
+        )
+
+
+class TranscriptionWrites:
+    """Transcription updates and shadow rows of one scheduler tick, written together.
+
+    Instead of a session and commit per update, the poller
+    queues them here (per task, later fields win) and flush() writes them all
+    in one transaction at the end of the tick. A task's terminal transition
+    takes its queued fields along (take()), so its result and its new status
+    commit together; so does the operation_id of a Scribe prediction the
+    poller starts, which must not wait for the end of the tick.
+    """
+
+    def __init__(self) -> None:
+        self._fields: dict[int, dict[str, Any]] = {}
+        self._shadows: list[dict[str, Any]] = []
 
+    def update(self, transcription_id: int, **fields: Any) -> None:
+        self._fields.setdefault(transcription_id, {}).update(fields)
+
+    def add_shadow(self, task: Transcription, model: str, result_json: Any) -> None:
+        """Queue a shadow row, as add_shadow_transcription would write it."""
+        self._shadows.append(_shadow_fields(task, model, result_json))
+
+    def take(self, transcription_id: int, **fields: Any) -> dict[str, Any]:
+        """Unqueue the fields of *transcription_id*, with *fields* on top, for the caller to write."""
+        return {**self._fields.pop(transcription_id, {}), **fields}
+
+    def flush(self) -> None:
+        if self._fields or self._shadows:
+            flush_transcription_writes(self._fields, self._shadows)
+        self._fields = {}
+        self._shadows = []
+
+
+@timed_query
+def flush_transcription_writes(updates: dict[int, dict[str, Any]], shadows: list[dict[str, Any]]) -> None:
+    """Apply *updates* (fields by transcription id) and insert *shadows* in one transaction."""
+    with SessionLocal() as session:
+        if updates:
+            # ORM bulk UPDATE by primary key: rows with the same set of
+            # columns go to the driver as one executemany.
+            session.execute(update(Transcription), [{"id": tid, **fields} for tid, fields in updates.items()])
+        session.add_all(Transcription(**fields) for fields in shadows)
+        session.commit()
 
+
+@timed_query
 def claim_and_charge_transcription(
     transcription_id: int,
     started_at: datetime,
     model: str,
     message_id: str,
     price: Decimal,
+    provider: Optional[str] = None,
 ) -> str:
     """Atomically transition pending → running and charge the owner's balance.
 
@@ -170,7 +364,8 @@ def claim_and_charge_transcription(
 
     Returns "claimed" if this caller won; "not_pending" if the task already
     left pending (claimed by another click, or cancelled); "insufficient_funds"
-    if the balance is below *price* (the task stays pending).
+    if the balance is below *price* (the task stays pending). *provider*, if
+    given, replaces the one chosen at upload (utils/routing.py).
     """
     with SessionLocal() as session:
         task = (
@@ -196,11 +391,16 @@ def claim_and_charge_transcription(
         task.status = STATUS_RUNNING
         task.started_at = started_at
         task.model = model
+        if provider is not None:
+            task.provider = provider
         task.message_id = message_id
+        owner = (task.user_id, task.user_platform)
         session.commit()
-        return "claimed"
+    _forget_user(*owner)
+    return "claimed"
 
 
+@timed_query
 def cancel_transcription_if_pending(transcription_id: int) -> bool:
     """Atomically transition transcription pending → cancelled.
 
@@ -221,6 +421,7 @@ def cancel_transcription_if_pending(transcription_id: int) -> bool:
         return result.rowcount > 0
 
 
+@timed_query
 def expire_stale_pending_transcriptions(cutoff: datetime) -> int:
     """Mark never-started pending transcriptions created before *cutoff* as expired.
 
@@ -242,6 +443,7 @@ def expire_stale_pending_transcriptions(cutoff: datetime) -> int:
         return result.rowcount
 
 
+@timed_query
 def fail_transcription_and_refund(transcription_id: int, *, status: str = STATUS_FAILED, **fields: Any) -> bool:
     """Atomically mark a running transcription failed and refund its price.
 
@@ -275,10 +477,13 @@ def fail_transcription_and_refund(transcription_id: int, *, status: str = STATUS
                 .one()
             )
             user.balance = (user.balance or Decimal("0")) + task.price_for_user
+        owner = (task.user_id, task.user_platform)
         session.commit()
-        return True
+    _forget_user(*owner)
+    return True
 
 
+@timed_query
 def get_transcriptions_by_status(status: str) -> list[Transcription]:
     """Return all transcriptions with the specified *status*."""
     with SessionLocal() as session:
@@ -289,6 +494,7 @@ def get_transcriptions_by_status(status: str) -> list[Transcription]:
         )
 
 
+@timed_query
 def get_recent_transcriptions(user_id: int, platform: str, limit: int = 10) -> list[Transcription]:
     """Return recent transcriptions for the given user limited by *limit*."""
     with SessionLocal() as session:
@@ -305,6 +511,136 @@ def get_recent_transcriptions(user_id: int, platform: str, limit: int = 10) -> l
         )
 
 
+@timed_query
+def get_recent_provider_timings(provider: str, since: datetime, limit: int = 200) -> list:
+    """Timing columns of the latest *provider* tasks started after *since*, newest first.
+
+    Feeds the queue-wait estimates of utils/routing.py; result_json and the
+    other wide columns are not loaded.
+    """
+    with SessionLocal() as session:
+        return (
+            session.query(
+                Transcription.model,
+                Transcription.operation_id,
+                Transcription.duration_seconds,
+                Transcription.actual_price,
+                Transcription.started_at,
+                Transcription.finished_at,
+            )
+            .filter(
+                Transcription.provider == provider,
+                Transcription.is_shadow.is_(False),
+                Transcription.started_at >= since,
+            )
+            .order_by(Transcription.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+
+@timed_query
+def add_ingest_job(
+    user_id: int,
+    platform: str,
+    source_message_id: str,
+    source_ref: str,
+    file_name: str,
+    ack_message_id: str | None = None,
+) -> IngestJob:
+    """Persist a new running ingest job for a just-received file."""
+    with _KeepLoadedSession() as session:
+        job = IngestJob(
+            user_id=user_id,
+            user_platform=platform,
+            source_message_id=source_message_id,
+            ack_message_id=ack_message_id,
+            source_ref=source_ref,
+            file_name=file_name,
+            stage=INGEST_STAGE_RECEIVED,
+            status=STATUS_RUNNING,
+            attempts=0,
+        )
+        session.add(job)
+        session.commit()
+        return job
+
+
+@timed_query
+def update_ingest_job(job_id: int, **fields: Any) -> bool:
+    """Update fields of an existing ingest job; False if it does not exist."""
+    return _update_where(IngestJob, IngestJob.id == job_id, fields)
+
+
+@timed_query
+def get_ingest_jobs_by_status(status: str) -> list[IngestJob]:
+    """Return all ingest jobs with the specified *status*, oldest first."""
+    with SessionLocal() as session:
+        return (
+            session.query(IngestJob)
+            .filter(IngestJob.status == status)
+            .order_by(IngestJob.id)
+            .all()
+        )
+
+
+@timed_query
+def add_transcription_chunks(transcription_id: int, chunks: list[dict]) -> None:
+    """Record the pieces a long recording was cut into, in order.
+
+    Each item carries ``offset_seconds``, ``duration_seconds`` and
+    ``audio_s3_path``; the pieces start out pending.
+    """
+    with SessionLocal() as session:
+        session.add_all(
+            TranscriptionChunk(
+                transcription_id=transcription_id,
+                chunk_index=index,
+                offset_seconds=chunk["offset_seconds"],
+                duration_seconds=chunk["duration_seconds"],
+                audio_s3_path=chunk["audio_s3_path"],
+                status=STATUS_PENDING,
+                attempts=0,
+            )
+            for index, chunk in enumerate(chunks)
+        )
+        session.commit()
+
+
+@timed_query
+def copy_transcription_chunks(source_id: int, target_id: int) -> None:
+    """Give *target_id* the same pieces as *source_id*, for a transcription of the same audio."""
+    chunks = get_transcription_chunks(source_id)
+    if chunks:
+        add_transcription_chunks(target_id, [
+            {
+                "offset_seconds": chunk.offset_seconds,
+                "duration_seconds": chunk.duration_seconds,
+                "audio_s3_path": chunk.audio_s3_path,
+            }
+            for chunk in chunks
+        ])
+
+
+@timed_query
+def get_transcription_chunks(transcription_id: int) -> list[TranscriptionChunk]:
+    """Return the pieces of a transcription in recording order."""
+    with SessionLocal() as session:
+        return (
+            session.query(TranscriptionChunk)
+            .filter(TranscriptionChunk.transcription_id == transcription_id)
+            .order_by(TranscriptionChunk.chunk_index)
+            .all()
+        )
+
+
+@timed_query
+def update_transcription_chunk(chunk_id: int, **fields: Any) -> bool:
+    """Update fields of an existing transcription chunk; False if it does not exist."""
+    return _update_where(TranscriptionChunk, TranscriptionChunk.id == chunk_id, fields)
+
+
+@timed_query
 def create_refinement(
     transcription_id: int,
     user_id: int,
@@ -313,7 +649,7 @@ def create_refinement(
     task_type: str = "summarize",
 ) -> Refinement:
     """Persist a new refinement record in pending state."""
-    with SessionLocal() as session:
+    with _KeepLoadedSession() as session:
         record = Refinement(
             transcription_id=transcription_id,
             user_id=user_id,
@@ -324,21 +660,22 @@ def create_refinement(
         )
         session.add(record)
         session.commit()
-        session.refresh(record)
         return record
 
 
+@timed_query
 def get_refinement(refinement_id: int) -> Optional[Refinement]:
     """Fetch a refinement record by its identifier."""
     with SessionLocal() as session:
         return session.get(Refinement, refinement_id)
 
 
+@timed_query
 def has_refinement(transcription_id: int, task_type: str) -> bool:
     """Return True if a non-failed refinement of the given type exists for the transcription."""
     with SessionLocal() as session:
         return (
-            session.query(Refinement)
+            session.query(Refinement.id)
             .filter(
                 Refinement.transcription_id == transcription_id,
                 Refinement.task_type == task_type,
@@ -348,6 +685,7 @@ def has_refinement(transcription_id: int, task_type: str) -> bool:
         ) is not None
 
 
+@timed_query
 def get_refinements_by_status(status: str) -> list[Refinement]:
     """Return all refinements with the specified *status*."""
     with SessionLocal() as session:
@@ -358,21 +696,13 @@ def get_refinements_by_status(status: str) -> list[Refinement]:
         )
 
 
-def update_refinement(refinement_id: int, **fields: Any) -> Optional[Refinement]:
-    """Update fields of an existing refinement record."""
-    if not fields:
-        return None
-    with SessionLocal() as session:
-        record = session.get(Refinement, refinement_id)
-        if record is None:
-            return None
-        for key, value in fields.items():
-            setattr(record, key, value)
-        session.commit()
-        session.refresh(record)
-        return record
+@timed_query
+def update_refinement(refinement_id: int, **fields: Any) -> bool:
+    """Update fields of an existing refinement record; False if it does not exist."""
+    return _update_where(Refinement, Refinement.id == refinement_id, fields)
 
 
+@timed_query
 def create_payment(
     user_id: int,
     platform: str,
@@ -384,7 +714,7 @@ def create_payment(
     description: str,
     tinkoff_response: dict,
 ) -> Payment:
-    with SessionLocal() as session:
+    with _KeepLoadedSession() as session:
         topup = Payment(
             user_id=user_id,
             user_platform=platform,
@@ -398,10 +728,10 @@ def create_payment(
         )
         session.add(topup)
         session.commit()
-        session.refresh(topup)
         return topup
 
 
+@timed_query
 def get_recent_payments(user_id: int, platform: str, limit: int = 5) -> list[Payment]:
     with SessionLocal() as session:
         return (
@@ -413,6 +743,7 @@ def get_recent_payments(user_id: int, platform: str, limit: int = 5) -> list[Pay
         )
 
 
+@timed_query
 def get_payments_by_status(status: str) -> list[Payment]:
     """Return all payments with the specified *status*."""
     with SessionLocal() as session:
@@ -423,71 +754,97 @@ def get_payments_by_status(status: str) -> list[Payment]:
         )
 
 
-def get_payments_due_for_check() -> list[Payment]:
-    """Return NEW payments whose next_check_at is past."""
+@timed_query
+def claim_due_payments(next_check_at: Callable[[Payment], datetime]) -> list[Payment]:
+    """Reserve every NEW payment whose next_check_at is past, and return them.
+
+    The due rows are locked with SKIP LOCKED, so two workers never claim the
+    same payment, and all of them move to ``next_check_at(payment)`` in one
+    UPDATE.
+    """
     now = datetime.now(MoscowTimezone)
-    with SessionLocal() as session:
-        return (
+    with _KeepLoadedSession() as session:
+        due = (
             session.query(Payment)
-            .filter(
-                Payment.status == "NEW",
-                Payment.next_check_at <= now,
-            )
+            .filter(Payment.status == "NEW", Payment.next_check_at <= now)
+            .order_by(Payment.id)
+            .with_for_update(skip_locked=True)
             .all()
         )
-
-
-def claim_payment_for_check(order_id: str, next_check_at: datetime) -> bool:
-    """Atomically reserve a payment for checking.
-
-    Sets next_check_at only when the row is still NEW and still due.
-    Returns True if this caller won the slot; False if another worker already did.
-    """
-    now = datetime.now(MoscowTimezone)
-    with SessionLocal() as session:
-        result = session.execute(
-            update(Payment)
-            .where(
-                Payment.order_id == order_id,
-                Payment.status == "NEW",
-                Payment.next_check_at <= now,
+        if due:
+            session.execute(
+                update(Payment)
+                .where(Payment.id.in_([payment.id for payment in due]))
+                .values(next_check_at=case({payment.id: next_check_at(payment) for payment in due}, value=Payment.id))
+                .execution_options(synchronize_session=False)
             )
-            .values(next_check_at=next_check_at)
-        )
         session.commit()
-        return result.rowcount > 0
+        return due
+
 
+class ConfirmedPayment(NamedTuple):
+    user: User
+    # The owner's first confirmed payment ever, counting the rest of the batch.
+    first: bool
 
-def confirm_payment(order_id: str, payment_status: str) -> tuple[bool, Optional[User]]:
-    """Atomically transition payment NEW→paid and credit user balance in one transaction.
 
-    Uses SELECT FOR UPDATE so only one caller (scheduler or button handler) can win the race.
-    Returns (True, updated_user) if this caller performed the transition;
-    (False, None) if the payment was already handled by someone else.
+@timed_query
+def confirm_payments(statuses: dict[str, str]) -> dict[str, ConfirmedPayment]:
+    """Move NEW payments to their *statuses* (by order id) and credit the users, in one transaction.
+
+    Rows are locked with SELECT FOR UPDATE, so only one caller can credit a
+    payment. Returns the refreshed owner of every payment this caller
+    confirmed, and whether it was the owner's first; payments already handled
+    elsewhere are left out.
     """
+    if not statuses:
+        return {}
     with SessionLocal() as session:
-        payment = (
+        payments = (
             session.query(Payment)
-            .filter(Payment.order_id == order_id, Payment.status == "NEW")
-            .with_for_update()
-            .one_or_none()
-        )
-        if payment is None:
-            return False, None
-
-        payment.status = payment_status
-        user = (
-            session.query(User)
-            .filter(User.user_id == payment.user_id, User.user_platform == payment.user_platform)
+            .filter(Payment.order_id.in_(statuses), Payment.status == "NEW")
+            .order_by(Payment.id)
             .with_for_update()
-            .one()
+            .all()
         )
-        user.balance = (user.balance or Decimal("0")) + payment.amount
+        if not payments:
+            return {}
+
+        credits: dict[tuple[int, str], Decimal] = {}
+        owners = {}
+        for payment in payments:
+            payment.status = statuses[payment.order_id]
+            owner = (payment.user_id, payment.user_platform)
+            credits[owner] = credits.get(owner, Decimal("0")) + payment.amount
+            owners[payment.order_id] = owner
+        # Users are locked in a fixed order, so two batches cannot deadlock.
+        users = {}
+        # total_topped_up before this batch: a user with none gets their first
+        # payment here, the one with the lowest id.
+        first_orders = set()
+        for owner in sorted(credits):
+            user = (
+                session.query(User)
+                .filter(User.user_id == owner[0], User.user_platform == owner[1])
+                .with_for_update()
+                .one()
+            )
+            if not user.total_topped_up:
+                first_orders.add(next(payment.order_id for payment in payments if (payment.user_id, payment.user_platform) == owner))
+            user.balance = (user.balance or Decimal("0")) + credits[owner]
+            users[owner] = user
         session.commit()
-        session.refresh(user)
-        return True, user
+        # total_topped_up is maintained by a trigger, so the users are read back.
+        for user in users.values():
+            session.refresh(user)
+    for owner in users:
+        _forget_user(*owner)
+    return {
+        order_id: ConfirmedPayment(users[owner], order_id in first_orders) for order_id, owner in owners.items()
+    }
 
 
+@timed_query
 def expire_payment(order_id: str) -> bool:
     """Set payment status to EXPIRED only if it is still NEW.
 
@@ -504,6 +861,7 @@ def expire_payment(order_id: str) -> bool:
         return result.rowcount > 0
 
 
+@timed_query
 def cancel_payment_record(order_id: str) -> bool:
     """Set payment status to CANCELED only if it is still NEW.
 
@@ -520,6 +878,7 @@ def cancel_payment_record(order_id: str) -> bool:
         return result.rowcount > 0
 
 
+@timed_query
 def fail_payment_record(order_id: str, status: str) -> bool:
     """Move a still-NEW payment to a terminal failure *status* reported by Tinkoff.
 
@@ -536,44 +895,222 @@ def fail_payment_record(order_id: str, status: str) -> bool:
         return result.rowcount > 0
 
 
+@timed_query
 def get_payment_by_order_id(order_id: str) -> Optional[Payment]:
     with SessionLocal() as session:
         return session.query(Payment).filter(Payment.order_id == order_id).one_or_none()
 
 
-def update_payment(order_id: str, **fields: Any) -> Optional[Payment]:
-    if not fields:
-        return None
+@timed_query
+def update_payment(order_id: str, **fields: Any) -> bool:
+    """Update fields of the payment with *order_id*; False if there is none."""
+    return _update_where(Payment, Payment.order_id == order_id, fields)
+
 
+def _archive_mark_name(column) -> str:
+    return f"{column.class_.__tablename__}.{column.key}"
+
+
+@timed_query
+def get_archivable_results(column, cutoff: datetime, limit: int) -> tuple[list[tuple[int, Optional[str]]], Optional[int]]:
+    """The next rows whose *column* (e.g. ``Transcription.result_json``) may be archived.
+
+    Walks the table by primary key from the column's archive mark, at most
+    *limit* rows, and stops at the first one created after *cutoff*. Returns
+    the ``(id, payload)`` pairs and the id to move the mark to, ``None`` when
+    there is nothing new to walk over.
+    """
+    model = column.class_
+    cutoff = cutoff.replace(tzinfo=None)
     with SessionLocal() as session:
-        topup = session.query(Payment).filter(Payment.order_id == order_id).first()
-        if topup is None:
-            return None
-        for key, value in fields.items():
-            setattr(topup, key, value)
+        mark = session.get(ArchiveMark, _archive_mark_name(column))
+        rows = (
+            session.query(model.id, model.created_at)
+            .filter(model.id > (mark.last_id if mark else 0))
+            .order_by(model.id)
+            .limit(limit)
+            .all()
+        )
+        ids = []
+        for row in rows:
+            if row.created_at.replace(tzinfo=None) >= cutoff:
+                break
+            ids.append(row.id)
+        if not ids:
+            return [], None
+        payloads = (
+            session.query(model.id, column)
+            .filter(model.id.in_(ids), column.is_not(None))
+            .order_by(model.id)
+            .all()
+        )
+        return [(row_id, payload) for row_id, payload in payloads], ids[-1]
+
+
+@timed_query
+def save_archived_results(column, pointers: dict[int, str], last_id: int) -> None:
+    """Replace archived payloads of *column* with their *pointers* and move the mark to *last_id*."""
+    model = column.class_
+    with SessionLocal() as session:
+        if pointers:
+            session.execute(update(model), [{"id": row_id, column.key: pointer} for row_id, pointer in pointers.items()])
+        name = _archive_mark_name(column)
+        mark = session.get(ArchiveMark, name)
+        if mark is None:
+            session.add(ArchiveMark(name=name, last_id=last_id))
+        else:
+            mark.last_id = last_id
         session.commit()
-        session.refresh(topup)
-        return topup
 
 
+# Pending tasks expire after a week (schedulers/expire_pending.py): a
+# transcription still pending or running after this long is stuck and is
+# no longer waited for.
+_LANDING_STATS_SETTLE = timedelta(days=8)
+# Rows younger than this wait for the next refresh, so one whose neighbour
+# with a lower id has not been committed yet is not passed over.
+_LANDING_STATS_FRESH = timedelta(minutes=1)
+
+
+@timed_query
 def get_landing_stats() -> dict[str, int]:
-    """Aggregate counts and total duration for the landing-page stats block."""
-    with SessionLocal() as session:
-        row = session.execute(
-            text(
-                """
-                SELECT
-                    COALESCE(SUM(CASE WHEN status = :completed THEN duration_seconds END), 0) AS sec,
-                    SUM(CASE WHEN status = :completed THEN 1 ELSE 0 END) AS completed,
-                    SUM(CASE WHEN status = :failed    THEN 1 ELSE 0 END) AS failed
-                FROM transcriptions
-                WHERE is_shadow = 0
-                """
-            ),
-            {"completed": STATUS_COMPLETED, "failed": STATUS_FAILED},
-        ).one()
-        return {
-            "duration_seconds": int(row.sec or 0),
-            "completed": int(row.completed or 0),
-            "failed": int(row.failed or 0),
+    """Aggregate counts and total duration for the landing-page stats block.
+
+    The totals live in landing_stats. Each call folds in the transcriptions
+    after its high-water mark and moves the mark past them; the ones still
+    pending or running are held back by id and folded in by a later call,
+    once they finish. A refresh costs the rows added since the last one
+    plus the few held back, rather than a scan of the whole table.
+    """
+    now = datetime.now(MoscowTimezone)
+    unfinished = Transcription.status.in_((STATUS_PENDING, STATUS_RUNNING))
+    with SessionLocal() as session:
+        stats = session.get(LandingStats, 1, with_for_update=True)
+        if stats is None:
+            stats = LandingStats(
+                id=1, last_transcription_id=0, duration_seconds=0, completed=0, failed=0, held_ids=[],
+            )
+            session.add(stats)
+        after = stats.last_transcription_id
+
+        held = []
+        if stats.held_ids:
+            rows = (
+                session.query(
+                    Transcription.id, Transcription.status, Transcription.duration_seconds, Transcription.created_at,
+                )
+                .filter(Transcription.id.in_(stats.held_ids))
+                .all()
+            )
+            for row in rows:
+                if row.status in (STATUS_PENDING, STATUS_RUNNING):
+                    if row.created_at >= (now - _LANDING_STATS_SETTLE).replace(tzinfo=None):
+                        held.append(row.id)
+                elif row.status == STATUS_COMPLETED:
+                    stats.duration_seconds += row.duration_seconds or 0
+                    stats.completed += 1
+                elif row.status == STATUS_FAILED:
+                    stats.failed += 1
+
+        fresh = (
+            session.query(func.min(Transcription.id))
+            .filter(Transcription.id > after, Transcription.created_at >= now - _LANDING_STATS_FRESH)
+            .scalar()
+        )
+        counted = Transcription.is_shadow.is_(False)
+        completed = and_(counted, Transcription.status == STATUS_COMPLETED)
+        query = (
+            session.query(
+                func.max(Transcription.id),
+                func.sum(case((completed, func.coalesce(Transcription.duration_seconds, 0)), else_=0)),
+                func.sum(case((completed, 1), else_=0)),
+                func.sum(case((and_(counted, Transcription.status == STATUS_FAILED), 1), else_=0)),
+            )
+            .filter(Transcription.id > after)
+        )
+        if fresh is not None:
+            query = query.filter(Transcription.id < fresh)
+        last_id, seconds, completed_count, failed_count = query.one()
+
+        if last_id is not None:
+            held += [
+                row_id for row_id, in session.query(Transcription.id).filter(
+                    Transcription.id > after,
+                    Transcription.id <= last_id,
+                    counted,
+                    unfinished,
+                    Transcription.created_at >= now - _LANDING_STATS_SETTLE,
+                )
+            ]
+            stats.last_transcription_id = last_id
+            stats.duration_seconds += int(seconds or 0)
+            stats.completed += int(completed_count or 0)
+            stats.failed += int(failed_count or 0)
+        stats.held_ids = held
+        totals = {
+            "duration_seconds": stats.duration_seconds,
+            "completed": stats.completed,
+            "failed": stats.failed,
         }
+        session.commit()
+        return totals
+
+
+@timed_query
+def add_metrica_hits(hits: list[dict[str, Any]]) -> None:
+    """Queue Measurement Protocol *hits* (MetricaHit column values) in the outbox."""
+    with SessionLocal() as session:
+        session.add_all([MetricaHit(**hit) for hit in hits])
+        session.commit()
+
+
+@timed_query
+def claim_metrica_hits(limit: int, lease: timedelta) -> list[MetricaHit]:
+    """Reserve up to *limit* due outbox hits for *lease*, and return them.
+
+    As in claim_due_payments, SKIP LOCKED keeps two workers off the same hits;
+    hits of a worker that died mid-send fall due again once the lease ends.
+    A goal's pageview and event fall due together until the first send, and
+    ties go in queue order, so the pageview is never claimed after its event.
+    """
+    now = datetime.now(MoscowTimezone)
+    with _KeepLoadedSession() as session:
+        due = (
+            session.query(MetricaHit)
+            .filter(MetricaHit.next_attempt_at <= now)
+            .order_by(MetricaHit.next_attempt_at, MetricaHit.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if due:
+            session.execute(
+                update(MetricaHit)
+                .where(MetricaHit.id.in_([hit.id for hit in due]))
+                .values(next_attempt_at=now + lease)
+                .execution_options(synchronize_session=False)
+            )
+        session.commit()
+        return due
+
+
+@timed_query
+def finish_metrica_hits(done: list[int], retry_at: dict[int, datetime]) -> None:
+    """Drop the *done* hits from the outbox and reschedule the rest at *retry_at*, in one transaction."""
+    with SessionLocal() as session:
+        if done:
+            session.execute(delete(MetricaHit).where(MetricaHit.id.in_(done)))
+        if retry_at:
+            session.execute(
+                update(MetricaHit)
+                .where(MetricaHit.id.in_(list(retry_at)))
+                .values(attempts=MetricaHit.attempts + 1, next_attempt_at=case(retry_at, value=MetricaHit.id))
+                .execution_options(synchronize_session=False)
+            )
+        session.commit()
+
+
+@timed_query
+def count_metrica_hits() -> int:
+    with SessionLocal() as session:
+        return session.query(func.count(MetricaHit.id)).scalar()
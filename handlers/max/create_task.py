@@ -5,7 +5,7 @@ from datetime import datetime
 
 import aiomax
 
-from database.models import PLATFORM_MAX, is_owner, STATUS_EXPIRED
+from database.models import PLATFORM_MAX, PROVIDER_REPLICATE, is_owner, STATUS_EXPIRED
 from database.queries import (
     claim_and_charge_transcription,
     fail_transcription_and_refund,
@@ -13,6 +13,7 @@ from database.queries import (
     get_user,
     update_transcription,
 )
+from utils.routing import choose_route
 from utils.utils import format_duration, MoscowTimezone
 from utils.transcription import start_transcription, get_model_name
 from utils.sentry import sentry_bind_user_max, sentry_transaction
@@ -45,10 +46,14 @@ async def handle_max_create_task(callback: aiomax.Callback, bot: aiomax.Bot) ->
 
     price_for_user = Decimal(task.price_for_user or 0)
     now = datetime.now(MoscowTimezone)
+    provider = task.provider
     model = get_model_name(task.provider, task.duration_seconds)
+    if provider == PROVIDER_REPLICATE:
+        route = choose_route(task.duration_seconds, task.mean_volume_db, task.id)
+        provider, model = route.provider, route.model
 
     outcome = claim_and_charge_transcription(
-        task.id, now, model, str(message_id), price_for_user
+        task.id, now, model, str(message_id), price_for_user, provider
     )
     if outcome == "not_pending":
         if task.status == STATUS_EXPIRED:
@@ -71,9 +76,11 @@ async def handle_max_create_task(callback: aiomax.Callback, bot: aiomax.Bot) ->
 
     operation_id = await start_transcription(
         task.audio_s3_path,
-        provider=task.provider,
+        provider=provider,
         duration_seconds=task.duration_seconds,
         mean_volume_db=task.mean_volume_db,
+        transcription_id=task.id,
+        model=model,
     )
     if not operation_id:
         fail_transcription_and_refund(task.id)
@@ -3,26 +3,39 @@ import asyncio
 import logging
 import math
 import mimetypes
-import tempfile
 import time
 import aiomax
 
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from database.models import PLATFORM_MAX, PROVIDER_REPLICATE, STATUS_PENDING
-from database.queries import add_transcription, add_user, get_user, update_transcription
+from database.models import (
+    PLATFORM_MAX, PROVIDER_REPLICATE, STATUS_COMPLETED, STATUS_PENDING,
+    INGEST_STAGE_CONVERTED, INGEST_STAGE_DOWNLOADED, INGEST_STAGE_PRICED, INGEST_STAGE_UPLOADED,
+)
+from database.queries import (
+    add_transcription, add_transcription_chunks, add_user, copy_transcription_chunks,
+    find_completed_duplicate, get_user, update_transcription,
+)
 from handlers.max.rate_transcription import _awaiting_feedback
 
 import providers.speechkit as speechkit_provider
-import providers.replicate as replicate_provider
-
-from utils.ffmpeg import convert_to_ogg, get_conversion_progress, get_mean_volume, get_media_duration
-from utils.max_download import download_max_file
+import utils.chunking as chunking
+import utils.dedup as dedup
+import utils.ingest as ingest
+
+from utils.ffmpeg import (
+    STREAMABLE_HEAD_BYTES, analyze_audio, convert_to_ogg, get_conversion_progress, get_media_duration, is_streamable,
+)
+from utils.max_download import DownloadProgress, download_max_file, iter_downloaded, wait_for_head
 from utils.s3 import upload_file
 from utils.tg import is_supported_mime, sanitize_filename, truncate_filename
 from utils.utils import format_duration, MAX_AUDIO_DURATION, MIN_PRICE_RUB
 from utils.sentry import sentry_bind_user_max, sentry_transaction
-from messengers.max import make_confirm_keyboard, make_topup_amounts_keyboard, safe_delete_message, safe_edit_message, safe_send_message
+from messengers.max import (
+    make_confirm_keyboard, make_send_as_text_keyboard, make_topup_amounts_keyboard,
+    safe_delete_message, safe_edit_message, safe_send_message,
+)
 
 
 # Files below this prepare in seconds — staged progress would only flicker.
@@ -42,19 +55,18 @@ def download_estimate_minutes(size_bytes: int) -> int:
     return max(1, math.ceil(size_bytes / 1_000_000 / 10 / 60))
 
 
-async def _download_ticker(bot, message_id, local_path: Path, expected_size: int) -> None:
+async def _download_ticker(bot, message_id, progress: DownloadProgress, expected_size: int) -> None:
     started = time.time()
     last_text = None
     while True:
         await asyncio.sleep(TICKER_INTERVAL)
-        try:
-            size = local_path.stat().st_size
-        except OSError:
-            continue  # the download has not created the file yet
-        percent = min(99, int(size * 100 / expected_size))
+        # Segments are written in place into a preallocated file, so its size
+        # says nothing; count the bytes the downloader actually received.
+        size = progress.received
+        percent = min(99, int(size * 100 / (progress.total or expected_size)))
         if percent <= 0:
             continue
-        eta = max(0.0, (expected_size - size) / (size / (time.time() - started)))
+        eta = max(0.0, ((progress.total or expected_size) - size) / (size / (time.time() - started)))
         text = (
             f"📥 Скачиваю файл… {percent}%\n\n"
             f"Осталось примерно {format_duration(int(eta))}"
@@ -65,6 +77,28 @@ async def _download_ticker(bot, message_id, local_path: Path, expected_size: int
         await safe_edit_message(bot, message_id, text)
 
 
+def _read_head(path: Path) -> bytes:
+    with path.open("rb") as f:
+        return f.read(STREAMABLE_HEAD_BYTES)
+
+
+@asynccontextmanager
+async def _workdir(job):
+    """ingest.workdir plus a list of tasks to cancel once the block is left, however it is left.
+
+    The tasks are awaited before the job directory is removed or failed, so
+    no download is still writing into it and no ffmpeg is still being killed.
+    """
+    tasks = []
+    with ingest.workdir(job) as (in_dir, out_dir):
+        try:
+            yield in_dir, out_dir, tasks
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def _conversion_ticker(bot, message_id, progress_path, duration: float) -> None:
     started = time.time()
     while True:
@@ -160,22 +194,45 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
         )
         return
 
-    with tempfile.TemporaryDirectory() as workdir:
-        workdir = Path(workdir)
-        in_dir = workdir / "in"
-        out_dir = workdir / "out"
-        in_dir.mkdir()
-        out_dir.mkdir()
-
+    # Persisted so a restart mid-ingest resumes instead of losing the upload
+    # (schedulers/ingest.py); the attachment URL lets the resumer fetch it again.
+    job = ingest.start_job(
+        user_id=user_id,
+        platform=PLATFORM_MAX,
+        source_message_id=str(message.body.message_id),
+        source_ref=file_url,
+        file_name=file_name,
+        ack_message_id=str(ack.body.message_id),
+    )
+    async with _workdir(job) as (in_dir, out_dir, background):
         local_path = in_dir / file_name
+        safe_stem = sanitize_filename(Path(file_name).stem)
+        ogg_path = out_dir / f"{safe_stem}.ogg"
+        progress_path = out_dir / f"{safe_stem}.progress"
 
+        progress = DownloadProgress()
         download_ticker = None
         if show_progress:
             download_ticker = asyncio.create_task(
-                _download_ticker(bot, ack.body.message_id, local_path, file_size)
+                _download_ticker(bot, ack.body.message_id, progress, file_size)
             )
+        early_conversion = None
         try:
-            downloaded = await download_max_file(file_url, local_path)
+            download = asyncio.create_task(download_max_file(file_url, local_path, progress))
+            background.append(download)
+            # A big streamable file starts converting while it downloads: ffmpeg
+            # reads it through a pipe as the downloader completes it. Anything
+            # else (moov-at-end MP4s) converts from the finished file below.
+            if (
+                await wait_for_head(progress, STREAMABLE_HEAD_BYTES)
+                and progress.total > PROGRESS_THRESHOLD_BYTES
+                and is_streamable(_read_head(local_path))
+            ):
+                early_conversion = asyncio.create_task(convert_to_ogg(
+                    local_path, ogg_path, progress_path, feed=iter_downloaded(local_path, progress),
+                ))
+                background.append(early_conversion)
+            downloaded = await download
         finally:
             # Await the cancellation so no in-flight ticker edit can land after
             # the next stage text.
@@ -194,6 +251,7 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
                 chat_id=chat_id,
             )
             return
+        ingest.advance(job, INGEST_STAGE_DOWNLOADED)
 
         if not show_progress:
             # Max attachments do not always carry a size — fall back to the
@@ -227,49 +285,60 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
         # prepared, and a topup prompt follows the confirm message below.
         needs_topup = user.balance < price_for_user
 
-        safe_stem = sanitize_filename(Path(file_name).stem)
-        ogg_name = f"{safe_stem}.ogg"
-        ogg_path = out_dir / ogg_name
-        progress_path = out_dir / f"{safe_stem}.progress"
-
-        ticker = None
-        if show_progress:
-            await safe_edit_message(bot, ack.body.message_id, "🎬 Извлекаю аудиодорожку…")
-            ticker = asyncio.create_task(
-                _conversion_ticker(bot, ack.body.message_id, progress_path, duration)
-            )
-        try:
-            convert_error = await convert_to_ogg(local_path, ogg_path, progress_path)
-        finally:
-            # Await the cancellation so no in-flight ticker edit can land after
-            # the next stage text (or after the tempdir is gone).
-            if ticker is not None:
-                ticker.cancel()
-                try:
-                    await ticker
-                except asyncio.CancelledError:
-                    pass
-                except Exception:
-                    logging.exception("Conversion progress ticker failed")
-        if convert_error:
-            if convert_error == "no_audio_stream":
-                error_text = (
-                    "❌ В этом файле не обнаружено аудио\n\n"
-                    "Пожалуйста, отправьте файл со звуком"
-                )
-            elif convert_error == "moov_atom_not_found":
-                error_text = (
-                    "❌ Файл повреждён — запись была прервана и не сохранена до конца\n\n"
-                    "Попробуйте записать снова"
+        # A file seen before skips conversion and the S3 upload altogether.
+        source_sha256 = await dedup.file_sha256(local_path)
+        reused = dedup.find_reusable(user_id, PLATFORM_MAX, source_sha256=source_sha256)
+        audio_sha256 = None
+        chunks = None
+
+        if reused is None:
+            ticker = None
+            if show_progress:
+                await safe_edit_message(bot, ack.body.message_id, "🎬 Извлекаю аудиодорожку…")
+                ticker = asyncio.create_task(
+                    _conversion_ticker(bot, ack.body.message_id, progress_path, duration)
                 )
-            else:
-                error_text = (
-                    "❌ Не удалось обработать файл\n\n"
-                    "Возможно, он имеет неподдерживаемый формат"
-                )
-            await safe_send_message(bot, error_text, chat_id=chat_id)
-            await upload_file(local_path, f"error/{user_id}/{message.body.message_id}_{local_path.name}")
-            return
+            try:
+                if early_conversion is not None:
+                    convert_error = await early_conversion
+                    # Read through a pipe, ffmpeg cannot seek back: should it
+                    # have skipped anything, the output comes out short.
+                    if convert_error or abs(await get_media_duration(ogg_path) - duration) > 2.0:
+                        logging.info("Early conversion of %s unusable, converting the whole file", file_name)
+                        early_conversion = None
+                if early_conversion is None:
+                    convert_error = await convert_to_ogg(local_path, ogg_path, progress_path)
+            finally:
+                # Await the cancellation so no in-flight ticker edit can land after
+                # the next stage text (or after the tempdir is gone).
+                if ticker is not None:
+                    ticker.cancel()
+                    try:
+                        await ticker
+                    except asyncio.CancelledError:
+                        pass
+                    except Exception:
+                        logging.exception("Conversion progress ticker failed")
+            if convert_error:
+                if convert_error == "no_audio_stream":
+                    error_text = (
+                        "❌ В этом файле не обнаружено аудио\n\n"
+                        "Пожалуйста, отправьте файл со звуком"
+                    )
+                elif convert_error == "moov_atom_not_found":
+                    error_text = (
+                        "❌ Файл повреждён — запись была прервана и не сохранена до конца\n\n"
+                        "Попробуйте записать снова"
+                    )
+                else:
+                    error_text = (
+                        "❌ Не удалось обработать файл\n\n"
+                        "Возможно, он имеет неподдерживаемый формат"
+                    )
+                await safe_send_message(bot, error_text, chat_id=chat_id)
+                await upload_file(local_path, f"error/{user_id}/{message.body.message_id}_{local_path.name}")
+                return
+            ingest.advance(job, INGEST_STAGE_CONVERTED, duration_seconds=int(duration))
 
         try:
             if local_path.exists():
@@ -277,20 +346,35 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
         except Exception:
             logging.exception("Could not remove original file %s", local_path)
 
-        if show_progress:
-            await safe_edit_message(bot, ack.body.message_id, "✨ Почти готово…")
-
-        mean_volume_db = await get_mean_volume(ogg_path)
-
-        object_name = f"source/{user_id}/{message.body.message_id}_{ogg_path.name}"
-        s3_url = await upload_file(ogg_path, object_name)
-        if not s3_url:
-            await safe_send_message(bot,
-                "❌ Не удалось загрузить файл\n\n"
-                "Пожалуйста, попробуйте ещё раз чуть позже",
-                chat_id=chat_id,
-            )
-            return
+        if reused is None:
+            if show_progress:
+                await safe_edit_message(bot, ack.body.message_id, "✨ Почти готово…")
+
+            mean_volume_db, audio_sha256 = await analyze_audio(ogg_path)
+            # Same audio in a different container.
+            reused = dedup.find_reusable(user_id, PLATFORM_MAX, audio_sha256=audio_sha256)
+
+        if reused is not None:
+            logging.info("Reusing the audio of transcription %s for a repeat upload", reused.id)
+            mean_volume_db = reused.mean_volume_db
+            s3_url = reused.audio_s3_path
+            audio_sha256 = audio_sha256 or reused.audio_sha256
+        else:
+            object_name = f"source/{user_id}/{message.body.message_id}_{ogg_path.name}"
+            s3_url = await upload_file(ogg_path, object_name)
+            if not s3_url:
+                await safe_send_message(bot,
+                    "❌ Не удалось загрузить файл\n\n"
+                    "Пожалуйста, попробуйте ещё раз чуть позже",
+                    chat_id=chat_id,
+                )
+                return
+            if chunking.is_eligible(duration):
+                chunks = await chunking.prepare(ogg_path, out_dir, duration, object_name.removesuffix(".ogg"))
+        ingest.advance(
+            job, INGEST_STAGE_UPLOADED,
+            duration_seconds=int(duration), mean_volume_db=mean_volume_db, audio_s3_path=s3_url,
+        )
 
     history = add_transcription(
         user_id=user_id,
@@ -302,23 +386,20 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
         mean_volume_db=mean_volume_db,
         price_for_user=price_for_user,
         result_s3_path=None,
+        source_sha256=source_sha256,
+        audio_sha256=audio_sha256,
+        audio_uploaded_at=dedup.uploaded_at(reused),
     )
+    # Long recordings are transcribed in pieces (utils/chunking.py); a reused
+    # upload shares the earlier one's pieces along with its audio.
+    if chunks:
+        add_transcription_chunks(history.id, chunks)
+    elif reused is not None:
+        copy_transcription_chunks(reused.id, history.id)
+    ingest.advance(job, INGEST_STAGE_PRICED, transcription_id=history.id)
 
     keyboard = make_confirm_keyboard(history.id)
-
-    hint = "\n\n💡 Бот лучше всего работает с записями от 5 минут" if duration < 300 else ""
-    quiet_warning = (
-        "\n\n⚠️ Запись тихая — возможна потеря фрагментов. "
-        "Лучше перезаписать громче или ближе к микрофону"
-        if mean_volume_db is not None and mean_volume_db < replicate_provider.QUIET_MEAN_VOLUME_DB
-        else ""
-    )
-    details = (
-        f"Длительность: {duration_str}\n"
-        f"Стоимость: {price_for_user} ₽"
-        f"{quiet_warning}"
-        f"{hint}"
-    )
+    details = ingest.prepared_details(duration, price_for_user, mean_volume_db)
     confirm_msg = await safe_send_message(bot,
         f"<b>🎧 Аудио подготовлено</b>\n\n{details}",
         chat_id=chat_id,
@@ -332,6 +413,7 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
             chat_id=chat_id,
             keyboard=keyboard,
         )
+    ingest.finish(job, STATUS_COMPLETED)
 
     if confirm_msg is None:
         return
@@ -341,6 +423,18 @@ async def handle_max_file(message: aiomax.Message, bot: aiomax.Bot) -> None:
     # The confirm message carries all the info — the staged ack is now clutter.
     await safe_delete_message(bot, ack.body.message_id)
 
+    earlier = find_completed_duplicate(
+        user_id, PLATFORM_MAX, source_sha256=source_sha256, audio_sha256=audio_sha256
+    )
+    if earlier is not None:
+        await safe_send_message(bot,
+            dedup.DUPLICATE_OFFER_TEXT,
+            chat_id=chat_id,
+            keyboard=make_send_as_text_keyboard(
+                earlier.id, show_improve=False, show_timecodes=earlier.provider == PROVIDER_REPLICATE
+            ),
+        )
+
     if needs_topup:
         await safe_send_message(bot,
             f"⚠️ На балансе не хватает средств\n\n"
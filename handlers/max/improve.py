@@ -1,4 +1,5 @@
 """Handler for the 'Оформить текст' callback on Max messenger."""
+import asyncio
 import logging
 
 import aiomax
@@ -43,7 +44,7 @@ async def handle_max_improve(callback: aiomax.Callback, bot: aiomax.Bot) -> None
     if duration > SUMMARIZE_THRESHOLD:
         remaining_keyboard = make_summarize_keyboard(transcription_id, show_summarize=show_summarize, show_improve=False, show_timecodes=show_timecodes)
     else:
-        text = get_result_text(transcription.provider, transcription.result_json) or ""
+        text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json) or ""
         remaining_keyboard = make_send_as_text_keyboard(transcription_id, show_send_as_text=len(text) > INLINE_MAX_CHARS, show_improve=False, show_timecodes=show_timecodes)
     await safe_edit_message(bot, message_id, callback.message.body.text or "", keyboard=remaining_keyboard)
 
@@ -13,7 +13,7 @@ from database.models import (
     STATUS_RUNNING,
     is_owner,
 )
-from database.queries import add_transcription, get_transcription, update_transcription
+from database.queries import add_transcription, copy_transcription_chunks, get_transcription, update_transcription
 
 from messengers.max import (
     make_language_other_keyboard,
@@ -113,6 +113,7 @@ async def handle_max_retranscribe(callback: aiomax.Callback, bot: aiomax.Bot) ->
         mean_volume_db=source.mean_volume_db,
         price_for_user=Decimal("0"),
     )
+    copy_transcription_chunks(source.id, retry.id)
 
     operation_id = await start_transcription(
         source.audio_s3_path,
@@ -120,6 +121,7 @@ async def handle_max_retranscribe(callback: aiomax.Callback, bot: aiomax.Bot) ->
         duration_seconds=source.duration_seconds,
         mean_volume_db=source.mean_volume_db,
         language=language,
+        transcription_id=retry.id,
     )
     if not operation_id:
         update_transcription(retry.id, status=STATUS_FAILED, finished_at=now)
@@ -138,6 +140,7 @@ async def handle_max_retranscribe(callback: aiomax.Callback, bot: aiomax.Bot) ->
         model=model,
         message_id=str(message_id),
         operation_id=operation_id,
+        language=language,
     )
 
     language_name = RETRY_LANGUAGE_NAMES.get(language, language)
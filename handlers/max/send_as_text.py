@@ -1,4 +1,5 @@
 """Handler for the 'Send as text' button on short transcriptions (Max messenger)."""
+import asyncio
 import logging
 
 import aiomax
@@ -30,7 +31,7 @@ async def handle_max_send_as_text(callback: aiomax.Callback, bot: aiomax.Bot) ->
     if not is_owner(transcription, user_id, PLATFORM_MAX):
         return
 
-    text = get_result_text(transcription.provider, transcription.result_json)
+    text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json)
     if not text:
         logging.warning("Max send_as_text: no result text for transcription %s", transcription_id)
         chat_id = callback.message.recipient.chat_id
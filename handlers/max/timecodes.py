@@ -1,6 +1,9 @@
 """Handlers for the 'С таймкодами' callbacks on Max messenger."""
+import asyncio
 import logging
 
+import utils.timecodes_cache as timecodes_cache
+
 from pathlib import Path
 
 import aiomax
@@ -22,12 +25,12 @@ from messengers.max import (
 )
 
 
-def _restore_main_keyboard(transcription):
+async def _restore_main_keyboard(transcription):
     show_summarize = not has_refinement(transcription.id, "summarize")
     show_improve = not has_refinement(transcription.id, "improve")
     if (transcription.duration_seconds or 0) > SUMMARIZE_THRESHOLD:
         return make_summarize_keyboard(transcription.id, show_summarize=show_summarize, show_improve=show_improve, show_timecodes=True)
-    text = get_result_text(transcription.provider, transcription.result_json) or ""
+    text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json) or ""
     show_send_as_text = len(text) > INLINE_MAX_CHARS
     return make_send_as_text_keyboard(transcription.id, show_send_as_text=show_send_as_text, show_improve=show_improve, show_timecodes=True)
 
@@ -73,7 +76,7 @@ async def handle_max_timecodes_back(callback: aiomax.Callback, bot: aiomax.Bot)
         return
 
     message_id = callback.message.body.message_id
-    await safe_edit_message(bot, message_id, callback.message.body.text or "", keyboard=_restore_main_keyboard(transcription))
+    await safe_edit_message(bot, message_id, callback.message.body.text or "", keyboard=await _restore_main_keyboard(transcription))
 
 
 @sentry_bind_user_max
@@ -98,30 +101,36 @@ async def handle_max_timecodes_format(callback: aiomax.Callback, bot: aiomax.Bot
     formatter_entry = FORMATTERS.get(fmt)
     if formatter_entry is None:
         return
-    formatter, extension = formatter_entry
+    _, extension = formatter_entry
 
     chat_id = callback.message.recipient.chat_id
     message_id = callback.message.body.message_id
 
-    payload = parse_result_json(transcription.result_json)
-    if payload is None:
-        await safe_send_message(bot, "❌ Не удалось получить таймкоды для этой расшифровки", chat_id=chat_id)
-        return
+    # Rendered files are cached per format, so the second and third format
+    # taps skip re-parsing result_json entirely.
+    version = timecodes_cache.version_of(transcription.result_json)
+    data = timecodes_cache.get(transcription_id, fmt, version)
+    if data is None:
+        payload = await asyncio.to_thread(parse_result_json, transcription.result_json)
+        if payload is None:
+            await safe_send_message(bot, "❌ Не удалось получить таймкоды для этой расшифровки", chat_id=chat_id)
+            return
 
-    segments = extract_segments(payload)
-    if not segments:
-        await safe_send_message(bot, "❌ В этой расшифровке нет данных с таймкодами", chat_id=chat_id)
-        return
+        segments = extract_segments(payload)
+        if not segments:
+            await safe_send_message(bot, "❌ В этой расшифровке нет данных с таймкодами", chat_id=chat_id)
+            return
+
+        data = timecodes_cache.put_segments(transcription_id, version, segments)[fmt]
 
-    text = formatter(segments)
     stem = Path(transcription.audio_s3_path or "transcript").stem
     encoded = stem.encode("utf-8")[:240]
     stem = encoded.decode("utf-8", errors="ignore") or "transcript"
     filename = f"{stem}.{extension}"
 
-    sent = await safe_send_document(bot, chat_id, text.encode("utf-8"), filename, "")
+    sent = await safe_send_document(bot, chat_id, data, filename, "")
     if sent is None:
         await safe_send_message(bot, "❌ Не удалось отправить файл", chat_id=chat_id)
         return
 
-    await safe_edit_message(bot, message_id, callback.message.body.text or "", keyboard=_restore_main_keyboard(transcription))
+    await safe_edit_message(bot, message_id, callback.message.body.text or "", keyboard=await _restore_main_keyboard(transcription))
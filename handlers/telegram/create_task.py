@@ -4,7 +4,7 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from database.models import PLATFORM_TELEGRAM, is_owner, STATUS_EXPIRED
+from database.models import PLATFORM_TELEGRAM, PROVIDER_REPLICATE, is_owner, STATUS_EXPIRED
 from database.queries import (
     claim_and_charge_transcription,
     fail_transcription_and_refund,
@@ -14,6 +14,7 @@ from database.queries import (
 )
 
 from messengers.telegram import make_topup_amounts_keyboard, safe_edit_message_text, safe_query_answer, safe_reply_text
+from utils.routing import choose_route
 from utils.sentry import sentry_bind_user, sentry_transaction
 from utils.utils import format_duration, MoscowTimezone
 from utils.transcription import start_transcription, get_model_name
@@ -41,10 +42,14 @@ async def handle_create_task(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     price_for_user = Decimal(task.price_for_user or 0)
     now = datetime.now(MoscowTimezone)
+    provider = task.provider
     model = get_model_name(task.provider, task.duration_seconds)
+    if provider == PROVIDER_REPLICATE:
+        route = choose_route(task.duration_seconds, task.mean_volume_db, task.id)
+        provider, model = route.provider, route.model
 
     outcome = claim_and_charge_transcription(
-        task.id, now, model, str(query.message.message_id), price_for_user
+        task.id, now, model, str(query.message.message_id), price_for_user, provider
     )
     if outcome == "not_pending":
         if task.status == STATUS_EXPIRED:
@@ -67,9 +72,11 @@ async def handle_create_task(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     operation_id = await start_transcription(
         task.audio_s3_path,
-        provider=task.provider,
+        provider=provider,
         duration_seconds=task.duration_seconds,
         mean_volume_db=task.mean_volume_db,
+        transcription_id=task.id,
+        model=model,
     )
     if not operation_id:
         fail_transcription_and_refund(task.id)
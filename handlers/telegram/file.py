@@ -2,26 +2,34 @@ import asyncio
 import math
 import os
 import logging
-import tempfile
 import time
 
 import providers.speechkit as speechkit_provider
-import providers.replicate as replicate_provider
+import utils.chunking as chunking
+import utils.dedup as dedup
+import utils.ingest as ingest
 
 from pathlib import Path
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
-from database.models import PLATFORM_TELEGRAM, PROVIDER_REPLICATE, STATUS_PENDING
-from database.queries import add_transcription, add_user, get_user
-
-from utils.ffmpeg import convert_to_ogg, get_conversion_progress, get_mean_volume, get_media_duration
+from database.models import (
+    PLATFORM_TELEGRAM, PROVIDER_REPLICATE, STATUS_COMPLETED, STATUS_PENDING,
+    INGEST_STAGE_CONVERTED, INGEST_STAGE_DOWNLOADED, INGEST_STAGE_PRICED, INGEST_STAGE_UPLOADED,
+)
+from database.queries import (
+    add_transcription, add_transcription_chunks, add_user, copy_transcription_chunks, find_completed_duplicate, get_user,
+)
+from utils.bot_api_watch import DownloadWatcher, get_watcher
+from utils.ffmpeg import analyze_audio, convert_to_ogg, get_conversion_progress, get_media_duration
 from utils.s3 import upload_file
 from utils.sentry import sentry_bind_user, sentry_transaction
 from utils.tg import ANCHOR, is_supported_mime, sanitize_filename, truncate_filename, extract_local_path
 from utils.utils import format_duration, MAX_AUDIO_DURATION, MIN_PRICE_RUB
-from messengers.telegram import make_topup_amounts_keyboard, safe_delete_message, safe_edit_message, safe_reply_text
+from messengers.telegram import (
+    make_send_as_text_keyboard, make_topup_amounts_keyboard, safe_delete_message, safe_edit_message, safe_reply_text,
+)
 
 
 USE_LOCAL_PTB = os.environ.get("USE_LOCAL_PTB") is not None
@@ -52,42 +60,22 @@ def download_estimate_minutes(size_bytes: int) -> int:
     return max(1, math.ceil(size_bytes / 1_000_000 / 10 / 60))
 
 
-async def _download_ticker(bot, chat_id, message_id, watch_root: Path, baseline: set, expected_size: int) -> None:
-    """Poll the bot-api working dir and report download progress.
+async def _download_ticker(
+    bot, chat_id, message_id, watcher: DownloadWatcher, file_unique_id: str, expected_size: int,
+) -> None:
+    """Report progress of the file the local bot-api server is fetching for us.
 
-    getFile gives no progress signal, so this watches for a new file growing
-    under the local bot-api directory and assumes it is ours. If several new
-    files grow at once (parallel downloads), attribution is impossible — keep
-    the static text rather than risk showing someone else's progress.
+    getFile gives no progress signal; the shared watcher (utils/bot_api_watch.py)
+    knows which file under the bot-api directory is ours, also when several
+    downloads run at once.
     """
     started = time.time()
-    sizes = {}
-    matched = None
     last_text = None
     while True:
         await asyncio.sleep(TICKER_INTERVAL)
-        if matched is None:
-            try:
-                fresh = {p for p in watch_root.glob("*/*") if p.is_file()} - baseline
-            except OSError:
-                continue
-            growing = []
-            for path in fresh:
-                try:
-                    size = path.stat().st_size
-                except OSError:
-                    continue
-                if size > sizes.get(path, -1):
-                    growing.append(path)
-                sizes[path] = size
-            if len(growing) != 1:
-                continue  # nothing new yet, or several candidates — cannot attribute
-            matched = growing[0]
-            logging.info("Download progress: tracking %s", matched.name)
-        try:
-            size = matched.stat().st_size
-        except OSError:
-            return  # the file moved away — bot-api is finalizing the download
+        size = watcher.received(file_unique_id)
+        if not size:
+            continue  # bot-api has not started writing our file yet
         percent = min(99, int(size * 100 / expected_size))
         if percent <= 0:
             continue
@@ -152,15 +140,12 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     show_progress = show_progress and ack is not None
 
     download_ticker = None
-    if show_progress and USE_LOCAL_PTB:
-        watch_root = Path(ANCHOR) / context.bot.token
-        try:
-            baseline = {p for p in watch_root.glob("*/*") if p.is_file()}
-            download_ticker = context.application.create_task(
-                _download_ticker(context.bot, ack.chat_id, ack.message_id, watch_root, baseline, file_size)
-            )
-        except OSError:
-            logging.exception("Could not snapshot bot-api dir for download progress")
+    watcher = get_watcher(Path(ANCHOR) / context.bot.token) if show_progress and USE_LOCAL_PTB else None
+    if watcher is not None:
+        watcher.expect(incoming.file_unique_id, file_size)
+        download_ticker = context.application.create_task(
+            _download_ticker(context.bot, ack.chat_id, ack.message_id, watcher, incoming.file_unique_id, file_size)
+        )
 
     try:
         file = None
@@ -212,6 +197,8 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 pass
             except Exception:
                 logging.exception("Download progress ticker failed")
+        if watcher is not None:
+            watcher.forget(incoming.file_unique_id)
 
     if not is_supported_mime(mime):
         await safe_reply_text(
@@ -221,14 +208,18 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
         return
 
-    with tempfile.TemporaryDirectory() as workdir:
-        workdir = Path(workdir)
-        in_dir = workdir / "in"
-        out_dir = workdir / "out"
-        in_dir.mkdir()
-        out_dir.mkdir()
-
-        local_path = in_dir / truncate_filename(Path(file_name).name)
+    # Persisted so a restart mid-ingest resumes instead of losing the upload
+    # (schedulers/ingest.py); the file_id lets the resumer fetch it again.
+    job = ingest.start_job(
+        user_id=user_id,
+        platform=PLATFORM_TELEGRAM,
+        source_message_id=str(message.message_id),
+        source_ref=file.file_id,
+        file_name=truncate_filename(Path(file_name).name),
+        ack_message_id=str(ack.message_id) if ack is not None else None,
+    )
+    with ingest.workdir(job) as (in_dir, out_dir):
+        local_path = in_dir / job.file_name
 
         try:
             if USE_LOCAL_PTB:
@@ -244,6 +235,7 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 "Пожалуйста, попробуйте ещё раз"
             )
             return
+        ingest.advance(job, INGEST_STAGE_DOWNLOADED)
 
         duration = await get_media_duration(local_path)
         if not duration:
@@ -269,52 +261,60 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         # prepared, and a topup prompt follows the confirm message below.
         needs_topup = user.balance < price_for_user
 
-        safe_stem = sanitize_filename(local_path.stem)
+        # A file seen before skips conversion and the S3 upload altogether.
+        source_sha256 = await dedup.file_sha256(local_path)
+        reused = dedup.find_reusable(user_id, PLATFORM_TELEGRAM, source_sha256=source_sha256)
+        audio_sha256 = None
+        chunks = None
 
-        ogg_name = f"{safe_stem}.ogg"
-        ogg_path = out_dir / ogg_name
+        if reused is None:
+            safe_stem = sanitize_filename(local_path.stem)
 
-        progress_name = f"{safe_stem}.progress"
-        progress_path = out_dir / progress_name
+            ogg_name = f"{safe_stem}.ogg"
+            ogg_path = out_dir / ogg_name
 
-        ticker = None
-        if show_progress:
-            await safe_edit_message(context.bot, ack.chat_id, ack.message_id, "🎬 Извлекаю аудиодорожку…")
-            ticker = context.application.create_task(
-                _conversion_ticker(context.bot, ack.chat_id, ack.message_id, progress_path, duration)
-            )
-        try:
-            convert_error = await convert_to_ogg(local_path, ogg_path, progress_path)
-        finally:
-            # Await the cancellation so no in-flight ticker edit can land after
-            # the next stage text (or after the tempdir is gone).
-            if ticker is not None:
-                ticker.cancel()
-                try:
-                    await ticker
-                except asyncio.CancelledError:
-                    pass
-                except Exception:
-                    logging.exception("Conversion progress ticker failed")
-        if convert_error:
-            if convert_error == "no_audio_stream":
-                error_text = (
-                    "❌ В этом файле не обнаружено аудио\n\n"
-                    "Пожалуйста, отправьте файл со звуком"
-                )
-            elif convert_error == "moov_atom_not_found":
-                error_text = (
-                    "❌ Файл повреждён — запись была прервана и не сохранена до конца\n\n"
-                    "Попробуйте записать снова"
-                )
-            else:
-                error_text = (
-                    "❌ Не удалось обработать файл\n\n"
-                    "Возможно, он имеет неподдерживаемый формат"
+            progress_name = f"{safe_stem}.progress"
+            progress_path = out_dir / progress_name
+
+            ticker = None
+            if show_progress:
+                await safe_edit_message(context.bot, ack.chat_id, ack.message_id, "🎬 Извлекаю аудиодорожку…")
+                ticker = context.application.create_task(
+                    _conversion_ticker(context.bot, ack.chat_id, ack.message_id, progress_path, duration)
                 )
-            await safe_reply_text(message, error_text)
-            await upload_file(local_path, f"error/{user_id}/{message.message_id}_{local_path.name}")
-            return
+            try:
+                convert_error = await convert_to_ogg(local_path, ogg_path, progress_path)
+            finally:
+                # Await the cancellation so no in-flight ticker edit can land after
+                # the next stage text (or after the tempdir is gone).
+                if ticker is not None:
+                    ticker.cancel()
+                    try:
+                        await ticker
+                    except asyncio.CancelledError:
+                        pass
+                    except Exception:
+                        logging.exception("Conversion progress ticker failed")
+            if convert_error:
+                if convert_error == "no_audio_stream":
+                    error_text = (
+                        "❌ В этом файле не обнаружено аудио\n\n"
+                        "Пожалуйста, отправьте файл со звуком"
+                    )
+                elif convert_error == "moov_atom_not_found":
+                    error_text = (
+                        "❌ Файл повреждён — запись была прервана и не сохранена до конца\n\n"
+                        "Попробуйте записать снова"
+                    )
+                else:
+                    error_text = (
+                        "❌ Не удалось обработать файл\n\n"
+                        "Возможно, он имеет неподдерживаемый формат"
+                    )
+                await safe_reply_text(message, error_text)
+                await upload_file(local_path, f"error/{user_id}/{message.message_id}_{local_path.name}")
+                return
+            ingest.advance(job, INGEST_STAGE_CONVERTED, duration_seconds=int(duration))
 
         try:
             real_path = local_path.resolve()
@@ -323,20 +323,35 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         except Exception:
             logging.exception("Could not remove original file %s", local_path)
 
-        if show_progress:
-            await safe_edit_message(context.bot, ack.chat_id, ack.message_id, "✨ Почти готово…")
+        if reused is None:
+            if show_progress:
+                await safe_edit_message(context.bot, ack.chat_id, ack.message_id, "✨ Почти готово…")
 
-        mean_volume_db = await get_mean_volume(ogg_path)
+            mean_volume_db, audio_sha256 = await analyze_audio(ogg_path)
+            # Same audio in a different container.
+            reused = dedup.find_reusable(user_id, PLATFORM_TELEGRAM, audio_sha256=audio_sha256)
 
-        object_name = f"source/{user_id}/{message.message_id}_{ogg_path.name}"
-        s3_url = await upload_file(ogg_path, object_name)
-        if not s3_url:
-            await safe_reply_text(
-                message,
-                "❌ Не удалось загрузить файл\n\n"
-                "Пожалуйста, попробуйте ещё раз чуть позже"
-            )
-            return
+        if reused is not None:
+            logging.info("Reusing the audio of transcription %s for a repeat upload", reused.id)
+            mean_volume_db = reused.mean_volume_db
+            s3_url = reused.audio_s3_path
+            audio_sha256 = audio_sha256 or reused.audio_sha256
+        else:
+            object_name = f"source/{user_id}/{message.message_id}_{ogg_path.name}"
+            s3_url = await upload_file(ogg_path, object_name)
+            if not s3_url:
+                await safe_reply_text(
+                    message,
+                    "❌ Не удалось загрузить файл\n\n"
+                    "Пожалуйста, попробуйте ещё раз чуть позже"
+                )
+                return
+            if chunking.is_eligible(duration):
+                chunks = await chunking.prepare(ogg_path, out_dir, duration, object_name.removesuffix(".ogg"))
+        ingest.advance(
+            job, INGEST_STAGE_UPLOADED,
+            duration_seconds=int(duration), mean_volume_db=mean_volume_db, audio_s3_path=s3_url,
+        )
 
     history = add_transcription(
         user_id=user_id,
@@ -348,7 +363,17 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         mean_volume_db=mean_volume_db,
         price_for_user=price_for_user,
         result_s3_path=None,
+        source_sha256=source_sha256,
+        audio_sha256=audio_sha256,
+        audio_uploaded_at=dedup.uploaded_at(reused),
     )
+    # Long recordings are transcribed in pieces (utils/chunking.py); a reused
+    # upload shares the earlier one's pieces along with its audio.
+    if chunks:
+        add_transcription_chunks(history.id, chunks)
+    elif reused is not None:
+        copy_transcription_chunks(reused.id, history.id)
+    ingest.advance(job, INGEST_STAGE_PRICED, transcription_id=history.id)
 
     buttons = [
         InlineKeyboardButton(
@@ -359,28 +384,31 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         ),
     ]
 
-    hint = "\n\n💡 Бот лучше всего работает с записями от 5 минут" if duration < 300 else ""
-    quiet_warning = (
-        "\n\n⚠️ Запись тихая — возможна потеря фрагментов. "
-        "Лучше перезаписать громче или ближе к микрофону"
-        if mean_volume_db is not None and mean_volume_db < replicate_provider.QUIET_MEAN_VOLUME_DB
-        else ""
-    )
     confirm = await safe_reply_text(
         message,
         "<b>🎧 Аудио подготовлено</b>\n\n"
-        f"Длительность: {duration_str}\n"
-        f"Стоимость: {price_for_user} ₽"
-        f"{quiet_warning}"
-        f"{hint}",
+        f"{ingest.prepared_details(duration, price_for_user, mean_volume_db)}",
         reply_markup=InlineKeyboardMarkup([buttons]),
         parse_mode="HTML",
     )
+    ingest.finish(job, STATUS_COMPLETED)
 
     if confirm is not None and ack is not None:
         # The confirm message carries all the info — the staged ack is now clutter.
         await safe_delete_message(context.bot, ack.chat_id, ack.message_id)
 
+    earlier = find_completed_duplicate(
+        user_id, PLATFORM_TELEGRAM, source_sha256=source_sha256, audio_sha256=audio_sha256
+    )
+    if earlier is not None:
+        await safe_reply_text(
+            message,
+            dedup.DUPLICATE_OFFER_TEXT,
+            reply_markup=make_send_as_text_keyboard(
+                earlier.id, show_improve=False, show_timecodes=earlier.provider == PROVIDER_REPLICATE
+            ),
+        )
+
     if needs_topup:
         await safe_reply_text(
             message,
@@ -1,4 +1,6 @@
 """Handler for the 'Оформить текст' button on completed transcriptions."""
+import asyncio
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
@@ -35,7 +37,7 @@ async def handle_improve(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if duration > SUMMARIZE_THRESHOLD:
         remaining_keyboard = make_summarize_keyboard(transcription_id, show_summarize=show_summarize, show_improve=False, show_timecodes=show_timecodes)
     else:
-        text = get_result_text(transcription.provider, transcription.result_json) or ""
+        text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json) or ""
         remaining_keyboard = make_send_as_text_keyboard(transcription_id, show_send_as_text=len(text) > INLINE_MAX_CHARS, show_improve=False, show_timecodes=show_timecodes)
     await safe_edit_message_reply_markup(query, reply_markup=remaining_keyboard)
     msg = await safe_reply_text(
@@ -13,7 +13,7 @@ from database.models import (
     STATUS_RUNNING,
     is_owner,
 )
-from database.queries import add_transcription, get_transcription, update_transcription
+from database.queries import add_transcription, copy_transcription_chunks, get_transcription, update_transcription
 
 from messengers.telegram import (
     make_language_other_keyboard,
@@ -91,6 +91,7 @@ async def handle_retranscribe(update: Update, context: ContextTypes.DEFAULT_TYPE
         mean_volume_db=source.mean_volume_db,
         price_for_user=Decimal("0"),
     )
+    copy_transcription_chunks(source.id, retry.id)
 
     operation_id = await start_transcription(
         source.audio_s3_path,
@@ -98,6 +99,7 @@ async def handle_retranscribe(update: Update, context: ContextTypes.DEFAULT_TYPE
         duration_seconds=source.duration_seconds,
         mean_volume_db=source.mean_volume_db,
         language=language,
+        transcription_id=retry.id,
     )
     if not operation_id:
         update_transcription(retry.id, status=STATUS_FAILED, finished_at=now)
@@ -115,6 +117,7 @@ async def handle_retranscribe(update: Update, context: ContextTypes.DEFAULT_TYPE
         model=model,
         message_id=str(query.message.message_id),
         operation_id=operation_id,
+        language=language,
     )
 
     language_name = RETRY_LANGUAGE_NAMES.get(language, language)
@@ -49,7 +49,7 @@ async def handle_send_as_text(update: Update, context: ContextTypes.DEFAULT_TYPE
     if not is_owner(transcription, query.from_user.id, PLATFORM_TELEGRAM):
         return
 
-    text = get_result_text(transcription.provider, transcription.result_json)
+    text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json)
     if not text:
         logging.warning("send_as_text: no result text for transcription %s", transcription_id)
         await safe_reply_text(query.message, "❌ Не удалось получить текст")
@@ -49,7 +49,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if user is None:
         user = add_user(user_id, PLATFORM_TELEGRAM, yclid=yclid)
         if yclid:
-            context.application.create_task(track_goal(yclid, "telegram_startbot"))
+            track_goal(yclid, "telegram_startbot")
 
     balance = Decimal(user.balance or 0)
     duration_str = available_time_by_balance(balance)
@@ -1,6 +1,9 @@
 """Handlers for the 'С таймкодами' button on completed Replicate transcriptions."""
+import asyncio
 import logging
 
+import utils.timecodes_cache as timecodes_cache
+
 from pathlib import Path
 
 from telegram import InputFile, Update
@@ -23,12 +26,12 @@ from messengers.telegram import (
 )
 
 
-def _restore_main_keyboard(transcription):
+async def _restore_main_keyboard(transcription):
     show_summarize = not has_refinement(transcription.id, "summarize")
     show_improve = not has_refinement(transcription.id, "improve")
     if (transcription.duration_seconds or 0) > SUMMARIZE_THRESHOLD:
         return make_summarize_keyboard(transcription.id, show_summarize=show_summarize, show_improve=show_improve, show_timecodes=True)
-    text = get_result_text(transcription.provider, transcription.result_json) or ""
+    text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json) or ""
     show_send_as_text = len(text) > INLINE_MAX_CHARS
     return make_send_as_text_keyboard(transcription.id, show_send_as_text=show_send_as_text, show_improve=show_improve, show_timecodes=True)
 
@@ -64,7 +67,7 @@ async def handle_timecodes_back(update: Update, context: ContextTypes.DEFAULT_TY
     if not is_owner(transcription, query.from_user.id, PLATFORM_TELEGRAM):
         return
 
-    await safe_edit_message_reply_markup(query, reply_markup=_restore_main_keyboard(transcription))
+    await safe_edit_message_reply_markup(query, reply_markup=await _restore_main_keyboard(transcription))
 
 
 @sentry_bind_user
@@ -85,19 +88,25 @@ async def handle_timecodes_format(update: Update, context: ContextTypes.DEFAULT_
     formatter_entry = FORMATTERS.get(fmt)
     if formatter_entry is None:
         return
-    formatter, extension = formatter_entry
+    _, extension = formatter_entry
 
-    payload = parse_result_json(transcription.result_json)
-    if payload is None:
-        await safe_reply_text(query.message, "❌ Не удалось получить таймкоды для этой расшифровки")
-        return
+    # Rendered files are cached per format, so the second and third format
+    # taps skip re-parsing result_json entirely.
+    version = timecodes_cache.version_of(transcription.result_json)
+    data = timecodes_cache.get(transcription_id, fmt, version)
+    if data is None:
+        payload = await asyncio.to_thread(parse_result_json, transcription.result_json)
+        if payload is None:
+            await safe_reply_text(query.message, "❌ Не удалось получить таймкоды для этой расшифровки")
+            return
 
-    segments = extract_segments(payload)
-    if not segments:
-        await safe_reply_text(query.message, "❌ В этой расшифровке нет данных с таймкодами")
-        return
+        segments = extract_segments(payload)
+        if not segments:
+            await safe_reply_text(query.message, "❌ В этой расшифровке нет данных с таймкодами")
+            return
+
+        data = timecodes_cache.put_segments(transcription_id, version, segments)[fmt]
 
-    text = formatter(segments)
     stem = Path(transcription.audio_s3_path or "transcript").stem
     encoded = stem.encode("utf-8")[:240]
     stem = encoded.decode("utf-8", errors="ignore") or "transcript"
@@ -107,7 +116,7 @@ async def handle_timecodes_format(update: Update, context: ContextTypes.DEFAULT_
         context.bot,
         query.message.chat_id,
         query.message.message_id,
-        InputFile(text.encode("utf-8"), filename=filename),
+        InputFile(data, filename=filename),
         "",
     )
     if sent is None:
@@ -115,4 +124,4 @@ async def handle_timecodes_format(update: Update, context: ContextTypes.DEFAULT_
         await safe_reply_text(query.message, "❌ Не удалось отправить файл")
         return
 
-    await safe_edit_message_reply_markup(query, reply_markup=_restore_main_keyboard(transcription))
+    await safe_edit_message_reply_markup(query, reply_markup=await _restore_main_keyboard(transcription))
@@ -4,6 +4,14 @@ Deep check: returns 503 when a critical loop has stopped ticking or the database
 is unreachable, so an external GET monitor catches the silent-failure case
 ("process alive but bot broken"), not just a hard crash. Defined as async so the
 check is itself subject to event-loop health — a frozen loop fails the probe.
+
+``GET /metrics`` serves the latency histograms from utils/metrics.py in the
+Prometheus text format, for trends the binary check cannot show.
+
+``POST /tinkoff/notification`` receives Tinkoff's NotificationURL callbacks
+(see TERMINAL_NOTIFICATION_URL in config.py): the token is verified with the
+same scheme that signs our requests, and the status is applied at once
+through schedulers/topup.py instead of waiting for the next poll.
 """
 import asyncio
 import logging
@@ -11,16 +19,23 @@ import os
 import shutil
 
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from telegram.ext import CallbackContext
 
 from database.queries import ping_db
+from payment import verify_notification
+from schedulers.topup import apply_notification, serve_notifications
 from utils.heartbeat import overdue
+from utils.metrics import render as render_metrics
 from utils.tg import ANCHOR
 
 app = FastAPI()
 
 _unhealthy = False
+# The bot application, for messaging users about notified payments.
+_application = None
 
 
 @app.get("/healthcheck")
@@ -62,7 +77,31 @@ async def healthcheck():
     return {"status": "ok"}
 
 
-async def start_healthcheck_server() -> None:
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint; see utils/metrics.py."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/tinkoff/notification")
+async def tinkoff_notification(request: Request):
+    """Tinkoff NotificationURL callback; anything but a plain ``OK`` makes Tinkoff retry."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return PlainTextResponse("Bad request", status_code=400)
+    if not isinstance(data, dict) or not verify_notification(data):
+        logging.warning("Rejected Tinkoff notification for order %s", data.get("OrderId") if isinstance(data, dict) else None)
+        return PlainTextResponse("Forbidden", status_code=403)
+
+    await apply_notification(CallbackContext(_application), data)
+    return PlainTextResponse("OK")
+
+
+async def start_healthcheck_server(application=None) -> None:
+    global _application
+    _application = application
+    serve_notifications()
     config = uvicorn.Config(app, host="0.0.0.0", port=9010, log_level="warning")
     server = uvicorn.Server(config)
     await server.serve()
@@ -28,6 +28,9 @@ from schedulers.topup import check_pending_payments
 from schedulers.landing_stats import refresh_landing_stats
 from schedulers.poller import check_pollers
 from schedulers.expire_pending import expire_stale_pending
+from schedulers.archive import archive_old_results
+from schedulers.metrica import send_metrica_hits
+from schedulers.ingest import resume_ingest_jobs
 
 from handlers.telegram.balance import handle_balance
 from handlers.telegram.cancel_task import handle_cancel_task
@@ -63,14 +66,19 @@ from handlers.max.topup import (
     handle_max_cancel_payment,
 )
 
+from payment import close as close_payment_client
+from database.connection import warm_up as warm_up_database
 from database.models import PLATFORM_MAX
 from database.queries import add_user, get_user
 from messengers.max import safe_send_message as max_safe_send_message
 from messengers.max import patch_aiomax
-from utils.marketing import track_goal
+from utils.ingest import drain as drain_ingest
+from utils.marketing import close as close_metrica_client, track_goal
+from utils.s3 import warm_up as warm_up_s3
+from utils.tokens import warm_up as warm_up_tokens
 from utils.utils import available_time_by_balance
 
-from healthcheck import start_healthcheck_server
+from utils.metrics import monitor_event_loop
 
 
 def _msk_time(secs):
@@ -107,9 +115,13 @@ async def register_commands(application: Application) -> None:
     )
 
 
-async def run_bots() -> None:
-    """Start Telegram and (optionally) Max bots in the same event loop."""
-    # --- Build PTB application ---
+def build_application(base_url: str | None = None, base_file_url: str | None = None) -> Application:
+    """PTB application with every Telegram handler registered.
+
+    ``base_url`` / ``base_file_url`` point the bot at another Bot API server
+    (the load-test harness passes its fake one); by default it talks to
+    Telegram, or to the local server when USE_LOCAL_PTB is set.
+    """
     builder = (
         Application.builder()
         .token(TELEGRAM_BOT_TOKEN)
@@ -118,7 +130,9 @@ async def run_bots() -> None:
         # file upload would block buttons and commands for every other user.
         .concurrent_updates(True)
     )
-    if USE_LOCAL_PTB:
+    if base_url is not None:
+        builder = builder.base_url(base_url).base_file_url(base_file_url or base_url)
+    elif USE_LOCAL_PTB:
         builder = (
             builder
             .base_url("http://127.0.0.1:8081/bot")
@@ -180,150 +194,193 @@ async def run_bots() -> None:
     application.add_handler(
         CallbackQueryHandler(handle_retranscribe_back, pattern=r"^retrans_back:\d+$")
     )
-
-    # --- Build Max bot (optional) ---
-    max_bot = None
-    if MAX_BOT_TOKEN:
-        patch_aiomax()
-        max_bot = aiomax.Bot(access_token=MAX_BOT_TOKEN, use_certificate=True)
-
-        @max_bot.on_ready()
-        async def _on_max_ready() -> None:
-            await max_bot.patch_me(commands=[
-                aiomax.BotCommand("history", "История распознаваний"),
-                aiomax.BotCommand("balance", "Текущий баланс"),
-                aiomax.BotCommand("topup", "Пополнить баланс"),
-                aiomax.BotCommand("price", "Стоимость распознавания"),
-            ])
-            logging.info("Max bot commands registered")
-
-        @max_bot.on_bot_start()
-        async def _on_max_bot_start(event) -> None:
-            yclid = (getattr(event, "payload", None) or "").strip() or None
-            logging.info("Max bot_start from user_id=%s payload=%r", getattr(event, "user_id", "?"), yclid)
-            try:
-                user_id = int(event.user_id)
-            except (ValueError, TypeError):
-                return
-            user = get_user(user_id, PLATFORM_MAX)
-            is_new = user is None
-            if is_new:
-                user = add_user(user_id, PLATFORM_MAX, yclid=yclid)
-                if yclid:
-                    application.create_task(track_goal(yclid, "max_startbot"))
-            balance = Decimal(user.balance or 0)
-            duration_str = available_time_by_balance(balance)
-            if is_new:
-                await max_safe_send_message(
-                    max_bot,
-                    "🎁 Подарили вам почти полтора часа распознавания бесплатно",
-                    user_id=user_id,
-                )
+    return application
+
+
+def build_max_bot(application: Application, api_url: str | None = None) -> aiomax.Bot | None:
+    """Max bot with every handler registered, or ``None`` when MAX_BOT_TOKEN is unset."""
+    if not MAX_BOT_TOKEN:
+        return None
+    patch_aiomax()
+    kwargs = {"api_url": api_url} if api_url is not None else {}
+    max_bot = aiomax.Bot(access_token=MAX_BOT_TOKEN, use_certificate=True, **kwargs)
+
+    @max_bot.on_ready()
+    async def _on_max_ready() -> None:
+        await max_bot.patch_me(commands=[
+            aiomax.BotCommand("history", "История распознаваний"),
+            aiomax.BotCommand("balance", "Текущий баланс"),
+            aiomax.BotCommand("topup", "Пополнить баланс"),
+            aiomax.BotCommand("price", "Стоимость распознавания"),
+        ])
+        logging.info("Max bot commands registered")
+
+    @max_bot.on_bot_start()
+    async def _on_max_bot_start(event) -> None:
+        yclid = (getattr(event, "payload", None) or "").strip() or None
+        logging.info("Max bot_start from user_id=%s payload=%r", getattr(event, "user_id", "?"), yclid)
+        try:
+            user_id = int(event.user_id)
+        except (ValueError, TypeError):
+            return
+        user = get_user(user_id, PLATFORM_MAX)
+        is_new = user is None
+        if is_new:
+            user = add_user(user_id, PLATFORM_MAX, yclid=yclid)
+            if yclid:
+                track_goal(yclid, "max_startbot")
+        balance = Decimal(user.balance or 0)
+        duration_str = available_time_by_balance(balance)
+        if is_new:
             await max_safe_send_message(
                 max_bot,
-                "Отправьте видео или аудио — вернём текст\n\n"
-                "Поддерживаем все популярные форматы:\n"
-                "* Видео: mp4, mov, mkv, webm и другие\n"
-                "* Аудио: mp3, m4a, wav, ogg/opus, flac и другие\n\n"
-                f"Текущий баланс: {balance} ₽\n"
-                f"Хватит на распознавание: {duration_str}\n\n"
-                "Доступные команды:\n"
-                "* /history — история распознаваний\n"
-                "* /balance — текущий баланс\n"
-                "* /topup — пополнить баланс\n"
-                "* /price — стоимость",
+                "🎁 Подарили вам почти полтора часа распознавания бесплатно",
                 user_id=user_id,
             )
+        await max_safe_send_message(
+            max_bot,
+            "Отправьте видео или аудио — вернём текст\n\n"
+            "Поддерживаем все популярные форматы:\n"
+            "* Видео: mp4, mov, mkv, webm и другие\n"
+            "* Аудио: mp3, m4a, wav, ogg/opus, flac и другие\n\n"
+            f"Текущий баланс: {balance} ₽\n"
+            f"Хватит на распознавание: {duration_str}\n\n"
+            "Доступные команды:\n"
+            "* /history — история распознаваний\n"
+            "* /balance — текущий баланс\n"
+            "* /topup — пополнить баланс\n"
+            "* /price — стоимость",
+            user_id=user_id,
+        )
 
-        @max_bot.on_message()
-        async def _on_max_message(message: aiomax.Message) -> None:
-            logging.info(
-                "Max message from user_id=%s text=%r attachments=%s",
-                getattr(message.sender, "user_id", "?"),
-                (message.body.text or "")[:100],
-                [type(a).__name__ for a in (message.body.attachments or [])],
+    @max_bot.on_message()
+    async def _on_max_message(message: aiomax.Message) -> None:
+        logging.info(
+            "Max message from user_id=%s text=%r attachments=%s",
+            getattr(message.sender, "user_id", "?"),
+            (message.body.text or "")[:100],
+            [type(a).__name__ for a in (message.body.attachments or [])],
+        )
+        _file_types = ("FileAttachment", "AudioAttachment", "VideoAttachment")
+        _all_atts = list(message.body.attachments or [])
+        _linked = getattr(message.link, "message", None)
+        if _linked:
+            _all_atts += list(_linked.attachments or [])
+        if any(type(a).__name__ in _file_types for a in _all_atts):
+            await handle_max_file(message, max_bot)
+            return
+        if (
+            message.link is not None
+            and getattr(message.link, "type", None) == "forward"
+            and _linked is None
+            and not (message.body.text or "").strip()
+        ):
+            await max_safe_send_message(
+                max_bot,
+                "⚠️ Пересланное голосовое не дошло\n\n"
+                "Max не передаёт ботам голосовые сообщения при пересылке.\n"
+                "Отправьте голосовое или аудио боту напрямую — без «Переслать».",
+                chat_id=message.recipient.chat_id,
             )
-            _file_types = ("FileAttachment", "AudioAttachment", "VideoAttachment")
-            _all_atts = list(message.body.attachments or [])
-            _linked = getattr(message.link, "message", None)
-            if _linked:
-                _all_atts += list(_linked.attachments or [])
-            if any(type(a).__name__ in _file_types for a in _all_atts):
-                await handle_max_file(message, max_bot)
-                return
-            if (
-                message.link is not None
-                and getattr(message.link, "type", None) == "forward"
-                and _linked is None
-                and not (message.body.text or "").strip()
-            ):
-                await max_safe_send_message(
-                    max_bot,
-                    "⚠️ Пересланное голосовое не дошло\n\n"
-                    "Max не передаёт ботам голосовые сообщения при пересылке.\n"
-                    "Отправьте голосовое или аудио боту напрямую — без «Переслать».",
-                    chat_id=message.recipient.chat_id,
-                )
-                return
-            await handle_max_text(message, max_bot)
-
-        @max_bot.on_button_callback()
-        async def _on_max_callback(callback: aiomax.Callback) -> None:
-            payload = callback.payload or ""
-            if payload.startswith("create_task:"):
-                await handle_max_create_task(callback, max_bot)
-            elif payload.startswith("cancel_task:"):
-                await handle_max_cancel_task(callback, max_bot)
-            elif payload.startswith("rate:"):
-                await handle_max_rate(callback, max_bot)
-            elif payload.startswith("summarize:"):
-                await handle_max_summarize(callback, max_bot)
-            elif payload.startswith("send_as_text:"):
-                await handle_max_send_as_text(callback, max_bot)
-            elif payload.startswith("improve:"):
-                await handle_max_improve(callback, max_bot)
-            elif payload.startswith("tc_fmt:"):
-                await handle_max_timecodes_format(callback, max_bot)
-            elif payload.startswith("tc_back:"):
-                await handle_max_timecodes_back(callback, max_bot)
-            elif payload.startswith("tc:"):
-                await handle_max_timecodes(callback, max_bot)
-            elif payload.startswith("retrans_more:"):
-                await handle_max_retranscribe_more(callback, max_bot)
-            elif payload.startswith("retrans_back:"):
-                await handle_max_retranscribe_back(callback, max_bot)
-            elif payload.startswith("retrans:"):
-                await handle_max_retranscribe(callback, max_bot)
-            elif payload.startswith("topup:"):
-                await handle_max_topup_callback(callback, max_bot)
-            elif payload.startswith("payment:cancel:"):
-                await handle_max_cancel_payment(callback, max_bot)
-
-        @max_bot.on_command("balance")
-        async def _cmd_balance(message: aiomax.Message) -> None:
-            await handle_max_balance(message, max_bot)
-
-        @max_bot.on_command("history")
-        async def _cmd_history(message: aiomax.Message) -> None:
-            await handle_max_history(message, max_bot)
-
-        @max_bot.on_command("topup")
-        async def _cmd_topup(message: aiomax.Message) -> None:
-            await handle_max_topup(message, max_bot)
-
-        @max_bot.on_command("price")
-        async def _cmd_price(message: aiomax.Message) -> None:
-            await handle_max_price(message, max_bot)
+            return
+        await handle_max_text(message, max_bot)
+
+    @max_bot.on_button_callback()
+    async def _on_max_callback(callback: aiomax.Callback) -> None:
+        payload = callback.payload or ""
+        if payload.startswith("create_task:"):
+            await handle_max_create_task(callback, max_bot)
+        elif payload.startswith("cancel_task:"):
+            await handle_max_cancel_task(callback, max_bot)
+        elif payload.startswith("rate:"):
+            await handle_max_rate(callback, max_bot)
+        elif payload.startswith("summarize:"):
+            await handle_max_summarize(callback, max_bot)
+        elif payload.startswith("send_as_text:"):
+            await handle_max_send_as_text(callback, max_bot)
+        elif payload.startswith("improve:"):
+            await handle_max_improve(callback, max_bot)
+        elif payload.startswith("tc_fmt:"):
+            await handle_max_timecodes_format(callback, max_bot)
+        elif payload.startswith("tc_back:"):
+            await handle_max_timecodes_back(callback, max_bot)
+        elif payload.startswith("tc:"):
+            await handle_max_timecodes(callback, max_bot)
+        elif payload.startswith("retrans_more:"):
+            await handle_max_retranscribe_more(callback, max_bot)
+        elif payload.startswith("retrans_back:"):
+            await handle_max_retranscribe_back(callback, max_bot)
+        elif payload.startswith("retrans:"):
+            await handle_max_retranscribe(callback, max_bot)
+        elif payload.startswith("topup:"):
+            await handle_max_topup_callback(callback, max_bot)
+        elif payload.startswith("payment:cancel:"):
+            await handle_max_cancel_payment(callback, max_bot)
+
+    @max_bot.on_command("balance")
+    async def _cmd_balance(message: aiomax.Message) -> None:
+        await handle_max_balance(message, max_bot)
+
+    @max_bot.on_command("history")
+    async def _cmd_history(message: aiomax.Message) -> None:
+        await handle_max_history(message, max_bot)
+
+    @max_bot.on_command("topup")
+    async def _cmd_topup(message: aiomax.Message) -> None:
+        await handle_max_topup(message, max_bot)
+
+    @max_bot.on_command("price")
+    async def _cmd_price(message: aiomax.Message) -> None:
+        await handle_max_price(message, max_bot)
+
+    return max_bot
+
+
+# Periodic jobs: (callback, interval seconds, first run delay).
+JOBS = (
+    (check_running_tasks, 1.0, None),
+    (check_refinements, 1.0, None),
+    (check_pending_payments, 10.0, None),
+    (refresh_landing_stats, 3600.0, 10.0),
+    (check_pollers, 30.0, 30.0),
+    (expire_stale_pending, 3600.0, 60.0),
+    (archive_old_results, 3600.0, 120.0),
+    (send_metrica_hits, 10.0, 15.0),
+)
 
+
+async def warm_up() -> None:
+    """Pay the one-off cost of the first DB query, S3 call and token count.
+
+    Runs in worker threads alongside the bots' startup and first getUpdates
+    instead of before them: pm2 restarts are downtime, and none of this is
+    needed to start receiving updates. A failure here is only logged — the
+    first real call retries it and reports through the usual paths.
+    """
+    started = time.perf_counter()
+    steps = {"database": warm_up_database, "s3": warm_up_s3, "tiktoken": warm_up_tokens}
+    results = await asyncio.gather(
+        *(asyncio.to_thread(step) for step in steps.values()), return_exceptions=True
+    )
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logging.warning("Warm-up of %s failed: %r", name, result)
+    logging.info("Warm-up finished in %.2fs", time.perf_counter() - started)
+
+
+async def run_bots() -> None:
+    """Start Telegram and (optionally) Max bots in the same event loop."""
+    warm_up_task = asyncio.create_task(warm_up())
+
+    application = build_application()
+    max_bot = build_max_bot(application)
     application.bot_data["max_bot"] = max_bot
 
     # Register job queue
-    application.job_queue.run_repeating(check_running_tasks, interval=1.0)
-    application.job_queue.run_repeating(check_refinements, interval=1.0)
-    application.job_queue.run_repeating(check_pending_payments, interval=10.0)
-    application.job_queue.run_repeating(refresh_landing_stats, interval=3600.0, first=10.0)
-    application.job_queue.run_repeating(check_pollers, interval=30.0, first=30.0)
-    application.job_queue.run_repeating(expire_stale_pending, interval=3600.0, first=60.0)
+    for callback, interval, first in JOBS:
+        application.job_queue.run_repeating(callback, interval=interval, first=first)
+    # Uploads a restart cut off mid-ingest; once, after the bots are up.
+    application.job_queue.run_once(resume_ingest_jobs, when=5.0)
 
     # --- Start PTB (non-blocking) ---
     await application.initialize()
@@ -339,7 +396,18 @@ async def run_bots() -> None:
         logging.info("MAX_BOT_TOKEN not set; running Telegram only. Press Ctrl+C to stop.")
         tasks.append(asyncio.Event().wait())
     if ENABLE_HEALTHCHECK:
-        tasks.append(start_healthcheck_server())
+        # Imported here so fastapi/uvicorn stay off the cold-start path
+        # when the healthcheck is disabled.
+        from healthcheck import start_healthcheck_server
+
+        tasks.append(start_healthcheck_server(application))
+        # Lag samples are only ever read through /metrics on the same server.
+        tasks.append(monitor_event_loop())
+    elif config.TERMINAL_NOTIFICATION_URL:
+        logging.warning(
+            "TERMINAL_NOTIFICATION_URL is set but ENABLE_HEALTHCHECK is not: "
+            "Tinkoff notifications go unanswered, payments are polled as usual"
+        )
     # SIGINT/SIGTERM cancel only the polling tasks: the default
     # KeyboardInterrupt path on Python 3.10 cancels every task at once,
     # killing in-flight handlers before aiomax and PTB can drain them.
@@ -352,9 +420,15 @@ async def run_bots() -> None:
     except asyncio.CancelledError:
         pass
     finally:
+        warm_up_task.cancel()
         await application.updater.stop()
+        # Uploads being prepared get a chance to finish; whatever does not is
+        # resumed by resume_ingest_jobs after the restart.
+        await drain_ingest()
         await application.stop()
         await application.shutdown()
+        await close_payment_client()
+        await close_metrica_client()
 
 
 def main() -> None:
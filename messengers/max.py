@@ -7,6 +7,8 @@ from typing import Optional
 from aiomax.buttons import CallbackButton, LinkButton, KeyboardBuilder
 from aiomax.exceptions import ChatNotFound, InternalError
 
+import utils.metrics as metrics
+
 from utils.utils import RETRY_LANGUAGE_NAMES, RETRY_OTHER_CODES
 
 
@@ -111,9 +113,14 @@ def _log_aiomax_failure(label: str, ident: str, exc: Exception) -> None:
     logging.exception("%s failed %s", label, ident)
 
 
+def _track(method: str):
+    return metrics.track(metrics.MESSAGE_SEND, metrics.MESSAGE_SEND_ERRORS, platform="max", method=method)
+
+
 async def safe_callback_answer(callback: aiomax.Callback, **kwargs):
     try:
-        return await callback.answer(**kwargs)
+        with _track(method="callback_answer"):
+            return await callback.answer(**kwargs)
     except Exception as exc:
         _log_aiomax_failure(
             "Max callback.answer",
@@ -126,7 +133,8 @@ async def safe_callback_answer(callback: aiomax.Callback, **kwargs):
 async def safe_send_message(bot: aiomax.Bot, *args, **kwargs):
     chat_id = kwargs.get("chat_id") or kwargs.get("user_id") or (args[1] if len(args) > 1 else "?")
     try:
-        return await bot.send_message(*args, **kwargs)
+        with _track(method="send_message"):
+            return await bot.send_message(*args, **kwargs)
     except Exception as exc:
         _log_aiomax_failure("Max send_message", f"chat={chat_id}", exc)
         return None
@@ -139,7 +147,8 @@ async def safe_edit_message(bot: aiomax.Bot, *args, keyboard=_KEYBOARD_NOT_SET,
     if keyboard is not _KEYBOARD_NOT_SET:
         kwargs["attachments"] = [_MaxKeyboardAttachment(keyboard)] if keyboard is not None else []
     try:
-        return await bot.edit_message(*args, **kwargs)
+        with _track(method="edit_message"):
+            return await bot.edit_message(*args, **kwargs)
     except Exception as exc:
         _log_aiomax_failure("Max edit_message", f"args={args[:1]}", exc)
         return None
@@ -147,7 +156,8 @@ async def safe_edit_message(bot: aiomax.Bot, *args, keyboard=_KEYBOARD_NOT_SET,
 
 async def safe_delete_message(bot: aiomax.Bot, message_id):
     try:
-        return await bot.delete_message(str(message_id))
+        with _track(method="delete_message"):
+            return await bot.delete_message(str(message_id))
     except Exception as exc:
         _log_aiomax_failure("Max delete_message", f"msg={message_id}", exc)
         return None
@@ -155,7 +165,8 @@ async def safe_delete_message(bot: aiomax.Bot, message_id):
 
 async def safe_remove_keyboard(bot: aiomax.Bot, message_id):
     try:
-        return await bot.edit_message(str(message_id), attachments=[])
+        with _track(method="remove_keyboard"):
+            return await bot.edit_message(str(message_id), attachments=[])
     except Exception as exc:
         _log_aiomax_failure("Max remove_keyboard", f"msg={message_id}", exc)
         return None
@@ -281,12 +292,13 @@ def make_language_other_keyboard(transcription_id: int) -> KeyboardBuilder:
 
 async def safe_send_document(bot: aiomax.Bot, chat_id, data, filename: str, caption: str, keyboard=None):
     try:
-        file_attachment = await bot.upload_file(data, filename)
-        attachments = []
-        if keyboard is not None:
-            attachments.append(_MaxKeyboardAttachment(keyboard))
-        attachments.append(file_attachment)
-        return await bot.send_message(caption, user_id=int(chat_id), attachments=attachments)
+        with _track(method="send_document"):
+            file_attachment = await bot.upload_file(data, filename)
+            attachments = []
+            if keyboard is not None:
+                attachments.append(_MaxKeyboardAttachment(keyboard))
+            attachments.append(file_attachment)
+            return await bot.send_message(caption, user_id=int(chat_id), attachments=attachments)
     except Exception as exc:
         _log_aiomax_failure("Max send_document", f"chat={chat_id} file={filename}", exc)
         return None
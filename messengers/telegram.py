@@ -6,6 +6,8 @@ from typing import Optional
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest, Forbidden
 
+import utils.metrics as metrics
+
 from utils.utils import RETRY_LANGUAGE_NAMES, RETRY_OTHER_CODES
 
 _MSG_NOT_MODIFIED = "message is not modified"
@@ -16,9 +18,14 @@ _CANT_INITIATE = "bot can't initiate conversation"
 _MSG_NOT_FOUND = "message to edit not found"
 
 
+def _track(method: str):
+    return metrics.track(metrics.MESSAGE_SEND, metrics.MESSAGE_SEND_ERRORS, platform="telegram", method=method)
+
+
 async def safe_query_answer(query, *args, **kwargs):
     try:
-        return await query.answer(*args, **kwargs)
+        with _track(method="query_answer"):
+            return await query.answer(*args, **kwargs)
     except BadRequest as exc:
         if _QUERY_TOO_OLD in exc.message.lower():
             logging.warning("TG query.answer skipped (too old): %s", exc)
@@ -32,7 +39,8 @@ async def safe_query_answer(query, *args, **kwargs):
 
 async def safe_reply_text(message, *args, **kwargs):
     try:
-        return await message.reply_text(*args, **kwargs)
+        with _track(method="reply_text"):
+            return await message.reply_text(*args, **kwargs)
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG reply_text skipped (bot blocked): %s", exc)
@@ -52,7 +60,8 @@ async def safe_reply_text(message, *args, **kwargs):
 
 async def safe_send_message(bot, *args, **kwargs):
     try:
-        return await bot.send_message(*args, **kwargs)
+        with _track(method="send_message"):
+            return await bot.send_message(*args, **kwargs)
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG send_message skipped (bot blocked): %s", exc)
@@ -75,7 +84,8 @@ async def safe_send_message(bot, *args, **kwargs):
 
 async def safe_edit_message_text(query, *args, **kwargs):
     try:
-        return await query.edit_message_text(*args, **kwargs)
+        with _track(method="edit_message_text"):
+            return await query.edit_message_text(*args, **kwargs)
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG edit_message_text skipped (bot blocked): %s", exc)
@@ -95,7 +105,8 @@ async def safe_edit_message_text(query, *args, **kwargs):
 
 async def safe_edit_message_caption(query, *args, **kwargs):
     try:
-        return await query.edit_message_caption(*args, **kwargs)
+        with _track(method="edit_message_caption"):
+            return await query.edit_message_caption(*args, **kwargs)
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG edit_message_caption skipped (bot blocked): %s", exc)
@@ -115,13 +126,14 @@ async def safe_edit_message_caption(query, *args, **kwargs):
 
 async def safe_edit_message(bot, chat_id, message_id, text: str, reply_markup=None, parse_mode=None):
     try:
-        return await bot.edit_message_text(
-            chat_id=int(chat_id),
-            message_id=int(message_id),
-            text=text,
-            reply_markup=reply_markup,
-            parse_mode=parse_mode,
-        )
+        with _track(method="edit_message"):
+            return await bot.edit_message_text(
+                chat_id=int(chat_id),
+                message_id=int(message_id),
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode,
+            )
     except BadRequest as exc:
         if _MSG_NOT_MODIFIED in exc.message.lower():
             logging.info("TG edit_message skipped (not modified): %s", exc)
@@ -138,18 +150,19 @@ async def safe_edit_message(bot, chat_id, message_id, text: str, reply_markup=No
 
 async def safe_send_document(bot, chat_id, reply_to_message_id, document, caption: str, reply_markup=None):
     try:
-        return await bot.send_document(
-            chat_id=int(chat_id),
-            reply_to_message_id=int(reply_to_message_id) if reply_to_message_id is not None else None,
-            # The user may have deleted the status message; deliver the paid
-            # result anyway instead of failing on the dangling reply.
-            allow_sending_without_reply=True,
-            document=document,
-            caption=caption,
-            reply_markup=reply_markup,
-            connect_timeout=15,
-            write_timeout=30,
-        )
+        with _track(method="send_document"):
+            return await bot.send_document(
+                chat_id=int(chat_id),
+                reply_to_message_id=int(reply_to_message_id) if reply_to_message_id is not None else None,
+                # The user may have deleted the status message; deliver the paid
+                # result anyway instead of failing on the dangling reply.
+                allow_sending_without_reply=True,
+                document=document,
+                caption=caption,
+                reply_markup=reply_markup,
+                connect_timeout=15,
+                write_timeout=30,
+            )
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG send_document skipped (bot blocked) chat=%s: %s", chat_id, exc)
@@ -169,7 +182,8 @@ async def safe_send_document(bot, chat_id, reply_to_message_id, document, captio
 
 async def safe_delete_message(bot, chat_id, message_id):
     try:
-        return await bot.delete_message(chat_id=int(chat_id), message_id=int(message_id))
+        with _track(method="delete_message"):
+            return await bot.delete_message(chat_id=int(chat_id), message_id=int(message_id))
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG delete_message skipped (bot blocked): %s", exc)
@@ -183,7 +197,8 @@ async def safe_delete_message(bot, chat_id, message_id):
 
 async def safe_edit_message_reply_markup(query, *args, **kwargs):
     try:
-        return await query.edit_message_reply_markup(*args, **kwargs)
+        with _track(method="edit_message_reply_markup"):
+            return await query.edit_message_reply_markup(*args, **kwargs)
     except Forbidden as exc:
         if _BOT_BLOCKED in exc.message.lower():
             logging.warning("TG edit_message_reply_markup skipped (bot blocked): %s", exc)
@@ -303,10 +318,11 @@ def make_topup_amounts_keyboard() -> InlineKeyboardMarkup:
 
 async def safe_remove_keyboard(bot, chat_id, message_id) -> None:
     try:
-        await bot.edit_message_reply_markup(
-            chat_id=int(chat_id),
-            message_id=int(message_id),
-            reply_markup=None,
-        )
+        with _track(method="remove_keyboard"):
+            await bot.edit_message_reply_markup(
+                chat_id=int(chat_id),
+                message_id=int(message_id),
+                reply_markup=None,
+            )
     except Exception:
         logging.exception("TG remove_keyboard failed")
@@ -1,5 +1,8 @@
+import asyncio
 import hashlib
+import hmac
 import ssl
+import time
 from pathlib import Path
 
 import certifi
@@ -7,6 +10,8 @@ import httpx
 
 import config
 
+import utils.metrics as metrics
+
 from utils.sentry import sentry_span
 
 
@@ -20,6 +25,7 @@ _SSL_CONTEXT.load_verify_locations(
 TERMINAL_KEY = config.TERMINAL_KEY
 TERMINAL_PASSWORD = config.TERMINAL_PASSWORD
 ENV = config.TERMINAL_ENV
+NOTIFICATION_URL = config.TERMINAL_NOTIFICATION_URL
 
 BASE_URL = (
     "https://securepay.tinkoff.ru/v2"
@@ -64,6 +70,56 @@ def format_payment_status(status: str | None) -> str:
     return "❓ неизвестно"
 
 
+# One pooled client for every acquiring call instead of a TLS handshake per
+# request; the scheduler checks many payments per tick concurrently.
+MAX_CONNECTIONS = 8
+# Requests per second to the acquiring API, across all callers.
+MAX_REQUESTS_PER_SECOND = 20
+
+_client: httpx.AsyncClient | None = None
+_rate_lock: asyncio.Lock | None = None
+_next_request_at = 0.0
+
+
+def _http() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=10.0,
+            verify=_SSL_CONTEXT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close() -> None:
+    """Close the pooled client at shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _throttle() -> None:
+    """Wait for the next request slot under MAX_REQUESTS_PER_SECOND."""
+    global _rate_lock, _next_request_at
+    if _rate_lock is None:
+        _rate_lock = asyncio.Lock()
+    async with _rate_lock:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + 1 / MAX_REQUESTS_PER_SECOND
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+
+async def _post(method: str, payload: dict) -> dict:
+    await _throttle()
+    response = await _http().post(f"{BASE_URL}/{method}", json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
 def _generate_token(params: dict) -> str:
     data = params.copy()
     data["Password"] = TERMINAL_PASSWORD
@@ -71,7 +127,23 @@ def _generate_token(params: dict) -> str:
     return hashlib.sha256(token_str.encode()).hexdigest()
 
 
+def verify_notification(data: dict) -> bool:
+    """Whether *data*, a NotificationURL callback body, was signed with our terminal password."""
+    token = data.get("Token")
+    if not isinstance(token, str) or data.get("TerminalKey") != TERMINAL_KEY:
+        return False
+    # Nested objects (Data, Receipt) are not signed; booleans are signed the
+    # way they appear in the JSON body, as true/false.
+    params = {
+        key: str(value).lower() if isinstance(value, bool) else value
+        for key, value in data.items()
+        if key != "Token" and not isinstance(value, (dict, list))
+    }
+    return hmac.compare_digest(_generate_token(params), token)
+
+
 @sentry_span(op="payment.init")
+@metrics.timed_call("tinkoff", "init")
 async def init_payment(
     order_id: str,
     amount: int,
@@ -89,15 +161,15 @@ async def init_payment(
         payload["SuccessURL"] = success_url
     if fail_url:
         payload["FailURL"] = fail_url
+    if NOTIFICATION_URL:
+        payload["NotificationURL"] = NOTIFICATION_URL
     payload["Token"] = _generate_token(payload)
 
-    async with httpx.AsyncClient(timeout=10.0, verify=_SSL_CONTEXT) as client:
-        response = await client.post(f"{BASE_URL}/Init", json=payload)
-        response.raise_for_status()
-        return response.json()
+    return await _post("Init", payload)
 
 
 @sentry_span(op="payment.get_state")
+@metrics.timed_call("tinkoff", "get_state")
 async def get_payment_state(payment_id: int) -> dict:
     payload = {
         "TerminalKey": TERMINAL_KEY,
@@ -105,13 +177,11 @@ async def get_payment_state(payment_id: int) -> dict:
     }
     payload["Token"] = _generate_token(payload)
 
-    async with httpx.AsyncClient(timeout=10.0, verify=_SSL_CONTEXT) as client:
-        response = await client.post(f"{BASE_URL}/GetState", json=payload)
-        response.raise_for_status()
-        return response.json()
+    return await _post("GetState", payload)
 
 
 @sentry_span(op="payment.cancel")
+@metrics.timed_call("tinkoff", "cancel")
 async def cancel_payment(payment_id: int) -> dict:
     payload = {
         "TerminalKey": TERMINAL_KEY,
@@ -119,7 +189,4 @@ async def cancel_payment(payment_id: int) -> dict:
     }
     payload["Token"] = _generate_token(payload)
 
-    async with httpx.AsyncClient(timeout=10.0, verify=_SSL_CONTEXT) as client:
-        response = await client.post(f"{BASE_URL}/Cancel", json=payload)
-        response.raise_for_status()
-        return response.json()
+    return await _post("Cancel", payload)
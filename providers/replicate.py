@@ -6,14 +6,18 @@ import logging
 import replicate
 
 from decimal import Decimal
-from typing import Any, Dict, Optional
+from typing import Any, Dict, NamedTuple, Optional
 
+from utils.metrics import PROVIDER_CALL, PROVIDER_ERRORS, track
 from utils.timecodes import is_phantom_segment
 
 
 MODEL_SMALL = "victor-upmeet/whisperx:655845d6190ef70573c669245f245892cd039df4b880a1e3a65852c09252f5cc"
 MODEL_LARGE = "victor-upmeet/whisperx-a40-large:8aad2534a4f2a268a80ab781928cf4bc624b0bbed25afe4d789c70c5781c47b1"
 
+# Model name (as stored in transcriptions.model) -> version to run.
+MODEL_VERSIONS = {version.split(":")[0]: version for version in (MODEL_SMALL, MODEL_LARGE)}
+
 ONE_HOUR = 3600
 USD_TO_RUB = Decimal("80")
 
@@ -38,20 +42,24 @@ def get_model_name(duration_seconds: int) -> str:
     return get_model(duration_seconds).split(":")[0]
 
 
-def cost_in_rub(predict_time_sec: float, model: str = "") -> Decimal:
+def usd_per_second(model: str = "") -> Decimal:
     """
-    Стоимость предсказания Replicate в рублях.
-
-    Тарификация:
+    Тариф Replicate за секунду предсказания:
     - victor-upmeet/whisperx (A100 80GB): $0.001400/сек
     - victor-upmeet/whisperx-a40-large (L40S): $0.000975/сек
-    Конвертация по курсу 80 ₽/$.
     """
     if "whisperx-a40-large" in model:
-        rate = Decimal("0.000975")
-    else:
-        rate = Decimal("0.001400")
-    usd = Decimal(str(predict_time_sec)) * rate
+        return Decimal("0.000975")
+    return Decimal("0.001400")
+
+
+def cost_in_rub(predict_time_sec: float, model: str = "") -> Decimal:
+    """
+    Стоимость предсказания Replicate в рублях.
+
+    Тариф — usd_per_second(), конвертация по курсу 80 ₽/$.
+    """
+    usd = Decimal(str(predict_time_sec)) * usd_per_second(model)
     return (usd * USD_TO_RUB).quantize(Decimal("0.01"))
 
 
@@ -60,13 +68,16 @@ async def start_transcription(
     duration_seconds: int,
     mean_volume_db: Optional[float] = None,
     language: Optional[str] = None,
+    model: Optional[str] = None,
 ) -> Optional[str]:
     """Start a Replicate transcription and return its ID.
 
     ``language`` forces WhisperX to a specific language (ISO code) for the
     "re-transcribe in another language" retry; left unset it auto-detects.
+    ``model`` is a model name from MODEL_VERSIONS (as chosen by
+    utils/routing.py); left unset the duration picks it.
     """
-    model = get_model(duration_seconds)
+    model = MODEL_VERSIONS.get(model) or get_model(duration_seconds)
     payload = {
         "audio_file": audio_url,
         "language_detection_min_prob": 0.9,
@@ -82,11 +93,12 @@ async def start_transcription(
         payload["vad_onset"] = 0.35
         payload["vad_offset"] = 0.25
     try:
-        transcription = await asyncio.to_thread(
-            client.predictions.create,
-            version=model,
-            input=payload,
-        )
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="replicate", call="create"):
+            transcription = await asyncio.to_thread(
+                client.predictions.create,
+                version=model,
+                input=payload,
+            )
         return transcription.id
     except Exception:
         logging.exception(f"Failed to start Replicate transcription for {audio_url}")
@@ -96,7 +108,8 @@ async def start_transcription(
 async def check_transcription(operation_id: str) -> Optional[Dict[str, Any]]:
     """Return transcription result if finished, otherwise ``None``."""
     try:
-        transcription = await asyncio.to_thread(client.predictions.get, operation_id)
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="replicate", call="get"):
+            transcription = await asyncio.to_thread(client.predictions.get, operation_id)
     except Exception:
         logging.exception(f"Failed to fetch Replicate transcription {operation_id}")
         return None
@@ -115,10 +128,22 @@ async def check_transcription(operation_id: str) -> Optional[Dict[str, Any]]:
     }
 
 
+async def get_status(operation_id: str) -> Optional[str]:
+    """Current status of a prediction ("starting" while it waits for a worker), or ``None`` on error."""
+    try:
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="replicate", call="get"):
+            prediction = await asyncio.to_thread(client.predictions.get, operation_id)
+    except Exception:
+        logging.exception(f"Failed to fetch Replicate transcription {operation_id}")
+        return None
+    return prediction.status
+
+
 async def cancel(operation_id: str) -> bool:
     """Best-effort cancel of a running Replicate prediction."""
     try:
-        await asyncio.to_thread(client.predictions.cancel, operation_id)
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="replicate", call="cancel"):
+            await asyncio.to_thread(client.predictions.cancel, operation_id)
         return True
     except Exception:
         logging.exception(f"Failed to cancel Replicate transcription {operation_id}")
@@ -182,24 +207,6 @@ def detected_language(payload: Dict[str, Any]) -> Optional[str]:
     return None
 
 
-def is_wrong_language(payload: Dict[str, Any]) -> bool:
-    """Heuristic flag that WhisperX transcribed in the wrong language.
-
-    Either it reported a language that for our audience is almost always a
-    misdetection of Russian, or the text is written in a script no Russian or
-    English speaker would expect (Chinese, Arabic, Hangul...). Drives the
-    "re-transcribe in another language" prompt.
-    """
-    if detected_language(payload) in WRONG_LANGUAGE_CODES:
-        return True
-    text = get_text(payload)
-    if not text:
-        return False
-    foreign = len(_FOREIGN_SCRIPT_RE.findall(text))
-    letters = sum(1 for ch in text if ch.isalpha())
-    return letters > 0 and foreign / letters > 0.20
-
-
 # Calibrated on prod: garbage has 45-100% of its segments below -0.5, coherent
 # and good recordings 0-8%. Flag on the SHARE of low-confidence segments, not the
 # mean — a mean is dragged below the bar by a minority of bad patches and refunds
@@ -209,33 +216,88 @@ _HALLUCINATION_LOW_SHARE = 0.5
 _HALLUCINATION_LOOP_SHARE = 0.5
 
 
-def looks_like_hallucination(payload: Dict[str, Any]) -> bool:
-    """Heuristic flag for likely-garbage WhisperX output.
+class HeuristicVerdict(NamedTuple):
+    """Everything the quality heuristics measure on one WhisperX payload."""
 
-    Two signals, both scaled so a blemish in otherwise-good speech is not
-    refunded: at least half the segments individually below ``-0.5`` (pervasively
-    low confidence — robust to a minority of bad patches dragging a mean down,
-    which used to refund good long recordings), or a long segment text repeated
-    enough to make up at least half of all segments (looping that dominates).
-    """
-    segments = _segments(payload)
-    if not segments:
-        return False
+    text: str
+    letters: int
+    foreign_letters: int
+    low_logprob_share: float
+    loop_share: float
+    wrong_language: bool
+    hallucinated: bool
 
-    logprobs = [
-        s["avg_logprob"]
-        for s in segments
-        if isinstance(s.get("avg_logprob"), (int, float))
-    ]
-    if logprobs:
-        low = sum(1 for lp in logprobs if lp < _HALLUCINATION_LOW_LOGPROB)
-        if low / len(logprobs) >= _HALLUCINATION_LOW_SHARE:
-            return True
 
+def analyze(payload: Dict[str, Any]) -> HeuristicVerdict:
+    """Run every quality heuristic over *payload* in a single segment pass.
+
+    Letter counts, foreign-script share, low-confidence share and loop share
+    are accumulated per segment, so a six-hour payload is walked once instead
+    of once per heuristic (plus once more for the delivered text), and no list
+    of every matched foreign character is materialised just to be counted.
+
+    ``wrong_language``: WhisperX reported a language that for our audience is
+    almost always a misdetection of Russian, or the text is written in a
+    script no Russian or English speaker would expect (Chinese, Arabic,
+    Hangul...). Drives the "re-transcribe in another language" prompt.
+
+    ``hallucinated``: likely-garbage output, scaled so a blemish in otherwise
+    good speech is not refunded — at least half the segments individually
+    below ``-0.5`` (pervasively low confidence, robust to a minority of bad
+    patches dragging a mean down, which used to refund good long recordings),
+    or a long segment text repeated enough to make up at least half of all
+    segments (looping that dominates).
+    """
+    segments = _segments(payload)
+    parts = []
+    letters = 0
+    foreign = 0
+    scored = 0
+    low = 0
     counts: Dict[str, int] = {}
     for segment in segments:
+        logprob = segment.get("avg_logprob")
+        if isinstance(logprob, (int, float)):
+            scored += 1
+            low += logprob < _HALLUCINATION_LOW_LOGPROB
         text = (segment.get("text") or "").strip()
+        if not text:
+            continue
+        parts.append(text)
+        letters += sum(map(str.isalpha, text))
+        foreign += _FOREIGN_SCRIPT_RE.subn("", text)[1]
         if len(text) >= 15:
             counts[text] = counts.get(text, 0) + 1
+
+    low_share = low / scored if scored else 0.0
     looped = sum(count for count in counts.values() if count >= 3)
-    return bool(looped) and looped / len(segments) >= _HALLUCINATION_LOOP_SHARE
+    loop_share = looped / len(segments) if segments else 0.0
+
+    if detected_language(payload) in WRONG_LANGUAGE_CODES:
+        wrong_language = True
+    else:
+        wrong_language = letters > 0 and foreign / letters > 0.20
+
+    hallucinated = bool(segments) and (
+        (scored > 0 and low_share >= _HALLUCINATION_LOW_SHARE)
+        or (looped > 0 and loop_share >= _HALLUCINATION_LOOP_SHARE)
+    )
+    return HeuristicVerdict(
+        text="\n".join(parts),
+        letters=letters,
+        foreign_letters=foreign,
+        low_logprob_share=low_share,
+        loop_share=loop_share,
+        wrong_language=wrong_language,
+        hallucinated=hallucinated,
+    )
+
+
+def is_wrong_language(payload: Dict[str, Any]) -> bool:
+    """Heuristic flag that WhisperX transcribed in the wrong language; see analyze()."""
+    return analyze(payload).wrong_language
+
+
+def looks_like_hallucination(payload: Dict[str, Any]) -> bool:
+    """Heuristic flag for likely-garbage WhisperX output; see analyze()."""
+    return analyze(payload).hallucinated
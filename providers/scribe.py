@@ -17,6 +17,7 @@ from typing import Any, Dict, List, Optional
 
 from providers.replicate import USD_TO_RUB, client
 
+from utils.metrics import PROVIDER_CALL, PROVIDER_ERRORS, track
 from utils.timecodes import extract_segments
 
 
@@ -202,11 +203,12 @@ def build_payload(prediction_id: str, info: Dict[str, Any]) -> Dict[str, Any]:
 async def start_transcription(audio_url: str) -> Optional[str]:
     """Start a Scribe prediction and return its ID, or ``None`` on failure."""
     try:
-        prediction = await asyncio.to_thread(
-            client.models.predictions.create,
-            MODEL,
-            input={"audio": audio_url, "language_code": "rus"},
-        )
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="scribe", call="create"):
+            prediction = await asyncio.to_thread(
+                client.models.predictions.create,
+                MODEL,
+                input={"audio": audio_url, "language_code": "rus"},
+            )
         return prediction.id
     except Exception:
         logging.exception(f"Failed to start Scribe fallback for {audio_url}")
@@ -216,7 +218,8 @@ async def start_transcription(audio_url: str) -> Optional[str]:
 async def check_transcription(operation_id: str) -> Optional[Dict[str, Any]]:
     """Return prediction info if finished, ``None`` while still running."""
     try:
-        prediction = await asyncio.to_thread(client.predictions.get, operation_id)
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="scribe", call="get"):
+            prediction = await asyncio.to_thread(client.predictions.get, operation_id)
     except Exception:
         logging.exception(f"Failed to fetch Scribe prediction {operation_id}")
         return None
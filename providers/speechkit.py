@@ -7,6 +7,8 @@ from decimal import Decimal
 from math import ceil
 from typing import Dict, Optional
 
+from utils.metrics import PROVIDER_CALL, PROVIDER_ERRORS, track
+
 
 API_URL = "https://transcribe.api.cloud.yandex.net/speech/stt/v2/longRunningRecognize"
 OPERATIONS_URL = "https://operation.api.cloud.yandex.net/operations/{id}"
@@ -71,11 +73,12 @@ async def check_transcription(operation_id: str) -> Optional[dict]:
     """Check status of *operation_id* and return result if finished."""
     headers = _auth_headers()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            status_response = await client.get(
-                OPERATIONS_URL.format(id=operation_id), headers=headers
-            )
-        status_response.raise_for_status()
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="speechkit", call="get"):
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                status_response = await client.get(
+                    OPERATIONS_URL.format(id=operation_id), headers=headers
+                )
+            status_response.raise_for_status()
         # Пример ответа:
         # {
         #     'done': True,
@@ -118,9 +121,10 @@ async def start_transcription(s3_uri: str, duration_seconds: int) -> Optional[st
         "folderId": YC_FOLDER_ID,
     }
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(API_URL, json=payload, headers=headers)
-        response.raise_for_status()
+        with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="speechkit", call="create"):
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.post(API_URL, json=payload, headers=headers)
+            response.raise_for_status()
 
         # Пример ответа:
         # {
@@ -0,0 +1,82 @@
+"""Periodic scheduler that moves old result payloads to the S3 archive.
+
+Payloads of transcriptions and refinements created more than
+``RESULT_ARCHIVE_AFTER_DAYS`` days ago are gzipped into S3 and replaced by a
+pointer (utils/result_archive.py), which readers resolve transparently. Each
+table is walked by primary key from a persisted mark, so a tick costs the rows
+that aged past the cutoff since the last one, not a scan of the table. An
+upload failure stops the walk at that row; the next tick retries it.
+"""
+import logging
+import os
+
+import utils.metrics as metrics
+
+from datetime import datetime, timedelta
+
+from telegram.ext import ContextTypes
+
+from database.models import Refinement, Transcription
+from database.queries import get_archivable_results, save_archived_results
+from utils import result_archive
+from utils.utils import MoscowTimezone
+from utils.sentry import sentry_transaction
+
+
+# Payload age, in days, after which it moves to S3; 0 keeps everything in the DB.
+RESULT_ARCHIVE_AFTER_DAYS = int(os.getenv("RESULT_ARCHIVE_AFTER_DAYS") or 0)
+
+ARCHIVED_COLUMNS = (Transcription.result_json, Refinement.result_text)
+
+_BATCH = 200
+# Bounds one tick while a large backlog is worked off.
+_BATCHES_PER_TICK = 25
+
+
+async def _archive_column(column, cutoff: datetime) -> int:
+    """Archive the aged payloads of *column*; the number moved."""
+    archived = 0
+    for _ in range(_BATCHES_PER_TICK):
+        rows, last_id = get_archivable_results(column, cutoff, _BATCH)
+        if last_id is None:
+            break
+        pointers = {}
+        failed = False
+        for row_id, payload in rows:
+            if not payload or result_archive.is_archived(payload):
+                continue
+            name = result_archive.object_name(column.class_.__tablename__, column.key, row_id)
+            pointer = await result_archive.archive(name, payload)
+            if pointer is None:
+                last_id, failed = row_id - 1, True
+                break
+            pointers[row_id] = pointer
+        save_archived_results(column, pointers, last_id)
+        archived += len(pointers)
+        if failed:
+            break
+    return archived
+
+
+@metrics.timed_tick("archive_results")
+async def archive_old_results(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Move result payloads older than RESULT_ARCHIVE_AFTER_DAYS to S3."""
+    if not RESULT_ARCHIVE_AFTER_DAYS:
+        return  # disabled runs do not open a Sentry transaction at all
+    await _archive_old_results()
+
+
+@sentry_transaction(name="results.archive", op="task.archive")
+async def _archive_old_results() -> None:
+    cutoff = datetime.now(MoscowTimezone) - timedelta(days=RESULT_ARCHIVE_AFTER_DAYS)
+    archived = 0
+    try:
+        for column in ARCHIVED_COLUMNS:
+            archived += await _archive_column(column, cutoff)
+    except Exception:
+        logging.exception("Failed to archive old results")
+        return
+
+    metrics.SCHEDULER_ITEMS.observe(archived, job="archive_results")
+    if archived:
+        logging.info("Archived %d old result payloads to S3", archived)
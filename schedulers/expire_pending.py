@@ -11,6 +11,8 @@ not_pending path as a cancelled task, so the user is never charged.
 """
 import logging
 
+import utils.metrics as metrics
+
 from datetime import datetime, timedelta
 
 from telegram.ext import ContextTypes
@@ -24,6 +26,7 @@ _EXPIRE_AFTER_DAYS = 7
 
 
 @sentry_transaction(name="transcription.expire_pending", op="task.expire")
+@metrics.timed_tick("expire_pending")
 async def expire_stale_pending(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Move pending transcriptions older than a week to the expired status."""
     cutoff = datetime.now(MoscowTimezone) - timedelta(days=_EXPIRE_AFTER_DAYS)
@@ -34,6 +37,7 @@ async def expire_stale_pending(context: ContextTypes.DEFAULT_TYPE) -> None:
         sentry_drop_transaction()
         return
 
+    metrics.SCHEDULER_ITEMS.observe(expired, job="expire_pending")
     if expired:
         logging.info("Expired %d stale pending transcriptions", expired)
     else:
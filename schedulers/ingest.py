@@ -0,0 +1,187 @@
+"""One-off job that resumes ingest jobs a restart interrupted.
+
+A job still running in the database that no task of this process works on
+was cut off by a restart (or a crash) mid-ingest. Each one picks up from the
+stage after its last recorded one: the file is fetched again from Telegram
+or Max only if the download had not finished, the conversion and the S3
+upload are redone only if they had not, and the user finally gets the usual
+"audio prepared" message with the confirm buttons. Progress messages are not
+shown on this path. A job that fails, or has already been resumed
+MAX_RESUME_ATTEMPTS times, asks the user to send the file again.
+"""
+import asyncio
+import logging
+import os
+
+import messengers.common as sender
+import messengers.max as max_sender
+import messengers.telegram as tg_sender
+import providers.speechkit as speechkit_provider
+import utils.ingest as ingest
+
+from pathlib import Path
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+from database.models import (
+    PLATFORM_MAX, PLATFORM_TELEGRAM, PROVIDER_REPLICATE,
+    STATUS_COMPLETED, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING,
+    INGEST_STAGE_CONVERTED, INGEST_STAGE_DOWNLOADED, INGEST_STAGE_PRICED,
+    INGEST_STAGE_RECEIVED, INGEST_STAGE_UPLOADED,
+)
+from database.queries import add_transcription, get_ingest_jobs_by_status, get_user, update_ingest_job
+from utils.ffmpeg import convert_to_ogg, get_mean_volume, get_media_duration
+from utils.max_download import download_max_file
+from utils.s3 import upload_file
+from utils.sentry import sentry_transaction, sentry_drop_transaction
+from utils.tg import extract_local_path, sanitize_filename
+from utils.utils import MAX_AUDIO_DURATION, MIN_PRICE_RUB
+
+
+USE_LOCAL_PTB = os.environ.get("USE_LOCAL_PTB") is not None
+
+_RESUME_FAILED_TEXT = (
+    "❌ Не удалось подготовить файл после перезапуска бота\n\n"
+    "Пожалуйста, отправьте его ещё раз"
+)
+
+
+@sentry_transaction(name="ingest.resume", op="task.resume")
+async def resume_ingest_jobs(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Resume every running ingest job this process is not already working on."""
+    jobs = [job for job in get_ingest_jobs_by_status(STATUS_RUNNING) if not ingest.is_active(job.id)]
+    if not jobs:
+        sentry_drop_transaction()
+        return
+
+    logging.info("Resuming %d interrupted ingest job(s)", len(jobs))
+    for job in jobs:
+        context.application.create_task(_resume(context, job))
+
+
+async def _resume(context: ContextTypes.DEFAULT_TYPE, job) -> None:
+    ingest.track(job)
+    if job.attempts >= ingest.MAX_RESUME_ATTEMPTS:
+        logging.warning("Ingest job %s resumed %d times already, giving up", job.id, job.attempts)
+        ingest.finish(job, STATUS_FAILED)
+        await sender.safe_send_message(context, job.user_platform, job.user_id, _RESUME_FAILED_TEXT)
+        return
+    update_ingest_job(job.id, attempts=job.attempts + 1)
+
+    logging.info("Resuming ingest job %s after stage %s", job.id, job.stage)
+    try:
+        resumed = await _run_stages(context, job)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logging.exception("Failed to resume ingest job %s", job.id)
+        resumed = False
+    if not resumed:
+        ingest.finish(job, STATUS_FAILED)
+        await sender.safe_send_message(context, job.user_platform, job.user_id, _RESUME_FAILED_TEXT)
+
+
+async def _download(context: ContextTypes.DEFAULT_TYPE, job, local_path: Path) -> bool:
+    # A partial file or a stale symlink from the interrupted attempt.
+    local_path.unlink(missing_ok=True)
+    if job.user_platform == PLATFORM_MAX:
+        return await download_max_file(job.source_ref, local_path)
+
+    file = await context.bot.get_file(job.source_ref, read_timeout=600)
+    if USE_LOCAL_PTB:
+        local_path.symlink_to(extract_local_path(file.file_path))
+    else:
+        await file.download_to_drive(custom_path=str(local_path))
+    return True
+
+
+async def _run_stages(context: ContextTypes.DEFAULT_TYPE, job) -> bool:
+    """Run the stages after ``job.stage``; False if the file could not be prepared."""
+    if job.stage in (INGEST_STAGE_RECEIVED, INGEST_STAGE_DOWNLOADED, INGEST_STAGE_CONVERTED):
+        in_dir, out_dir = ingest.job_dirs(job.id)
+        local_path = in_dir / job.file_name
+        safe_stem = sanitize_filename(local_path.stem)
+        ogg_path = out_dir / f"{safe_stem}.ogg"
+
+    if job.stage == INGEST_STAGE_RECEIVED:
+        if not await _download(context, job, local_path):
+            return False
+        ingest.advance(job, INGEST_STAGE_DOWNLOADED)
+
+    if job.stage == INGEST_STAGE_DOWNLOADED:
+        duration = await get_media_duration(local_path)
+        if not duration or duration > MAX_AUDIO_DURATION:
+            return False
+        if await convert_to_ogg(local_path, ogg_path, out_dir / f"{safe_stem}.progress"):
+            return False
+        try:
+            local_path.resolve().unlink(missing_ok=True)
+        except Exception:
+            logging.exception("Could not remove original file %s", local_path)
+        ingest.advance(job, INGEST_STAGE_CONVERTED, duration_seconds=int(duration))
+
+    if job.stage == INGEST_STAGE_CONVERTED:
+        mean_volume_db = await get_mean_volume(ogg_path)
+        object_name = f"source/{job.user_id}/{job.source_message_id}_{ogg_path.name}"
+        s3_url = await upload_file(ogg_path, object_name)
+        if not s3_url:
+            return False
+        ingest.advance(job, INGEST_STAGE_UPLOADED, mean_volume_db=mean_volume_db, audio_s3_path=s3_url)
+        ingest.remove_job_dir(job.id)
+
+    if job.stage == INGEST_STAGE_UPLOADED:
+        history = add_transcription(
+            user_id=job.user_id,
+            platform=job.user_platform,
+            status=STATUS_PENDING,
+            audio_s3_path=job.audio_s3_path,
+            provider=PROVIDER_REPLICATE,
+            duration_seconds=job.duration_seconds,
+            mean_volume_db=job.mean_volume_db,
+            price_for_user=_price(job),
+            result_s3_path=None,
+        )
+        ingest.advance(job, INGEST_STAGE_PRICED, transcription_id=history.id)
+
+    await _send_prepared(context, job)
+    ingest.finish(job, STATUS_COMPLETED)
+    return True
+
+
+def _price(job):
+    return max(MIN_PRICE_RUB, speechkit_provider.cost_in_rub(job.duration_seconds))
+
+
+async def _send_prepared(context: ContextTypes.DEFAULT_TYPE, job) -> None:
+    """The confirm message the handler would have sent, then the topup prompt if needed."""
+    price_for_user = _price(job)
+    text = "🎧 Аудио подготовлено\n\n" + ingest.prepared_details(
+        job.duration_seconds, price_for_user, job.mean_volume_db
+    )
+    tg_keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("Распознать", callback_data=f"create_task:{job.transcription_id}"),
+        InlineKeyboardButton("Отменить", callback_data=f"cancel_task:{job.transcription_id}"),
+    ]])
+    await sender.safe_send_message_with_keyboard(
+        context, job.user_platform, job.user_id, text,
+        tg_keyboard=tg_keyboard,
+        max_keyboard=max_sender.make_confirm_keyboard(job.transcription_id),
+    )
+
+    if job.ack_message_id:
+        if job.user_platform == PLATFORM_TELEGRAM:
+            await tg_sender.safe_delete_message(context.bot, job.user_id, int(job.ack_message_id))
+        elif (max_bot := context.bot_data.get("max_bot")) is not None:
+            await max_sender.safe_delete_message(max_bot, job.ack_message_id)
+
+    user = get_user(job.user_id, job.user_platform)
+    if user is not None and user.balance < price_for_user:
+        await sender.safe_send_message_with_keyboard(
+            context, job.user_platform, job.user_id,
+            f"⚠️ На балансе не хватает средств\n\n"
+            f"Баланс: {user.balance} ₽, стоимость: {price_for_user} ₽\n\n"
+            f"Пополните баланс и нажмите «Распознать»",
+            tg_keyboard=tg_sender.make_topup_amounts_keyboard(),
+            max_keyboard=max_sender.make_topup_amounts_keyboard(),
+        )
@@ -3,6 +3,8 @@ import logging
 import os
 import re
 
+import utils.metrics as metrics
+
 from pathlib import Path
 
 from telegram.ext import ContextTypes
@@ -40,6 +42,7 @@ def _render_values(stats: dict[str, int]) -> dict[str, str]:
 
 
 @sentry_transaction(name="landing.refresh_stats", op="task.refresh")
+@metrics.timed_tick("landing_stats")
 async def refresh_landing_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Re-render the three data-stat markers in landing/index.html."""
     try:
@@ -0,0 +1,64 @@
+"""Periodic sender of the Metrica conversion outbox (utils/marketing.py).
+
+track_goal() only queues hits in metrica_outbox, so a restart no longer loses
+a conversion mid-retry. Each tick claims a batch of due hits, sends them
+concurrently over marketing's pooled client and records every outcome in one
+transaction: sent and rejected hits leave the outbox, transient failures come
+back after marketing.retry_delay(), until MAX_ATTEMPTS. Metrica attributes an
+event to the visit its pageview opened, so events go out only once the
+pageviews of the batch have been attempted.
+"""
+import asyncio
+import logging
+
+from datetime import datetime, timedelta
+
+from telegram.ext import ContextTypes
+
+import utils.marketing as marketing
+import utils.metrics as metrics
+
+from database.queries import claim_metrica_hits, count_metrica_hits, finish_metrica_hits
+from utils.utils import MoscowTimezone
+from utils.sentry import sentry_transaction
+
+
+_BATCH = 100
+# Claimed hits stay reserved this long, well past one tick's sends.
+_LEASE = timedelta(minutes=5)
+
+
+@metrics.timed_tick("metrica")
+async def send_metrica_hits(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the due hits of the Metrica outbox."""
+    if not marketing.enabled():
+        return  # nothing is queued while Metrica is off
+
+    metrics.METRICA_BACKLOG.set(count_metrica_hits())
+    hits = claim_metrica_hits(_BATCH, _LEASE)
+    metrics.SCHEDULER_ITEMS.observe(len(hits), job="metrica")
+    if not hits:
+        return  # empty ticks do not open a Sentry transaction at all
+    await _send_hits(hits)
+
+
+@sentry_transaction(name="metrica.send", op="task.send")
+async def _send_hits(hits) -> None:
+    pageviews = [hit for hit in hits if hit.hit_type == "pageview"]
+    events = [hit for hit in hits if hit.hit_type != "pageview"]
+    results = await asyncio.gather(*(marketing.send_hit(hit) for hit in pageviews))
+    results += await asyncio.gather(*(marketing.send_hit(hit) for hit in events))
+
+    now = datetime.now(MoscowTimezone)
+    done, retry_at = [], {}
+    for hit, sent in zip(pageviews + events, results):
+        if sent is None and hit.attempts + 1 < marketing.MAX_ATTEMPTS:
+            retry_at[hit.id] = now + timedelta(seconds=marketing.retry_delay(hit.attempts))
+            continue
+        done.append(hit.id)
+        if not sent:
+            # Losing the conversion itself skews Direct's attribution, so it
+            # goes to Sentry; a lost pageview alone is less critical.
+            level = logging.ERROR if hit.hit_type == "event" else logging.WARNING
+            logging.log(level, "Metrica %s lost: yclid=%s goal=%s", hit.hit_type, hit.yclid, hit.goal)
+    finish_metrica_hits(done, retry_at)
@@ -25,11 +25,13 @@ import logging
 
 import config
 import utils.heartbeat as heartbeat
+import utils.metrics as metrics
 
 from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
 
 
+@metrics.timed_tick("pollers")
 async def check_pollers(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Probe each enabled poller; beat only if all are reachable."""
     healthy = True
@@ -1,8 +1,10 @@
 """Periodic scheduler for checking refinement statuses."""
+import asyncio
 import logging
 
 import messengers.common as sender
 import utils.heartbeat as heartbeat
+import utils.metrics as metrics
 
 from datetime import datetime
 
@@ -19,19 +21,23 @@ from utils.transcription import get_result_text
 from utils.summarize import REPLICATE_LLM_MODEL, check_refinement, start_refinement
 from utils.tg import need_edit, prune_edit_cache
 from utils.utils import MoscowTimezone, format_duration, INLINE_MAX_CHARS
-from utils.sentry import sentry_transaction, sentry_drop_transaction
+from utils.sentry import sentry_transaction
 
 
-@sentry_transaction(name="refinement.poll", op="task.check")
+@metrics.timed_tick("refinement")
 async def check_refinements(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Pick up pending refinements and poll running ones."""
     heartbeat.beat("refinement")
     pending_refinements = get_refinements_by_status(STATUS_PENDING)
     running_refinements = get_refinements_by_status(STATUS_RUNNING)
+    metrics.SCHEDULER_ITEMS.observe(len(pending_refinements) + len(running_refinements), job="refinement")
     if not pending_refinements and not running_refinements:
-        sentry_drop_transaction()
-        return
+        return  # empty ticks do not open a Sentry transaction at all
+    await _poll_refinements(context, pending_refinements, running_refinements)
+
 
+@sentry_transaction(name="refinement.poll", op="task.check")
+async def _poll_refinements(context: ContextTypes.DEFAULT_TYPE, pending_refinements, running_refinements) -> None:
     prune_edit_cache(context, {r.id for r in running_refinements}, cache_key="refinement_status_cache")
 
     await _process_pending(context, pending_refinements)
@@ -43,7 +49,7 @@ async def _process_pending(context: ContextTypes.DEFAULT_TYPE, pending_refinemen
         fail_text = "❌ Не удалось оформить текст" if record.task_type == "improve" else "❌ Не удалось создать конспект"
 
         transcription = get_transcription(record.transcription_id)
-        text = get_result_text(transcription.provider, transcription.result_json) if transcription else None
+        text = await asyncio.to_thread(get_result_text, transcription.provider, transcription.result_json) if transcription else None
         if not text:
             logging.warning("Refinement %s failed: transcription %s missing or has no result text", record.id, record.transcription_id)
             update_refinement(record.id, status=STATUS_FAILED, finished_at=datetime.now(MoscowTimezone))
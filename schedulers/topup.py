@@ -1,8 +1,21 @@
-"""Periodic scheduler for checking pending payment statuses."""
+"""Periodic scheduler for checking pending payment statuses.
+
+Each tick claims every due payment with one UPDATE, asks Tinkoff for their
+states concurrently (payment.py pools the connections and caps the request
+rate) and credits all the confirmed ones in one transaction.
+
+With TERMINAL_NOTIFICATION_URL set, Tinkoff pushes status changes to
+healthcheck.py, which hands them to apply_notification(); once that server
+is running, the poller only reconciles notifications that never arrived,
+every _RECONCILE_INTERVAL.
+"""
+import asyncio
 import logging
 
+import config
 import messengers.common as sender
 import utils.heartbeat as heartbeat
+import utils.metrics as metrics
 
 from decimal import Decimal
 from datetime import datetime, timedelta
@@ -11,15 +24,15 @@ from telegram.ext import ContextTypes
 
 from payment import get_payment_state, cancel_payment
 from database.queries import (
-    get_payments_due_for_check,
-    claim_payment_for_check,
-    confirm_payment,
+    claim_due_payments,
+    confirm_payments,
     expire_payment,
     fail_payment_record,
+    get_payment_by_order_id,
     update_payment,
 )
 from utils.utils import MoscowTimezone, available_time_by_balance
-from utils.sentry import sentry_transaction, sentry_drop_transaction
+from utils.sentry import sentry_transaction
 from utils.marketing import track_goal
 
 
@@ -32,6 +45,11 @@ _PHASE1_INTERVAL = 10
 _PHASE2_INTERVAL = 30
 _PHASE3_INTERVAL = 60
 
+# Polling interval while Tinkoff notifications drive the status changes.
+_RECONCILE_INTERVAL = 5 * 60
+# Set by healthcheck.py once POST /tinkoff/notification is being served.
+_notifications_served = False
+
 # Terminal Tinkoff statuses that mean the payment will never be confirmed.
 # AUTHORIZED is intentionally excluded — it is a transient in-progress state.
 _TERMINAL_FAILURE_STATUSES = {"REJECTED", "AUTH_FAIL", "CANCELED", "DEADLINE_EXPIRED"}
@@ -44,7 +62,15 @@ _FAILURE_MESSAGES = {
 }
 
 
+def serve_notifications() -> None:
+    """Mark Tinkoff notifications as received, slowing polling to reconciliation."""
+    global _notifications_served
+    _notifications_served = True
+
+
 def _check_interval(age_seconds: float) -> int:
+    if config.TERMINAL_NOTIFICATION_URL and _notifications_served:
+        return _RECONCILE_INTERVAL
     if age_seconds < _PHASE1_END:
         return _PHASE1_INTERVAL
     if age_seconds < _PHASE2_END:
@@ -52,56 +78,83 @@ def _check_interval(age_seconds: float) -> int:
     return _PHASE3_INTERVAL
 
 
-@sentry_transaction(name="payment.poll", op="task.check")
+def _age_seconds(payment, now: datetime) -> float:
+    return (now - payment.created_at.replace(tzinfo=MoscowTimezone)).total_seconds()
+
+
+@metrics.timed_tick("payments")
 async def check_pending_payments(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Poll due payments; credit balance when confirmed, expire after 3 hours."""
     heartbeat.beat("payments")
-    payments = get_payments_due_for_check()
-    if not payments:
-        sentry_drop_transaction()
-        return
-
     now = datetime.now(MoscowTimezone)
 
-    for payment in payments:
-        created_at = payment.created_at.replace(tzinfo=MoscowTimezone)
-        age_seconds = (now - created_at).total_seconds()
-
+    def next_check_at(payment) -> datetime:
+        age_seconds = _age_seconds(payment, now)
         if age_seconds >= _PHASE3_END:
             # Sentinel far in the future prevents other workers from racing on expiry
-            if not claim_payment_for_check(payment.order_id, now + timedelta(days=1)):
-                continue
-            await _expire_payment(context, payment)
-            continue
-
-        interval = _check_interval(age_seconds)
-        if not claim_payment_for_check(payment.order_id, now + timedelta(seconds=interval)):
-            continue
-
-        try:
-            tinkoff_response = await get_payment_state(payment.payment_id)
-        except Exception:
-            logging.exception("Failed to get payment state for order %s", payment.order_id)
-            continue
-
-        payment_status = tinkoff_response.get("Status")
+            return now + timedelta(days=1)
+        return now + timedelta(seconds=_check_interval(age_seconds))
+
+    payments = claim_due_payments(next_check_at)
+    metrics.SCHEDULER_ITEMS.observe(len(payments), job="payments")
+    if not payments:
+        return  # empty ticks do not open a Sentry transaction at all
+    await _poll_payments(context, payments, now)
+
+
+async def _get_state(payment) -> str | None:
+    """Tinkoff status of *payment*, or ``None`` if the request failed."""
+    try:
+        tinkoff_response = await get_payment_state(payment.payment_id)
+    except Exception:
+        logging.exception("Failed to get payment state for order %s", payment.order_id)
+        return None
+    return tinkoff_response.get("Status")
+
+
+@sentry_transaction(name="payment.poll", op="task.check")
+async def _poll_payments(context: ContextTypes.DEFAULT_TYPE, payments, now: datetime) -> None:
+    states = await asyncio.gather(*(_get_state(payment) for payment in payments))
+
+    confirmed = {}
+    for payment, payment_status in zip(payments, states):
         if payment_status == "CONFIRMED":
-            await _confirm_payment(context, payment, payment_status)
+            confirmed[payment.order_id] = payment
+        elif _age_seconds(payment, now) >= _PHASE3_END:
+            await _expire_payment(context, payment, payment_status)
         elif payment_status in _TERMINAL_FAILURE_STATUSES:
             await _fail_payment(context, payment, payment_status)
-        # Otherwise still in progress (NEW / AUTHORIZED / ...) → poll again next tick
-
+        # Otherwise still in progress (NEW / AUTHORIZED / ...) or the check
+        # failed → poll again at next_check_at
+
+    if confirmed:
+        # confirm_payments() holds SELECT FOR UPDATE, so only one caller can
+        # credit the balance; payments handled by another path are left out.
+        confirmations = confirm_payments({order_id: "CONFIRMED" for order_id in confirmed})
+        for order_id, confirmation in confirmations.items():
+            await _notify_confirmed(context, confirmed[order_id], *confirmation)
+
+
+async def apply_notification(context: ContextTypes.DEFAULT_TYPE, data: dict) -> None:
+    """Act on a verified Tinkoff notification as a poll would on the same status."""
+    payment = get_payment_by_order_id(str(data.get("OrderId")))
+    if payment is None or str(payment.payment_id) != str(data.get("PaymentId")):
+        logging.warning("Notification for unknown payment %s/%s", data.get("OrderId"), data.get("PaymentId"))
+        return
 
-async def _confirm_payment(context: ContextTypes.DEFAULT_TYPE, payment, payment_status: str) -> None:
-    """Atomically confirm payment and notify user.
+    payment_status = data.get("Status")
+    if payment_status == "CONFIRMED":
+        # Same lock as the poller: whichever gets there first credits the balance.
+        confirmations = confirm_payments({payment.order_id: "CONFIRMED"})
+        if payment.order_id in confirmations:
+            await _notify_confirmed(context, payment, *confirmations[payment.order_id])
+    elif payment_status in _TERMINAL_FAILURE_STATUSES:
+        await _fail_payment(context, payment, payment_status)
+    # Intermediate statuses (AUTHORIZED, ...) change nothing on our side.
 
-    Uses confirm_payment() which holds SELECT FOR UPDATE, so only one caller
-    (scheduler or manual button) can credit the balance.
-    """
-    won, user = confirm_payment(payment.order_id, payment_status)
-    if not won:
-        return  # another path already handled this payment
 
+async def _notify_confirmed(context: ContextTypes.DEFAULT_TYPE, payment, user, first: bool) -> None:
+    """Tell the user their balance was credited."""
     if payment.message_id:
         await sender.safe_remove_keyboard(context, payment.user_platform, payment.user_id, payment.message_id)
 
@@ -115,11 +168,10 @@ async def _confirm_payment(context: ContextTypes.DEFAULT_TYPE, payment, payment_
     await sender.safe_send_message(context, payment.user_platform, payment.user_id, text)
 
     # Report the ad-attributed user's first payment to Metrika as a per-platform
-    # paid conversion. total_topped_up is trigger-maintained and already includes
-    # this payment (confirm_payment refreshes the row), so equality with this
-    # payment's amount means no earlier confirmed payment existed.
-    if user.yclid and user.total_topped_up == payment.amount:
-        context.application.create_task(track_goal(user.yclid, f"{payment.user_platform}_paid"))
+    # paid conversion. confirm_payments decides "first" from total_topped_up
+    # before the batch, so two first payments credited together count once.
+    if user.yclid and first:
+        track_goal(user.yclid, f"{payment.user_platform}_paid")
 
 
 async def _fail_payment(context: ContextTypes.DEFAULT_TYPE, payment, payment_status: str) -> None:
@@ -137,30 +189,21 @@ async def _fail_payment(context: ContextTypes.DEFAULT_TYPE, payment, payment_sta
         await sender.safe_edit_message(context, payment.user_platform, payment.user_id, payment.message_id, text)
 
 
-async def _expire_payment(context: ContextTypes.DEFAULT_TYPE, payment) -> None:
-    """Check provider one last time before expiring.
+async def _expire_payment(context: ContextTypes.DEFAULT_TYPE, payment, payment_status: str | None) -> None:
+    """Expire a payment after the final provider check (*payment_status*).
 
-    If the check fails (network error), reschedule a retry instead of expiring.
-    If the provider reports success, confirm the payment.
-    Otherwise mark as EXPIRED and cancel with Tinkoff.
+    If the check failed (network error), reschedule a retry instead of
+    expiring. A confirmed payment never gets here: it is credited with the
+    rest of the tick. Otherwise mark as EXPIRED and cancel with Tinkoff.
     """
-    try:
-        tinkoff_response = await get_payment_state(payment.payment_id)
-        payment_status = tinkoff_response.get("Status")
-    except Exception:
-        logging.exception(
-            "Final status check failed for payment %s; rescheduling retry", payment.order_id
-        )
+    if payment_status is None:
+        logging.warning("Final status check failed for payment %s; rescheduling retry", payment.order_id)
         update_payment(
             payment.order_id,
             next_check_at=datetime.now(MoscowTimezone) + timedelta(seconds=_PHASE3_INTERVAL),
         )
         return
 
-    if payment_status == "CONFIRMED":
-        await _confirm_payment(context, payment, payment_status)
-        return
-
     if not expire_payment(payment.order_id):
         return  # already cancelled by the user or another process
 
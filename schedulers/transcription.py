@@ -1,5 +1,7 @@
 """Periodic scheduler for checking transcription statuses."""
+import asyncio
 import logging
+import os
 
 import providers.replicate as replicate_provider
 import providers.scribe as scribe_provider
@@ -7,21 +9,25 @@ import providers.speechkit as speechkit_provider
 import messengers.telegram as tg_sender
 import messengers.max as max_sender
 import messengers.common as sender
+import utils.chunking as chunking
 import utils.heartbeat as heartbeat
+import utils.metrics as metrics
+import utils.routing as routing
+import utils.timecodes_cache as timecodes_cache
 
 from decimal import Decimal
 from pathlib import Path
 from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
 
 from telegram.ext import ContextTypes
 
-from database.models import PROVIDER_REPLICATE, STATUS_RUNNING, STATUS_COMPLETED, STATUS_REJECTED
+from database.models import PROVIDER_REPLICATE, STATUS_RUNNING, STATUS_REJECTED
 from database.queries import (
-    add_shadow_transcription,
+    TranscriptionWrites,
+    complete_transcription,
     fail_transcription_and_refund,
     get_transcriptions_by_status,
-    get_user,
-    has_other_completed_transcription,
     update_transcription,
 )
 from utils.marketing import track_goal
@@ -29,10 +35,10 @@ from utils.marketing import track_goal
 from utils.s3 import get_signed_url, object_name_from_url
 from utils.utils import format_duration, MoscowTimezone, SUMMARIZE_THRESHOLD, INLINE_MAX_CHARS, RATING_PROMPT
 from utils.timecodes import parse_result_json
-from utils.transcription import check_transcription, get_result
+from utils.transcription import cancel_transcription, check_transcription, get_result
 from utils.tg import need_edit, prune_edit_cache
 from utils.tokens import tokens_by_model
-from utils.sentry import sentry_transaction, sentry_drop_transaction
+from utils.sentry import sentry_transaction
 
 
 # Safety net only. A task with no result after this long is treated as hung and
@@ -59,8 +65,56 @@ ZOMBIE_SECONDS = 10 * 60
 # apply, and a process restart resumes the challenge from the DB.
 SCRIBE_OP_PREFIX = "scribe:"
 
+# Marks a hedged task: its WhisperX prediction was still waiting in Replicate's
+# queue past the target from recent history (utils/routing.py), so a Scribe
+# prediction of the same audio runs next to it and operation_id is
+# "hedge:<whisperx id>|<scribe id>". The first acceptable result is delivered
+# and the other prediction cancelled; like a challenge, a restart resumes it.
+HEDGE_OP_PREFIX = "hedge:"
 
-async def _start_scribe_challenge(task, reason: str) -> bool:
+# WhisperX predictions seen past the queue; they are not hedged any more.
+_not_queued: set[str] = set()
+
+
+def is_hedging_enabled() -> bool:
+    return os.getenv("HEDGING_ENABLED") == "1"
+
+
+class _Leg(NamedTuple):
+    """One finished prediction of a hedged task."""
+
+    model: str
+    payload: Optional[Dict[str, Any]]  # None if the prediction failed
+    verdict: Optional[replicate_provider.HeuristicVerdict]
+    cost: Decimal
+
+    @property
+    def acceptable(self) -> bool:
+        verdict = self.verdict
+        return bool(verdict and verdict.text and not verdict.hallucinated and not verdict.wrong_language)
+
+
+def pick_hedge_winner(primary: Optional[_Leg], scribe: Optional[_Leg], timed_out: bool = False) -> Optional[str]:
+    """"primary", "scribe", "failed", or ``None`` to keep waiting.
+
+    The first acceptable result wins, WhisperX on a tie. Once both have
+    finished (or time is up) without one, the WhisperX output still goes
+    through the usual wrong-language / rejection flow, then Scribe's.
+    """
+    if primary is not None and primary.acceptable:
+        return "primary"
+    if scribe is not None and scribe.acceptable:
+        return "scribe"
+    if not timed_out and (primary is None or scribe is None):
+        return None
+    if primary is not None and primary.payload is not None:
+        return "primary"
+    if scribe is not None and scribe.payload is not None:
+        return "scribe"
+    return "failed"
+
+
+async def _start_scribe_challenge(task, reason: str, writes: TranscriptionWrites) -> bool:
     """Kick off the challenger for a suspicious primary result."""
     signed_url = await get_signed_url(
         object_name_from_url(task.audio_s3_path), expires_in=6 * 3600
@@ -70,12 +124,14 @@ async def _start_scribe_challenge(task, reason: str) -> bool:
     prediction_id = await scribe_provider.start_transcription(signed_url)
     if not prediction_id:
         return False
-    update_transcription(task.id, operation_id=SCRIBE_OP_PREFIX + prediction_id)
+    # Written at once, with the primary result queued this tick: the
+    # challenger is a paid prediction a crash before flush() would orphan.
+    update_transcription(task.id, **writes.take(task.id, operation_id=SCRIBE_OP_PREFIX + prediction_id))
     logging.info("Scribe challenge started task=%s reason=%s", task.id, reason)
     return True
 
 
-async def _resolve_scribe_challenge(task, duration: int):
+async def _resolve_scribe_challenge(task, duration: int, writes: TranscriptionWrites):
     """Settle a finished challenge: pick the better result for delivery.
 
     Returns ``(text, wrong_language, hallucinated)``, or ``None`` while the
@@ -93,15 +149,16 @@ async def _resolve_scribe_challenge(task, duration: int):
         logging.warning("Scribe challenge timed out task=%s, delivering primary", task.id)
         info = {"status": "canceled"}
 
-    prod_payload = parse_result_json(task.result_json) or {}
-    prod_text = replicate_provider.get_text(prod_payload)
+    prod_verdict = replicate_provider.analyze(parse_result_json(task.result_json) or {})
+    prod_text = prod_verdict.text
 
     if info.get("status") == "succeeded" and info.get("output"):
         scribe_payload = scribe_provider.build_payload(operation_id, info)
-        scribe_text = replicate_provider.get_text(scribe_payload)
+        scribe_verdict = replicate_provider.analyze(scribe_payload)
+        scribe_text = scribe_verdict.text
         wins = scribe_provider.challenger_wins(
             prod_text, scribe_text
-        ) and not replicate_provider.looks_like_hallucination(scribe_payload)
+        ) and not scribe_verdict.hallucinated
         actual_price = (task.actual_price or Decimal("0")) + scribe_provider.cost_in_rub(
             task.duration_seconds
         )
@@ -113,37 +170,179 @@ async def _resolve_scribe_challenge(task, duration: int):
             "scribe" if wins else "prod",
         )
         if wins:
-            add_shadow_transcription(task, model=task.model, result_json=task.result_json)
-            update_transcription(
+            writes.add_shadow(task, model=task.model, result_json=task.result_json)
+            writes.update(
                 task.id,
                 result_json=scribe_payload,
                 model=scribe_provider.MODEL,
                 actual_price=actual_price,
             )
-            return scribe_text, replicate_provider.is_wrong_language(scribe_payload), False
-        add_shadow_transcription(task, model=scribe_provider.MODEL, result_json=scribe_payload)
-        update_transcription(task.id, actual_price=actual_price)
+            timecodes_cache.invalidate(task.id)
+            return scribe_text, scribe_verdict.wrong_language, False
+        writes.add_shadow(task, model=scribe_provider.MODEL, result_json=scribe_payload)
+        writes.update(task.id, actual_price=actual_price)
     else:
         logging.warning(
             "Scribe challenge failed task=%s status=%s error=%s",
             task.id, info.get("status"), info.get("error"),
         )
 
-    return prod_text, False, replicate_provider.looks_like_hallucination(prod_payload)
+    return prod_text, False, prod_verdict.hallucinated
 
 
-@sentry_transaction(name="transcription.poll", op="task.check")
+async def _maybe_hedge(task, duration: int, writes: TranscriptionWrites) -> bool:
+    """Start a Scribe twin of a WhisperX prediction stuck in Replicate's queue."""
+    if not is_hedging_enabled() or task.provider != PROVIDER_REPLICATE:
+        return False
+    if task.language:
+        return False  # Scribe would ignore the language the user picked
+    if task.operation_id.startswith(chunking.CHUNKS_OP_PREFIX) or task.operation_id in _not_queued:
+        return False
+    if (task.duration_seconds or 0) > scribe_provider.MAX_DURATION_SECONDS:
+        return False
+    target = routing.hedge_after_seconds(task.model)
+    if duration < target:
+        return False
+    status = await replicate_provider.get_status(task.operation_id)
+    if status != "starting":
+        if status is not None:
+            _not_queued.add(task.operation_id)
+        return False
+    signed_url = await get_signed_url(
+        object_name_from_url(task.audio_s3_path), expires_in=6 * 3600
+    )
+    if not signed_url:
+        return False
+    prediction_id = await scribe_provider.start_transcription(signed_url)
+    if not prediction_id:
+        return False
+    # Written at once, like a challenge, so a crash cannot orphan the twin.
+    update_transcription(
+        task.id, **writes.take(task.id, operation_id=f"{HEDGE_OP_PREFIX}{task.operation_id}|{prediction_id}")
+    )
+    logging.info(
+        "Hedging task=%s: WhisperX still queued after %ss (target %.0fs), Scribe %s started",
+        task.id, duration, target, prediction_id,
+    )
+    return True
+
+
+def _primary_leg(task, info: Optional[Dict[str, Any]]) -> Optional[_Leg]:
+    if info is None:
+        return None
+    cost = replicate_provider.cost_in_rub(info.get("predict_time") or 0, task.model)
+    if info.get("status") != "succeeded" or not info.get("output"):
+        return _Leg(task.model, None, None, cost)
+    return _Leg(task.model, info, replicate_provider.analyze(info), cost)
+
+
+def _scribe_leg(task, prediction_id: str, info: Optional[Dict[str, Any]]) -> Optional[_Leg]:
+    if info is None:
+        return None
+    if info.get("status") != "succeeded" or not info.get("output"):
+        return _Leg(scribe_provider.MODEL, None, None, Decimal("0"))
+    payload = scribe_provider.build_payload(prediction_id, info)
+    return _Leg(
+        scribe_provider.MODEL, payload, replicate_provider.analyze(payload),
+        scribe_provider.cost_in_rub(task.duration_seconds),
+    )
+
+
+async def _resolve_hedge(context, task, duration: int, now: datetime, writes: TranscriptionWrites):
+    """Settle a hedged task once either prediction has a result worth delivering.
+
+    Returns ``(text, wrong_language, hallucinated)`` like
+    _resolve_scribe_challenge, or ``None`` while waiting and after refunding
+    a task whose predictions both failed or timed out. The prediction still
+    running is cancelled; a finished loser is kept as a shadow row, and
+    actual_price is what both cost.
+    """
+    primary_id, scribe_id = task.operation_id.removeprefix(HEDGE_OP_PREFIX).split("|", 1)
+    primary_info, scribe_info = await asyncio.gather(
+        replicate_provider.check_transcription(primary_id),
+        scribe_provider.check_transcription(scribe_id),
+    )
+    primary = _primary_leg(task, primary_info)
+    scribe = _scribe_leg(task, scribe_id, scribe_info)
+    winner = pick_hedge_winner(primary, scribe, timed_out=duration > MAX_PROCESSING_SECONDS)
+    if winner is None:
+        return None
+
+    for leg, prediction_id in ((primary, primary_id), (scribe, scribe_id)):
+        if leg is None:
+            await replicate_provider.cancel(prediction_id)
+    actual_price = sum((leg.cost for leg in (primary, scribe) if leg is not None), Decimal("0"))
+    logging.info(
+        "Hedge finished task=%s winner=%s whisperx=%s scribe=%s",
+        task.id, winner,
+        primary_info.get("status") if primary_info else "canceled",
+        scribe_info.get("status") if scribe_info else "canceled",
+    )
+
+    if winner == "failed":
+        writes.update(task.id, actual_price=actual_price)
+        if primary is None and scribe is None:
+            await _refund_timed_out(context, task, now, writes)
+        else:
+            writes.update(task.id, finished_at=now)
+            await _refund_failed(context, task, writes)
+        return None
+
+    won, lost = (primary, scribe) if winner == "primary" else (scribe, primary)
+    if lost is not None and lost.payload is not None:
+        writes.add_shadow(task, model=lost.model, result_json=lost.payload)
+    writes.update(
+        task.id,
+        result_json=won.payload,
+        model=won.model,
+        finished_at=now,
+        actual_price=actual_price,
+    )
+    return won.verdict.text, won.verdict.wrong_language, won.verdict.hallucinated
+
+
+async def _refund_failed(context, task, writes: TranscriptionWrites) -> None:
+    fail_transcription_and_refund(task.id, **writes.take(task.id))
+    fail_text = (
+        "❌ Распознавание завершилось с ошибкой\n\n"
+        "Деньги вернули на баланс, попробуйте ещё раз"
+    )
+    await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, fail_text, bold_header=True)
+
+
+async def _refund_timed_out(context, task, now: datetime, writes: TranscriptionWrites) -> None:
+    if fail_transcription_and_refund(task.id, **writes.take(task.id, finished_at=now)):
+        timeout_text = (
+            "❌ Не удалось распознать — очередь обработки перегружена\n\n"
+            "Деньги вернули на баланс, попробуйте ещё раз"
+        )
+        await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, timeout_text)
+
+
+@metrics.timed_tick("transcription")
 async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Poll running transcriptions and send results when ready."""
     heartbeat.beat("transcription")
     tasks = get_transcriptions_by_status(STATUS_RUNNING)
+    metrics.SCHEDULER_ITEMS.observe(len(tasks), job="transcription")
     if not tasks:
-        sentry_drop_transaction()
-        return
+        return  # empty ticks do not open a Sentry transaction at all
+    # Results and shadow rows of the whole tick go to the DB in one
+    # transaction; terminal transitions and started Scribe predictions take
+    # their task's along.
+    writes = TranscriptionWrites()
+    try:
+        await _poll_tasks(context, tasks, writes)
+    finally:
+        writes.flush()
+
 
+@sentry_transaction(name="transcription.poll", op="task.check")
+async def _poll_tasks(context: ContextTypes.DEFAULT_TYPE, tasks, writes: TranscriptionWrites) -> None:
     now = datetime.now(MoscowTimezone)
 
     prune_edit_cache(context, {task.id for task in tasks})
+    _not_queued.intersection_update(task.operation_id for task in tasks)
 
     for task in tasks:
         started_at = task.started_at.replace(tzinfo=MoscowTimezone)
@@ -183,7 +382,12 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
             await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, status_text)
 
         if task.operation_id.startswith(SCRIBE_OP_PREFIX):
-            resolution = await _resolve_scribe_challenge(task, duration)
+            resolution = await _resolve_scribe_challenge(task, duration, writes)
+            if resolution is None:
+                continue
+            text, wrong_language, hallucinated = resolution
+        elif task.operation_id.startswith(HEDGE_OP_PREFIX):
+            resolution = await _resolve_hedge(context, task, duration, now, writes)
             if resolution is None:
                 continue
             text, wrong_language, hallucinated = resolution
@@ -196,18 +400,15 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
 
             # Результата ещё нет
             if result_info is None:
+                # Очередь Replicate стоит — запускаем Scribe параллельно.
+                if await _maybe_hedge(task, duration, writes):
+                    continue
                 # Задача висит слишком долго (очередь провайдера перегружена) —
                 # отменяем её, возвращаем деньги и просим повторить.
                 if duration > MAX_PROCESSING_SECONDS:
-                    if task.provider == PROVIDER_REPLICATE:
-                        await replicate_provider.cancel(task.operation_id)
+                    await cancel_transcription(task.operation_id, provider=task.provider)
                     logging.warning("Cancelling stuck task=%s after %ss", task.id, duration)
-                    if fail_transcription_and_refund(task.id, finished_at=now):
-                        timeout_text = (
-                            "❌ Не удалось распознать — очередь обработки перегружена\n\n"
-                            "Деньги вернули на баланс, попробуйте ещё раз"
-                        )
-                        await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, timeout_text)
+                    await _refund_timed_out(context, task, now, writes)
                 continue
 
             payload = result_info.get("payload") or {}
@@ -217,7 +418,7 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
             else:
                 actual_price = speechkit_provider.cost_in_rub(task.duration_seconds)
 
-            update_transcription(
+            writes.update(
                 task.id,
                 result_json=payload,
                 finished_at=now,
@@ -226,23 +427,21 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
 
             if not result_info.get("success"):
                 logging.warning("Transcription failed task=%s payload=%s", task.id, payload)
-                fail_transcription_and_refund(task.id)
-                fail_text = (
-                    "❌ Распознавание завершилось с ошибкой\n\n"
-                    "Деньги вернули на баланс, попробуйте ещё раз"
-                )
-                await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, fail_text, bold_header=True)
+                await _refund_failed(context, task, writes)
                 continue
 
-            text = get_result(result_info)
+            # One pass over the segments yields the text and every quality
+            # signal — a six-hour payload is not re-walked per heuristic.
+            verdict = (
+                replicate_provider.analyze(payload)
+                if result_info.get("provider") == PROVIDER_REPLICATE
+                else None
+            )
+            text = verdict.text if verdict is not None else get_result(result_info)
 
             # Wrong-language detection needs the real text (before any fallback):
             # an empty result is "no speech", not "wrong language".
-            wrong_language = bool(
-                text
-                and result_info.get("provider") == PROVIDER_REPLICATE
-                and replicate_provider.is_wrong_language(payload)
-            )
+            wrong_language = bool(text and verdict is not None and verdict.wrong_language)
 
             # Output the user must not pay for: no discernible speech, or garbled /
             # looping recognition. Wrong language is excluded — it gets a free
@@ -250,14 +449,15 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
             # there is nothing worth delivering.
             hallucinated = (
                 not wrong_language
-                and result_info.get("provider") == PROVIDER_REPLICATE
-                and replicate_provider.looks_like_hallucination(payload)
+                and verdict is not None
+                and verdict.hallucinated
             )
 
             # A suspicious primary result gets one shot at a better outcome
             # before the reject/deliver decision: the task returns to the poll
-            # loop while the challenger runs.
-            reason = scribe_provider.should_try(
+            # loop while the challenger runs. Not for a forced language, which
+            # Scribe cannot follow.
+            reason = None if task.language else scribe_provider.should_try(
                 provider=task.provider,
                 duration_seconds=task.duration_seconds,
                 mean_volume_db=task.mean_volume_db,
@@ -266,7 +466,7 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
                 wrong_language=wrong_language,
                 hallucinated=hallucinated,
             )
-            if reason and await _start_scribe_challenge(task, reason):
+            if reason and await _start_scribe_challenge(task, reason, writes):
                 continue
 
         token_counts = tokens_by_model(text)
@@ -279,7 +479,7 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
                 "😕 Запись слишком зашумлённая или неразборчивая — распознать не удалось\n\n"
                 "Деньги вернули на баланс"
             )
-            fail_transcription_and_refund(task.id, status=STATUS_REJECTED, finished_at=now)
+            fail_transcription_and_refund(task.id, status=STATUS_REJECTED, **writes.take(task.id, finished_at=now))
             await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, refund_text, bold_header=True)
             continue
 
@@ -328,18 +528,13 @@ async def check_running_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
         # Persist final state before delivering the action keyboard so the
         # buttons (send-as-text / summarize / timecodes) find a usable result
         # the moment they become clickable. The text is served from result_json,
-        # so there is no S3 copy to record.
-        update_transcription(
-            task.id,
-            status=STATUS_COMPLETED,
-            llm_tokens_by_encoding=token_counts,
+        # so there is no S3 copy to record. One transaction writes the result,
+        # the new status and checks for the user's first completed task.
+        first_for = complete_transcription(
+            task.id, **writes.take(task.id, llm_tokens_by_encoding=token_counts),
         )
-        if not has_other_completed_transcription(task.user_id, task.user_platform, task.id):
-            user = get_user(task.user_id, task.user_platform)
-            if user is not None and user.yclid:
-                context.application.create_task(
-                    track_goal(user.yclid, f"{task.user_platform}_first_transcription")
-                )
+        if first_for is not None and first_for.yclid:
+            track_goal(first_for.yclid, f"{task.user_platform}_first_transcription")
         await sender.safe_edit_message(context, task.user_platform, task.user_id, task.message_id, done_text, tg_keyboard=tg_action_keyboard, max_keyboard=max_action_keyboard, bold_header=True)
 
         try:
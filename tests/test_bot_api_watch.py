@@ -0,0 +1,120 @@
+"""Tests for the inotify download watcher of the local Bot API directory (utils.bot_api_watch)."""
+import asyncio
+import sys
+
+import pytest
+
+from utils.bot_api_watch import get_watcher
+
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+
+
+async def _settle():
+    # Let the event loop hand the inotify events to the watcher.
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+def _run(tmp_path, scenario):
+    (tmp_path / "temp").mkdir()
+
+    async def run():
+        watcher = get_watcher(tmp_path)
+        try:
+            await scenario(watcher, tmp_path)
+        finally:
+            watcher.close()
+
+    asyncio.run(run())
+
+
+def test_parallel_downloads_each_get_their_own_progress(tmp_path):
+    async def scenario(watcher, root):
+        watcher.expect("big", 1000)
+        watcher.expect("small", 300)
+        big, small = root / "temp" / "1", root / "temp" / "2"
+        big.write_bytes(b"x" * 200)
+        small.write_bytes(b"x" * 100)
+        await _settle()
+
+        assert watcher.received("big") == 200
+        assert watcher.received("small") == 100
+
+        (root / "documents").mkdir()
+        await _settle()
+        small.write_bytes(b"x" * 300)
+        small.rename(root / "documents" / "file_2.ogg")
+        await _settle()
+
+        assert watcher.received("small") == 300
+        assert watcher.received("big") == 200
+
+    _run(tmp_path, scenario)
+
+
+def test_file_outgrowing_its_download_is_handed_to_the_right_one(tmp_path):
+    async def scenario(watcher, root):
+        watcher.expect("small", 300)
+        watcher.expect("big", 1000)
+        first, second = root / "temp" / "1", root / "temp" / "2"
+        first.write_bytes(b"")
+        second.write_bytes(b"")
+        await _settle()
+        # Paired in order, but the first file is the big download's.
+        first.write_bytes(b"x" * 500)
+        second.write_bytes(b"x" * 50)
+
+        assert watcher.received("small") == 50
+        assert watcher.received("big") == 500
+
+    _run(tmp_path, scenario)
+
+
+def test_completion_is_credited_by_exact_size(tmp_path):
+    async def scenario(watcher, root):
+        watcher.expect("a", 400)
+        watcher.expect("b", 700)
+        first, second = root / "temp" / "1", root / "temp" / "2"
+        first.write_bytes(b"")
+        second.write_bytes(b"")
+        await _settle()
+        # b's file was created first: its move into place credits b, not a.
+        first.write_bytes(b"x" * 700)
+        first.rename(root / "file_1.mp4")
+        await _settle()
+
+        assert watcher.received("b") == 700
+        assert watcher.received("a") == 0
+
+    _run(tmp_path, scenario)
+
+
+def test_files_of_no_pending_download_are_ignored(tmp_path):
+    async def scenario(watcher, root):
+        (root / "temp" / "other").write_bytes(b"x" * 10)
+        await _settle()
+        watcher.expect("late", 100)
+
+        assert watcher.received("late") is None
+        assert not watcher._files
+
+    _run(tmp_path, scenario)
+
+
+def test_same_file_sent_twice_is_tracked_until_both_handlers_are_done(tmp_path):
+    async def scenario(watcher, root):
+        watcher.expect("same", 1000)
+        watcher.expect("same", 1000)
+        await _settle()
+        (root / "temp" / "part").write_bytes(b"x" * 400)
+        await _settle()
+
+        watcher.forget("same")
+        assert watcher.received("same") == 400
+
+        watcher.forget("same")
+        assert watcher.received("same") is None
+        assert not watcher._files
+
+    _run(tmp_path, scenario)
@@ -0,0 +1,151 @@
+"""Tests for chunked transcription of long recordings (utils.chunking)."""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+os.environ.setdefault("S3_ACCESS_KEY", "test")
+os.environ.setdefault("S3_SECRET_KEY", "test")
+os.environ.setdefault("S3_ENDPOINT", "http://s3.test")
+os.environ.setdefault("S3_BUCKET", "test")
+
+import pytest
+
+import utils.chunking as chunking
+
+from database.connection import engine
+from database.models import Base, PLATFORM_TELEGRAM, STATUS_COMPLETED, STATUS_PENDING
+from database.queries import add_transcription, add_transcription_chunks, get_transcription_chunks
+
+
+@pytest.fixture(autouse=True)
+def _database():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _segment(start, end, text, **extra):
+    return {"start": start, "end": end, "text": text, **extra}
+
+
+def test_cuts_fall_in_the_longest_pause_before_each_target():
+    silences = [(1500.0, 1500.6), (1700.0, 1702.0), (3300.0, 3300.8)]
+
+    assert chunking.plan_cuts(5400.0, silences) == [1701.0, 3300.4]
+
+
+def test_cut_is_forced_at_the_target_without_a_pause():
+    assert chunking.plan_cuts(5000.0, []) == [chunking.CHUNK_SECONDS, 2 * chunking.CHUNK_SECONDS]
+
+
+def test_short_recording_is_not_cut():
+    assert chunking.plan_cuts(chunking.CHUNK_SECONDS * chunking.LAST_CHUNK_SLACK, []) == []
+
+
+def test_merge_shifts_times_and_drops_seam_repeats():
+    first = {"segments": [_segment(0.0, 5.0, "Hello"), _segment(5.0, 9.9, "see you at the seam")]}
+    second = {"segments": [
+        _segment(-0.2, 0.1, "see you at the seam"),  # already covered by the first piece
+        _segment(0.2, 3.0, "Next part", words=[{"word": "Next", "start": 0.2, "end": 0.6}]),
+        _segment(12.0, 14.0, "phantom"),  # past the end of the 10 s piece
+    ]}
+
+    merged = chunking.merge_outputs([(0.0, 10.0, first), (10.0, 10.0, second)], "ru")
+
+    assert [s["text"] for s in merged["segments"]] == ["Hello", "see you at the seam", "Next part"]
+    assert merged["segments"][2]["start"] == 10.2
+    assert merged["segments"][2]["words"][0]["end"] == 10.6
+    assert merged["detected_language"] == "ru"
+
+
+def test_majority_language_is_weighted_by_speech_duration():
+    pieces = [
+        (1800.0, {"detected_language": "ru", "segments": [_segment(0, 1, "Привет")]}),
+        (900.0, {"detected_language": "en", "segments": [_segment(0, 1, "Hello")]}),
+        (2000.0, {"detected_language": "en", "segments": [_segment(0, 1, " ")]}),  # no speech
+    ]
+
+    assert chunking.majority_language(pieces) == "ru"
+    assert chunking.majority_language([]) is None
+
+
+@pytest.fixture
+def replicate(monkeypatch):
+    """Predictions keyed by operation id; start_transcription records its calls."""
+    outputs = {}
+    started = []
+
+    async def start_transcription(url, duration, volume, language, model=None):
+        started.append(language)
+        return f"op-{len(started)}"
+
+    async def check_transcription(operation_id):
+        return outputs.get(operation_id)
+
+    async def get_signed_url(object_name, expires_in=3600):
+        return f"https://signed/{object_name}"
+
+    monkeypatch.setattr(chunking.replicate_provider, "start_transcription", start_transcription)
+    monkeypatch.setattr(chunking.replicate_provider, "check_transcription", check_transcription)
+    monkeypatch.setattr(chunking, "get_signed_url", get_signed_url)
+    return outputs, started
+
+
+def _chunked_task(count=3):
+    task = add_transcription(
+        user_id=1, platform=PLATFORM_TELEGRAM, status=STATUS_PENDING, audio_s3_path="s3://full.ogg",
+        duration_seconds=count * 1800, mean_volume_db=-20.0,
+    )
+    add_transcription_chunks(task.id, [
+        {"offset_seconds": index * 1800.0, "duration_seconds": 1800.0, "audio_s3_path": f"s3://part{index}.ogg"}
+        for index in range(count)
+    ])
+    return task
+
+
+def _done(language, text, predict_time=10.0):
+    return {
+        "status": "succeeded", "predict_time": predict_time,
+        "output": {"detected_language": language, "segments": [_segment(1.0, 2.0, text)]},
+    }
+
+
+def test_check_merges_once_every_piece_is_done(replicate):
+    outputs, _ = replicate
+    task = _chunked_task()
+
+    assert asyncio.run(chunking.start(task.id)) == f"chunks:{task.id}"
+    outputs["op-1"] = _done("ru", "один")
+    outputs["op-2"] = _done("ru", "два")
+    assert asyncio.run(chunking.check(task.id)) is None
+
+    outputs["op-3"] = _done("ru", "три")
+    result = asyncio.run(chunking.check(task.id))
+
+    assert result["status"] == "succeeded"
+    assert result["predict_time"] == 30.0
+    assert [(s["start"], s["text"]) for s in result["output"]["segments"]] == [
+        (1.0, "один"), (1801.0, "два"), (3601.0, "три"),
+    ]
+    assert all(c.status == STATUS_COMPLETED for c in get_transcription_chunks(task.id))
+
+
+def test_stray_language_piece_is_transcribed_again(replicate):
+    outputs, started = replicate
+    task = _chunked_task()
+
+    asyncio.run(chunking.start(task.id))
+    outputs["op-1"] = _done("ru", "один")
+    outputs["op-2"] = _done("en", "music")
+    outputs["op-3"] = _done("ru", "три")
+
+    assert asyncio.run(chunking.check(task.id)) is None
+    assert started == [None, None, None, "ru"]
+
+    outputs["op-4"] = _done("ru", "два")
+    result = asyncio.run(chunking.check(task.id))
+
+    assert [s["text"] for s in result["output"]["segments"]] == ["один", "два", "три"]
+    assert result["output"]["detected_language"] == "ru"
+    assert result["predict_time"] == 40.0
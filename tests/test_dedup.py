@@ -0,0 +1,88 @@
+"""Tests for repeat-upload deduplication (utils.dedup and its queries)."""
+import asyncio
+import hashlib
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.dedup as dedup
+
+from database.connection import engine
+from database.models import Base, PLATFORM_MAX, PLATFORM_TELEGRAM, STATUS_COMPLETED, STATUS_PENDING
+from database.queries import (
+    add_transcription, find_completed_duplicate, find_reusable_upload, get_transcription, update_transcription,
+)
+
+
+@pytest.fixture(autouse=True)
+def _database():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _upload(user_id=42, platform=PLATFORM_TELEGRAM, source="src", audio="aud", reused=None):
+    return add_transcription(
+        user_id=user_id, platform=platform, status=STATUS_PENDING, audio_s3_path=f"s3://{user_id}",
+        duration_seconds=60, mean_volume_db=-20.0, source_sha256=source, audio_sha256=audio,
+        audio_uploaded_at=dedup.uploaded_at(reused),
+    )
+
+
+def test_file_sha256_matches_hashlib(tmp_path):
+    path = tmp_path / "memo.m4a"
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+
+    assert asyncio.run(dedup.file_sha256(path)) == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert asyncio.run(dedup.file_sha256(tmp_path / "missing")) is None
+
+
+def test_reusable_upload_matches_either_fingerprint():
+    first = _upload(user_id=1, source="src-1", audio="aud-1")
+    since = datetime.now() - timedelta(days=1)
+
+    assert find_reusable_upload(1, PLATFORM_TELEGRAM, source_sha256="src-1", since=since).id == first.id
+    assert find_reusable_upload(1, PLATFORM_TELEGRAM, source_sha256="other", audio_sha256="aud-1", since=since).id == first.id
+    assert find_reusable_upload(1, PLATFORM_TELEGRAM, source_sha256="other", audio_sha256="other", since=since) is None
+    assert find_reusable_upload(1, PLATFORM_TELEGRAM, since=since) is None
+
+
+def test_reusable_upload_is_the_same_users_only():
+    _upload(user_id=1, source="src-1")
+    since = datetime.now() - timedelta(days=1)
+
+    # Another user's object sits under their source/ prefix, named after their file.
+    assert find_reusable_upload(2, PLATFORM_TELEGRAM, source_sha256="src-1", since=since) is None
+    assert find_reusable_upload(1, PLATFORM_MAX, source_sha256="src-1", since=since) is None
+
+
+def test_reusable_upload_ignores_uploads_before_the_window():
+    _upload(source="src-1")
+
+    assert find_reusable_upload(42, PLATFORM_TELEGRAM, source_sha256="src-1", since=datetime.now() + timedelta(days=1)) is None
+
+
+def test_reuse_chain_is_bounded_by_the_age_of_the_object():
+    original = _upload(source="src-1")
+    update_transcription(original.id, audio_uploaded_at=datetime.now() - timedelta(days=dedup.REUSE_MAX_AGE_DAYS + 1))
+    # A re-upload two weeks ago reused the object and carries its upload time.
+    repeat = _upload(source="src-1", reused=get_transcription(original.id))
+    update_transcription(repeat.id, created_at=datetime.now() - timedelta(days=14))
+
+    assert dedup.find_reusable(42, PLATFORM_TELEGRAM, source_sha256="src-1") is None
+
+
+def test_completed_duplicate_is_only_offered_to_the_same_user():
+    earlier = _upload(user_id=1, source="src-1")
+    assert find_completed_duplicate(1, PLATFORM_TELEGRAM, source_sha256="src-1") is None
+
+    update_transcription(earlier.id, status=STATUS_COMPLETED)
+
+    assert find_completed_duplicate(1, PLATFORM_TELEGRAM, source_sha256="src-1").id == earlier.id
+    assert find_completed_duplicate(2, PLATFORM_TELEGRAM, source_sha256="src-1") is None
+    assert find_completed_duplicate(1, PLATFORM_MAX, source_sha256="src-1") is None
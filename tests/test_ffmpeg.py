@@ -0,0 +1,33 @@
+"""Tests for the container sniffing that decides whether conversion can overlap a download."""
+import struct
+
+import pytest
+
+from utils.ffmpeg import is_streamable
+
+
+def _box(kind: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+FTYP = _box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2mp41")
+
+
+@pytest.mark.parametrize("head, expected", [
+    (FTYP + _box(b"moov", b"\x00" * 64) + _box(b"mdat"), True),              # faststart MP4
+    (FTYP + _box(b"free", b"\x00" * 8) + _box(b"moov") + _box(b"mdat"), True),
+    (FTYP + _box(b"moov") + _box(b"moof") + _box(b"mdat"), True),             # fragmented MP4
+    (FTYP + _box(b"mdat", b"\x00" * 64) + _box(b"moov"), False),              # moov at the end
+    (FTYP + struct.pack(">I", 1) + b"mdat" + struct.pack(">Q", 1 << 33), False),
+    (FTYP + struct.pack(">I", 1 << 20) + b"free", False),                     # next box beyond the head
+    (b"OggS\x00\x02" + b"\x00" * 20, True),
+    (b"\x1a\x45\xdf\xa3" + b"\x00" * 20, True),                              # webm / mkv
+    (b"RIFF\x24\x00\x00\x00WAVEfmt ", True),
+    (b"RIFF\x24\x00\x00\x00AVI LIST", False),
+    (b"ID3\x04\x00" + b"\x00" * 20, True),
+    (b"\xff\xfb\x90\x64" + b"\x00" * 20, True),                              # bare mp3 frame
+    (b"0&\xb2u\x8ef\xcf\x11" + b"\x00" * 20, False),                         # wma / asf
+    (b"", False),
+])
+def test_is_streamable(head, expected):
+    assert is_streamable(head) is expected
@@ -0,0 +1,111 @@
+"""Tests for hedging WhisperX predictions stuck in Replicate's queue (schedulers.transcription)."""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+os.environ.setdefault("YC_API_KEY", "test")
+os.environ.setdefault("YC_FOLDER_ID", "test")
+os.environ.setdefault("S3_ACCESS_KEY", "test")
+os.environ.setdefault("S3_SECRET_KEY", "test")
+os.environ.setdefault("S3_ENDPOINT", "http://s3.test")
+os.environ.setdefault("S3_BUCKET", "test")
+
+import asyncio
+
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+import providers.replicate as replicate_provider
+import providers.scribe as scribe_provider
+import schedulers.transcription as transcription
+import utils.routing as routing
+
+from database.models import PROVIDER_REPLICATE
+from database.queries import TranscriptionWrites
+from schedulers.transcription import _Leg, pick_hedge_winner
+
+
+GOOD = [{"text": "Добрый день, начинаем совещание", "avg_logprob": -0.1}]
+LOOP = [{"text": "Продолжение следует...", "avg_logprob": -0.1}] * 40
+
+
+def _leg(segments=None, failed=False):
+    if failed:
+        return _Leg("m", None, None, Decimal("0"))
+    payload = {"output": {"detected_language": "ru", "segments": segments}}
+    return _Leg("m", payload, replicate_provider.analyze(payload), Decimal("1"))
+
+
+def test_first_acceptable_result_wins():
+    assert pick_hedge_winner(_leg(GOOD), None) == "primary"
+    assert pick_hedge_winner(None, _leg(GOOD)) == "scribe"
+    assert pick_hedge_winner(_leg(GOOD), _leg(GOOD)) == "primary"
+
+
+def test_unacceptable_result_waits_for_the_other_prediction():
+    assert pick_hedge_winner(_leg(LOOP), None) is None
+    assert pick_hedge_winner(_leg(failed=True), None) is None
+    assert pick_hedge_winner(_leg(LOOP), _leg(GOOD)) == "scribe"
+
+
+def test_without_an_acceptable_result_whisperx_output_goes_first():
+    assert pick_hedge_winner(_leg(LOOP), _leg(LOOP)) == "primary"
+    assert pick_hedge_winner(_leg(failed=True), _leg(LOOP)) == "scribe"
+    assert pick_hedge_winner(_leg(failed=True), _leg(failed=True)) == "failed"
+
+
+def test_timeout_settles_with_what_has_finished():
+    assert pick_hedge_winner(_leg(LOOP), None, timed_out=True) == "primary"
+    assert pick_hedge_winner(None, None, timed_out=True) == "failed"
+
+
+@pytest.mark.parametrize("usual, expected", [(10, routing.HEDGE_MIN_SECONDS), (200, 600), (3600, routing.HEDGE_MAX_SECONDS)])
+def test_hedge_target_follows_the_usual_queue_wait(monkeypatch, usual, expected):
+    estimate = routing.Estimate(usual, 0.05, 5, usual)
+    monkeypatch.setattr(routing, "_current_estimates", lambda: {"m": estimate})
+
+    assert routing.hedge_after_seconds("m") == expected
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """A WhisperX prediction still queued past its hedge target; records Scribe starts."""
+    started = []
+
+    async def get_status(operation_id):
+        return "starting"
+
+    async def get_signed_url(object_name, expires_in):
+        return "https://s3.test/audio"
+
+    async def start_transcription(url):
+        started.append(url)
+        return "scribe-1"
+
+    monkeypatch.setenv("HEDGING_ENABLED", "1")
+    monkeypatch.setattr(routing, "hedge_after_seconds", lambda model: 60)
+    monkeypatch.setattr(replicate_provider, "get_status", get_status)
+    monkeypatch.setattr(transcription, "get_signed_url", get_signed_url)
+    monkeypatch.setattr(scribe_provider, "start_transcription", start_transcription)
+    monkeypatch.setattr(transcription, "update_transcription", lambda transcription_id, **fields: True)
+    return started
+
+
+def _task(language=None):
+    return SimpleNamespace(
+        id=1, provider=PROVIDER_REPLICATE, model="m", operation_id="whisperx-1",
+        duration_seconds=300, audio_s3_path="s3://test/audio.ogg", language=language,
+    )
+
+
+def test_queued_prediction_is_hedged(queued):
+    assert asyncio.run(transcription._maybe_hedge(_task(), 120, TranscriptionWrites()))
+    assert queued
+
+
+def test_forced_language_retry_is_not_hedged(queued):
+    # Scribe runs in Russian only; the user picked English for this retry.
+    assert not asyncio.run(transcription._maybe_hedge(_task(language="en"), 120, TranscriptionWrites()))
+    assert queued == []
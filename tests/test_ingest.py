@@ -0,0 +1,135 @@
+"""Tests for persistent ingest jobs (utils.ingest) and their resumer (schedulers.ingest)."""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+os.environ.setdefault("YC_API_KEY", "test")
+os.environ.setdefault("YC_FOLDER_ID", "test")
+os.environ.setdefault("S3_ACCESS_KEY", "test")
+os.environ.setdefault("S3_SECRET_KEY", "test")
+os.environ.setdefault("S3_ENDPOINT", "http://s3.test")
+os.environ.setdefault("S3_BUCKET", "test")
+
+from types import SimpleNamespace
+
+import pytest
+
+import schedulers.ingest as resumer
+import utils.ingest as ingest
+
+from database.connection import engine
+from database.models import (
+    Base, PLATFORM_TELEGRAM, STATUS_COMPLETED, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING,
+    INGEST_STAGE_DOWNLOADED, INGEST_STAGE_PRICED, INGEST_STAGE_UPLOADED,
+)
+from database.queries import add_ingest_job, get_ingest_jobs_by_status, get_transcription, update_ingest_job
+
+
+@pytest.fixture(autouse=True)
+def _database(monkeypatch, tmp_path):
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(ingest, "INGEST_DIR", tmp_path)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _new_job(**fields):
+    return add_ingest_job(
+        user_id=42, platform=PLATFORM_TELEGRAM, source_message_id="7",
+        source_ref="file-id", file_name="memo.m4a", **fields,
+    )
+
+
+def _status(job_id):
+    return {job.id: job for job in get_ingest_jobs_by_status(STATUS_RUNNING)}.get(job_id)
+
+
+def test_workdir_keeps_uploaded_job_running_and_removes_files():
+    job = _new_job()
+    with ingest.workdir(job) as (in_dir, _):
+        (in_dir / job.file_name).write_bytes(b"audio")
+        ingest.advance(job, INGEST_STAGE_UPLOADED, audio_s3_path="s3://x", duration_seconds=60)
+
+    assert _status(job.id).stage == INGEST_STAGE_UPLOADED
+    assert not (ingest.INGEST_DIR / str(job.id)).exists()
+
+
+def test_workdir_fails_rejected_job():
+    job = _new_job()
+    with ingest.workdir(job):
+        ingest.advance(job, INGEST_STAGE_DOWNLOADED)
+
+    assert _status(job.id) is None
+    assert job.status == STATUS_FAILED
+
+
+def test_cancelled_job_keeps_files_for_resume():
+    job = _new_job()
+
+    async def handler():
+        ingest.track(job)
+        with ingest.workdir(job) as (in_dir, _):
+            (in_dir / job.file_name).write_bytes(b"audio")
+            ingest.advance(job, INGEST_STAGE_DOWNLOADED)
+            await asyncio.sleep(10)
+
+    async def restart():
+        task = asyncio.create_task(handler())
+        await asyncio.sleep(0.01)
+        assert ingest.is_active(job.id)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not ingest.is_active(job.id)
+
+    asyncio.run(restart())
+
+    assert _status(job.id).stage == INGEST_STAGE_DOWNLOADED
+    assert (ingest.INGEST_DIR / str(job.id) / "in" / "memo.m4a").read_bytes() == b"audio"
+
+
+def test_resume_prices_uploaded_job_and_sends_confirm(monkeypatch):
+    job = _new_job()
+    update_ingest_job(job.id, stage=INGEST_STAGE_UPLOADED, audio_s3_path="s3://x", duration_seconds=600)
+    sent = []
+
+    async def send(context, platform, user_id, text, tg_keyboard=None, max_keyboard=None):
+        sent.append(text)
+
+    async def delete(*args):
+        pass
+
+    monkeypatch.setattr(resumer.sender, "safe_send_message_with_keyboard", send)
+    monkeypatch.setattr(resumer.tg_sender, "safe_delete_message", delete)
+    monkeypatch.setattr(resumer, "get_user", lambda *args: None)
+
+    async def run():
+        await resumer._resume(SimpleNamespace(bot=None, bot_data={}), _status(job.id))
+
+    asyncio.run(run())
+
+    assert _status(job.id) is None
+    assert sent and sent[0].startswith("🎧 Аудио подготовлено")
+    [finished] = get_ingest_jobs_by_status(STATUS_COMPLETED)
+    assert finished.stage == INGEST_STAGE_PRICED and finished.attempts == 1
+    assert get_transcription(finished.transcription_id).status == STATUS_PENDING
+
+
+def test_resume_gives_up_after_max_attempts(monkeypatch):
+    job = _new_job()
+    update_ingest_job(job.id, attempts=ingest.MAX_RESUME_ATTEMPTS)
+    sent = []
+
+    async def send(context, platform, user_id, text):
+        sent.append(text)
+
+    monkeypatch.setattr(resumer.sender, "safe_send_message", send)
+
+    async def run():
+        await resumer._resume(SimpleNamespace(), _status(job.id))
+
+    asyncio.run(run())
+
+    assert _status(job.id) is None
+    assert sent == [resumer._RESUME_FAILED_TEXT]
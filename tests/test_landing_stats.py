@@ -0,0 +1,95 @@
+"""Tests for the incrementally maintained landing stats (database.queries.get_landing_stats)."""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import event
+
+from database.connection import engine
+from database.models import (
+    Base, PLATFORM_TELEGRAM, STATUS_COMPLETED, STATUS_EXPIRED, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING,
+)
+from database.queries import add_shadow_transcription, add_transcription, get_landing_stats, update_transcription
+from utils.utils import MoscowTimezone
+
+
+@pytest.fixture(autouse=True)
+def _database():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _task(status, duration=60):
+    return add_transcription(
+        user_id=1, platform=PLATFORM_TELEGRAM, status=status, audio_s3_path="s3://a", duration_seconds=duration,
+    )
+
+
+def _stats(seconds, completed, failed):
+    return {"duration_seconds": seconds, "completed": completed, "failed": failed}
+
+
+def test_totals_count_finished_transcriptions_only():
+    task = _task(STATUS_COMPLETED, 3600)
+    _task(STATUS_FAILED)
+    _task(STATUS_EXPIRED)
+    add_shadow_transcription(task, "scribe", "{}")
+
+    assert get_landing_stats() == _stats(3600, 1, 1)
+    assert get_landing_stats() == _stats(3600, 1, 1)
+
+
+def test_unfinished_transcription_is_held_back_without_blocking_later_ones():
+    _task(STATUS_COMPLETED, 100)
+    running = _task(STATUS_RUNNING, 200)
+    pending = _task(STATUS_PENDING)
+    _task(STATUS_COMPLETED, 300)
+
+    assert get_landing_stats() == _stats(400, 2, 0)
+
+    update_transcription(running.id, status=STATUS_COMPLETED)
+    _task(STATUS_FAILED)
+
+    assert get_landing_stats() == _stats(600, 3, 1)
+
+    update_transcription(pending.id, status=STATUS_EXPIRED)
+
+    assert get_landing_stats() == _stats(600, 3, 1)
+    assert get_landing_stats() == _stats(600, 3, 1)
+
+
+def test_stuck_transcription_is_no_longer_held_back():
+    stuck = _task(STATUS_RUNNING)
+    get_landing_stats()
+    update_transcription(stuck.id, created_at=datetime.now(MoscowTimezone).replace(tzinfo=None) - timedelta(days=9))
+    get_landing_stats()
+
+    update_transcription(stuck.id, status=STATUS_COMPLETED)
+
+    assert get_landing_stats() == _stats(0, 0, 0)
+
+
+def test_refresh_reads_only_rows_after_the_mark():
+    for _ in range(5):
+        _task(STATUS_COMPLETED)
+    get_landing_stats()
+    _task(STATUS_FAILED)
+    parameters = []
+
+    def capture(conn, cursor, statement, params, context, executemany):
+        if "FROM transcriptions" in statement:
+            parameters.append(params)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        assert get_landing_stats() == _stats(300, 5, 1)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    # Both transcription queries start after the mark, id 5.
+    assert parameters and all(5 in params for params in parameters)
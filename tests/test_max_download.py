@@ -0,0 +1,151 @@
+"""Tests for the range-parallel Max attachment downloader (utils.max_download)."""
+import asyncio
+import os
+import re
+
+import httpx
+import pytest
+
+import utils.max_download as max_download
+
+
+URL = "https://okcdn.test/file"
+BODY = os.urandom(5 * 1024 + 123)
+
+_RANGE_RE = re.compile(r"bytes=(\d+)-(\d+)")
+
+
+class _DroppedStream(httpx.AsyncByteStream):
+    """Sends *data* then fails the way okcdn.ru does when it closes mid-body."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+        raise httpx.RemoteProtocolError("peer closed connection without sending complete message body")
+
+
+class _Cdn:
+    def __init__(self, ranges=True, drop_once_at=None, status=None):
+        self.ranges = ranges
+        self.drop_once_at = drop_once_at
+        self.status = status
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        header = request.headers.get("Range")
+        self.requests.append(header)
+        if self.status:
+            return httpx.Response(self.status)
+        if not self.ranges or header is None:
+            return httpx.Response(200, content=BODY)
+        start, end = map(int, _RANGE_RE.fullmatch(header).groups())
+        end = min(end, len(BODY) - 1)
+        headers = {"Content-Range": f"bytes {start}-{end}/{len(BODY)}"}
+        if self.drop_once_at is not None and start < self.drop_once_at <= end:
+            cut, self.drop_once_at = self.drop_once_at, None
+            return httpx.Response(206, headers=headers, stream=_DroppedStream(BODY[start:cut]))
+        return httpx.Response(206, headers=headers, content=BODY[start:end + 1])
+
+
+@pytest.fixture
+def cdn(monkeypatch):
+    def install(**kwargs):
+        server = _Cdn(**kwargs)
+        monkeypatch.setattr(
+            max_download, "_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(server))
+        )
+        return server
+
+    monkeypatch.setattr(max_download, "SEGMENT_SIZE", 1024)
+    monkeypatch.setattr(max_download, "RETRY_DELAY", 0)
+    return install
+
+
+def _download(path):
+    progress = max_download.DownloadProgress()
+    ok = asyncio.run(max_download.download_max_file(URL, path, progress))
+    return ok, progress
+
+
+def test_downloads_segments_in_parallel_ranges(cdn, tmp_path):
+    server = cdn()
+    ok, progress = _download(tmp_path / "video.mp4")
+
+    assert ok
+    assert (tmp_path / "video.mp4").read_bytes() == BODY
+    assert progress.received == progress.total == len(BODY)
+    # The probe, then one request per 1 KB segment.
+    assert server.requests[0] == "bytes=0-0"
+    assert sorted(server.requests[1:]) == sorted(
+        f"bytes={start}-{min(start + 1024, len(BODY)) - 1}" for start in range(0, len(BODY), 1024)
+    )
+
+
+def test_dropped_segment_resumes_from_its_offset(cdn, tmp_path):
+    server = cdn(drop_once_at=2500)
+    ok, progress = _download(tmp_path / "video.mp4")
+
+    assert ok
+    assert (tmp_path / "video.mp4").read_bytes() == BODY
+    assert progress.received == len(BODY)
+    assert "bytes=2500-3071" in server.requests
+
+
+def test_falls_back_to_a_single_stream_without_range_support(cdn, tmp_path):
+    server = cdn(ranges=False)
+    ok, progress = _download(tmp_path / "video.mp4")
+
+    assert ok
+    assert (tmp_path / "video.mp4").read_bytes() == BODY
+    assert progress.received == len(BODY)
+    assert server.requests == ["bytes=0-0", None]
+
+
+def test_expired_url_fails_without_leaving_a_file(cdn, tmp_path):
+    cdn(status=403)
+    ok, _ = _download(tmp_path / "video.mp4")
+
+    assert not ok
+    assert not (tmp_path / "video.mp4").exists()
+
+
+def test_contiguous_prefix_follows_out_of_order_segments():
+    progress = max_download.DownloadProgress()
+    progress._wrote(1024, 2048, 2048, 1024)
+    assert progress.contiguous == 0
+    progress._wrote(0, 500, 1024, 500)
+    assert progress.contiguous == 500
+    progress._wrote(0, 1024, 1024, 524)
+    assert progress.contiguous == 2048
+    assert progress.received == 2048
+
+
+def test_growing_file_is_read_in_order_while_it_downloads(cdn, tmp_path):
+    cdn(drop_once_at=2500)
+    path = tmp_path / "video.mp4"
+
+    async def run():
+        progress = max_download.DownloadProgress()
+        download = asyncio.create_task(max_download.download_max_file(URL, path, progress))
+        assert await max_download.wait_for_head(progress, 100) or progress.finished
+        read = b"".join([chunk async for chunk in max_download.iter_downloaded(path, progress)])
+        return await download, read
+
+    ok, read = asyncio.run(run())
+
+    assert ok
+    assert read == BODY
+
+
+def test_no_head_to_overlap_without_range_support(cdn, tmp_path):
+    cdn(ranges=False)
+
+    async def run():
+        progress = max_download.DownloadProgress()
+        download = asyncio.create_task(max_download.download_max_file(URL, tmp_path / "video.mp4", progress))
+        head = await max_download.wait_for_head(progress, 100)
+        return head, await download
+
+    assert asyncio.run(run()) == (False, True)
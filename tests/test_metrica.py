@@ -0,0 +1,141 @@
+"""Tests for the Metrica conversion outbox (utils.marketing, schedulers.metrica)."""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import schedulers.metrica as metrica
+import utils.marketing as marketing
+
+from database.connection import engine
+from database.models import Base
+from database.queries import claim_metrica_hits, count_metrica_hits
+from utils.metrics import METRICA_BACKLOG
+from utils.utils import MoscowTimezone
+
+
+@pytest.fixture(autouse=True)
+def _database(monkeypatch):
+    monkeypatch.setattr(marketing, "COUNTER_ID", "1")
+    monkeypatch.setattr(marketing, "MEAS_TOKEN", "token")
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def collect(monkeypatch):
+    """Outcome of send_hit by hit type; records the hits sent."""
+    outcomes, sent = {}, []
+
+    async def send_hit(hit):
+        sent.append((hit.hit_type, hit.goal, hit.attempts))
+        return outcomes.get(hit.hit_type, True)
+
+    monkeypatch.setattr(marketing, "send_hit", send_hit)
+    return outcomes, sent
+
+
+def _tick():
+    asyncio.run(metrica.send_metrica_hits(None))
+
+
+def test_goal_is_queued_until_the_sender_runs(collect):
+    _, sent = collect
+
+    assert marketing.track_goal("y", "telegram_paid")
+    assert count_metrica_hits() == 2
+
+    _tick()
+
+    assert sorted(sent) == [("event", "telegram_paid", 0), ("pageview", "telegram_paid", 0)]
+    assert count_metrica_hits() == 0
+    assert METRICA_BACKLOG.value() == 2
+
+
+def test_transient_failure_is_retried_later_and_rejection_dropped(collect):
+    outcomes, _ = collect
+    outcomes.update(pageview=False, event=None)
+    marketing.track_goal("y", "max_startbot")
+
+    _tick()
+
+    assert count_metrica_hits() == 1
+    assert claim_metrica_hits(10, timedelta(0)) == []  # backed off, not due yet
+
+
+def test_hit_is_dropped_after_max_attempts(collect, monkeypatch):
+    outcomes, sent = collect
+    outcomes["event"] = None
+    monkeypatch.setattr(marketing, "retry_delay", lambda attempts: -1)
+    marketing.track_goal("y", "max_startbot")
+
+    for _ in range(marketing.MAX_ATTEMPTS):
+        _tick()
+
+    assert [attempts for hit_type, _, attempts in sent if hit_type == "event"] == list(range(marketing.MAX_ATTEMPTS))
+    assert count_metrica_hits() == 0
+
+
+def test_event_is_sent_after_its_pageview(monkeypatch):
+    finished = []
+
+    async def send_hit(hit):
+        # A slow pageview must still land before its event.
+        await asyncio.sleep(0.01 if hit.hit_type == "pageview" else 0)
+        finished.append((hit.hit_type, hit.goal))
+        return True
+
+    monkeypatch.setattr(marketing, "send_hit", send_hit)
+    marketing.track_goal("y", "telegram_startbot")
+    marketing.track_goal("y", "telegram_paid")
+
+    _tick()
+
+    assert [hit_type for hit_type, _ in finished] == ["pageview", "pageview", "event", "event"]
+
+
+def test_hits_are_claimed_in_queue_order():
+    marketing.track_goal("y", "telegram_startbot")
+    marketing.track_goal("y", "telegram_paid")
+
+    hits = claim_metrica_hits(3, timedelta(minutes=5))
+
+    assert [(hit.goal, hit.hit_type) for hit in hits] == [
+        ("telegram_startbot", "pageview"), ("telegram_startbot", "event"), ("telegram_paid", "pageview"),
+    ]
+
+
+def test_claimed_hits_are_leased_to_one_worker():
+    marketing.track_goal("y", "telegram_startbot")
+
+    assert len(claim_metrica_hits(10, timedelta(minutes=5))) == 2
+    assert claim_metrica_hits(10, timedelta(minutes=5)) == []
+
+
+def test_retry_delay_backs_off_with_jitter():
+    delays = [marketing.retry_delay(attempts) for attempts in (0, 3, 30)]
+
+    assert 0.5 <= delays[0] <= 1.5
+    assert 4 <= delays[1] <= 12
+    assert marketing.MAX_BACKOFF / 2 <= delays[2] <= marketing.MAX_BACKOFF * 1.5
+
+
+def test_hit_keeps_the_conversion_time():
+    marketing.track_goal("y", "telegram_paid")
+    (pageview, event) = sorted(claim_metrica_hits(10, timedelta(0)), key=lambda hit: hit.hit_type, reverse=True)
+
+    assert marketing.hit_params(event)["et"] == marketing.hit_params(pageview)["et"] == event.event_time
+    assert marketing.hit_params(event)["ea"] == "telegram_paid"
+    assert event.event_time <= datetime.now(MoscowTimezone).timestamp()
+
+
+def test_disabled_metrica_skips_the_backlog_count(collect, monkeypatch):
+    monkeypatch.setattr(marketing, "MEAS_TOKEN", None)
+    monkeypatch.setattr(metrica, "count_metrica_hits", lambda: pytest.fail("counted while disabled"))
+
+    _tick()
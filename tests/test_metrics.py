@@ -0,0 +1,84 @@
+"""Tests for the Prometheus-format metrics registry (utils.metrics)."""
+import asyncio
+
+import pytest
+
+import utils.metrics as metrics
+
+
+@pytest.fixture
+def histogram():
+    histogram = metrics.Histogram("test_seconds", "Test latency.", buckets=(0.1, 1.0))
+    yield histogram
+    metrics._registry.remove(histogram)
+
+
+@pytest.fixture
+def counter():
+    counter = metrics.Counter("test_errors", "Test errors.")
+    yield counter
+    metrics._registry.remove(counter)
+
+
+def test_histogram_renders_cumulative_buckets(histogram):
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, job="a")
+
+    lines = histogram.render()
+
+    assert lines[:2] == ["# HELP test_seconds Test latency.", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{job="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{job="a",le="1"} 3' in lines
+    assert 'test_seconds_bucket{job="a",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{job="a"} 4.25' in lines
+    assert 'test_seconds_count{job="a"} 4' in lines
+
+
+def test_labels_are_escaped(counter):
+    counter.inc(function='say "hi"\\')
+
+    assert counter.render()[-1] == 'test_errors_total{function="say \\"hi\\"\\\\"} 1'
+
+
+def test_track_counts_errors_and_still_times(histogram, counter):
+    with metrics.track(histogram, counter, call="ok"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.track(histogram, counter, call="boom"):
+            raise ValueError
+
+    assert histogram.count(call="ok") == 1
+    assert histogram.count(call="boom") == 1
+    assert counter.value(call="ok") == 0
+    assert counter.value(call="boom") == 1
+
+
+def test_timed_query_labels_by_function_name():
+    @metrics.timed_query
+    def get_something():
+        return 42
+
+    before = metrics.DB_QUERY.count(function="get_something")
+
+    assert get_something() == 42
+    assert metrics.DB_QUERY.count(function="get_something") == before + 1
+
+
+def test_timed_tick_records_async_job():
+    @metrics.timed_tick("test_job")
+    async def job(context):
+        return context
+
+    before = metrics.SCHEDULER_TICK.count(job="test_job")
+
+    assert asyncio.run(job("ctx")) == "ctx"
+    assert metrics.SCHEDULER_TICK.count(job="test_job") == before + 1
+
+
+def test_render_covers_every_metric():
+    text = metrics.render()
+
+    for name in ("bot_event_loop_lag_seconds", "bot_scheduler_tick_seconds", "bot_db_query_seconds",
+                 "bot_provider_call_seconds", "bot_message_send_seconds"):
+        assert f"# TYPE {name} histogram" in text
+    assert text.endswith("\n")
@@ -1,6 +1,11 @@
-"""Characterization tests for format_payment_status."""
+"""Characterization tests for format_payment_status and the request rate limit."""
+import asyncio
+import time
+
 import pytest
 
+import payment
+
 from payment import format_payment_status
 
 
@@ -24,3 +29,32 @@ def test_known_statuses(status, expected):
 @pytest.mark.parametrize("status", [None, "GARBAGE", "", 123])
 def test_unknown_status_falls_back(status):
     assert format_payment_status(status) == "❓ неизвестно"
+
+
+def test_requests_are_spaced_by_the_rate_limit(monkeypatch):
+    monkeypatch.setattr(payment, "MAX_REQUESTS_PER_SECOND", 100)
+    monkeypatch.setattr(payment, "_rate_lock", None)
+    monkeypatch.setattr(payment, "_next_request_at", 0.0)
+
+    async def burst():
+        started = time.monotonic()
+        await asyncio.gather(*(payment._throttle() for _ in range(5)))
+        return time.monotonic() - started
+
+    assert asyncio.run(burst()) >= 0.04
+
+
+def _signed(**fields):
+    data = {"TerminalKey": payment.TERMINAL_KEY, "OrderId": "o", "Success": True, "Status": "CONFIRMED", "Amount": 10000, **fields}
+    params = {key: str(value).lower() if isinstance(value, bool) else value for key, value in data.items()}
+    return {**data, "Token": payment._generate_token(params), "Data": {"Source": "cards"}}
+
+
+def test_notification_token_is_verified(monkeypatch):
+    monkeypatch.setattr(payment, "TERMINAL_KEY", "key")
+    monkeypatch.setattr(payment, "TERMINAL_PASSWORD", "secret")
+
+    assert payment.verify_notification(_signed())
+    assert not payment.verify_notification({**_signed(), "Status": "REJECTED"})
+    assert not payment.verify_notification(_signed(TerminalKey="other"))
+    assert not payment.verify_notification({k: v for k, v in _signed().items() if k != "Token"})
@@ -0,0 +1,148 @@
+"""Round trips of the write queries (database.queries)."""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import database.queries as queries
+
+from sqlalchemy import event
+
+from database.connection import engine
+from database.models import Base, PLATFORM_MAX, PLATFORM_TELEGRAM, STATUS_COMPLETED, STATUS_PENDING, STATUS_RUNNING
+from database.queries import (
+    add_ingest_job, add_shadow_transcription, add_transcription, add_user, change_user_balance,
+    claim_and_charge_transcription, confirm_payments, create_payment, create_refinement, fail_transcription_and_refund,
+    get_payment_by_order_id, get_refinement, get_transcription, get_user, update_ingest_job, update_payment,
+    update_refinement, update_transcription,
+)
+
+
+@pytest.fixture(autouse=True)
+def _database(monkeypatch):
+    monkeypatch.setattr(queries, "_user_cache", OrderedDict())
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def _transcription():
+    return add_transcription(
+        user_id=1, platform=PLATFORM_TELEGRAM, status=STATUS_PENDING, audio_s3_path="s3://a", duration_seconds=60,
+    )
+
+
+def test_inserts_return_what_they_wrote_without_reading_it_back(statements):
+    user = add_user(1, PLATFORM_TELEGRAM, yclid="y")
+    task = _transcription()
+    shadow = add_shadow_transcription(task, "scribe", "{}")
+    refinement = create_refinement(task.id, 1, PLATFORM_TELEGRAM, "m")
+    job = add_ingest_job(1, PLATFORM_TELEGRAM, "m", "ref", "memo.ogg")
+
+    assert statements == ["INSERT"] * 5
+    assert (user.balance, user.yclid) == (Decimal("50.00"), "y")
+    assert (task.id, task.status, task.is_shadow) == (1, STATUS_PENDING, False)
+    assert (shadow.id, shadow.is_shadow, shadow.model) == (2, True, "scribe")
+    assert (refinement.status, refinement.task_type) == (STATUS_PENDING, "summarize")
+    assert (job.id, job.attempts, job.status) == (1, 0, STATUS_RUNNING)
+
+
+def test_create_payment_is_one_insert(statements):
+    payment = create_payment(1, PLATFORM_TELEGRAM, "order", Decimal("100"), "NEW", 7, "https://pay", "d", {})
+
+    assert statements == ["INSERT"]
+    assert (payment.order_id, payment.amount) == ("order", Decimal("100"))
+
+
+def test_balance_change_is_a_locked_read_and_an_update(statements):
+    add_user(1, PLATFORM_TELEGRAM)
+    statements.clear()
+
+    assert change_user_balance(1, PLATFORM_TELEGRAM, Decimal("-20")).balance == Decimal("30.00")
+    assert statements == ["SELECT", "UPDATE"]
+    assert get_user(1, PLATFORM_TELEGRAM).balance == Decimal("30.00")
+
+
+def test_updates_are_one_statement(statements):
+    task = _transcription()
+    refinement = create_refinement(task.id, 1, PLATFORM_TELEGRAM, "m")
+    create_payment(1, PLATFORM_TELEGRAM, "order", Decimal("100"), "NEW", 7, "https://pay", "d", {})
+    job = add_ingest_job(1, PLATFORM_TELEGRAM, "m", "ref", "memo.ogg")
+    statements.clear()
+
+    assert update_transcription(task.id, status=STATUS_COMPLETED, rating=5)
+    assert update_refinement(refinement.id, status=STATUS_COMPLETED, result_text="short")
+    assert update_payment("order", message_id="42")
+    assert update_ingest_job(job.id, attempts=1)
+
+    assert statements == ["UPDATE"] * 4
+    assert (get_transcription(task.id).status, get_transcription(task.id).rating) == (STATUS_COMPLETED, 5)
+    assert get_refinement(refinement.id).result_text == "short"
+    assert get_payment_by_order_id("order").message_id == "42"
+
+
+def test_update_of_a_missing_row_reports_it(statements):
+    assert not update_transcription(404, rating=5)
+    assert not update_payment("missing", message_id="1")
+    assert not update_refinement(404)
+    assert statements == ["UPDATE", "UPDATE"]
+
+
+def test_get_user_is_served_from_the_cache(statements):
+    add_user(1, PLATFORM_TELEGRAM)
+    statements.clear()
+
+    assert get_user(1, PLATFORM_TELEGRAM) is get_user(1, PLATFORM_TELEGRAM)
+    assert get_user(2, PLATFORM_TELEGRAM) is None
+    assert get_user(2, PLATFORM_TELEGRAM) is None
+    assert statements == ["SELECT", "SELECT", "SELECT"]
+
+
+def test_cached_user_expires(monkeypatch, statements):
+    add_user(1, PLATFORM_TELEGRAM)
+    monkeypatch.setattr(queries, "USER_CACHE_TTL_SECONDS", 0)
+    statements.clear()
+
+    get_user(1, PLATFORM_TELEGRAM)
+    get_user(1, PLATFORM_TELEGRAM)
+
+    assert statements == ["SELECT", "SELECT"]
+
+
+def test_balance_writes_invalidate_the_cached_user():
+    add_user(1, PLATFORM_TELEGRAM)
+    add_user(1, PLATFORM_MAX)
+    task = _transcription()
+    update_transcription(task.id, price_for_user=Decimal("10"))
+    create_payment(1, PLATFORM_TELEGRAM, "order", Decimal("100"), "NEW", 7, "https://pay", "d", {})
+
+    def balance():
+        return get_user(1, PLATFORM_TELEGRAM).balance
+
+    assert balance() == Decimal("50.00")
+    change_user_balance(1, PLATFORM_TELEGRAM, Decimal("5"))
+    assert balance() == Decimal("55.00")
+    claim_and_charge_transcription(task.id, datetime(2026, 1, 1), "m", "1", Decimal("10"))
+    assert balance() == Decimal("45.00")
+    fail_transcription_and_refund(task.id)
+    assert balance() == Decimal("55.00")
+    confirm_payments({"order": "CONFIRMED"})
+    assert balance() == Decimal("155.00")
+    assert get_user(1, PLATFORM_MAX).balance == Decimal("50.00")
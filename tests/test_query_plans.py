@@ -0,0 +1,107 @@
+"""Query-plan regression tests for the hot queries (database.queries).
+
+Each query is run against SQLite, and every SELECT it issued is fed back to
+EXPLAIN QUERY PLAN. A "SCAN" row means a table or whole index is read end
+to end; with the indexes of database/models.py every hot query must be a
+SEARCH, and the ones meant to be index-only must use a covering index.
+"""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from sqlalchemy import event
+
+from database.connection import engine
+from database.models import Base, PLATFORM_TELEGRAM, PROVIDER_REPLICATE, STATUS_PENDING, STATUS_RUNNING
+from database.queries import (
+    add_transcription, add_user, complete_transcription, create_payment, create_refinement, find_completed_duplicate,
+    find_reusable_upload, get_ingest_jobs_by_status, get_landing_stats, claim_due_payments,
+    get_recent_provider_timings, get_recent_transcriptions, get_refinements_by_status, get_transcriptions_by_status,
+    has_refinement, claim_metrica_hits,
+)
+from utils.utils import MoscowTimezone
+
+
+@pytest.fixture(autouse=True)
+def _database():
+    Base.metadata.create_all(engine)
+    add_user(1, PLATFORM_TELEGRAM)
+    task = add_transcription(
+        user_id=1, platform=PLATFORM_TELEGRAM, status=STATUS_RUNNING, audio_s3_path="s3://a",
+        provider=PROVIDER_REPLICATE, duration_seconds=60, source_sha256="s", audio_sha256="a",
+    )
+    create_refinement(task.id, 1, PLATFORM_TELEGRAM, "m")
+    create_payment(1, PLATFORM_TELEGRAM, "order", Decimal("100"), "NEW", 7, "https://pay", "d", {})
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _plans(query, *args, **kwargs) -> list[list[str]]:
+    """EXPLAIN QUERY PLAN rows of every SELECT that ``query(*args, **kwargs)`` issues."""
+    selects = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        query(*args, **kwargs)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert selects, f"{query.__name__} issued no SELECT"
+    with engine.connect() as conn:
+        return [
+            [row.detail for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            for statement, parameters in selects
+        ]
+
+
+SINCE = datetime.now(MoscowTimezone) - timedelta(hours=3)
+
+HOT_QUERIES = [
+    (get_transcriptions_by_status, (STATUS_RUNNING,), {}),
+    (get_refinements_by_status, (STATUS_PENDING,), {}),
+    (claim_due_payments, (lambda payment: datetime.now(MoscowTimezone),), {}),
+    (claim_metrica_hits, (100, timedelta(minutes=5)), {}),
+    (get_ingest_jobs_by_status, (STATUS_RUNNING,), {}),
+    (get_recent_transcriptions, (1, PLATFORM_TELEGRAM), {}),
+    (get_recent_provider_timings, (PROVIDER_REPLICATE, SINCE), {}),
+    (has_refinement, (1, "summarize"), {}),
+    (complete_transcription, (1,), {}),
+    (get_landing_stats, (), {}),
+    (find_reusable_upload, (1, PLATFORM_TELEGRAM), {"source_sha256": "s", "audio_sha256": "a", "since": SINCE}),
+    (find_completed_duplicate, (1, PLATFORM_TELEGRAM), {"source_sha256": "s", "audio_sha256": "a"}),
+]
+
+
+@pytest.mark.parametrize("query, args, kwargs", HOT_QUERIES, ids=[q.__name__ for q, _, _ in HOT_QUERIES])
+def test_hot_query_never_scans(query, args, kwargs):
+    for plan in _plans(query, *args, **kwargs):
+        assert not [row for row in plan if row.startswith("SCAN ")], plan
+
+
+def test_has_refinement_is_index_only():
+    (plan,) = _plans(has_refinement, 1, "summarize")
+
+    assert any("USING COVERING INDEX idx_refinements_transcription_task" in row for row in plan), plan
+
+
+def test_landing_stats_read_a_primary_key_range():
+    plans = _plans(get_landing_stats)
+
+    # The totals by primary key, the unfinished rows to hold back through the
+    # status index; both only past the mark.
+    assert all("rowid>?" in row for plan in plans for row in plan if "transcriptions" in row), plans
+
+
+def test_first_completion_check_is_index_only():
+    plans = _plans(complete_transcription, 1)
+
+    assert any("USING COVERING INDEX idx_transcriptions_user_status" in row for plan in plans for row in plan), plans
@@ -16,7 +16,7 @@ import os
 
 os.environ.setdefault("REPLICATE_API_TOKEN", "test")
 
-from providers.replicate import detected_language, get_text, is_wrong_language, looks_like_hallucination
+from providers.replicate import analyze, detected_language, get_text, is_wrong_language, looks_like_hallucination
 from utils.timecodes import extract_segments, is_phantom_segment
 
 
@@ -210,3 +210,33 @@ def test_wrong_language_ignores_stray_foreign_glyph():
 
 def test_wrong_language_empty_text():
     assert is_wrong_language(_payload_lang("ru", [])) is False
+
+
+def test_analyze_matches_separate_heuristics():
+    loop = {"text": "Спасибо за внимание, до встречи", "avg_logprob": -0.2}
+    payloads = [
+        _payload_lang("ru", [{"text": "Привет", "avg_logprob": -0.1}, {"text": " мир ", "avg_logprob": -0.9}]),
+        _payload_lang("ja", [{"text": "これは日本語のテキストです"}]),
+        _payload_lang("uk", [{"text": "какой-то текст"}]),
+        _payload([loop, loop, loop]),
+        {"output": None},
+    ]
+    for payload in payloads:
+        verdict = analyze(payload)
+        assert verdict.text == get_text(payload)
+        assert verdict.wrong_language == is_wrong_language(payload)
+        assert verdict.hallucinated == looks_like_hallucination(payload)
+
+
+def test_analyze_reports_shares():
+    segments = [
+        {"text": "первый", "avg_logprob": -0.9},
+        {"text": "второй", "avg_logprob": -0.1},
+        {"text": "", "avg_logprob": -0.8},
+        {"text": "четвёртый"},
+    ]
+    verdict = analyze(_payload(segments))
+    assert verdict.low_logprob_share == 2 / 3
+    assert verdict.loop_share == 0.0
+    assert verdict.letters == len("первыйвторойчетвёртый")
+    assert verdict.foreign_letters == 0
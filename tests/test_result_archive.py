@@ -0,0 +1,122 @@
+"""Tests for archiving old result payloads to S3 (utils.result_archive, schedulers.archive)."""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("S3_ACCESS_KEY", "test")
+os.environ.setdefault("S3_SECRET_KEY", "test")
+os.environ.setdefault("S3_ENDPOINT", "http://s3.test")
+os.environ.setdefault("S3_BUCKET", "test")
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import schedulers.archive as archive_scheduler
+import utils.result_archive as result_archive
+import utils.s3 as s3
+
+from database.connection import engine
+from database.models import Base, PLATFORM_TELEGRAM, STATUS_COMPLETED
+from database.queries import (
+    add_transcription, create_refinement, get_refinement, get_transcription, update_refinement, update_transcription,
+)
+from utils.timecodes import parse_result_json
+from utils.utils import MoscowTimezone
+
+
+@pytest.fixture(autouse=True)
+def _database():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """In-memory S3; object names in ``failing`` refuse uploads."""
+    objects, failing = {}, set()
+
+    async def upload_bytes(data, object_name):
+        if object_name in failing:
+            return False
+        objects[object_name] = data
+        return True
+
+    monkeypatch.setattr(s3, "upload_bytes", upload_bytes)
+    monkeypatch.setattr(s3, "download_bytes", objects.get)
+    monkeypatch.setattr(result_archive, "_cache", type(result_archive._cache)())
+    monkeypatch.setattr(archive_scheduler, "RESULT_ARCHIVE_AFTER_DAYS", 30)
+    return objects, failing
+
+
+def _result(days_old, payload="{'output': {'segments': [{'text': 'привет'}]}}"):
+    task = add_transcription(
+        user_id=1, platform=PLATFORM_TELEGRAM, status=STATUS_COMPLETED, audio_s3_path="s3://a", duration_seconds=60,
+    )
+    created_at = datetime.now(MoscowTimezone).replace(tzinfo=None) - timedelta(days=days_old)
+    update_transcription(task.id, result_json=payload, created_at=created_at)
+    return task.id
+
+
+def _run():
+    asyncio.run(archive_scheduler.archive_old_results(None))
+
+
+def test_old_payloads_move_to_s3_and_read_back_transparently(bucket):
+    objects, _ = bucket
+    old, new = _result(40), _result(1)
+    refinement = create_refinement(old, 1, PLATFORM_TELEGRAM, "m")
+    update_refinement(refinement.id, result_text="Конспект", created_at=datetime(2020, 1, 1))
+
+    _run()
+
+    archived = get_transcription(old).result_json
+    assert result_archive.is_archived(archived)
+    assert set(objects) == {
+        f"archive/transcriptions.result_json/{old}.gz", f"archive/refinements.result_text/{refinement.id}.gz",
+    }
+    assert parse_result_json(archived) == {"output": {"segments": [{"text": "привет"}]}}
+    assert result_archive.load(get_refinement(refinement.id).result_text) == "Конспект"
+    assert not result_archive.is_archived(get_transcription(new).result_json)
+
+
+def test_walk_resumes_from_its_mark(bucket):
+    objects, _ = bucket
+    first = _result(40)
+    _run()
+    objects.clear()
+    second = _result(35)  # a later id that aged past the cutoff
+
+    _run()
+
+    assert list(objects) == [f"archive/transcriptions.result_json/{second}.gz"]
+    assert result_archive.is_archived(get_transcription(first).result_json)
+
+
+def test_failed_upload_is_retried_on_the_next_tick(bucket):
+    objects, failing = bucket
+    first, second = _result(40), _result(40)
+    failing.add(f"archive/transcriptions.result_json/{second}.gz")
+
+    _run()
+
+    assert result_archive.is_archived(get_transcription(first).result_json)
+    assert not result_archive.is_archived(get_transcription(second).result_json)
+
+    failing.clear()
+    _run()
+
+    assert result_archive.is_archived(get_transcription(second).result_json)
+
+
+def test_archived_payload_is_fetched_once(bucket, monkeypatch):
+    objects, _ = bucket
+    _result(40)
+    _run()
+    pointer = get_transcription(1).result_json
+    fetched = []
+    monkeypatch.setattr(s3, "download_bytes", lambda name: fetched.append(name) or objects[name])
+
+    assert result_archive.load(pointer) == result_archive.load(pointer)
+    assert len(fetched) == 1
@@ -0,0 +1,133 @@
+"""Tests for provider and model routing (utils.routing)."""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+os.environ.setdefault("YC_API_KEY", "test")
+os.environ.setdefault("YC_FOLDER_ID", "test")
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+import providers.replicate as replicate_provider
+import utils.routing as routing
+
+from database.connection import engine
+from database.models import Base, PLATFORM_TELEGRAM, PROVIDER_REPLICATE, PROVIDER_SPEECHKIT, STATUS_RUNNING
+from database.queries import add_transcription, get_recent_provider_timings, update_transcription
+from utils.utils import MoscowTimezone
+
+
+SMALL = replicate_provider.get_model_name(0)
+LARGE = replicate_provider.get_model_name(replicate_provider.ONE_HOUR)
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def _database(monkeypatch):
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(routing, "_estimated_at", None)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _row(model, duration, queued, predict=None, running=False, operation_id="op"):
+    """A finished task that queued *queued* s and ran *predict* s, or a running one started *queued* s ago."""
+    started_at = NOW - timedelta(hours=1)
+    if running:
+        return SimpleNamespace(
+            model=model, operation_id=operation_id, duration_seconds=duration, actual_price=None,
+            started_at=NOW - timedelta(seconds=queued), finished_at=None,
+        )
+    return SimpleNamespace(
+        model=model, operation_id=operation_id, duration_seconds=duration,
+        actual_price=replicate_provider.cost_in_rub(predict, model) if predict else None,
+        started_at=started_at, finished_at=started_at + timedelta(seconds=queued + (predict or 0)),
+    )
+
+
+def test_estimates_split_wall_time_into_queue_and_pace():
+    rows = [_row(SMALL, 600, 30, 60), _row(SMALL, 1200, 50, 120), _row(SMALL, 300, 40, 30)]
+
+    estimate = routing.estimate_models(rows, NOW)[SMALL]
+
+    assert estimate.queue_seconds == pytest.approx(40, abs=1)
+    assert estimate.seconds_per_audio_second == pytest.approx(0.1, abs=0.01)
+    assert estimate.samples == 3
+
+
+def test_running_tasks_raise_the_queue_estimate_before_they_finish():
+    rows = [_row(SMALL, 600, 30, 60)] + [_row(SMALL, 60, 900, running=True) for _ in range(3)]
+
+    assert routing.estimate_models(rows, NOW)[SMALL].queue_seconds == pytest.approx(894, abs=1)
+
+
+def test_composite_tasks_and_unknown_models_are_ignored():
+    rows = [
+        _row(SMALL, 600, 3000, 60, operation_id="chunks:7"),
+        _row(SMALL, 600, 3000, 60, operation_id="scribe:abc"),
+        _row("elevenlabs/scribe-v2", 600, 3000, 60),
+    ]
+
+    estimate = routing.estimate_models(rows, NOW)[SMALL]
+
+    assert estimate.queue_seconds == routing.DEFAULT_QUEUE_SECONDS
+    assert estimate.samples == 0
+
+
+def test_long_recordings_only_go_to_the_large_model():
+    estimates = routing.estimate_models([], NOW)
+
+    assert {r.model for r in routing.candidate_routes(1800, None, estimates)} == {SMALL, LARGE}
+    assert [r.model for r in routing.candidate_routes(2 * 3600, None, estimates)] == [LARGE]
+
+
+def test_speechkit_is_an_overflow_for_loud_recordings_only(monkeypatch):
+    monkeypatch.setattr(routing, "SPEECHKIT_OVERFLOW_SECONDS", 600)
+    calm = routing.estimate_models([], NOW)
+    backed_up = {model: e._replace(queue_seconds=3600) for model, e in calm.items()}
+
+    assert PROVIDER_SPEECHKIT not in {r.provider for r in routing.candidate_routes(1800, -20.0, calm)}
+    assert PROVIDER_SPEECHKIT in {r.provider for r in routing.candidate_routes(1800, -20.0, backed_up)}
+    assert PROVIDER_SPEECHKIT not in {r.provider for r in routing.candidate_routes(1800, -50.0, backed_up)}
+
+
+def test_backed_up_queue_moves_short_recordings_to_the_other_model():
+    for _ in range(3):
+        task = add_transcription(
+            user_id=1, platform=PLATFORM_TELEGRAM, status=STATUS_RUNNING, audio_s3_path="s3://a",
+            provider=PROVIDER_REPLICATE, duration_seconds=60,
+        )
+        update_transcription(task.id, model=SMALL, operation_id="op", started_at=datetime.now(MoscowTimezone) - timedelta(hours=1))
+
+    assert routing.choose_route(600).model == LARGE
+
+
+def test_recent_timings_are_per_provider():
+    since = datetime.now(MoscowTimezone) - timedelta(hours=1)
+    for provider in (PROVIDER_REPLICATE, PROVIDER_SPEECHKIT):
+        task = add_transcription(
+            user_id=1, platform=PLATFORM_TELEGRAM, status=STATUS_RUNNING, audio_s3_path="s3://a",
+            provider=provider, duration_seconds=60,
+        )
+        update_transcription(task.id, model=SMALL, started_at=datetime.now(MoscowTimezone), actual_price=Decimal("1.00"))
+
+    rows = get_recent_provider_timings(PROVIDER_REPLICATE, since)
+
+    assert [(r.model, r.actual_price) for r in rows] == [(SMALL, Decimal("1.00"))]
+
+
+def test_hedged_tasks_count_only_while_their_whisperx_prediction_waits():
+    rows = [
+        _row(SMALL, 600, 3000, 60, operation_id="hedge:a|b"),
+        _row(SMALL, 60, 900, running=True, operation_id="hedge:c|d"),
+    ]
+
+    estimate = routing.estimate_models(rows, NOW)[SMALL]
+
+    assert estimate.samples == 1
+    assert estimate.usual_queue_seconds == routing.DEFAULT_QUEUE_SECONDS
+    assert estimate.queue_seconds == pytest.approx(897, abs=1)
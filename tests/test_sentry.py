@@ -0,0 +1,50 @@
+"""Tests for Sentry trace sampling and span skipping (utils.sentry)."""
+import asyncio
+
+import sentry_sdk
+
+import utils.sentry as sentry
+
+
+def _context(name, parent_sampled=None):
+    return {"transaction_context": {"name": name}, "parent_sampled": parent_sampled}
+
+
+def test_user_facing_transactions_are_always_sampled():
+    assert sentry._traces_sampler(_context("file.upload")) == 1.0
+    assert sentry._traces_sampler(_context("transcription.create", parent_sampled=False)) == 1.0
+
+
+def test_poll_ticks_use_the_poll_rate(monkeypatch):
+    monkeypatch.setattr(sentry, "POLL_TRACES_SAMPLE_RATE", 0.05)
+
+    for name in ("transcription.poll", "refinement.poll", "payment.poll", "metrica.send"):
+        assert sentry._traces_sampler(_context(name)) == 0.05
+
+
+def test_other_transactions_follow_parent_then_default(monkeypatch):
+    monkeypatch.setattr(sentry, "TRACES_SAMPLE_RATE", 0.5)
+
+    assert sentry._traces_sampler(_context("landing.stats")) == 0.5
+    assert sentry._traces_sampler(_context("landing.stats", parent_sampled=True)) == 1.0
+    assert sentry._traces_sampler(_context("landing.stats", parent_sampled=False)) == 0.0
+
+
+def test_span_is_skipped_without_a_sampled_transaction(monkeypatch):
+    monkeypatch.setattr(sentry, "ENABLE_SENTRY", True)
+
+    def fail(**kwargs):
+        raise AssertionError("span must not be started")
+
+    monkeypatch.setattr(sentry_sdk, "start_span", fail)
+
+    @sentry.sentry_span(op="test")
+    async def work():
+        return 42
+
+    async def unsampled():
+        with sentry_sdk.start_transaction(name="transcription.poll", sampled=False):
+            return await work()
+
+    assert asyncio.run(work()) == 42
+    assert asyncio.run(unsampled()) == 42
@@ -0,0 +1,77 @@
+"""Tests for the rendered-timecodes cache (utils.timecodes_cache)."""
+import pytest
+
+import utils.timecodes_cache as timecodes_cache
+
+from utils.timecodes import format_srt
+
+
+SEGMENTS = [
+    {"start": 0.0, "end": 1.5, "text": "Привет"},
+    {"start": 2.0, "end": 3.0, "text": "мир"},
+]
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache(monkeypatch):
+    monkeypatch.setattr(timecodes_cache, "_memory", timecodes_cache.OrderedDict())
+    monkeypatch.setattr(timecodes_cache, "_memory_bytes", 0)
+    monkeypatch.setattr(timecodes_cache, "SPILL_DIR", None)
+
+
+def test_miss_then_all_formats_hit():
+    version = timecodes_cache.version_of("{'output': {}}")
+    assert timecodes_cache.get(1, "srt", version) is None
+
+    rendered = timecodes_cache.put_segments(1, version, SEGMENTS)
+
+    assert rendered["srt"] == format_srt(SEGMENTS).encode("utf-8")
+    for fmt in ("txt", "srt", "vtt"):
+        assert timecodes_cache.get(1, fmt, version) == rendered[fmt]
+
+
+def test_swapped_payload_is_not_served_stale():
+    old = timecodes_cache.version_of("{'model': 'whisperx'}")
+    new = timecodes_cache.version_of("{'model': 'scribe'}")
+    timecodes_cache.put_segments(1, old, SEGMENTS)
+
+    assert timecodes_cache.get(1, "txt", new) is None
+    assert timecodes_cache.get(1, "txt", old) is None  # the stale entry is dropped
+
+
+def test_invalidate_forgets_only_that_transcription():
+    version = timecodes_cache.version_of("x")
+    timecodes_cache.put_segments(1, version, SEGMENTS)
+    timecodes_cache.put_segments(2, version, SEGMENTS)
+
+    timecodes_cache.invalidate(1)
+
+    assert timecodes_cache.get(1, "srt", version) is None
+    assert timecodes_cache.get(2, "srt", version) is not None
+
+
+def test_lru_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(timecodes_cache, "MAX_ENTRIES", 4)
+    version = timecodes_cache.version_of("x")
+    timecodes_cache.put_segments(1, version, SEGMENTS)
+    timecodes_cache.get(1, "txt", version)  # touch: now most recently used
+
+    timecodes_cache.put_segments(2, version, SEGMENTS[:1])
+
+    assert timecodes_cache.get(1, "txt", version) is not None
+    assert timecodes_cache.get(1, "srt", version) is None
+    assert len(timecodes_cache._memory) == 4
+
+
+def test_evicted_entries_spill_to_disk(monkeypatch, tmp_path):
+    monkeypatch.setattr(timecodes_cache, "MAX_ENTRIES", 3)
+    monkeypatch.setattr(timecodes_cache, "SPILL_DIR", str(tmp_path))
+    version = timecodes_cache.version_of("x")
+    rendered = timecodes_cache.put_segments(1, version, SEGMENTS)
+    timecodes_cache.put_segments(2, version, SEGMENTS)
+
+    assert (1, "srt") not in timecodes_cache._memory
+    assert timecodes_cache.get(1, "srt", version) == rendered["srt"]
+
+    timecodes_cache.invalidate(1)
+    assert not list(tmp_path.glob("1-*"))
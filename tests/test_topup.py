@@ -0,0 +1,167 @@
+"""Tests for batched payment polling (schedulers.topup)."""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy import event
+
+import database.queries as queries
+import schedulers.topup as topup
+
+from database.connection import engine
+from database.models import Base, PLATFORM_TELEGRAM
+from database.queries import add_user, claim_due_payments, create_payment, get_payment_by_order_id, get_user, update_payment
+from utils.utils import MoscowTimezone
+
+
+@pytest.fixture(autouse=True)
+def _database(monkeypatch):
+    monkeypatch.setattr(queries, "_user_cache", OrderedDict())
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+def _payment(order_id, user_id=1, amount="100", age=timedelta(minutes=1)):
+    if get_user(user_id, PLATFORM_TELEGRAM) is None:
+        add_user(user_id, PLATFORM_TELEGRAM)
+    create_payment(user_id, PLATFORM_TELEGRAM, order_id, Decimal(amount), "NEW", hash(order_id) % 10**9, "u", "d", {})
+    now = datetime.now(MoscowTimezone).replace(tzinfo=None)
+    update_payment(order_id, created_at=now - age, next_check_at=now - timedelta(seconds=1))
+
+
+def test_due_payments_are_claimed_with_one_update():
+    for order_id in ("a", "b", "c"):
+        _payment(order_id)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.split()[0])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        claimed = claim_due_payments(lambda payment: datetime.now(MoscowTimezone) + timedelta(seconds=10))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert [p.order_id for p in claimed] == ["a", "b", "c"]
+    assert statements == ["SELECT", "UPDATE"]
+    assert claim_due_payments(lambda payment: datetime.now(MoscowTimezone)) == []
+
+
+@pytest.fixture
+def tinkoff(monkeypatch):
+    """Payment states by payment id; records the peak number of concurrent GetState calls."""
+    states, in_flight, peak = {}, [0], [0]
+
+    async def get_payment_state(payment_id):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return {"Status": states[payment_id]}
+
+    async def cancel_payment(payment_id):
+        return {}
+
+    sent = []
+
+    async def record(*args, **kwargs):
+        sent.append(args)
+
+    monkeypatch.setattr(topup, "get_payment_state", get_payment_state)
+    monkeypatch.setattr(topup, "cancel_payment", cancel_payment)
+    for name in ("safe_send_message", "safe_remove_keyboard", "safe_edit_message"):
+        monkeypatch.setattr(topup.sender, name, record)
+    return states, peak, sent
+
+
+def _context():
+    return SimpleNamespace(application=SimpleNamespace(create_task=lambda coro: coro.close()))
+
+
+def test_tick_checks_payments_concurrently_and_credits_them_together(tinkoff):
+    states, peak, sent = tinkoff
+    _payment("a", amount="100")
+    _payment("b", amount="200")
+    _payment("c", user_id=2)
+    _payment("d", age=timedelta(hours=4))
+    for order_id, status in (("a", "CONFIRMED"), ("b", "CONFIRMED"), ("c", "REJECTED"), ("d", "NEW")):
+        states[get_payment_by_order_id(order_id).payment_id] = status
+
+    asyncio.run(topup.check_pending_payments(_context()))
+
+    assert peak[0] == 4
+    assert get_user(1, PLATFORM_TELEGRAM).balance == Decimal("350.00")
+    assert get_user(2, PLATFORM_TELEGRAM).balance == Decimal("50.00")
+    assert [get_payment_by_order_id(o).status for o in "abcd"] == ["CONFIRMED", "CONFIRMED", "REJECTED", "EXPIRED"]
+    assert len([args for args in sent if "успешно завершён" in args[-1]]) == 2
+
+
+def test_first_payments_credited_together_report_one_conversion(tinkoff, monkeypatch):
+    states, _, _ = tinkoff
+    goals = []
+    monkeypatch.setattr(topup, "track_goal", lambda yclid, goal: goals.append((yclid, goal)))
+    add_user(1, PLATFORM_TELEGRAM, yclid="y")
+    add_user(2, PLATFORM_TELEGRAM, yclid="z")
+    _payment("a")
+    _payment("b", amount="200")
+    _payment("c", user_id=2)
+    # User 2 has paid before; total_topped_up is kept by a MySQL trigger.
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE users SET total_topped_up = 300 WHERE user_id = 2")
+    for order_id in "abc":
+        states[get_payment_by_order_id(order_id).payment_id] = "CONFIRMED"
+
+    asyncio.run(topup.check_pending_payments(_context()))
+
+    assert goals == [("y", "telegram_paid")]
+
+
+def test_signed_notification_credits_the_payment_at_once(tinkoff, monkeypatch):
+    import httpx
+
+    import healthcheck
+    import payment
+
+    _, _, sent = tinkoff
+    monkeypatch.setattr(payment, "TERMINAL_KEY", "key")
+    monkeypatch.setattr(payment, "TERMINAL_PASSWORD", "secret")
+    monkeypatch.setattr(healthcheck, "_application", SimpleNamespace(create_task=lambda coro: coro.close()))
+    _payment("a")
+    fields = {
+        "TerminalKey": "key", "OrderId": "a", "Success": "true", "Status": "CONFIRMED",
+        "PaymentId": get_payment_by_order_id("a").payment_id, "Amount": 10000,
+    }
+    body = {**fields, "Success": True, "Token": payment._generate_token(fields)}
+
+    async def notify():
+        transport = httpx.ASGITransport(app=healthcheck.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            forged = await client.post("/tinkoff/notification", json={**body, "Amount": 1})
+            # Tinkoff repeats a notification until it gets OK; the repeat changes nothing.
+            return forged, [await client.post("/tinkoff/notification", json=body) for _ in range(2)]
+
+    forged, responses = asyncio.run(notify())
+
+    assert forged.status_code == 403
+    assert [(r.status_code, r.text) for r in responses] == [(200, "OK"), (200, "OK")]
+
+    assert get_payment_by_order_id("a").status == "CONFIRMED"
+    assert get_user(1, PLATFORM_TELEGRAM).balance == Decimal("150.00")
+    assert len([args for args in sent if "успешно завершён" in args[-1]]) == 1
+
+
+def test_notifications_slow_polling_down_to_reconciliation(monkeypatch):
+    assert topup._check_interval(0) == topup._PHASE1_INTERVAL
+    monkeypatch.setattr(topup.config, "TERMINAL_NOTIFICATION_URL", "https://bot.example/tinkoff/notification")
+    # Nobody receives the notifications until the healthcheck server is up.
+    assert topup._check_interval(0) == topup._PHASE1_INTERVAL
+    monkeypatch.setattr(topup, "_notifications_served", False)
+    topup.serve_notifications()
+    assert topup._check_interval(0) == topup._RECONCILE_INTERVAL
@@ -0,0 +1,149 @@
+"""Tests for the poller's batched transcription writes (database.queries)."""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+os.environ.setdefault("S3_ACCESS_KEY", "test")
+os.environ.setdefault("S3_SECRET_KEY", "test")
+os.environ.setdefault("S3_ENDPOINT", "http://s3.test")
+os.environ.setdefault("S3_BUCKET", "test")
+
+import asyncio
+
+from decimal import Decimal
+
+import pytest
+
+from sqlalchemy import event
+
+import providers.replicate as replicate_provider
+import providers.scribe as scribe_provider
+import schedulers.transcription as transcription
+
+from database.connection import engine
+from database.models import Base, PLATFORM_TELEGRAM, PROVIDER_REPLICATE, STATUS_COMPLETED, STATUS_RUNNING
+from database.queries import (
+    TranscriptionWrites, add_transcription, add_user, complete_transcription, get_recent_transcriptions,
+    get_transcription, update_transcription,
+)
+
+
+@pytest.fixture(autouse=True)
+def _database():
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def _task(user_id=1):
+    task = add_transcription(
+        user_id=user_id, platform=PLATFORM_TELEGRAM, status=STATUS_RUNNING, audio_s3_path="s3://a",
+        duration_seconds=60,
+    )
+    update_transcription(task.id, operation_id="op")
+    return get_transcription(task.id)
+
+
+def test_flush_writes_every_queued_update_in_one_statement(statements):
+    tasks = [_task() for _ in range(3)]
+    writes = TranscriptionWrites()
+    for task in tasks:
+        writes.update(task.id, result_json="{}", actual_price=Decimal("1.00"))
+    writes.update(tasks[0].id, actual_price=Decimal("2.00"))
+
+    statements.clear()
+    writes.flush()
+
+    assert statements == ["UPDATE"]
+    assert [get_transcription(t.id).actual_price for t in tasks] == [Decimal("2.00"), Decimal("1.00"), Decimal("1.00")]
+
+
+def test_shadow_rows_are_written_with_the_tick():
+    task = _task()
+    writes = TranscriptionWrites()
+    writes.add_shadow(task, model="scribe", result_json="{'output': None}")
+    writes.update(task.id, actual_price=Decimal("3.00"))
+    writes.flush()
+
+    shadow = get_transcription(task.id + 1)
+    assert shadow.is_shadow and shadow.model == "scribe" and shadow.operation_id == "op"
+    assert get_transcription(task.id).actual_price == Decimal("3.00")
+    assert [t.id for t in get_recent_transcriptions(1, PLATFORM_TELEGRAM)] == [task.id]
+
+
+def test_take_hands_queued_fields_to_the_terminal_transition():
+    task = _task()
+    writes = TranscriptionWrites()
+    writes.update(task.id, result_json="{}", actual_price=Decimal("1.00"))
+
+    assert writes.take(task.id, actual_price=Decimal("2.00")) == {"result_json": "{}", "actual_price": Decimal("2.00")}
+    assert writes.take(task.id) == {}
+
+
+def test_complete_transcription_reports_the_owner_of_a_first_result(statements):
+    add_user(1, PLATFORM_TELEGRAM)
+    first, second = _task(), _task()
+
+    statements.clear()
+    owner = complete_transcription(first.id, llm_tokens_by_encoding={"cl100k_base": 3})
+
+    assert owner is not None and owner.user_id == 1
+    # The task, the other-completed check, the update and the owner.
+    assert statements == ["SELECT", "SELECT", "UPDATE", "SELECT"]
+    assert complete_transcription(second.id) is None
+    completed = [get_transcription(t.id) for t in (first, second)]
+    assert [t.status for t in completed] == [STATUS_COMPLETED, STATUS_COMPLETED]
+    assert completed[0].llm_tokens_by_encoding == {"cl100k_base": 3}
+
+
+@pytest.fixture
+def scribe(monkeypatch):
+    async def get_signed_url(object_name, expires_in):
+        return "https://s3.test/audio"
+
+    async def start_transcription(url):
+        return "scribe-1"
+
+    monkeypatch.setattr(transcription, "get_signed_url", get_signed_url)
+    monkeypatch.setattr(scribe_provider, "start_transcription", start_transcription)
+
+
+def test_started_challenge_is_written_before_the_flush(scribe):
+    task = _task()
+    writes = TranscriptionWrites()
+    writes.update(task.id, result_json="{'output': {}}", actual_price=Decimal("1.00"))
+
+    assert asyncio.run(transcription._start_scribe_challenge(task, "empty", writes))
+
+    # A crash now leaves the paid challenger resumable, with the primary result.
+    stored = get_transcription(task.id)
+    assert stored.operation_id == transcription.SCRIBE_OP_PREFIX + "scribe-1"
+    assert stored.result_json == "{'output': {}}"
+    assert writes.take(task.id) == {}
+
+
+def test_started_hedge_is_written_before_the_flush(scribe, monkeypatch):
+    async def get_status(operation_id):
+        return "starting"
+
+    monkeypatch.setenv("HEDGING_ENABLED", "1")
+    monkeypatch.setattr(transcription.routing, "hedge_after_seconds", lambda model: 60)
+    monkeypatch.setattr(replicate_provider, "get_status", get_status)
+    task = _task()
+    update_transcription(task.id, provider=PROVIDER_REPLICATE)
+
+    assert asyncio.run(transcription._maybe_hedge(get_transcription(task.id), 120, TranscriptionWrites()))
+
+    assert get_transcription(task.id).operation_id == f"{transcription.HEDGE_OP_PREFIX}op|scribe-1"
@@ -0,0 +1,257 @@
+"""Download progress of files the local Bot API server is fetching.
+
+In local mode getFile returns only once telegram-bot-api has the whole file
+under /var/lib/telegram-bot-api/<token>/, with no progress on the way. The
+handler registers each download it waits on (file_unique_id, expected size);
+one inotify watch per directory of the bot's tree reports every file the
+server creates, moves or deletes there, and new files are paired with
+pending downloads in the order both appeared, skipping downloads a file has
+outgrown; a file moved into place completes the download of its exact size.
+The handlers' tickers then stat only their own file — no directory scans,
+and parallel downloads each get their own progress.
+
+inotify is reached through ctypes (Linux only); elsewhere get_watcher returns
+``None`` and the handlers keep the static "downloading" text.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import itertools
+import logging
+import os
+import struct
+import sys
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+
+# No IN_MODIFY: it fires on every write of a multi-gigabyte download. Sizes
+# are read on demand by whoever asks for progress.
+_WATCH_MASK = _IN_CREATE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; the name follows
+
+# Registration order of downloads and creation order of files, compared
+# when pairing the two.
+_sequence = itertools.count()
+
+
+@dataclass
+class _Download:
+    file_unique_id: str
+    expected_size: int
+    seq: int
+    path: Optional[Path] = None
+    finished: bool = False
+    # Handlers waiting on it: the same file sent twice at once is one download.
+    waiters: int = 1
+
+
+@dataclass
+class _File:
+    path: Path
+    seq: int
+    owner: Optional[str] = None
+
+
+class DownloadWatcher:
+    """Maps files appearing under *root* to the downloads registered with expect()."""
+
+    def __init__(self, root: Path, fd: int, libc) -> None:
+        self.root = root
+        self._fd = fd
+        self._libc = libc
+        self._dirs: dict[int, Path] = {}
+        self._downloads: dict[str, _Download] = {}
+        self._files: dict[Path, _File] = {}
+        self._moving: dict[int, _File] = {}  # by inotify cookie
+
+    def _watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            logging.warning(
+                "inotify_add_watch failed for %s: %s", directory, os.strerror(ctypes.get_errno())
+            )
+            return
+        self._dirs[wd] = directory
+
+    def _start(self) -> None:
+        self._watch(self.root)
+        for child in self.root.iterdir():
+            if child.is_dir():
+                self._watch(child)
+        asyncio.get_running_loop().add_reader(self._fd, self._read_events)
+
+    def expect(self, file_unique_id: str, expected_size: int) -> None:
+        """Start tracking a download getFile is about to wait for; each call needs its forget()."""
+        download = self._downloads.get(file_unique_id)
+        if download is not None:
+            download.waiters += 1
+            return
+        self._downloads[file_unique_id] = _Download(file_unique_id, expected_size, next(_sequence))
+
+    def forget(self, file_unique_id: str) -> None:
+        """Stop tracking a download once its last waiter's getFile has returned or failed."""
+        download = self._downloads.get(file_unique_id)
+        if download is None:
+            return
+        download.waiters -= 1
+        if download.waiters > 0:
+            return
+        del self._downloads[file_unique_id]
+        if download.path in self._files:
+            self._files.pop(download.path)
+
+    def received(self, file_unique_id: str) -> Optional[int]:
+        """Bytes of the download on disk so far, or ``None`` while its file is unknown."""
+        download = self._downloads.get(file_unique_id)
+        if download is None:
+            return None
+        if download.finished:
+            return download.expected_size
+        self._pair()
+        if download.path is None:
+            return None
+        try:
+            return download.path.stat().st_size
+        except OSError:
+            return None
+
+    def _pair(self) -> None:
+        """Pair files with unfinished downloads from scratch, by their current sizes.
+
+        In order of appearance, each file goes to the oldest download still
+        unpaired that was registered before it and that it still fits, so a
+        file that has outgrown a wrong guess moves on to its real owner.
+        """
+        waiting = [d for d in self._downloads.values() if not d.finished]
+        for download in waiting:
+            download.path = None
+        for file in list(self._files.values()):
+            file.owner = None
+            if not any(download.seq < file.seq for download in waiting):
+                # Only downloads registered later are left, and they cannot
+                # own an older file: it is not one we wait for.
+                del self._files[file.path]
+                continue
+            try:
+                size = file.path.stat().st_size
+            except OSError:
+                continue
+            for download in waiting:
+                if (download.path is None and download.seq < file.seq
+                        and size <= download.expected_size):
+                    file.owner = download.file_unique_id
+                    download.path = file.path
+                    break
+
+    def _read_events(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                logging.warning("inotify queue overflowed; download progress may be missing")
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            self._on_event(directory / os.fsdecode(name), mask, cookie)
+        # Both halves of a move arrive in one read; a file moved out of the
+        # tree has no IN_MOVED_TO, and its owner is taken at its word.
+        for file in self._moving.values():
+            self._complete(file, None)
+        self._moving.clear()
+        if self._files:
+            self._pair()
+
+    def _on_event(self, path: Path, mask: int, cookie: int) -> None:
+        if mask & _IN_ISDIR:
+            if mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._watch(path)
+            return
+        if mask & _IN_CREATE:
+            self._files[path] = _File(path, next(_sequence))
+        elif mask & _IN_MOVED_FROM:
+            # telegram-bot-api moves a file into place once it has all of it;
+            # the matching IN_MOVED_TO carries the same cookie.
+            if path in self._files:
+                self._moving[cookie] = self._files.pop(path)
+        elif mask & _IN_MOVED_TO:
+            if cookie in self._moving:
+                self._complete(self._moving.pop(cookie), path)
+        elif mask & _IN_DELETE:
+            # Abandoned; the download may yet start over in a new file.
+            self._files.pop(path, None)
+
+    def _complete(self, file: _File, path: Optional[Path]) -> None:
+        """*file* is whole; credit the download of exactly its size, its owner first."""
+        try:
+            size = path.stat().st_size if path is not None else None
+        except OSError:
+            size = None
+        owner = self._downloads.get(file.owner) if file.owner else None
+        if size is None:
+            download = owner
+        else:
+            candidates = ([owner] if owner else []) + [
+                d for d in self._downloads.values() if not d.finished and d is not owner
+            ]
+            download = next((d for d in candidates if d.expected_size == size), None)
+        if download is not None:
+            download.finished = True
+            download.path = None
+
+    def close(self) -> None:
+        asyncio.get_running_loop().remove_reader(self._fd)
+        os.close(self._fd)
+        _watchers.pop(self.root, None)
+
+
+_watchers: dict[Path, DownloadWatcher] = {}
+
+
+def get_watcher(root: str | Path) -> Optional[DownloadWatcher]:
+    """The watcher of *root*, started on first use; ``None`` if inotify is unavailable."""
+    root = Path(root)
+    if root in _watchers:
+        return _watchers[root]
+    if not sys.platform.startswith("linux") or not root.is_dir():
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    except Exception:
+        logging.exception("inotify is unavailable, no download progress for %s", root)
+        return None
+    watcher = DownloadWatcher(root, fd, libc)
+    try:
+        watcher._start()
+    except Exception:
+        logging.exception("Could not watch %s for download progress", root)
+        os.close(fd)
+        return None
+    _watchers[root] = watcher
+    return watcher
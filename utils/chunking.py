@@ -0,0 +1,278 @@
+"""Chunked transcription of long recordings.
+
+A six-hour upload used to be one WhisperX prediction on MODEL_LARGE, whose
+queue wait plus predict time can run past an hour. With
+CHUNKED_TRANSCRIPTION_MIN_SECONDS set, recordings at least that long are cut
+during ingest into pieces of about CHUNK_SECONDS, each ending in a pause
+(ffmpeg silencedetect) when there is one near the target, and uploaded next
+to the full audio. Starting such a transcription starts one prediction per
+piece, all at once; the task's operation_id is then ``chunks:<id>`` and the
+poller gets the merged result from check() when the last piece is done:
+segment times shifted by the piece's offset, repeats at the seams dropped,
+and pieces that detected a language other than the recording's majority
+transcribed again in that language, so one recording gets one language.
+
+Pieces use the model the whole recording would, so quality and pricing match
+the single-prediction path; only the wall time changes.
+"""
+import asyncio
+import logging
+import os
+import re
+
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import providers.replicate as replicate_provider
+
+from database.models import STATUS_COMPLETED, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING
+from database.queries import get_transcription, get_transcription_chunks, update_transcription_chunk
+from utils.ffmpeg import detect_silences, split_audio
+from utils.s3 import get_signed_url, object_name_from_url, upload_file
+from utils.timecodes import parse_result_json
+
+
+# Recordings at least this long are transcribed in pieces; 0 turns it off.
+CHUNKED_MIN_SECONDS = int(os.getenv("CHUNKED_TRANSCRIPTION_MIN_SECONDS") or 0)
+
+CHUNK_SECONDS = 30 * 60
+# How far ahead of the target length a pause may pull a cut.
+CUT_SEARCH_SECONDS = 5 * 60
+# A remainder up to this much over CHUNK_SECONDS stays in the last piece
+# rather than becoming a piece of its own.
+LAST_CHUNK_SLACK = 1.25
+
+CHUNKS_OP_PREFIX = "chunks:"
+
+# Predictions per piece, counting reruns in the recording's language.
+MAX_CHUNK_ATTEMPTS = 2
+
+# WhisperX timestamps are not exact; a piece's segment this far past its end,
+# or into the previous piece's last segment, is not real speech.
+SEAM_TOLERANCE = 0.5
+
+
+def is_eligible(duration_seconds: float) -> bool:
+    return bool(CHUNKED_MIN_SECONDS) and duration_seconds >= CHUNKED_MIN_SECONDS
+
+
+def plan_cuts(duration: float, silences: list[tuple[float, float]]) -> list[float]:
+    """Where to cut a recording of *duration* seconds: in its longest pause near each target."""
+    cuts = []
+    start = 0.0
+    while duration - start > CHUNK_SECONDS * LAST_CHUNK_SLACK:
+        target = start + CHUNK_SECONDS
+        pauses = [
+            (end - begin, (begin + end) / 2)
+            for begin, end in silences
+            if target - CUT_SEARCH_SECONDS <= (begin + end) / 2 <= target
+        ]
+        cut = max(pauses)[1] if pauses else target
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+async def prepare(ogg_path: Path, out_dir: Path, duration: float, object_stem: str) -> Optional[list[dict]]:
+    """Cut the converted audio into pieces and upload them to S3.
+
+    Returns the pieces for add_transcription_chunks, or ``None`` if the
+    recording is short enough for one piece or anything failed — it is then
+    transcribed whole, as before.
+    """
+    try:
+        cuts = plan_cuts(duration, await detect_silences(ogg_path))
+        if not cuts:
+            return None
+        pieces = await split_audio(ogg_path, out_dir / "chunks", cuts)
+        if len(pieces) != len(cuts) + 1:
+            logging.warning("Expected %d pieces of %s, got %d", len(cuts) + 1, ogg_path, len(pieces))
+            return None
+        urls = await asyncio.gather(*(
+            upload_file(path, f"{object_stem}.part{index:02d}{path.suffix}")
+            for index, (path, _, _) in enumerate(pieces)
+        ))
+        if not all(urls):
+            return None
+    except Exception:
+        logging.exception("Failed to prepare pieces of %s", ogg_path)
+        return None
+    return [
+        {"offset_seconds": start, "duration_seconds": end - start, "audio_s3_path": url}
+        for (_, start, end), url in zip(pieces, urls)
+    ]
+
+
+def has_chunks(transcription_id: int) -> bool:
+    return bool(get_transcription_chunks(transcription_id))
+
+
+async def _start_chunk(chunk, task, language: Optional[str], model: Optional[str]) -> Optional[str]:
+    # URL must outlive Replicate's queue wait, same as for a whole recording.
+    signed_url = await get_signed_url(object_name_from_url(chunk.audio_s3_path), expires_in=6 * 3600)
+    if not signed_url:
+        return None
+    # The whole recording's model (or, unrouted, its duration) is used, so
+    # pieces of a long recording get the model and price it would.
+    operation_id = await replicate_provider.start_transcription(
+        signed_url, task.duration_seconds, task.mean_volume_db, language, model,
+    )
+    if operation_id:
+        update_transcription_chunk(
+            chunk.id,
+            operation_id=operation_id,
+            status=STATUS_RUNNING,
+            language=language,
+            attempts=chunk.attempts + 1,
+            result_json=None,
+        )
+    return operation_id
+
+
+async def start(transcription_id: int, language: Optional[str] = None, model: Optional[str] = None) -> Optional[str]:
+    """Start every piece of a transcription; its operation id, or ``None`` on any failure."""
+    task = get_transcription(transcription_id)
+    chunks = get_transcription_chunks(transcription_id)
+    model = model or task.model
+    started = await asyncio.gather(*(_start_chunk(chunk, task, language, model) for chunk in chunks))
+    if not all(started):
+        logging.warning("Could not start all %d pieces of task=%s", len(chunks), transcription_id)
+        await asyncio.gather(*(replicate_provider.cancel(op) for op in started if op))
+        return None
+    return f"{CHUNKS_OP_PREFIX}{transcription_id}"
+
+
+async def cancel(transcription_id: int) -> None:
+    """Best-effort cancel of the pieces still running."""
+    running = [c for c in get_transcription_chunks(transcription_id) if c.status == STATUS_RUNNING]
+    await asyncio.gather(*(replicate_provider.cancel(chunk.operation_id) for chunk in running))
+
+
+def _has_speech(output: Dict[str, Any]) -> bool:
+    return any((segment.get("text") or "").strip() for segment in output.get("segments") or [])
+
+
+def majority_language(pieces: list[tuple[float, Dict[str, Any]]]) -> Optional[str]:
+    """Language of most of the speech, from ``(duration, output)`` of every piece."""
+    weights: Dict[str, float] = {}
+    for duration, output in pieces:
+        language = output.get("detected_language")
+        if isinstance(language, str) and _has_speech(output):
+            weights[language] = weights.get(language, 0.0) + duration
+    return max(weights, key=weights.get) if weights else None
+
+
+def _shift(segment: Dict[str, Any], offset: float) -> Dict[str, Any]:
+    shifted = dict(segment)
+    for key in ("start", "end"):
+        if isinstance(shifted.get(key), (int, float)):
+            shifted[key] = round(shifted[key] + offset, 3)
+    if isinstance(shifted.get("words"), list):
+        shifted["words"] = [
+            _shift(word, offset) if isinstance(word, dict) else word
+            for word in shifted["words"]
+        ]
+    return shifted
+
+
+def _normalized(text: str) -> str:
+    return re.sub(r"\W+", " ", text).strip().lower()
+
+
+def _repeats_seam(previous: Dict[str, Any], segment: Dict[str, Any]) -> bool:
+    """A segment at the start of a piece that the end of the previous piece already covers."""
+    prev_end = previous.get("end")
+    start, end = segment.get("start"), segment.get("end")
+    if not all(isinstance(v, (int, float)) for v in (prev_end, start, end)):
+        return False
+    if end <= prev_end + SEAM_TOLERANCE:
+        return True
+    same_text = _normalized(previous.get("text") or "") == _normalized(segment.get("text") or "")
+    return same_text and start < prev_end + 2.0
+
+
+def merge_outputs(pieces: list[tuple[float, float, Dict[str, Any]]], language: Optional[str]) -> Dict[str, Any]:
+    """One WhisperX output from ``(offset, duration, output)`` of every piece, in order."""
+    segments: list = []
+    for offset, duration, output in pieces:
+        at_seam = bool(segments)
+        for segment in output.get("segments") or []:
+            if not isinstance(segment, dict):
+                continue
+            start = segment.get("start")
+            if isinstance(start, (int, float)) and start > duration + SEAM_TOLERANCE:
+                continue  # past the end of the piece's audio
+            segment = _shift(segment, offset)
+            if at_seam and _repeats_seam(segments[-1], segment):
+                continue
+            at_seam = False
+            segments.append(segment)
+    merged: Dict[str, Any] = {"segments": segments}
+    if language:
+        merged["detected_language"] = language
+    return merged
+
+
+async def check(transcription_id: int) -> Optional[Dict[str, Any]]:
+    """Result of a chunked transcription if every piece is done, otherwise ``None``.
+
+    Shaped like providers.replicate.check_transcription, so the poller treats
+    it as one prediction; predict_time is the sum over all pieces, which is
+    what Replicate bills.
+    """
+    task = get_transcription(transcription_id)
+    chunks = get_transcription_chunks(transcription_id)
+    running = [chunk for chunk in chunks if chunk.status == STATUS_RUNNING]
+    infos = await asyncio.gather(*(replicate_provider.check_transcription(c.operation_id) for c in running))
+    for chunk, info in zip(running, infos):
+        if info is None:
+            continue
+        predict_time = (chunk.predict_time or 0.0) + (info.get("predict_time") or 0.0)
+        if info.get("status") == "succeeded" and info.get("output"):
+            update_transcription_chunk(
+                chunk.id, status=STATUS_COMPLETED, predict_time=predict_time, result_json=repr(info["output"]),
+            )
+            continue
+        update_transcription_chunk(chunk.id, predict_time=predict_time)
+        chunk.predict_time = predict_time
+        logging.warning(
+            "Piece %s of task=%s ended %s: %s", chunk.chunk_index, transcription_id, info.get("status"), info.get("error"),
+        )
+        if chunk.attempts >= MAX_CHUNK_ATTEMPTS or not await _start_chunk(chunk, task, chunk.language, task.model):
+            update_transcription_chunk(chunk.id, status=STATUS_FAILED)
+
+    chunks = get_transcription_chunks(transcription_id)
+    if any(chunk.status in (STATUS_PENDING, STATUS_RUNNING) for chunk in chunks):
+        return None
+
+    result = {
+        "id": f"{CHUNKS_OP_PREFIX}{transcription_id}",
+        "predict_time": sum(chunk.predict_time or 0.0 for chunk in chunks),
+    }
+    failed = [chunk.chunk_index for chunk in chunks if chunk.status == STATUS_FAILED]
+    if failed:
+        return {**result, "status": "failed", "output": None, "error": f"pieces {failed} failed"}
+
+    outputs = [parse_result_json(chunk.result_json) or {} for chunk in chunks]
+    language = majority_language([(chunk.duration_seconds, output) for chunk, output in zip(chunks, outputs)])
+    # A piece that is mostly music or another speaker can detect a language
+    # of its own; transcribe it again in the recording's language.
+    strays = [
+        chunk for chunk, output in zip(chunks, outputs)
+        if language
+        and chunk.language is None
+        and chunk.attempts < MAX_CHUNK_ATTEMPTS
+        and _has_speech(output)
+        and output.get("detected_language") != language
+    ]
+    if strays:
+        logging.info("Re-transcribing %d piece(s) of task=%s in %s", len(strays), transcription_id, language)
+        restarted = await asyncio.gather(*(_start_chunk(chunk, task, language, task.model) for chunk in strays))
+        if any(restarted):
+            return None
+
+    merged = merge_outputs(
+        [(chunk.offset_seconds, chunk.duration_seconds, output) for chunk, output in zip(chunks, outputs)],
+        language,
+    )
+    return {**result, "status": "succeeded", "output": merged, "error": None}
@@ -0,0 +1,74 @@
+"""Content fingerprints for repeat uploads.
+
+Users resend the same file after an error. The file handlers fingerprint
+every upload twice — SHA-256 of the file as received, then SHA-256 of the
+decoded audio once it is converted (see utils.ffmpeg.analyze_audio) — and
+store both on the transcription. A repeat upload matching an earlier one of
+the same user reuses its S3 object, duration and loudness instead of
+converting and uploading again, and if the user already has a finished
+transcript of it, that is offered straight away. Uploads are matched per
+platform: the other bot's account is a different user.
+"""
+import asyncio
+import hashlib
+import logging
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from database.models import Transcription
+from database.queries import find_reusable_upload
+from utils.utils import MoscowTimezone
+
+
+# source/ objects are lifecycle-deleted at ~30 days and a pending task waits
+# up to 7 days for confirmation (schedulers/expire_pending.py); an upload this
+# recent still has its audio in S3 whenever the new task is confirmed.
+REUSE_MAX_AGE_DAYS = 20
+
+DUPLICATE_OFFER_TEXT = (
+    "💡 Этот файл вы уже распознавали\n\n"
+    "Прошлую расшифровку можно получить сразу и бесплатно"
+)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_sha256(path: str | Path) -> Optional[str]:
+    """SHA-256 of the file at *path*, or ``None`` if it cannot be read."""
+    try:
+        return await asyncio.to_thread(_sha256, Path(path))
+    except OSError:
+        logging.warning("Could not hash %s", path, exc_info=True)
+        return None
+
+
+def uploaded_at(reused: Optional[Transcription]) -> datetime:
+    """audio_uploaded_at of a new upload: the reused object's, or now for a fresh one."""
+    if reused is not None:
+        return reused.audio_uploaded_at
+    return datetime.now(MoscowTimezone)
+
+
+def find_reusable(
+    user_id: int, platform: str, source_sha256: str | None = None, audio_sha256: str | None = None,
+) -> Optional[Transcription]:
+    """An earlier upload of the same content by the user whose S3 object can be reused."""
+    since = datetime.now(MoscowTimezone) - timedelta(days=REUSE_MAX_AGE_DAYS)
+    try:
+        return find_reusable_upload(
+            user_id, platform, source_sha256=source_sha256, audio_sha256=audio_sha256, since=since,
+        )
+    except Exception:
+        # Deduplication is an optimisation; never fail an upload over it.
+        logging.exception("Failed to look up a duplicate upload")
+        return None
@@ -4,7 +4,7 @@ import time
 import asyncio
 import logging
 
-from typing import Tuple
+from typing import AsyncIterable, Tuple
 from pathlib import Path
 
 from utils.sentry import sentry_span
@@ -143,11 +143,214 @@ async def get_mean_volume(source: str | Path) -> float | None:
         return None
 
 
+@sentry_span(op="ffmpeg.analyze")
+async def analyze_audio(source: str | Path) -> Tuple[float | None, str | None]:
+    """Return ``(mean volume in dB, SHA-256 of the decoded audio)`` of *source*.
+
+    One decoding pass serves both: ``volumedetect`` passes the samples
+    through unchanged to the ``hash`` muxer. The hash identifies the audio
+    itself, so two conversions of the same recording match even though their
+    OGG bytes differ (Ogg stream serials are random). Either value is
+    ``None`` if it could not be determined.
+    """
+    command = [
+        "ffmpeg",
+        "-i",
+        str(Path(source)),
+        "-map",
+        "0:a:0",
+        "-af",
+        "volumedetect",
+        "-f",
+        "hash",
+        "-hash",
+        "sha256",
+        "-",
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            logging.warning(f"Audio analysis failed for {source}: {stderr.decode().strip()[-200:]}")
+            return None, None
+        volume = re.search(r"mean_volume: (-?[\d.]+) dB", stderr.decode())
+        digest = re.search(r"SHA256=([0-9a-f]{64})", stdout.decode())
+        return (
+            float(volume.group(1)) if volume else None,
+            digest.group(1) if digest else None,
+        )
+    except Exception:
+        logging.warning(f"Failed to analyze audio of {source}", exc_info=True)
+        return None, None
+
+
+@sentry_span(op="ffmpeg.silencedetect")
+async def detect_silences(
+    source: str | Path, noise_db: float = -35.0, min_seconds: float = 0.5,
+) -> list[Tuple[float, float]]:
+    """Return ``(start, end)`` of every pause in *source*, in seconds.
+
+    A pause is at least *min_seconds* quieter than *noise_db* (ffmpeg
+    ``silencedetect``). An empty list if there are none or ffmpeg failed.
+    """
+    command = [
+        "ffmpeg",
+        "-i",
+        str(Path(source)),
+        "-map",
+        "0:a:0",
+        "-af",
+        f"silencedetect=noise={noise_db}dB:d={min_seconds}",
+        "-f",
+        "null",
+        "-",
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            logging.warning(f"silencedetect failed for {source}: {stderr.decode().strip()[-200:]}")
+            return []
+        text = stderr.decode()
+        starts = [float(v) for v in re.findall(r"silence_start: (-?[\d.]+)", text)]
+        ends = [float(v) for v in re.findall(r"silence_end: (-?[\d.]+)", text)]
+        # A pause running to the end of the file has no silence_end.
+        return list(zip(starts, ends))
+    except Exception:
+        logging.warning(f"Failed to detect silences in {source}", exc_info=True)
+        return []
+
+
+@sentry_span(op="ffmpeg.split")
+async def split_audio(
+    source: str | Path, out_dir: str | Path, cut_points: list[float],
+) -> list[Tuple[Path, float, float]]:
+    """Cut *source* at *cut_points* (seconds) without re-encoding.
+
+    Returns ``(path, start, end)`` of every piece, the times being where the
+    piece really starts and ends in *source*: stream copy can only cut
+    between packets, which the ``segment`` muxer reports exactly. An empty
+    list on failure.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    listing = out / "pieces.csv"
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(Path(source)),
+        "-map",
+        "0:a:0",
+        "-c",
+        "copy",
+        "-f",
+        "segment",
+        "-segment_times",
+        ",".join(f"{point:.3f}" for point in cut_points),
+        "-segment_list",
+        str(listing),
+        "-segment_list_type",
+        "csv",
+        "-reset_timestamps",
+        "1",
+        str(out / f"piece%03d{Path(source).suffix}"),
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            logging.warning(f"Splitting {source} failed: {stderr.decode().strip()[-200:]}")
+            return []
+        pieces = []
+        for line in listing.read_text().splitlines():
+            name, start, end = line.rsplit(",", 2)
+            pieces.append((out / name, float(start), float(end)))
+        return pieces
+    except Exception:
+        logging.warning(f"Failed to split {source}", exc_info=True)
+        return []
+
+
+# Bytes of a file is_streamable wants to see: enough for the top-level MP4
+# boxes ahead of moov (ftyp, free, sometimes a uuid) in every sample we have.
+STREAMABLE_HEAD_BYTES = 64 * 1024
+
+# Containers ffmpeg demuxes front to back without seeking, by their magic bytes.
+_STREAMABLE_MAGIC = (
+    b"OggS",              # ogg / opus
+    b"fLaC",              # flac
+    b"ID3",               # mp3 with a tag
+    b"\x1a\x45\xdf\xa3",  # matroska / webm
+)
+
+
+def _mp4_index_first(head: bytes) -> bool:
+    """Whether the top-level boxes in *head* reach moov (or moof) before mdat."""
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], "big")
+        kind = head[offset + 4:offset + 8]
+        if kind in (b"moov", b"moof"):
+            return True
+        if kind == b"mdat":
+            return False
+        if size == 1:  # 64-bit size follows the type
+            if offset + 16 > len(head):
+                return False
+            size = int.from_bytes(head[offset + 8:offset + 16], "big")
+        if size < 8:  # 0 means the box runs to the end of the file
+            return False
+        offset += size
+    return False
+
+
+def is_streamable(head: bytes) -> bool:
+    """Whether ffmpeg can convert a file starting with *head* as it is read from a pipe.
+
+    True for ogg, flac, webm/mkv, wav, raw mp3/aac frames and MP4/MOV with
+    the index (moov) or fragments ahead of the media data. An MP4 with moov
+    at the end — what most phones and editors write — needs the whole file.
+    """
+    if head[4:8] == b"ftyp":
+        return _mp4_index_first(head)
+    if head.startswith(_STREAMABLE_MAGIC):
+        return True
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return True
+    # MPEG audio / ADTS frame sync.
+    return len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0
+
+
+async def _feed_stdin(process: asyncio.subprocess.Process, feed: AsyncIterable[bytes]) -> None:
+    try:
+        async for chunk in feed:
+            process.stdin.write(chunk)
+            await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # ffmpeg gave up on the input; its exit code and stderr say why
+    finally:
+        process.stdin.close()
+
+
 @sentry_span(op="ffmpeg.convert")
 async def convert_to_ogg(
     source: str | Path,
     destination: str | Path,
-    progress_file: str | Path
+    progress_file: str | Path,
+    feed: AsyncIterable[bytes] | None = None,
 ) -> str | None:
     """Convert an audio or video file to OGG using ffmpeg.
 
@@ -160,6 +363,10 @@ async def convert_to_ogg(
         is created automatically.
     progress_file:
         Path to a temporary file where ffmpeg will write ``-progress`` updates.
+    feed:
+        If given, ffmpeg reads the input from a pipe fed with these bytes
+        instead of opening *source*, so conversion can run while the file is
+        still arriving (see is_streamable). *source* only names it in logs.
 
     Returns
     -------
@@ -180,7 +387,7 @@ async def convert_to_ogg(
         "-progress",
         str(progress),
         "-i",
-        str(src),
+        "pipe:0" if feed is not None else str(src),
         "-vn",
         "-ac",
         "1",
@@ -193,10 +400,21 @@ async def convert_to_ogg(
     try:
         process = await asyncio.create_subprocess_exec(
             *command,
+            stdin=asyncio.subprocess.PIPE if feed is not None else None,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
-        _, stderr = await process.communicate()
+        try:
+            if feed is not None:
+                _, stderr = await asyncio.gather(_feed_stdin(process, feed), process.stderr.read())
+                await process.wait()
+            else:
+                _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # The caller no longer wants this output (the file was rejected,
+            # or reused, or the bot is stopping); do not leave ffmpeg running.
+            process.kill()
+            raise
         if process.returncode != 0:
             stderr_text = stderr.decode().strip()
             logging.warning(f"ffmpeg failed for {source}: {stderr_text}")
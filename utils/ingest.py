@@ -0,0 +1,137 @@
+"""Persistent state of uploads being prepared for transcription.
+
+The file handlers used to prepare an upload inside a TemporaryDirectory, so a
+restart mid-ingest lost the download, the conversion and the upload, and the
+user never heard back. Every upload is now an ingest_jobs row plus a working
+directory under INGEST_DIR named after it. The handler records each finished
+stage; schedulers/ingest.py resumes the jobs a restart interrupted from the
+stage after the last recorded one, and run_bots drains in-flight jobs on
+shutdown so most never need resuming.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from database.models import IngestJob, INGEST_STAGE_UPLOADED, STATUS_FAILED
+from database.queries import add_ingest_job, update_ingest_job
+from providers.replicate import QUIET_MEAN_VOLUME_DB
+from utils.utils import format_duration
+
+
+# Must survive a process restart, unlike a TemporaryDirectory; /tmp does,
+# which is all a pm2 restart needs.
+INGEST_DIR = Path(os.getenv("INGEST_DIR") or Path(tempfile.gettempdir()) / "cleartranscript-ingest")
+
+# Restarts a job is resumed after before the user is asked to send the file
+# again: a file that keeps crashing the bot must not crash it forever.
+MAX_RESUME_ATTEMPTS = 2
+
+# How long shutdown waits for in-flight jobs; stays under pm2's kill_timeout
+# (30 s, ecosystem.config.js) so the rest of the shutdown still fits.
+DRAIN_TIMEOUT = 20.0
+
+# Jobs being worked on by this process, by id: drain() waits for them and the
+# resumer leaves them alone.
+_active: dict[int, asyncio.Task] = {}
+
+
+def track(job: IngestJob) -> None:
+    """Mark *job* as worked on by the current task until that task ends."""
+    task = asyncio.current_task()
+    _active[job.id] = task
+    task.add_done_callback(lambda _: _active.pop(job.id, None))
+
+
+def is_active(job_id: int) -> bool:
+    return job_id in _active
+
+
+def start_job(**fields) -> IngestJob:
+    """Persist a job for a just-received file, worked on by the current task."""
+    job = add_ingest_job(**fields)
+    track(job)
+    return job
+
+
+def job_dirs(job_id: int) -> tuple[Path, Path]:
+    """Input and output directories of the job, created if missing."""
+    workdir = INGEST_DIR / str(job_id)
+    in_dir = workdir / "in"
+    out_dir = workdir / "out"
+    in_dir.mkdir(parents=True, exist_ok=True)
+    out_dir.mkdir(exist_ok=True)
+    return in_dir, out_dir
+
+
+def remove_job_dir(job_id: int) -> None:
+    shutil.rmtree(INGEST_DIR / str(job_id), ignore_errors=True)
+
+
+def advance(job: IngestJob, stage: str, **fields) -> None:
+    """Record that *stage* has finished, together with what it produced."""
+    update_ingest_job(job.id, stage=stage, **fields)
+    job.stage = stage
+    for key, value in fields.items():
+        setattr(job, key, value)
+
+
+def finish(job: IngestJob, status: str) -> None:
+    """Close *job* as completed or failed and delete its files."""
+    update_ingest_job(job.id, status=status)
+    job.status = status
+    remove_job_dir(job.id)
+
+
+@contextmanager
+def workdir(job: IngestJob):
+    """Input and output directories of *job* for the download → upload stages.
+
+    Leaving the block with the file uploaded deletes the files and keeps the
+    job running for the pricing step; leaving it any other way — the file was
+    rejected or something raised — fails the job. Cancellation means the
+    process is shutting down: the job and its files stay for the resumer.
+    """
+    try:
+        yield job_dirs(job.id)
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        finish(job, STATUS_FAILED)
+        raise
+    if job.stage == INGEST_STAGE_UPLOADED:
+        remove_job_dir(job.id)
+    else:
+        finish(job, STATUS_FAILED)
+
+
+async def drain(timeout: float = DRAIN_TIMEOUT) -> None:
+    """Wait up to *timeout* seconds for in-flight jobs; the rest are resumed after restart."""
+    tasks = [task for task in _active.values() if task is not asyncio.current_task()]
+    if not tasks:
+        return
+    logging.info("Waiting up to %.0fs for %d ingest job(s) to finish", timeout, len(tasks))
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    if pending:
+        logging.warning("%d ingest job(s) left to resume after restart", len(pending))
+
+
+def prepared_details(duration: float, price_for_user, mean_volume_db: float | None) -> str:
+    """Body of the "audio prepared" confirm message."""
+    hint = "\n\n💡 Бот лучше всего работает с записями от 5 минут" if duration < 300 else ""
+    quiet_warning = (
+        "\n\n⚠️ Запись тихая — возможна потеря фрагментов. "
+        "Лучше перезаписать громче или ближе к микрофону"
+        if mean_volume_db is not None and mean_volume_db < QUIET_MEAN_VOLUME_DB
+        else ""
+    )
+    return (
+        f"Длительность: {format_duration(int(duration))}\n"
+        f"Стоимость: {price_for_user} ₽"
+        f"{quiet_warning}"
+        f"{hint}"
+    )
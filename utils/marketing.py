@@ -1,10 +1,14 @@
 import os
 import time
-import asyncio
+import random
 import httpx
 import logging
 
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from database.queries import add_metrica_hits
+from utils.utils import MoscowTimezone
 
 
 COUNTER_ID   = os.getenv("COUNTER_ID")  # ID счётчика Яндекс.Метрики
@@ -14,94 +18,122 @@ MP_COLLECT   = "https://mc.yandex.ru/collect/"
 HTTP_TIMEOUT = 5.0
 
 # Конверсии уходят в атрибуцию Яндекс.Директа, поэтому потерянный хит искажает
-# CPA/ROI. Транзиентные сбои (таймауты, сеть, 5xx) ретраим с нарастающей паузой,
-# пока не отправится; сдаёмся только на постоянных 4xx, которые ретрай не лечит.
-# Бэкофф: 1,2,4,8,16,32,60,60... — 12 попыток это ~6 минут перед сдачей.
-MAX_ATTEMPTS = 12
-MAX_BACKOFF  = 60.0
-
-
-async def _send_hit(client: httpx.AsyncClient, params: Dict[str, Any], label: str) -> bool:
-    """Отправить один хит в Метрику, ретраить транзиентные сбои до успеха."""
-    backoff = 1.0
-    for attempt in range(1, MAX_ATTEMPTS + 1):
-        try:
-            response = await client.get(MP_COLLECT, params=params)
-            response.raise_for_status()
-            return True
-        except httpx.HTTPStatusError as exc:
-            status = exc.response.status_code
-            # 429 (rate limit) и 408 — транзиентные 4xx, их ретраим. Остальные
-            # 4xx (400/401/403/404) — непринятый хит: тот же payload даст тот же
-            # ответ (см. CLEAR-TRANSCRIPT-4T: один yclid → 400 дважды за 34 мин),
-            # поэтому сдаёмся сразу, и это всплывёт в Sentry как потерянный хит.
-            if 400 <= status < 500 and status not in (408, 429):
-                logging.warning("Metrica %s rejected (%s), not retrying", label, status)
-                return False
-            logging.warning("Metrica %s attempt %d/%d failed: %s", label, attempt, MAX_ATTEMPTS, exc)
-        except Exception as exc:
-            logging.warning("Metrica %s attempt %d/%d failed: %s", label, attempt, MAX_ATTEMPTS, exc)
-        if attempt < MAX_ATTEMPTS:
-            await asyncio.sleep(backoff)
-            backoff = min(backoff * 2, MAX_BACKOFF)
-    return False
-
-
-async def track_goal(yclid: str, goal: str) -> bool:
+# CPA/ROI. track_goal только кладёт хиты в таблицу metrica_outbox, а отправляет
+# их schedulers/metrica.py — так рестарт не теряет конверсию. Транзиентные сбои
+# (таймауты, сеть, 5xx) ретраим с нарастающей паузой и джиттером, переживая
+# рестарты; сдаёмся только на постоянных 4xx, которые ретрай не лечит.
+# Бэкофф: 1,2,4,...,2048 с, дальше раз в час — 20 попыток это ~9 часов.
+MAX_ATTEMPTS = 20
+MAX_BACKOFF  = 3600.0
+# Одновременных запросов к Метрике из одного тика отправителя.
+MAX_CONNECTIONS = 8
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def enabled() -> bool:
+    return bool(MEAS_TOKEN and COUNTER_ID)
+
+
+def _http() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close() -> None:
+    """Закрыть общий клиент при остановке бота."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def retry_delay(attempts: int) -> float:
+    """Пауза в секундах перед следующей попыткой после *attempts* неудачных."""
+    backoff = min(2.0 ** attempts, MAX_BACKOFF)
+    # Джиттер разводит хиты, упавшие в одном тике, чтобы не бить Метрику залпом.
+    return backoff * random.uniform(0.5, 1.5)
+
+
+def hit_params(hit) -> Dict[str, Any]:
+    """Параметры Measurement Protocol для хита из metrica_outbox."""
+    dl = f"{SITE_URL}?yclid={hit.yclid}"
+
+    if hit.hit_type == "pageview":
+        # pageview — создаём/дополняем визит
+        return {
+            "tid": COUNTER_ID,  # tid — идентификатор счётчика (Counter ID)
+            "cid": hit.yclid,   # cid — идентификатор клиента (в нашем случае YCLID)
+            "t":   "pageview",  # t — тип хита ("pageview" = просмотр страницы)
+            "dr":  "https://yabs.yandex.ru",  # dr — document referrer (источник перехода)
+            "dl":  dl,              # dl = document location (URL страницы/экрана визита)
+            "dt":  hit.goal,        # dt — document title (название "страницы", можно указать имя цели)
+            "et":  hit.event_time,  # et — event time (время конверсии, а не отправки)
+            "ms":  MEAS_TOKEN,      # ms — measurement protocol token
+        }
+
+    # event — сама конверсия
+    return {
+        "tid": COUNTER_ID,      # tid — идентификатор счётчика
+        "cid": hit.yclid,       # cid — идентификатор клиента
+        "t":   "event",         # t — тип хита ("event" = событие)
+        "ea":  hit.goal,        # ea — event action (действие события, обычно имя цели)
+        "et":  hit.event_time,  # et — event time
+        "dl":  dl,              # dl — document location (адрес, к которому привязываем событие)
+        "ms":  MEAS_TOKEN,      # ms — measurement protocol token
+    }
+
+
+async def send_hit(hit) -> Optional[bool]:
+    """Одна попытка отправить хит: True — принят, False — отвергнут навсегда, None — ретраить."""
+    try:
+        response = await _http().get(MP_COLLECT, params=hit_params(hit))
+        response.raise_for_status()
+        return True
+    except httpx.HTTPStatusError as exc:
+        status = exc.response.status_code
+        # 429 (rate limit) и 408 — транзиентные 4xx, их ретраим. Остальные
+        # 4xx (400/401/403/404) — непринятый хит: тот же payload даст тот же
+        # ответ (см. CLEAR-TRANSCRIPT-4T: один yclid → 400 дважды за 34 мин),
+        # поэтому сдаёмся сразу, и это всплывёт в Sentry как потерянный хит.
+        if 400 <= status < 500 and status not in (408, 429):
+            logging.warning("Metrica %s rejected (%s), not retrying: yclid=%s goal=%s", hit.hit_type, status, hit.yclid, hit.goal)
+            return False
+        logging.warning("Metrica %s attempt %d/%d failed: %s", hit.hit_type, hit.attempts + 1, MAX_ATTEMPTS, exc)
+    except Exception as exc:
+        logging.warning("Metrica %s attempt %d/%d failed: %s", hit.hit_type, hit.attempts + 1, MAX_ATTEMPTS, exc)
+    return None
+
+
+def track_goal(yclid: str, goal: str) -> bool:
     """
-    Асинхронная отправка визита (pageview) + события (event) в Яндекс.Метрику.
+    Поставить визит (pageview) + событие (event) для Яндекс.Метрики в очередь отправки.
 
     :param yclid: идентификатор рекламного клика (например, из /start <yclid>)
     :param goal: название цели в Метрике (например, "startbot", "resultbot")
-    :return: True при успехе, False при ошибке
+    :return: True, если хиты поставлены в очередь
     """
     logging.info("Metrica: track_goal yclid=%s goal=%s", yclid, goal)
 
-    if not MEAS_TOKEN or not COUNTER_ID:
+    if not enabled():
         logging.info("Metrica disabled: MEAS_TOKEN or COUNTER_ID not set")
         return False
 
-    ts = int(time.time())
-    dl = f"{SITE_URL}?yclid={yclid}"
-    dr = "https://yabs.yandex.ru"
-
-    # 1) pageview — создаём/дополняем визит
-    pv: Dict[str, Any] = {
-        "tid": COUNTER_ID,  # tid — идентификатор счётчика (Counter ID)
-        "cid": yclid,       # cid — идентификатор клиента (в нашем случае YCLID)
-        "t":   "pageview",  # t — тип хита ("pageview" = просмотр страницы)
-        "dr":  dr,    # dr — document referrer (источник перехода)
-        "dl":  dl,    # dl = document location (URL страницы/экрана визита)
-        "dt":  goal,  # dt — document title (название "страницы", можно указать имя цели)
-        "et":  ts,    # et — event time (время события, unix timestamp в секундах)
-        "ms":  MEAS_TOKEN,  # ms — measurement protocol token
-    }
-
-    # 2) event — сама конверсия
-    ev: Dict[str, Any] = {
-        "tid": COUNTER_ID,  # tid — идентификатор счётчика
-        "cid": yclid,       # cid — идентификатор клиента
-        "t":   "event",     # t — тип хита ("event" = событие)
-        "ea":  goal,        # ea — event action (действие события, обычно имя цели)
-        "et":  ts,          # et — event time
-        "dl":  dl,          # dl — document location (адрес, к которому привязываем событие)
-        "ms":  MEAS_TOKEN,  # ms — measurement protocol token
-    }
-
     # Хиты независимы: успешный pageview не переотправляется, если упал event.
-    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-        ok_pv = await _send_hit(client, pv, "pageview")
-        ok_ev = await _send_hit(client, ev, "event")
-
-    if ok_pv and ok_ev:
-        logging.info("Metrica OK: yclid=%s goal=%s", yclid, goal)
-        return True
-
-    # Конверсия (event) не доехала даже после ретраев — это реально потерянный
-    # сигнал, поднимаем до error, чтобы увидеть в Sentry. Недослать только
-    # pageview менее критично — оставляем warning.
-    if not ok_ev:
-        logging.error("Metrica event lost after retries: yclid=%s goal=%s", yclid, goal)
-    else:
-        logging.warning("Metrica pageview lost after retries: yclid=%s goal=%s", yclid, goal)
-    return False
+    ts = int(time.time())
+    now = datetime.now(MoscowTimezone)
+    try:
+        add_metrica_hits([
+            {"yclid": yclid, "goal": goal, "hit_type": hit_type, "event_time": ts, "next_attempt_at": now}
+            for hit_type in ("pageview", "event")
+        ])
+    except Exception:
+        # Конверсия не должна ломать пользовательский сценарий, который её вызвал.
+        logging.exception("Metrica goal not queued: yclid=%s goal=%s", yclid, goal)
+        return False
+    return True
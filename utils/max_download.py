@@ -1,57 +1,256 @@
-"""File download utility for Max messenger attachments."""
+"""File download utility for Max messenger attachments.
+
+okcdn.ru caps the throughput of a single connection and sometimes closes a
+response stream before the body is complete (httpx.RemoteProtocolError).
+When the CDN honours Range requests the file is fetched as SEGMENT_SIZE
+segments over up to MAX_CONNECTIONS connections, each written in place at
+its offset; a segment cut off mid-stream is requested again from the first
+byte it is missing, so a dropped connection costs seconds, not the whole
+transfer. Servers without Range support get the old sequential stream.
+"""
 import asyncio
 import logging
+import re
+
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import AsyncIterator, Optional
 
 import httpx
 
 from utils.sentry import sentry_span
 
 
-@sentry_span(op="max.download_file")
-async def download_max_file(url: str, destination: str | Path) -> bool:
-    """Stream a Max file attachment from *url* directly to *destination*.
+SEGMENT_SIZE = 16 * 1024 * 1024
+MAX_CONNECTIONS = 4
+# Attempts per segment; every retry resumes from the segment's last written byte.
+SEGMENT_ATTEMPTS = 4
+RETRY_DELAY = 1.0  # seconds, doubled after each failed attempt of a segment
 
-    okcdn.ru sometimes closes the response stream before the body is
-    complete (httpx.RemoteProtocolError); retry once before giving up.
+_CHUNK_SIZE = 1024 * 1024
+_CONTENT_RANGE_RE = re.compile(r"bytes \d+-\d+/(\d+)")
 
-    Returns ``True`` on success and ``False`` on failure.
+# Transport-level failures worth retrying: the CDN dropped or stalled the
+# connection. HTTP errors are not — a 4xx means the signed URL is no good.
+_RETRYABLE = (httpx.RemoteProtocolError, httpx.ReadError, httpx.ReadTimeout, httpx.ConnectError)
+
+
+@dataclass
+class DownloadProgress:
+    """Bytes written so far; the handler's progress ticker reads it.
+
+    ``total`` is filled in once the CDN has reported the file size. Bytes of
+    a segment that is retried are not counted twice. ``contiguous`` is how
+    far from the start the file is complete, which is what a reader of the
+    growing file (iter_downloaded) may consume; it only moves on the range
+    path, where a dropped connection never rewrites bytes already written.
     """
-    dst = Path(destination)
+
+    received: int = 0
+    total: Optional[int] = None
+    contiguous: int = 0
+    finished: bool = False
+    # Segment start -> (first byte not yet written, end of the segment).
+    _segments: dict = field(default_factory=dict, repr=False)
+    _head: int = field(default=0, repr=False)  # start of the segment holding the frontier
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def _wrote(self, start: int, reached: int, end: int, size: int) -> None:
+        """*size* more bytes of segment start..end (exclusive) are on disk, up to *reached*."""
+        self.received += size
+        self._segments[start] = (reached, end)
+        while self._head in self._segments:
+            reached, end = self._segments[self._head]
+            self.contiguous = reached
+            if reached < end:
+                break
+            del self._segments[self._head]
+            self._head = end
+        self._changed.set()
+
+    def _finish(self) -> None:
+        self.finished = True
+        self._changed.set()
+
+    async def changed(self) -> None:
+        """Wait until more of the file is written or the download ends (one waiter at a time)."""
+        await self._changed.wait()
+        self._changed.clear()
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=120.0)
+
+
+async def _probe(client: httpx.AsyncClient, url: str) -> Optional[int]:
+    """Size of the file if the server serves byte ranges of it, else ``None``."""
+    async with client.stream("GET", url, headers={"Range": "bytes=0-0"}) as resp:
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            return None
+        match = _CONTENT_RANGE_RE.fullmatch(resp.headers.get("Content-Range", ""))
+        return int(match.group(1)) if match else None
+
+
+async def _fetch_segment(
+    client: httpx.AsyncClient, url: str, dst: Path, start: int, end: int, progress: DownloadProgress,
+) -> None:
+    """Write bytes ``start..end`` (inclusive) of *url* at the same offset of *dst*."""
+    offset = start
+    for attempt in range(SEGMENT_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        try:
+            async with client.stream("GET", url, headers={"Range": f"bytes={offset}-{end}"}) as resp:
+                resp.raise_for_status()
+                if resp.status_code != 206:
+                    raise httpx.HTTPStatusError(
+                        f"Expected 206 for a range request, got {resp.status_code}",
+                        request=resp.request, response=resp,
+                    )
+                with dst.open("r+b") as f:
+                    f.seek(offset)
+                    # Unbuffered, so every byte received before a drop is
+                    # written and the retry starts right after it.
+                    async for chunk in resp.aiter_bytes():
+                        chunk = chunk[:end + 1 - offset]
+                        f.write(chunk)
+                        offset += len(chunk)
+                        # Flushed first, so a reader of the growing file sees what it is told about.
+                        f.flush()
+                        progress._wrote(start, offset, end + 1, len(chunk))
+            if offset > end:
+                return
+            logging.warning("Max file CDN sent bytes %d-%d of %d-%d, resuming", start, offset - 1, start, end)
+        except _RETRYABLE as exc:
+            if attempt == SEGMENT_ATTEMPTS - 1:
+                raise
+            logging.warning("Max file CDN dropped segment at byte %d, resuming: %s", offset, exc)
+    raise httpx.RemoteProtocolError(f"Segment {start}-{end} still incomplete after {SEGMENT_ATTEMPTS} attempts")
+
+
+async def _download_ranges(
+    client: httpx.AsyncClient, url: str, dst: Path, total: int, progress: DownloadProgress,
+) -> None:
+    with dst.open("wb") as f:
+        f.truncate(total)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for start in range(0, total, SEGMENT_SIZE):
+        queue.put_nowait((start, min(start + SEGMENT_SIZE, total) - 1))
+
+    async def worker():
+        while not queue.empty():
+            start, end = queue.get_nowait()
+            await _fetch_segment(client, url, dst, start, end, progress)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(MAX_CONNECTIONS, queue.qsize()))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # One segment failing for good fails the file; stop the others.
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def _download_whole(client: httpx.AsyncClient, url: str, dst: Path, progress: DownloadProgress) -> None:
+    """Sequential stream for servers without Range support; a drop restarts from zero, once."""
     for attempt in range(2):
         if attempt:
-            await asyncio.sleep(1.0)
+            await asyncio.sleep(RETRY_DELAY)
+        progress.received = 0
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                async with client.stream("GET", url) as resp:
-                    resp.raise_for_status()
-                    with dst.open("wb") as f:
-                        async for chunk in resp.aiter_bytes(chunk_size=1024 * 1024):
-                            if chunk:
-                                f.write(chunk)
-            return True
+            async with client.stream("GET", url) as resp:
+                resp.raise_for_status()
+                if resp.headers.get("Content-Length", "").isdigit():
+                    progress.total = int(resp.headers["Content-Length"])
+                with dst.open("wb") as f:
+                    async for chunk in resp.aiter_bytes(chunk_size=_CHUNK_SIZE):
+                        f.write(chunk)
+                        progress.received += len(chunk)
+            return
         except httpx.RemoteProtocolError as exc:
-            if attempt == 0:
-                logging.warning("Max file CDN closed mid-stream, retrying: %s", exc)
-                continue
-            logging.warning("Max file CDN closed mid-stream after retry: %s", exc)
-            break
-        except httpx.HTTPStatusError as exc:
-            status = exc.response.status_code
-            if 400 <= status < 500:
-                # Most often Max's signed URL expired before we fetched it;
-                # the user just needs to send the file again.
-                logging.warning("Max file CDN returned %s for %s...", status, url[:80])
-                break
-            logging.exception("Failed to download Max file from %s...", url[:80])
-            break
-        except Exception:
+            if attempt:
+                raise
+            logging.warning("Max file CDN closed mid-stream, retrying: %s", exc)
+
+
+@sentry_span(op="max.download_file")
+async def download_max_file(
+    url: str, destination: str | Path, progress: Optional[DownloadProgress] = None,
+) -> bool:
+    """Download a Max file attachment from *url* to *destination*.
+
+    *progress*, if given, is kept up to date with the bytes written.
+    Returns ``True`` on success and ``False`` on failure.
+    """
+    dst = Path(destination)
+    progress = progress if progress is not None else DownloadProgress()
+    try:
+        async with _client() as client:
+            progress.total = await _probe(client, url)
+            if progress.total:
+                await _download_ranges(client, url, dst, progress.total, progress)
+            else:
+                await _download_whole(client, url, dst, progress)
+        progress.contiguous = dst.stat().st_size
+        progress._finish()
+        return True
+    except httpx.RemoteProtocolError as exc:
+        logging.warning("Max file CDN closed mid-stream after retries: %s", exc)
+    except httpx.HTTPStatusError as exc:
+        status = exc.response.status_code
+        if 400 <= status < 500:
+            # Most often Max's signed URL expired before we fetched it;
+            # the user just needs to send the file again.
+            logging.warning("Max file CDN returned %s for %s...", status, url[:80])
+        else:
             logging.exception("Failed to download Max file from %s...", url[:80])
-            break
+    except Exception:
+        logging.exception("Failed to download Max file from %s...", url[:80])
 
+    progress._finish()
     try:
         if dst.exists():
             dst.unlink()
     except Exception:
         logging.exception("Failed to cleanup partially downloaded file %s", dst)
     return False
+
+
+async def wait_for_head(progress: DownloadProgress, size: int) -> bool:
+    """Wait until the first *size* bytes are on disk while the download still runs.
+
+    False if the download ended first — finished or failed — so there is
+    nothing left to overlap with it.
+    """
+    while progress.contiguous < size:
+        if progress.finished:
+            return False
+        await progress.changed()
+    return not progress.finished
+
+
+async def iter_downloaded(path: str | Path, progress: DownloadProgress) -> AsyncIterator[bytes]:
+    """The file at *path* in order, as the download completes it.
+
+    Meant for a consumer that runs alongside download_max_file, such as an
+    ffmpeg reading from a pipe. Stops at the end of the file once the download
+    has finished; if the download failed, the consumer gets a truncated
+    file and should be discarded.
+    """
+    position = 0
+    # Unbuffered: a buffered reader reads ahead into bytes not written yet and
+    # would serve them from its buffer later.
+    with Path(path).open("rb", buffering=0) as f:
+        while True:
+            if position < progress.contiguous:
+                f.seek(position)
+                chunk = f.read(min(progress.contiguous - position, _CHUNK_SIZE))
+                position += len(chunk)
+                yield chunk
+            elif progress.finished:
+                return
+            else:
+                await progress.changed()
@@ -0,0 +1,247 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+The heartbeat only says whether a loop ticked recently; these say how long
+things take, so a slowing event loop, a scheduler tick creeping towards its
+interval or a provider getting slower show up as trends on a dashboard long
+before the healthcheck flips to 503. Served as ``GET /metrics`` by
+healthcheck.py.
+
+Deliberately tiny instead of pulling in prometheus_client: counters, gauges
+and histograms with labels, all values kept in dicts behind one lock. Queries and
+provider calls also run in worker threads (asyncio.to_thread).
+"""
+import asyncio
+import functools
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+
+# Seconds; from a fast SELECT up to a slow multi-MB upload.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Rows a scheduler tick picked up.
+ITEM_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_lock = threading.Lock()
+_registry: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def clear(self) -> None:
+        with _lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    @abstractmethod
+    def _render_samples(self, items) -> list[str]:
+        """Sample lines for the (labels, value) *items*, already sorted."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with _lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def _render_samples(self, items) -> list[str]:
+        return [f"{self.name}_total{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with _lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def value(self, **labels) -> float:
+        with _lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def _render_samples(self, items) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        with _lock:
+            state = self._values.get(tuple(sorted(labels.items())))
+            return state[2] if state else 0
+
+    def _render_samples(self, items) -> list[str]:
+        lines = []
+        inf = 'le="+Inf"'
+        for key, (buckets, total, count) in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, buckets):
+                cumulative += hits
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+EVENT_LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds",
+    "How late a periodic sleep on the shared event loop woke up.",
+)
+SCHEDULER_TICK = Histogram(
+    "bot_scheduler_tick_seconds",
+    "Duration of one scheduler job run.",
+)
+SCHEDULER_ITEMS = Histogram(
+    "bot_scheduler_items",
+    "Rows a scheduler job run picked up.",
+    buckets=ITEM_BUCKETS,
+)
+PROVIDER_CALL = Histogram(
+    "bot_provider_call_seconds",
+    "Latency of calls to transcription and payment providers.",
+)
+PROVIDER_ERRORS = Counter(
+    "bot_provider_call_errors",
+    "Provider calls that raised.",
+)
+DB_QUERY = Histogram(
+    "bot_db_query_seconds",
+    "Latency of database/queries.py functions.",
+)
+DB_ERRORS = Counter(
+    "bot_db_query_errors",
+    "database/queries.py calls that raised.",
+)
+MESSAGE_SEND = Histogram(
+    "bot_message_send_seconds",
+    "Latency of outbound Telegram / Max API calls made through the safe_* helpers.",
+)
+MESSAGE_SEND_ERRORS = Counter(
+    "bot_message_send_errors",
+    "Outbound Telegram / Max API calls that raised.",
+)
+METRICA_BACKLOG = Gauge(
+    "bot_metrica_outbox_hits",
+    "Metrica hits waiting in the outbox, as of the last sender tick.",
+)
+
+
+@contextmanager
+def track(histogram: Histogram, errors: Counter | None = None, **labels):
+    """Time the block into *histogram*; count it in *errors* if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def timed_query(func):
+    """Decorator for database/queries.py functions: latency and errors by function name."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track(DB_QUERY, DB_ERRORS, function=func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def timed_call(provider: str, call: str):
+    """Decorator for async provider calls that raise on failure."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track(PROVIDER_CALL, PROVIDER_ERRORS, provider=provider, call=call):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_tick(job: str):
+    """Decorator for scheduler jobs: duration of every run, labelled *job*."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track(SCHEDULER_TICK, job=job):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def monitor_event_loop(interval: float = 0.5) -> None:
+    """Sample event-loop lag forever: how much later than *interval* a sleep returns."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,97 @@
+"""Cold storage of old result payloads in S3.
+
+``transcriptions.result_json`` (a multi-megabyte WhisperX payload for long
+recordings) and ``refinements.result_text`` used to stay in MySQL forever,
+bloating the table, its backups and the buffer pool around the hot rows.
+schedulers/archive.py moves payloads older than ``RESULT_ARCHIVE_AFTER_DAYS``
+into gzip objects under ``archive/`` and leaves a short pointer in the cell::
+
+    archived:archive/transcriptions.result_json/123.gz
+
+The pointer keeps the cell non-empty, so "has a result" checks still hold,
+and load() — called by utils.timecodes.parse_result_json, which the handlers
+run in a worker thread — swaps it back for the payload on demand. Fetched
+payloads are kept in a small in-memory LRU, as the user who opens an old
+transcription usually asks for text and timecodes in a row.
+
+The archive/ prefix must be excluded from the bucket lifecycle rule that
+removes uploads after ~30 days.
+"""
+import asyncio
+import gzip
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Optional
+
+
+ARCHIVE_PREFIX = "archived:"
+
+CACHE_MAX_ENTRIES = 32
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# pointer -> payload; most recently used last. load() runs in worker threads.
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def is_archived(raw) -> bool:
+    """True if *raw* is a pointer left by archive() rather than a payload."""
+    return isinstance(raw, str) and raw.startswith(ARCHIVE_PREFIX)
+
+
+def object_name(table: str, column: str, row_id: int) -> str:
+    return f"archive/{table}.{column}/{row_id}.gz"
+
+
+async def archive(name: str, payload: str) -> Optional[str]:
+    """Upload *payload* gzipped as *name*; the pointer to store, or ``None`` on failure."""
+    from utils.s3 import upload_bytes
+
+    data = await asyncio.to_thread(gzip.compress, payload.encode("utf-8"))
+    if not await upload_bytes(data, name):
+        return None
+    return f"{ARCHIVE_PREFIX}{name}"
+
+
+def _remember(pointer: str, payload: str) -> None:
+    global _cache_bytes
+    with _cache_lock:
+        if pointer in _cache:  # fetched by another thread meanwhile
+            _cache.move_to_end(pointer)
+            return
+        _cache[pointer] = payload
+        _cache_bytes += len(payload)
+        while len(_cache) > 1 and (len(_cache) > CACHE_MAX_ENTRIES or _cache_bytes > CACHE_MAX_BYTES):
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def load(raw: Optional[str]) -> Optional[str]:
+    """The payload behind *raw*: *raw* itself, or the archived object it points to.
+
+    A cache miss is a blocking S3 fetch plus a gunzip; callers on the event
+    loop go through asyncio.to_thread.
+    """
+    if not is_archived(raw):
+        return raw
+    with _cache_lock:
+        cached = _cache.get(raw)
+        if cached is not None:
+            _cache.move_to_end(raw)
+            return cached
+
+    from utils.s3 import download_bytes
+
+    data = download_bytes(raw.removeprefix(ARCHIVE_PREFIX))
+    if data is None:
+        return None
+    try:
+        payload = gzip.decompress(data).decode("utf-8")
+    except (OSError, EOFError, UnicodeDecodeError):
+        logging.exception("result archive: corrupt object behind %s", raw)
+        return None
+    _remember(raw, payload)
+    return payload
@@ -0,0 +1,210 @@
+"""Per-job choice of transcription provider and model.
+
+providers/replicate.get_model picks the model from a one-hour cutoff alone,
+and SpeechKit was only reachable through a stored provider string. When a
+task is started, choose_route() prices every eligible route with the
+provider's own cost_in_rub and estimates how long the user would wait for it.
+Each Replicate model's queue wait and processing speed come from the tasks
+that ran on it in the last ESTIMATE_WINDOW_SECONDS: wall time started_at →
+finished_at, minus the predict time recovered from actual_price. Tasks still
+running count with the time they have waited so far, so a backed-up queue
+shows before its tasks finish. The route with the lowest cost plus
+WAIT_RUB_PER_MINUTE per minute of expected wait wins, and the decision is
+logged with its expected latency.
+
+Routes:
+
+- Replicate MODEL_SMALL, recordings under an hour only (as before);
+- Replicate MODEL_LARGE, any recording;
+- SpeechKit, only with SPEECHKIT_OVERFLOW_SECONDS set and only once every
+  Replicate route is expected to take longer than that. It recognizes
+  Russian only, returns no timecodes and has no quiet-speech VAD, so it is
+  an overflow valve rather than a peer; quiet recordings never go there.
+
+The user's price is fixed at upload and does not depend on the route.
+"""
+import logging
+import os
+import statistics
+import time
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+import providers.replicate as replicate_provider
+import providers.speechkit as speechkit_provider
+
+from database.models import PROVIDER_REPLICATE, PROVIDER_SPEECHKIT
+from database.queries import get_recent_provider_timings
+from utils.utils import MoscowTimezone
+
+
+# What one minute of the user's wait is worth, in rubles of provider cost.
+WAIT_RUB_PER_MINUTE = Decimal(os.getenv("ROUTING_WAIT_RUB_PER_MINUTE") or "1")
+
+# Expected Replicate wait above which SpeechKit is offered; 0 never offers it.
+SPEECHKIT_OVERFLOW_SECONDS = int(os.getenv("SPEECHKIT_OVERFLOW_SECONDS") or 0)
+# SpeechKit's asynchronous recognition takes up to 4 hours of audio.
+SPEECHKIT_MAX_SECONDS = 4 * 3600
+# SpeechKit's documented pace: about 10 seconds per minute of mono audio.
+SPEECHKIT_SECONDS_PER_AUDIO_SECOND = 10 / 60
+
+ESTIMATE_WINDOW_SECONDS = 3 * 3600
+# Estimates are recomputed at most this often, not on every button press.
+ESTIMATE_TTL_SECONDS = 30
+
+_SMALL_MODEL = replicate_provider.get_model_name(0)
+_LARGE_MODEL = replicate_provider.get_model_name(replicate_provider.ONE_HOUR)
+
+# Until a model has history: a minute of queue and a pace of 1/20 and 1/12
+# of the audio duration, rough figures of a quiet evening.
+DEFAULT_QUEUE_SECONDS = 60.0
+DEFAULT_SECONDS_PER_AUDIO_SECOND = {_SMALL_MODEL: 1 / 20, _LARGE_MODEL: 1 / 12}
+
+# Chunked, challenged and hedged tasks run several predictions per task;
+# their wall time says nothing about one model's queue.
+_COMPOSITE_OP_PREFIXES = ("chunks:", "scribe:", "hedge:")
+# A hedged task still running is still waiting on its WhisperX prediction.
+_HEDGE_OP_PREFIX = "hedge:"
+
+# Hedging (schedulers/transcription.py): a WhisperX prediction still queued
+# after this many times its model's usual queue wait gets a Scribe twin,
+# but never sooner than HEDGE_MIN_SECONDS or later than HEDGE_MAX_SECONDS.
+HEDGE_QUEUE_FACTOR = 3
+HEDGE_MIN_SECONDS = 5 * 60
+HEDGE_MAX_SECONDS = 15 * 60
+
+
+class Route(NamedTuple):
+    provider: str
+    model: str
+    expected_seconds: float
+    cost_rub: Decimal
+
+
+class Estimate(NamedTuple):
+    queue_seconds: float
+    seconds_per_audio_second: float
+    samples: int
+    # Queue wait of the finished tasks alone, before a backlog of running ones.
+    usual_queue_seconds: float
+
+
+_estimates: dict[str, Estimate] = {}
+_estimated_at: Optional[float] = None
+
+
+def _predict_seconds(actual_price: Optional[Decimal], model: str) -> float:
+    """Predict time Replicate billed for *actual_price* (see cost_in_rub)."""
+    if not actual_price:
+        return 0.0
+    return float(Decimal(actual_price) / (replicate_provider.usd_per_second(model) * replicate_provider.USD_TO_RUB))
+
+
+def estimate_models(rows, now: datetime) -> dict[str, Estimate]:
+    """Queue wait and pace of every Replicate model, from get_recent_provider_timings rows.
+
+    Wall time minus predict time is the queue wait of a finished task (all of
+    it for one cancelled while still queued); a running task has waited at
+    least its age minus its expected processing time. Each is the median of
+    its samples, and the larger of the two wins; the first alone is the
+    usual queue wait.
+    """
+    now = now.replace(tzinfo=None)
+    finished: dict[str, list[tuple[float, float]]] = {}
+    running: dict[str, list[tuple[float, int]]] = {}
+    for row in rows:
+        if row.model not in DEFAULT_SECONDS_PER_AUDIO_SECOND or not row.duration_seconds:
+            continue
+        operation_id = row.operation_id or ""
+        if operation_id.startswith(_COMPOSITE_OP_PREFIXES) and not (
+            row.finished_at is None and operation_id.startswith(_HEDGE_OP_PREFIX)
+        ):
+            continue
+        started_at = row.started_at.replace(tzinfo=None)
+        if row.finished_at is None:
+            running.setdefault(row.model, []).append(((now - started_at).total_seconds(), row.duration_seconds))
+            continue
+        wall = (row.finished_at.replace(tzinfo=None) - started_at).total_seconds()
+        predict = _predict_seconds(row.actual_price, row.model)
+        pace = predict / row.duration_seconds if predict else None
+        finished.setdefault(row.model, []).append((max(0.0, wall - predict), pace))
+
+    estimates = {}
+    for model, default_pace in DEFAULT_SECONDS_PER_AUDIO_SECOND.items():
+        done = finished.get(model, [])
+        paces = [pace for _, pace in done if pace]
+        pace = statistics.median(paces) if paces else default_pace
+        usual = statistics.median(wait for wait, _ in done) if done else DEFAULT_QUEUE_SECONDS
+        queue = usual
+        in_flight = running.get(model, [])
+        if in_flight:
+            queue = max(queue, statistics.median(max(0.0, age - pace * audio) for age, audio in in_flight))
+        estimates[model] = Estimate(queue, pace, len(done) + len(in_flight), usual)
+    return estimates
+
+
+def _current_estimates() -> dict[str, Estimate]:
+    global _estimated_at, _estimates
+    if _estimated_at is None or time.monotonic() - _estimated_at > ESTIMATE_TTL_SECONDS:
+        now = datetime.now(MoscowTimezone)
+        rows = get_recent_provider_timings(PROVIDER_REPLICATE, now - timedelta(seconds=ESTIMATE_WINDOW_SECONDS))
+        _estimates = estimate_models(rows, now)
+        _estimated_at = time.monotonic()
+    return _estimates
+
+
+def candidate_routes(
+    duration_seconds: int, mean_volume_db: Optional[float], estimates: dict[str, Estimate],
+) -> list[Route]:
+    """Every route the recording may take, with its expected wait and cost."""
+    routes = []
+    for model, estimate in estimates.items():
+        if model == _SMALL_MODEL and duration_seconds >= replicate_provider.ONE_HOUR:
+            continue
+        predict = estimate.seconds_per_audio_second * duration_seconds
+        routes.append(Route(
+            PROVIDER_REPLICATE, model,
+            estimate.queue_seconds + predict,
+            replicate_provider.cost_in_rub(predict, model),
+        ))
+
+    quiet = mean_volume_db is not None and mean_volume_db < replicate_provider.QUIET_MEAN_VOLUME_DB
+    if (
+        SPEECHKIT_OVERFLOW_SECONDS
+        and not quiet
+        and duration_seconds <= SPEECHKIT_MAX_SECONDS
+        and all(route.expected_seconds > SPEECHKIT_OVERFLOW_SECONDS for route in routes)
+    ):
+        routes.append(Route(
+            PROVIDER_SPEECHKIT, speechkit_provider.get_model_name(duration_seconds),
+            SPEECHKIT_SECONDS_PER_AUDIO_SECOND * duration_seconds,
+            speechkit_provider.cost_in_rub(duration_seconds),
+        ))
+    return routes
+
+
+def hedge_after_seconds(model: Optional[str]) -> float:
+    """How long a prediction of *model* may sit in the queue before it is hedged."""
+    estimate = _current_estimates().get(model)
+    usual = estimate.usual_queue_seconds if estimate else DEFAULT_QUEUE_SECONDS
+    return min(HEDGE_MAX_SECONDS, max(HEDGE_MIN_SECONDS, HEDGE_QUEUE_FACTOR * usual))
+
+
+def _score(route: Route) -> Decimal:
+    return route.cost_rub + WAIT_RUB_PER_MINUTE * Decimal(str(route.expected_seconds / 60))
+
+
+def choose_route(
+    duration_seconds: int, mean_volume_db: Optional[float] = None, transcription_id: Optional[int] = None,
+) -> Route:
+    """The cheapest route once the user's expected wait is priced in."""
+    routes = candidate_routes(duration_seconds or 0, mean_volume_db, _current_estimates())
+    route = min(routes, key=_score)
+    logging.info(
+        "Route task=%s (%ss audio): %s %s, expected %.0fs, cost %s ₽; considered %s",
+        transcription_id, duration_seconds, route.provider, route.model, route.expected_seconds, route.cost_rub,
+        ", ".join(f"{r.model} {r.expected_seconds:.0f}s/{r.cost_rub} ₽" for r in routes),
+    )
+    return route
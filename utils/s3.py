@@ -1,8 +1,8 @@
 """Utilities for uploading files to Yandex Cloud S3."""
 import os
-import boto3
 import asyncio
 import logging
+import threading
 
 from pathlib import Path
 from typing import Optional
@@ -20,10 +20,29 @@ if not all([S3_ACCESS_KEY, S3_SECRET_KEY, S3_ENDPOINT, S3_BUCKET]):
         "S3_ACCESS_KEY, S3_SECRET_KEY, S3_ENDPOINT and S3_BUCKET must be set"
     )
 
-_s3 = boto3.session.Session(
-    aws_access_key_id=S3_ACCESS_KEY,
-    aws_secret_access_key=S3_SECRET_KEY,
-).client("s3", endpoint_url=S3_ENDPOINT)
+# Importing boto3 and building the client takes about a quarter of a second,
+# so it happens on first use (or in warm_up() right after startup) instead of
+# at import time.
+_client = None
+_client_lock = threading.Lock()
+
+
+def _s3():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import boto3
+
+            _client = boto3.session.Session(
+                aws_access_key_id=S3_ACCESS_KEY,
+                aws_secret_access_key=S3_SECRET_KEY,
+            ).client("s3", endpoint_url=S3_ENDPOINT)
+    return _client
+
+
+def warm_up() -> None:
+    """Build the S3 client ahead of the first upload. Blocking; run in a thread."""
+    _s3()
 
 
 @sentry_span(op="s3.upload")
@@ -40,7 +59,7 @@ async def upload_file(
 
     def _upload() -> Optional[str]:
         try:
-            _s3.upload_file(str(file_path), S3_BUCKET, object_name)
+            _s3().upload_file(str(file_path), S3_BUCKET, object_name)
             return f"{S3_ENDPOINT}/{S3_BUCKET}/{object_name}"
         except Exception:
             logging.exception(f"Failed to upload {file_path} to S3")
@@ -55,13 +74,42 @@ async def upload_file(
     return None
 
 
+@sentry_span(op="s3.upload")
+async def upload_bytes(data: bytes, object_name: str) -> bool:
+    """Store *data* as *object_name*; ``False`` if every attempt failed."""
+
+    def _put() -> bool:
+        try:
+            _s3().put_object(Bucket=S3_BUCKET, Key=object_name, Body=data)
+            return True
+        except Exception:
+            logging.exception(f"Failed to upload {object_name} to S3")
+            return False
+
+    for attempt in range(3):
+        if await asyncio.to_thread(_put):
+            return True
+        if attempt < 2:
+            await asyncio.sleep(1)
+    return False
+
+
+def download_bytes(object_name: str) -> Optional[bytes]:
+    """Read *object_name* from S3, or ``None`` on failure. Blocking."""
+    try:
+        return _s3().get_object(Bucket=S3_BUCKET, Key=object_name)["Body"].read()
+    except Exception:
+        logging.exception(f"Failed to download {object_name} from S3")
+        return None
+
+
 @sentry_span(op="s3.signed_url")
 async def get_signed_url(object_name: str, expires_in: int = 3600) -> Optional[str]:
     """Generate a fresh presigned URL for an existing S3 object."""
 
     def _sign() -> Optional[str]:
         try:
-            return _s3.generate_presigned_url(
+            return _s3().generate_presigned_url(
                 "get_object",
                 Params={"Bucket": S3_BUCKET, "Key": object_name},
                 ExpiresIn=expires_in,
@@ -3,15 +3,19 @@ import logging
 import functools
 import sentry_sdk
 
-from sentry_sdk.integrations.fastapi import FastApiIntegration
-from sentry_sdk.integrations.httpx import HttpxIntegration
-from sentry_sdk.integrations.logging import LoggingIntegration
-from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
-from sentry_sdk.scrubber import EventScrubber
-
 
 ENABLE_SENTRY = os.getenv("ENABLE_SENTRY") == "1"
 
+# Traces are sampled up front by transaction name (see _traces_sampler), so
+# an unsampled transaction never builds its spans. Uploads and task creation
+# are the user-facing paths worth every trace; the 1-second poll ticks are
+# tens of thousands of near-identical transactions a day, so a small share
+# shows their shape. Empty ticks never open a transaction at all.
+ALWAYS_TRACED = frozenset({"file.upload", "transcription.create"})
+POLL_TRANSACTIONS = frozenset({"transcription.poll", "refinement.poll", "payment.poll", "metrica.send"})
+POLL_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_POLL_TRACES_SAMPLE_RATE", "0.01"))
+TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "1.0"))
+
 
 def _drop_known_noise(event, hint):
     record = hint.get("log_record")
@@ -41,12 +45,32 @@ def _drop_known_noise(event, hint):
     return event
 
 
+def _traces_sampler(sampling_context) -> float:
+    name = (sampling_context.get("transaction_context") or {}).get("name")
+    if name in ALWAYS_TRACED:
+        return 1.0
+    if name in POLL_TRANSACTIONS:
+        return POLL_TRACES_SAMPLE_RATE
+    parent_sampled = sampling_context.get("parent_sampled")
+    if parent_sampled is not None:
+        return float(parent_sampled)
+    return TRACES_SAMPLE_RATE
+
+
 if ENABLE_SENTRY:
+    # Imported only when enabled: the FastAPI integration alone pulls in
+    # fastapi, a quarter of a second of the bot's cold start.
+    from sentry_sdk.integrations.fastapi import FastApiIntegration
+    from sentry_sdk.integrations.httpx import HttpxIntegration
+    from sentry_sdk.integrations.logging import LoggingIntegration
+    from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+    from sentry_sdk.scrubber import EventScrubber
+
     sentry_sdk.init(
         dsn=os.getenv("SENTRY_DSN"),
         enable_logs=True,
         send_default_pii=False,
-        traces_sample_rate=1.0,
+        traces_sampler=_traces_sampler,
         # Default EventScrubber only scrubs top-level keys; nested dicts in
         # frame locals (e.g. headers={"Authorization": "Api-Key …"}) slip
         # through. recursive=True walks into nested dicts so credentials in
@@ -89,7 +113,8 @@ def sentry_transaction(name, op="task"):
 def sentry_span(op, description=None):
     """
     Async decorator that creates a span within the current Sentry transaction.
-    No-op when ENABLE_SENTRY=0.
+    No-op when ENABLE_SENTRY=0 or when there is no sampled transaction to
+    attach the span to.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -97,6 +122,10 @@ def sentry_span(op, description=None):
             if not ENABLE_SENTRY:
                 return await func(*args, **kwargs)
 
+            current = sentry_sdk.get_current_span()
+            if current is None or not current.sampled:
+                return await func(*args, **kwargs)
+
             with sentry_sdk.start_span(op=op, description=description or func.__name__):
                 return await func(*args, **kwargs)
 
@@ -107,7 +136,7 @@ def sentry_span(op, description=None):
 def sentry_drop_transaction() -> None:
     """
     Mark the current Sentry transaction as not sampled so it won't be sent.
-    Call this to discard a transaction that isn't worth tracking (e.g. empty poll cycles).
+    Call this to discard a transaction that isn't worth tracking (e.g. a housekeeping run that found nothing).
     No-op when ENABLE_SENTRY=0 or no active transaction.
     """
     if not ENABLE_SENTRY:
@@ -6,6 +6,7 @@ import replicate
 
 from typing import Optional
 
+from utils.metrics import PROVIDER_CALL, PROVIDER_ERRORS, track
 from utils.sentry import sentry_span
 
 
@@ -91,10 +92,11 @@ async def start_refinement(text: str, task_type: str = "summarize") -> Optional[
 
     def _create() -> Optional[str]:
         try:
-            prediction = client.predictions.create(
-                model=REPLICATE_LLM_MODEL,
-                input={"prompt": prompt},
-            )
+            with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="replicate_llm", call="create"):
+                prediction = client.predictions.create(
+                    model=REPLICATE_LLM_MODEL,
+                    input={"prompt": prompt},
+                )
             return prediction.id
         except Exception:
             logging.exception("Failed to start summarization on Replicate")
@@ -112,7 +114,8 @@ async def check_refinement(operation_id: str) -> Optional[dict]:
     """
     def _check() -> Optional[dict]:
         try:
-            prediction = client.predictions.get(operation_id)
+            with track(PROVIDER_CALL, PROVIDER_ERRORS, provider="replicate_llm", call="get"):
+                prediction = client.predictions.get(operation_id)
         except Exception:
             logging.exception(f"Failed to fetch summarization prediction {operation_id}")
             return None
@@ -5,6 +5,8 @@ import re
 
 from typing import Any, Dict, List, Optional
 
+from utils import result_archive
+
 
 # WhisperX inherits YouTube/TV subtitle credits from its training data and emits
 # them as confident phantom segments over silence, foreign, or garbled audio
@@ -35,7 +37,11 @@ def is_phantom_segment(text: str) -> bool:
 
 
 def parse_result_json(raw: Optional[str]) -> Optional[Dict[str, Any]]:
-    """Parse a ``result_json`` cell (stored as Python ``repr(dict)``)."""
+    """Parse a ``result_json`` cell (stored as Python ``repr(dict)``).
+
+    A cell archived to S3 (utils/result_archive.py) is fetched first.
+    """
+    raw = result_archive.load(raw)
     if not raw:
         return None
     try:
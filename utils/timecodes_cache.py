@@ -0,0 +1,148 @@
+"""Bounded cache of rendered timecode files (.txt / .srt / .vtt).
+
+Every "С таймкодами" format tap used to re-parse ``result_json`` (a Python
+repr of a multi-megabyte WhisperX payload for long recordings), rebuild the
+segments and reformat the whole file — and users usually download two or three
+formats in a row. A miss now renders every format from one parse, so the next
+taps are served from memory.
+
+Entries are keyed by transcription id and format and stamped with a digest of
+the ``result_json`` they were rendered from, so a payload swapped by a Scribe
+challenge can never be served stale even if an explicit invalidate() is
+missed. Memory holds the most recently used files; entries evicted from it are
+spilled to ``TIMECODES_CACHE_DIR`` when that is set, so a burst of other
+users does not throw away a six-hour .srt.
+"""
+import hashlib
+import logging
+import os
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.timecodes import FORMATTERS
+
+
+MAX_ENTRIES = 64
+MAX_BYTES = 32 * 1024 * 1024  # a 6-hour .srt is ~1 MB, so this is never the tight bound in practice
+
+# Optional on-disk spill for entries evicted from memory; disabled when unset.
+SPILL_DIR = os.getenv("TIMECODES_CACHE_DIR")
+SPILL_MAX_BYTES = 512 * 1024 * 1024
+
+# (transcription_id, fmt) -> (version, rendered bytes); most recently used last.
+_memory: "OrderedDict[tuple[int, str], tuple[str, bytes]]" = OrderedDict()
+_memory_bytes = 0
+
+
+def version_of(result_json: Any) -> str:
+    """Digest of a ``result_json`` cell, used to detect a swapped payload."""
+    raw = result_json if isinstance(result_json, str) else repr(result_json)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _spill_path(transcription_id: int, fmt: str, version: str) -> Optional[Path]:
+    if not SPILL_DIR:
+        return None
+    return Path(SPILL_DIR) / f"{transcription_id}-{fmt}-{version}"
+
+
+def _drop(key: tuple[int, str]) -> None:
+    global _memory_bytes
+    _, data = _memory.pop(key)
+    _memory_bytes -= len(data)
+
+
+def _store(key: tuple[int, str], version: str, data: bytes) -> None:
+    global _memory_bytes
+    old = _memory.pop(key, None)
+    if old is not None:
+        _memory_bytes -= len(old[1])
+    _memory[key] = (version, data)
+    _memory_bytes += len(data)
+    while len(_memory) > 1 and (len(_memory) > MAX_ENTRIES or _memory_bytes > MAX_BYTES):
+        (evicted_id, evicted_fmt), (evicted_version, evicted_data) = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted_data)
+        _spill(evicted_id, evicted_fmt, evicted_version, evicted_data)
+
+
+def _spill(transcription_id: int, fmt: str, version: str, data: bytes) -> None:
+    path = _spill_path(transcription_id, fmt, version)
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        _trim_spill_dir(path.parent)
+    except OSError:
+        logging.exception("timecodes cache: failed to spill %s", path)
+
+
+def _trim_spill_dir(directory: Path) -> None:
+    """Drop the oldest spilled files once the directory outgrows its budget."""
+    files = []
+    for path in directory.iterdir():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= SPILL_MAX_BYTES:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+
+
+def get(transcription_id: int, fmt: str, version: str) -> Optional[bytes]:
+    """Return the cached rendering, or ``None`` on a miss or a stale version."""
+    key = (transcription_id, fmt)
+    entry = _memory.get(key)
+    if entry is not None:
+        if entry[0] == version:
+            _memory.move_to_end(key)
+            return entry[1]
+        _drop(key)
+
+    path = _spill_path(transcription_id, fmt, version)
+    if path is None:
+        return None
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    except OSError:
+        logging.exception("timecodes cache: failed to read %s", path)
+        return None
+    _store(key, version, data)
+    return data
+
+
+def put_segments(transcription_id: int, version: str, segments: List[Dict[str, Any]]) -> Dict[str, bytes]:
+    """Render *segments* in every format, cache them all and return the files."""
+    rendered = {}
+    for fmt, (formatter, _extension) in FORMATTERS.items():
+        data = formatter(segments).encode("utf-8")
+        _store((transcription_id, fmt), version, data)
+        rendered[fmt] = data
+    return rendered
+
+
+def invalidate(transcription_id: int) -> None:
+    """Forget every rendering of *transcription_id* (its ``result_json`` changed)."""
+    for key in [key for key in _memory if key[0] == transcription_id]:
+        _drop(key)
+    if not SPILL_DIR:
+        return
+    try:
+        for path in Path(SPILL_DIR).glob(f"{transcription_id}-*"):
+            path.unlink(missing_ok=True)
+    except OSError:
+        logging.exception("timecodes cache: failed to invalidate spilled files of %s", transcription_id)
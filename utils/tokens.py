@@ -1,6 +1,8 @@
-"""Utilities for counting LLM tokens."""
-import tiktoken
+"""Utilities for counting LLM tokens.
 
+tiktoken is imported and its encodings loaded on first use (or in warm_up()
+right after startup): loading an encoding reads a multi-MB BPE file.
+"""
 from typing import Optional
 
 
@@ -14,6 +16,8 @@ def _count_tokens(text: str, encoding_name) -> Optional[int]:
     """Count tokens in *text* using tiktoken encoding *encoding_name*."""
     if not text:
         return 0
+    import tiktoken
+
     try:
         encoding = tiktoken.get_encoding(encoding_name)
         return len(encoding.encode(text))
@@ -29,3 +33,11 @@ def tokens_by_model(text: str) -> dict[str, Optional[int]]:
         encoding_name: _count_tokens(text, encoding_name)
         for encoding_name in ENCODING_NAMES
     }
+
+
+def warm_up() -> None:
+    """Load every encoding ahead of the first result. Blocking; run in a thread."""
+    import tiktoken
+
+    for encoding_name in ENCODING_NAMES:
+        tiktoken.get_encoding(encoding_name)
@@ -1,6 +1,8 @@
 """Unified interface for transcription providers."""
 import logging
 
+import utils.chunking as chunking
+
 from providers import replicate as replicate_provider
 from providers import speechkit as speechkit_provider
 
@@ -29,16 +31,29 @@ async def start_transcription(
     duration_seconds: int,
     mean_volume_db: Optional[float] = None,
     language: Optional[str] = None,
+    transcription_id: Optional[int] = None,
+    model: Optional[str] = None,
 ) -> Optional[str]:
-    """Start transcription and return the operation id, or ``None`` on any failure."""
+    """Start transcription and return the operation id, or ``None`` on any failure.
+
+    ``model`` is the Replicate model name chosen by utils/routing.py; left
+    unset the duration picks it. A Replicate transcription whose audio was
+    cut into pieces at ingest (utils/chunking.py) starts one prediction per
+    piece instead.
+    """
 
     try:
+        if provider == PROVIDER_REPLICATE and transcription_id is not None and chunking.has_chunks(transcription_id):
+            return await chunking.start(transcription_id, language, model)
+
         if provider == PROVIDER_REPLICATE:
             # URL must outlive Replicate's queue wait (can exceed 1h) or the fetch 403s
             signed_url = await get_signed_url(object_name_from_url(audio_url), expires_in=6 * 3600)
             if not signed_url:
                 return None
-            return await replicate_provider.start_transcription(signed_url, duration_seconds, mean_volume_db, language)
+            return await replicate_provider.start_transcription(
+                signed_url, duration_seconds, mean_volume_db, language, model,
+            )
 
         return await speechkit_provider.start_transcription(audio_url, duration_seconds)
     except Exception:
@@ -50,7 +65,9 @@ async def start_transcription(
 async def check_transcription(operation_id: str, provider: str = PROVIDER_SPEECHKIT) -> Optional[Dict[str, Any]]:
     """Return transcription info if finished, otherwise ``None``."""
 
-    if provider == PROVIDER_REPLICATE:
+    if operation_id.startswith(chunking.CHUNKS_OP_PREFIX):
+        payload = await chunking.check(int(operation_id.removeprefix(chunking.CHUNKS_OP_PREFIX)))
+    elif provider == PROVIDER_REPLICATE:
         payload = await replicate_provider.check_transcription(operation_id)
     else:
         payload = await speechkit_provider.check_transcription(operation_id)
@@ -70,6 +87,14 @@ async def check_transcription(operation_id: str, provider: str = PROVIDER_SPEECH
     }
 
 
+async def cancel_transcription(operation_id: str, provider: str) -> None:
+    """Best-effort cancel of a running transcription (SpeechKit jobs cannot be cancelled)."""
+    if operation_id.startswith(chunking.CHUNKS_OP_PREFIX):
+        await chunking.cancel(int(operation_id.removeprefix(chunking.CHUNKS_OP_PREFIX)))
+    elif provider == PROVIDER_REPLICATE:
+        await replicate_provider.cancel(operation_id)
+
+
 def get_result(check_info: Dict[str, Any]) -> Optional[str]:
     """Extract transcription text from a finished check result."""
 
@@ -90,7 +115,9 @@ def get_result_text(provider: Optional[str], result_json: Optional[str]) -> Opti
 
     The text is served from the DB (the raw provider payload), not the S3
     ``.txt`` copy: that copy is removed by the bucket lifecycle after ~30 days,
-    while ``result_json`` is kept indefinitely.
+    while ``result_json`` is kept indefinitely — in the DB, or past
+    ``RESULT_ARCHIVE_AFTER_DAYS`` in the S3 archive its cell points to
+    (utils/result_archive.py).
     """
     payload = parse_result_json(result_json)
     if payload is None: